@@ -1,3 +1,65 @@
 from django.contrib import admin
+from django.db.models import Sum
+from django.template.defaultfilters import filesizeformat
 
-# Register your models here.
+from .models import DocumentShare, StorageQuota, StorageUsage
+
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    """
+    Uso de armazenamento por usuário e extensão (somente leitura).
+
+    Os totais são mantidos pelos uploads e exclusões; para corrigi-los,
+    use o comando `reconcile_usage`.
+    """
+    list_display = ('user', 'extension', 'documents_count', 'size_display', 'updated_at')
+    list_filter = ('extension',)
+    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    ordering = ('-total_size',)
+
+    @admin.display(description='Tamanho total', ordering='total_size')
+    def size_display(self, obj):
+        return filesizeformat(obj.total_size)
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        if hasattr(response, 'context_data') and 'cl' in response.context_data:
+            # totais do filtro atual, somados das linhas já agregadas
+            totals = response.context_data['cl'].queryset.aggregate(
+                documents=Sum('documents_count'), size=Sum('total_size')
+            )
+            response.context_data['title'] = (
+                f'Uso de armazenamento: {totals["documents"] or 0} documento(s), '
+                f'{filesizeformat(totals["size"] or 0)}'
+            )
+        return response
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StorageQuota)
+class StorageQuotaAdmin(admin.ModelAdmin):
+    """Cotas individuais de armazenamento (substituem `DOCUMENTS_USER_QUOTA`)."""
+    list_display = ('user', 'max_bytes', 'max_bytes_display')
+    search_fields = ('user__username',)
+    autocomplete_fields = ('user',)
+
+    @admin.display(description='Cota', ordering='max_bytes')
+    def max_bytes_display(self, obj):
+        return filesizeformat(obj.max_bytes) if obj.max_bytes else 'Sem limite'
+
+
+@admin.register(DocumentShare)
+class DocumentShareAdmin(admin.ModelAdmin):
+    """Compartilhamentos de documentos com usuários e grupos."""
+    list_display = ('document', 'user', 'group', 'level', 'created_by', 'created_at')
+    list_filter = ('level',)
+    search_fields = ('document__title', 'user__username', 'group__name')
+    list_select_related = ('document', 'user', 'group', 'created_by')
+    raw_id_fields = ('document', 'user', 'group', 'created_by')
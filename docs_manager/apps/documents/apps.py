@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DocumentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.documents'
+
+    def ready(self):
+        # registra os receptores de sinais do app
+        from . import signals  # noqa: F401
@@ -0,0 +1,437 @@
+"""
+benchmark.py
+
+Carga de dados e medição de desempenho das views de documentos (comando
+`benchmark`).
+
+O comando cria usuários, documentos (com arquivos reais de tipos e
+tamanhos variados) e comentários de forma determinística a partir de uma
+semente, e então executa cada cenário (listagem, busca, detalhes, upload e
+download) com várias threads, pela pilha WSGI completa do Django, dentro do
+próprio processo. O resultado é um JSON com percentis de latência, vazão e
+consultas por requisição, que pode ser comparado com o de outra execução.
+
+Cada cenário tem um orçamento de consultas por requisição: se alguma
+requisição passar dele (ex: um N+1 introduzido em um template), a execução
+é marcada como falha.
+
+Notas:
+    - Os dados gerados pertencem a usuários com o prefixo `BENCH_PREFIX` e
+      podem ser removidos com `--reset`.
+    - O `Client` de testes do Django não verifica o token CSRF, então os
+      POSTs do upload não precisam dele.
+"""
+
+import io
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.test import Client
+from django.urls import reverse
+from PIL import Image
+
+from .bulk import BulkEntry, import_entries
+from .models import Comment, Document
+
+# Prefixo dos usuários criados pela carga de dados
+BENCH_PREFIX = 'bench-'
+
+BENCH_PASSWORD = 'bench-password'
+
+# Palavras usadas nos títulos, textos e termos de busca
+WORDS = [
+    'contrato', 'relatório', 'ata', 'orçamento', 'projeto', 'reunião',
+    'financeiro', 'jurídico', 'proposta', 'nota', 'fiscal', 'planejamento',
+    'anual', 'mensal', 'cliente', 'fornecedor', 'auditoria', 'política',
+    'manual', 'procedimento', 'estoque', 'compras', 'vendas', 'recursos',
+]
+
+# Tipos de arquivo gerados e seus pesos na mistura
+FILE_KINDS = {'txt': 4, 'csv': 2, 'pdf': 3, 'png': 1}
+
+# Faixas de tamanho (bytes) e seus pesos: muitos pequenos, poucos grandes
+FILE_SIZES = [
+    ((2 * 1024, 32 * 1024), 70),
+    ((64 * 1024, 512 * 1024), 25),
+    ((1024 * 1024, 2 * 1024 * 1024), 5),
+]
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _text_content(rng, size):
+    lines = []
+    total = 0
+    while total < size:
+        line = _words(rng, 12) + '\n'
+        lines.append(line)
+        total += len(line.encode())
+    return ''.join(lines).encode()[:size]
+
+
+def _csv_content(rng, size):
+    rows = ['id,descricao,valor\n']
+    total = len(rows[0])
+    while total < size:
+        row = f'{len(rows)},{_words(rng, 3)},{rng.uniform(1, 10000):.2f}\n'
+        rows.append(row)
+        total += len(row.encode())
+    return ''.join(rows).encode()
+
+
+def _pdf_content(rng, size):
+    """Gera um PDF de uma página com texto (o tamanho é aproximado)."""
+    lines = ' '.join(
+        f'({_words(rng, 8)}) Tj T*' for _ in range(max(1, min(size // 60, 2000)))
+    )
+    stream = f'BT /F1 10 Tf 40 800 Td 12 TL {lines} ET'.encode('latin-1', 'replace')
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+        b'/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>',
+        b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b'%010d 00000 n \n' % offset)
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def _png_content(rng, size):
+    """Gera uma imagem com ruído, cujo PNG tem aproximadamente `size` bytes."""
+    side = max(16, int((size / 3) ** 0.5))
+    image = Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3))
+    out = io.BytesIO()
+    image.save(out, 'PNG', compress_level=1)
+    return out.getvalue()
+
+
+_GENERATORS = {
+    'txt': _text_content,
+    'csv': _csv_content,
+    'pdf': _pdf_content,
+    'png': _png_content,
+}
+
+
+def make_file(seed, index):
+    """
+    Gera, de forma determinística, o arquivo de número `index` da carga.
+
+    Args:
+        seed (int): semente da carga de dados.
+        index (int): número do arquivo.
+
+    Returns:
+        tuple: (nome do arquivo, conteúdo em bytes).
+    """
+    rng = random.Random(f'{seed}-file-{index}')
+    kind = rng.choices(list(FILE_KINDS), weights=list(FILE_KINDS.values()))[0]
+    (low, high), = rng.choices(
+        [limits for limits, _ in FILE_SIZES], weights=[weight for _, weight in FILE_SIZES]
+    )
+    name = f'{rng.choice(WORDS)}-{rng.choice(WORDS)}-{index}.{kind}'
+    return name, _GENERATORS[kind](rng, rng.randint(low, high))
+
+
+def bench_users():
+    """Usuários criados pela carga de dados."""
+    return get_user_model().objects.filter(username__startswith=BENCH_PREFIX)
+
+
+def reset():
+    """
+    Remove todos os dados criados pela carga (usuários, documentos e comentários).
+
+    Returns:
+        int: quantidade de documentos removidos.
+    """
+    with transaction.atomic():
+        documents = Document.all_objects.filter(author__in=bench_users())
+        # defer evita carregar o texto extraído de cada documento
+        deleted = documents.defer('content', 'search_vector').delete()[1].get('documents.Document', 0)
+        bench_users().delete()
+    return deleted
+
+
+def seed(users=10, documents=500, comments=2000, seed=42):
+    """
+    Cria a carga de dados, se ainda não existir.
+
+    Args:
+        users (int): quantidade de usuários.
+        documents (int): quantidade de documentos.
+        comments (int): quantidade de comentários, espalhados entre os documentos.
+        seed (int): semente que torna a carga reproduzível.
+
+    Returns:
+        dict: quantidades existentes de usuários, documentos e comentários.
+    """
+    User = get_user_model()
+    password = make_password(BENCH_PASSWORD)
+    User.objects.bulk_create(
+        [User(username=f'{BENCH_PREFIX}{n}', password=password) for n in range(users)],
+        ignore_conflicts=True,
+    )
+    authors = list(bench_users().order_by('pk'))
+
+    existing = Document.objects.filter(author__in=authors).count()
+    for position, author in enumerate(authors):
+        # distribui os documentos ainda não criados entre os autores, em rodízio
+        indexes = range(existing + (position - existing) % len(authors), documents, len(authors))
+
+        def entries(indexes=indexes):
+            for index in indexes:
+                name, content = make_file(seed, index)
+                yield BulkEntry(name, len(content), lambda content=content: io.BytesIO(content))
+
+        import_entries(entries(), author=author, description=f'Documento de teste {seed}')
+
+    document_ids = list(
+        Document.objects.filter(author__in=authors).order_by('pk').values_list('pk', flat=True)
+    )
+    missing = comments - Comment.objects.filter(document_id__in=document_ids).count()
+    if missing > 0 and document_ids:
+        rng = random.Random(f'{seed}-comments')
+        Comment.objects.bulk_create(
+            [
+                Comment(document_id=rng.choice(document_ids), author=rng.choice(authors), text=_words(rng, 15))
+                for _ in range(missing)
+            ],
+            batch_size=1000,
+        )
+        # bulk_create não dispara os sinais que mantêm o contador
+        Document.objects.filter(pk__in=document_ids).update(
+            comments_count=Coalesce(
+                Subquery(
+                    Comment.objects.filter(document=OuterRef('pk'))
+                    .order_by().values('document').annotate(total=Count('pk')).values('total')
+                ),
+                Value(0),
+            )
+        )
+
+    return {
+        'users': len(authors),
+        'documents': len(document_ids),
+        'comments': Comment.objects.filter(document_id__in=document_ids).count(),
+    }
+
+
+class Scenario:
+    """
+    Cenário de carga: um tipo de requisição repetido várias vezes.
+
+    Atributos:
+        name (str): nome do cenário no relatório.
+        query_budget (int): máximo de consultas aceito por requisição.
+        prepare (Callable): (rng, contexto) -> argumentos de uma requisição;
+            chamado antes da medição, para que os alvos sejam reproduzíveis.
+        perform (Callable): (client, argumentos) -> resposta.
+        expected_status (tuple): status considerados sucesso.
+    """
+
+    def __init__(self, name, query_budget, prepare, perform, expected_status=(200,)):
+        self.name = name
+        self.query_budget = query_budget
+        self.prepare = prepare
+        self.perform = perform
+        self.expected_status = expected_status
+
+
+def _upload(client, index):
+    name, content = make_file('upload', index)
+    return client.post(reverse('documents_upload'), {
+        'title': f'Upload {index}',
+        'description': 'Upload do benchmark',
+        'file': SimpleUploadedFile(name, content),
+    })
+
+
+SCENARIOS = [
+    Scenario(
+        'list', 6,
+        lambda rng, ctx: None,
+        lambda client, _: client.get(reverse('documents_list')),
+    ),
+    Scenario(
+        'search', 6,
+        lambda rng, ctx: f'{rng.choice(WORDS)} {rng.choice(WORDS)}',
+        lambda client, text: client.get(reverse('documents_list'), {'search': text}),
+    ),
+    Scenario(
+        'details', 7,
+        lambda rng, ctx: rng.choice(ctx['documents']),
+        lambda client, pk: client.get(reverse('documents_details', args=[pk])),
+    ),
+    Scenario(
+        'download', 4,
+        lambda rng, ctx: rng.choice(ctx['documents']),
+        lambda client, pk: client.get(reverse('documents_download', args=[pk])),
+    ),
+    Scenario(
+        'upload', 12,
+        lambda rng, ctx: rng.randrange(1_000_000),
+        _upload,
+        expected_status=(302,),
+    ),
+]
+
+
+def percentile(values, percent):
+    """Percentil (interpolação linear) de uma lista já ordenada."""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _client_host():
+    """Retorna um host aceito por `ALLOWED_HOSTS` para as requisições do benchmark."""
+    for host in settings.ALLOWED_HOSTS:
+        if host and '*' not in host and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def _consume(response):
+    """Lê o corpo inteiro da resposta, como faria o cliente, e a fecha."""
+    try:
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+    finally:
+        response.close()
+
+
+def run_scenario(scenario, requests, concurrency, context, seed=42):
+    """
+    Executa um cenário com `concurrency` threads e mede cada requisição.
+
+    Args:
+        scenario (Scenario): cenário a executar.
+        requests (int): total de requisições.
+        concurrency (int): requisições simultâneas.
+        context (dict): dados da carga ('documents' e 'users').
+        seed (int): semente que define os alvos das requisições.
+
+    Returns:
+        dict: latências (ms), vazão, consultas por requisição, bytes
+            recebidos, erros e requisições acima do orçamento de consultas.
+    """
+    rng = random.Random(f'{seed}-{scenario.name}')
+    targets = [scenario.prepare(rng, context) for _ in range(requests)]
+    clients = threading.local()
+    lock = threading.Lock()
+    samples = []
+
+    def execute(number):
+        if not hasattr(clients, 'client'):
+            clients.client = Client(SERVER_NAME=_client_host())
+            clients.client.force_login(context['users'][number % len(context['users'])])
+        queries = 0
+
+        def count_query(execute_sql, sql, params, many, ctx):
+            nonlocal queries
+            queries += 1
+            return execute_sql(sql, params, many, ctx)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = scenario.perform(clients.client, targets[number])
+            received = _consume(response)
+        elapsed = time.perf_counter() - started
+        with lock:
+            samples.append((elapsed, queries, received, response.status_code))
+
+    def worker(numbers):
+        try:
+            for number in numbers:
+                execute(number)
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='benchmark') as pool:
+        for future in [pool.submit(worker, range(i, requests, concurrency)) for i in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed * 1000 for elapsed, _, _, _ in samples)
+    queries = [count for _, count, _, _ in samples]
+    result = {
+        'requests': len(samples),
+        'concurrency': concurrency,
+        'throughput_rps': round(len(samples) / wall, 2) if wall else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            **{f'p{p}': round(percentile(latencies, p), 2) for p in PERCENTILES},
+            'max': round(latencies[-1], 2) if latencies else 0.0,
+        },
+        'queries_per_request': {
+            'mean': round(statistics.fmean(queries), 2) if queries else 0.0,
+            'max': max(queries, default=0),
+            'budget': scenario.query_budget,
+        },
+        'bytes_received': sum(received for _, _, received, _ in samples),
+        'errors': sum(1 for *_, status in samples if status not in scenario.expected_status),
+        'over_budget': sum(1 for count in queries if count > scenario.query_budget),
+    }
+    return result
+
+
+def compare(current, baseline):
+    """
+    Compara duas execuções do benchmark.
+
+    Args:
+        current (dict): resultado da execução atual.
+        baseline (dict): resultado de uma execução anterior.
+
+    Returns:
+        dict: por cenário, a variação percentual de p50, p95 e vazão e a
+            diferença na média de consultas por requisição.
+    """
+    def change(new, old):
+        return round((new - old) / old * 100, 1) if old else None
+
+    deltas = {}
+    for name, result in current['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            continue
+        deltas[name] = {
+            'p50_change_pct': change(result['latency_ms']['p50'], old['latency_ms']['p50']),
+            'p95_change_pct': change(result['latency_ms']['p95'], old['latency_ms']['p95']),
+            'throughput_change_pct': change(result['throughput_rps'], old['throughput_rps']),
+            'queries_mean_diff': round(
+                result['queries_per_request']['mean'] - old['queries_per_request']['mean'], 2
+            ),
+        }
+    return deltas
@@ -0,0 +1,360 @@
+"""
+bulk.py
+
+Importação de documentos em lote: vários arquivos, arquivos .zip ou uma
+pasta do servidor (comando `import_documents`).
+
+Cada arquivo passa pelas mesmas regras do upload individual (extensão e
+tamanho máximo). Os arquivos válidos de um lote são gravados no
+armazenamento em paralelo e os documentos são inseridos com um único
+`bulk_create` por lote, junto com as referências aos blobs e as tarefas
+de extração de texto e miniaturas. O resultado é um relatório por arquivo.
+
+Notas:
+    - Um erro em um arquivo não interrompe os demais; um erro no banco
+      descarta apenas o lote em que ocorreu.
+    - Com cota de armazenamento, os arquivos que não cabem no espaço
+      restante do autor são recusados; os anteriores são importados.
+    - O título de cada documento é o nome do arquivo, sem a extensão.
+"""
+
+import hashlib
+import mimetypes
+import os
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django import forms
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+
+from apps.jobs.queue import enqueue_many
+
+from .forms import MAX_FILE_SIZE, validate_file_name
+from .models import Blob, Document
+from .search import document_search_vector
+from .storage import add_blob_references, save_blob_file
+from .tasks import process_document
+from .usage import quota_error, record_usage, remaining_quota
+
+# Quantidade de documentos inseridos por transação
+BATCH_SIZE = 500
+
+# Threads que gravam os arquivos de um lote no armazenamento
+WRITE_WORKERS = 8
+
+# Arquivos até este tamanho ficam em memória durante a importação
+SPOOL_MAX_SIZE = 1024 * 1024
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class BulkEntry:
+    """
+    Arquivo a ser importado.
+
+    Atributos:
+        name (str): caminho exibido no relatório (ex: 'pasta/arquivo.pdf').
+        size (int): tamanho declarado, em bytes.
+        opener (Callable): função que abre o conteúdo em modo binário.
+        error (str): erro já conhecido antes da leitura (ex: .zip corrompido).
+    """
+
+    def __init__(self, name, size, opener=None, error=''):
+        self.name = name
+        self.size = size
+        self.opener = opener
+        self.error = error
+
+    @property
+    def file_name(self):
+        """Nome do arquivo, sem as pastas."""
+        return os.path.basename(self.name)
+
+
+class BulkResult:
+    """
+    Resultado da importação de um arquivo.
+
+    Atributos:
+        name (str): caminho do arquivo, como em `BulkEntry.name`.
+        document (Document | None): documento criado, em caso de sucesso.
+        error (str): motivo da falha, se houver.
+    """
+
+    def __init__(self, name, document=None, error=''):
+        self.name = name
+        self.document = document
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.document is not None
+
+
+def zip_entries(archive, prefix=''):
+    """
+    Lista os arquivos de um .zip já aberto como entradas de importação.
+
+    Pastas, metadados do macOS e arquivos ocultos são ignorados.
+
+    Args:
+        archive (ZipFile): arquivo .zip aberto; deve permanecer aberto
+            até o fim da importação.
+        prefix (str): prefixo exibido no relatório (ex: nome do .zip).
+
+    Returns:
+        list[BulkEntry]: uma entrada por arquivo do .zip.
+    """
+    entries = []
+    for info in archive.infolist():
+        base = os.path.basename(info.filename)
+        if info.is_dir() or info.filename.startswith('__MACOSX/') or base.startswith('.'):
+            continue
+        entries.append(BulkEntry(
+            f'{prefix}{info.filename}',
+            info.file_size,
+            lambda info=info: archive.open(info),
+        ))
+    return entries
+
+
+def upload_entries(files, stack):
+    """
+    Converte os arquivos enviados pelo formulário em entradas de importação.
+
+    Arquivos .zip são abertos e expandidos.
+
+    Args:
+        files (list[UploadedFile]): arquivos enviados.
+        stack (ExitStack): mantém os .zip abertos até o fim da importação.
+
+    Returns:
+        list[BulkEntry]: entradas na ordem em que foram enviadas.
+    """
+    entries = []
+    for uploaded in files:
+        if uploaded.name.lower().endswith('.zip'):
+            try:
+                archive = stack.enter_context(zipfile.ZipFile(uploaded))
+            except zipfile.BadZipFile:
+                entries.append(BulkEntry(uploaded.name, uploaded.size, error='Arquivo .zip inválido.'))
+                continue
+            entries.extend(zip_entries(archive, prefix=f'{uploaded.name}/'))
+        else:
+            entries.append(BulkEntry(uploaded.name, uploaded.size, lambda f=uploaded: f.open('rb')))
+    return entries
+
+
+def directory_entries(root):
+    """
+    Percorre uma pasta do servidor (recursivamente) gerando entradas de importação.
+
+    Args:
+        root (str): pasta de origem.
+
+    Yields:
+        BulkEntry: uma entrada por arquivo, com o caminho relativo à pasta.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+        for filename in sorted(filenames):
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(dirpath, filename)
+            yield BulkEntry(
+                os.path.relpath(path, root),
+                os.path.getsize(path),
+                lambda path=path: open(path, 'rb'),
+            )
+
+
+def validate_entry(entry):
+    """
+    Aplica a uma entrada as regras do upload individual.
+
+    Args:
+        entry (BulkEntry): arquivo a validar.
+
+    Returns:
+        str: mensagem de erro, ou '' se o arquivo puder ser importado.
+    """
+    if entry.error:
+        return entry.error
+    try:
+        validate_file_name(entry.file_name)
+    except forms.ValidationError as e:
+        return e.messages[0]
+    if entry.size > MAX_FILE_SIZE:
+        return f'Arquivo muito grande! Máx 50MB ({entry.size / 1024 / 1024:.2f}MB)'
+    if entry.size == 0:
+        return 'O arquivo está vazio.'
+    return ''
+
+
+def _spool(entry):
+    """Copia o conteúdo para um arquivo temporário, calculando hash e tamanho."""
+    digest = hashlib.sha256()
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    size = 0
+    try:
+        with entry.opener() as source:
+            while True:
+                data = source.read(COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                if size > MAX_FILE_SIZE:
+                    # o tamanho declarado no .zip pode não corresponder ao conteúdo
+                    raise ValueError('Arquivo muito grande! Máx 50MB')
+                digest.update(data)
+                spooled.write(data)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, digest.hexdigest(), size
+
+
+def _write_entry(entry):
+    """
+    Grava uma entrada no armazenamento.
+
+    Returns:
+        tuple: (caminho gravado, SHA-256, tamanho, se o arquivo foi criado
+            agora, erro); em caso de falha, apenas o erro é preenchido.
+    """
+    try:
+        spooled, sha256, size = _spool(entry)
+        with spooled:
+            if settings.DOCUMENTS_DEDUPLICATE:
+                path, created = save_blob_file(File(spooled), sha256, entry.file_name)
+            else:
+                path = default_storage.save(f'documents/{entry.file_name}', File(spooled))
+                created = True
+    except (OSError, ValueError, zipfile.BadZipFile, zlib.error) as e:
+        return None, None, 0, False, str(e)
+    return path, sha256, size, created, ''
+
+
+def _discard_written(paths):
+    """
+    Apaga os arquivos gravados por um lote cuja transação foi desfeita.
+
+    Com deduplicação, um blob criado ao mesmo tempo por outro processo pode
+    estar usando o mesmo arquivo; esses são mantidos.
+    """
+    paths = set(paths)
+    if settings.DOCUMENTS_DEDUPLICATE and paths:
+        try:
+            paths -= set(Blob.objects.filter(file__in=paths).values_list('file', flat=True))
+        except DatabaseError:
+            # sem como conferir: os arquivos são mantidos (podem estar em uso)
+            return
+    for path in paths:
+        default_storage.delete(path)
+
+
+def _build_document(entry, path, sha256, size, author, description):
+    name = entry.file_name
+    return Document(
+        title=os.path.splitext(name)[0][:255] or name[:255],
+        description=description,
+        author=author,
+        file=path,
+        blob_id=sha256 if settings.DOCUMENTS_DEDUPLICATE else None,
+        file_name=name[:255],
+        file_size=size,
+        file_type=mimetypes.guess_type(name)[0] or '',
+        file_extension=os.path.splitext(name)[1].lower(),
+    )
+
+
+def _import_batch(entries, author, description, pool):
+    """Importa um lote de entradas, retornando os resultados na mesma ordem."""
+    errors = {}
+    valid = []
+    remaining = remaining_quota(author)
+    for index, entry in enumerate(entries):
+        error = validate_entry(entry)
+        if not error and remaining is not None:
+            if entry.size > remaining:
+                error = quota_error(entry.size, remaining)
+            else:
+                remaining -= entry.size
+        if error:
+            errors[index] = error
+        else:
+            valid.append(index)
+
+    documents = {}
+    references = {}
+    created_paths = []
+    written = pool.map(_write_entry, [entries[index] for index in valid])
+    for index, (path, sha256, size, created, error) in zip(valid, written):
+        if error:
+            errors[index] = error
+            continue
+        if created:
+            created_paths.append(path)
+        documents[index] = _build_document(entries[index], path, sha256, size, author, description)
+        if settings.DOCUMENTS_DEDUPLICATE:
+            blob_path, blob_size, count = references.get(sha256, (path, size, 0))
+            references[sha256] = (blob_path, blob_size, count + 1)
+
+    if documents:
+        try:
+            with transaction.atomic():
+                paths = add_blob_references(references)
+                for document in documents.values():
+                    if document.blob_id:
+                        # o blob pode já existir gravado com outra compressão
+                        document.file = paths[document.blob_id]
+                orphans = [
+                    path for sha, (path, _, _) in references.items() if paths[sha] != path
+                ]
+                if orphans:
+                    transaction.on_commit(lambda: [default_storage.delete(path) for path in orphans])
+                created = Document.objects.bulk_create(documents.values())
+                ids = [document.pk for document in created]
+                # título e descrição já entram na busca; o conteúdo é extraído pelo worker
+                Document.objects.filter(pk__in=ids).update(search_vector=document_search_vector())
+                record_usage(created)
+                enqueue_many(process_document, [{'document_id': pk} for pk in ids])
+        except DatabaseError as e:
+            _discard_written(created_paths)
+            for index in documents:
+                errors[index] = f'Erro ao salvar no banco: {e}'
+            documents = {}
+
+    return [
+        BulkResult(entry.name, document=documents.get(index), error=errors.get(index, ''))
+        for index, entry in enumerate(entries)
+    ]
+
+
+def import_entries(entries, author=None, description='', batch_size=BATCH_SIZE, workers=WRITE_WORKERS):
+    """
+    Importa arquivos em lote.
+
+    Args:
+        entries (Iterable[BulkEntry]): arquivos a importar.
+        author (User | None): autor dos documentos criados.
+        description (str): descrição aplicada a todos os documentos.
+        batch_size (int): documentos inseridos por transação.
+        workers (int): threads que gravam os arquivos em paralelo.
+
+    Returns:
+        list[BulkResult]: um resultado por arquivo, na ordem de entrada.
+    """
+    entries = iter(entries)
+    results = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk-import') as pool:
+        while batch := list(islice(entries, batch_size)):
+            results.extend(_import_batch(batch, author, description, pool))
+    return results
@@ -0,0 +1,305 @@
+"""
+compression.py
+
+Compressão dos arquivos no armazenamento deduplicado.
+
+Conteúdos que comprimem bem (txt, csv, doc) são gravados comprimidos, com
+o algoritmo definido por `DOCUMENTS_COMPRESSION`, e o caminho do blob
+recebe o sufixo do algoritmo ('.gz' ou '.zst'). No download, o arquivo
+comprimido é enviado como está, com `Content-Encoding`, para os clientes
+que aceitam o algoritmo; para os demais, é descomprimido durante o envio.
+
+Formatos que já são comprimidos (docx, xlsx, pdf, imagens) são detectados
+pela extensão e pelos primeiros bytes e gravados sem alteração; o mesmo
+vale para conteúdos cuja amostra inicial quase não diminui ao comprimir.
+
+Notas:
+    - O zstd depende do pacote opcional `zstandard`; sem ele, é usado o gzip.
+    - O SHA-256 do blob é sempre o do conteúdo original, então a
+      deduplicação não depende da compressão.
+    - Os trechos das revisões (ver `revisions.py`) seguem as mesmas regras.
+"""
+
+import gzip
+import logging
+import os
+import re
+import shutil
+import tempfile
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Sufixo do caminho de cada algoritmo
+SUFFIXES = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# Pastas do armazenamento cujos arquivos podem estar comprimidos
+COMPRESSED_PREFIXES = ('blobs/', 'chunks/')
+
+# Extensões comprimidas quando a amostra confirma o ganho
+COMPRESSIBLE_EXTENSIONS = {'.txt', '.csv', '.doc'}
+
+# Extensões de formatos que já são comprimidos
+COMPRESSED_EXTENSIONS = {'.docx', '.xlsx', '.pdf', '.png', '.jpg', '.jpeg', '.gif', '.zip'}
+
+# Assinaturas (primeiros bytes) de formatos já comprimidos
+COMPRESSED_SIGNATURES = (
+    b'PK\x03\x04',         # zip (docx, xlsx)
+    b'\x1f\x8b',           # gzip
+    b'\x28\xb5\x2f\xfd',   # zstd
+    b'\x89PNG',
+    b'\xff\xd8\xff',       # jpeg
+    b'GIF8',
+    b'%PDF',
+)
+
+# Tamanho da amostra usada para estimar o ganho da compressão
+SAMPLE_SIZE = 64 * 1024
+
+# Proporção máxima (comprimido / original) da amostra para valer a pena comprimir
+MAX_SAMPLE_RATIO = 0.8
+
+# Tamanho dos blocos lidos ao comprimir e descomprimir
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Arquivos comprimidos até este tamanho ficam em memória antes da gravação
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+
+_ACCEPT_ENCODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$')
+
+
+def storage_encoding():
+    """
+    Retorna o algoritmo usado nas novas gravações ('' se desativado).
+
+    O setting é lido a cada chamada; apenas a validação (e o aviso no log)
+    fica em cache, por valor.
+
+    Returns:
+        str: 'gzip', 'zstd' ou ''.
+    """
+    return _resolve_encoding((settings.DOCUMENTS_COMPRESSION or '').lower())
+
+
+@lru_cache(maxsize=None)
+def _resolve_encoding(encoding):
+    """Valida o valor de `DOCUMENTS_COMPRESSION`, avisando uma única vez."""
+    if encoding == 'zstd' and zstandard is None:
+        logger.warning('Pacote zstandard não instalado; usando gzip na compressão dos arquivos.')
+        return 'gzip'
+    if encoding and encoding not in SUFFIXES:
+        logger.warning('DOCUMENTS_COMPRESSION inválido (%r); compressão desativada.', encoding)
+        return ''
+    return encoding
+
+
+def path_encoding(name):
+    """
+    Retorna o algoritmo de compressão de um arquivo armazenado, pelo sufixo.
+
+    Args:
+        name (str): caminho do arquivo no armazenamento.
+
+    Returns:
+        str: 'gzip', 'zstd' ou '' (arquivo sem compressão).
+    """
+    for encoding, suffix in SUFFIXES.items():
+        if name.endswith(suffix) and name.startswith(COMPRESSED_PREFIXES):
+            return encoding
+    return ''
+
+
+def _sample_ratio(sample):
+    if not sample:
+        return 1.0
+    return len(zlib.compress(sample, 1)) / len(sample)
+
+
+def is_compressed_format(file_name, sample=b''):
+    """
+    Verifica se um conteúdo já está em um formato comprimido.
+
+    Usado também pela exportação em .zip, que guarda esses arquivos sem
+    comprimi-los de novo.
+
+    Args:
+        file_name (str): nome original do arquivo, usado para a extensão.
+        sample (bytes): primeiros bytes do conteúdo, se disponíveis.
+
+    Returns:
+        bool: True se a extensão ou a assinatura indicar um formato comprimido.
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    return extension in COMPRESSED_EXTENSIONS or sample.startswith(COMPRESSED_SIGNATURES)
+
+
+def choose_encoding(fileobj, file_name=''):
+    """
+    Decide se um conteúdo deve ser gravado comprimido.
+
+    Args:
+        fileobj (File): conteúdo aberto em modo binário; a posição é restaurada.
+        file_name (str): nome original do arquivo, usado para a extensão.
+
+    Returns:
+        str: algoritmo a usar, ou '' para gravar o conteúdo original.
+    """
+    encoding = storage_encoding()
+    extension = os.path.splitext(file_name)[1].lower()
+    if not encoding or is_compressed_format(file_name):
+        return ''
+
+    fileobj.seek(0)
+    sample = fileobj.read(SAMPLE_SIZE)
+    fileobj.seek(0)
+    if is_compressed_format(file_name, sample):
+        return ''
+    if extension and extension not in COMPRESSIBLE_EXTENSIONS:
+        return ''
+    if _sample_ratio(sample) > MAX_SAMPLE_RATIO:
+        return ''
+    return encoding
+
+
+def compress(fileobj, encoding):
+    """
+    Comprime um conteúdo em um arquivo temporário.
+
+    Args:
+        fileobj (File): conteúdo original, aberto em modo binário.
+        encoding (str): 'gzip' ou 'zstd'.
+
+    Returns:
+        SpooledTemporaryFile: conteúdo comprimido, posicionado no início;
+            deve ser fechado pelo chamador.
+    """
+    fileobj.seek(0)
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        if encoding == 'zstd':
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            compressor.copy_stream(fileobj, out, read_size=COMPRESS_CHUNK_SIZE)
+        else:
+            # mtime fixo: o mesmo conteúdo gera sempre os mesmos bytes
+            with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) as target:
+                shutil.copyfileobj(fileobj, target, COMPRESS_CHUNK_SIZE)
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+
+def compressing_writer(fileobj, encoding):
+    """
+    Retorna um destino que comprime, durante a escrita, o que é gravado nele.
+
+    Usado pelo upload em uma única passagem (ver `upload_handlers.py`),
+    que grava cada bloco recebido já comprimido. O resultado é o mesmo de
+    `compress`.
+
+    Args:
+        fileobj (File): arquivo de destino, aberto em modo binário; não é
+            fechado junto com o destino.
+        encoding (str): 'gzip', 'zstd' ou '' (devolve o próprio arquivo).
+
+    Returns:
+        file-like: destino com `write` e `close`.
+    """
+    if encoding == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return compressor.stream_writer(fileobj, closefd=False)
+    return fileobj
+
+
+class _GzipReader(gzip.GzipFile):
+    """`GzipFile` que, ao ser fechado, fecha também o arquivo comprimido."""
+
+    def close(self):
+        # o GzipFile só fecha o arquivo que ele mesmo abriu (pelo nome)
+        fileobj = self.fileobj
+        try:
+            super().close()
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+def decoded(fileobj, encoding):
+    """
+    Retorna um leitor que descomprime o arquivo durante a leitura.
+
+    O leitor aceita `seek` para frente (descomprimindo e descartando os
+    bytes anteriores), o que basta para atender requisições com Range.
+
+    Args:
+        fileobj (File): arquivo comprimido, aberto em modo binário; é
+            fechado junto com o leitor.
+        encoding (str): algoritmo do arquivo ('' devolve o próprio arquivo).
+
+    Returns:
+        file-like: leitor do conteúdo original.
+    """
+    if encoding == 'gzip':
+        return _GzipReader(fileobj=fileobj, mode='rb')
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=True)
+    return fileobj
+
+
+def open_document_file(document):
+    """
+    Abre o arquivo de um documento para leitura do conteúdo original.
+
+    Usado por quem precisa dos bytes originais (extração de texto,
+    miniaturas), independentemente da compressão no armazenamento.
+
+    Args:
+        document (Document): documento com arquivo.
+
+    Returns:
+        file-like: leitor do conteúdo original; deve ser fechado.
+    """
+    return decoded(document.file.open('rb'), path_encoding(document.file.name))
+
+
+def accepts_encoding(request, encoding):
+    """
+    Verifica se o cliente aceita respostas com `Content-Encoding: encoding`.
+
+    Args:
+        request (HttpRequest): requisição do cliente.
+        encoding (str): 'gzip' ou 'zstd'.
+
+    Returns:
+        bool: True se o algoritmo (ou '*') aparece em Accept-Encoding com q > 0.
+    """
+    header = request.headers.get('Accept-Encoding', '')
+    accepted = {}
+    for item in header.split(','):
+        match = _ACCEPT_ENCODING_RE.match(item)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) is not None else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1).lower()] = quality
+    quality = accepted.get(encoding, accepted.get('*', 0.0))
+    return quality > 0
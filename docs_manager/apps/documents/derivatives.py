@@ -0,0 +1,220 @@
+"""
+derivatives.py
+
+Geração e cache de miniaturas e pré-visualizações dos documentos.
+
+Imagens (png, jpg, jpeg, gif) são reduzidas com o Pillow; PDFs têm a
+primeira página renderizada pelo `pdftoppm` (poppler-utils), quando ele
+está instalado no servidor. Os derivados são gravados em
+'derivatives/<aa>/<chave>-<tamanho>.<formato>', onde a chave é o hash do
+conteúdo, e por isso podem ser servidos com cache de longa duração.
+
+Notas:
+    - A geração nunca acontece durante a requisição que exibe a página:
+      ela roda na fila de tarefas após o upload (ou no primeiro acesso a
+      um derivado ausente) e, enquanto isso, o ícone genérico é exibido.
+    - O formato de saída é definido por `DOCUMENTS_DERIVATIVE_FORMAT`
+      ('webp' ou 'jpeg').
+"""
+
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from apps.jobs.queue import enqueue
+
+from .compression import open_document_file
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+# Maior dimensão (em pixels) de cada tamanho de derivado
+SIZES = {
+    'thumb': 160,
+    'preview': 1280,
+}
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif'}
+PDF_EXTENSIONS = {'.pdf'}
+
+# Resolução usada ao renderizar a primeira página de PDFs
+PDF_RENDER_DPI = 110
+
+@lru_cache(maxsize=1)
+def _can_render_pdf():
+    return shutil.which('pdftoppm') is not None
+
+
+def supports_derivatives(document):
+    """Indica se o tipo do documento permite gerar miniaturas."""
+    extension = (document.file_extension or '').lower()
+    if extension in PDF_EXTENSIONS:
+        return _can_render_pdf()
+    return extension in IMAGE_EXTENSIONS
+
+
+def derivative_key(document):
+    """
+    Retorna a chave de cache dos derivados de um documento.
+
+    Documentos deduplicados usam o SHA-256 do conteúdo, compartilhando os
+    derivados entre cópias; os demais usam o ID e a data de atualização.
+
+    Args:
+        document (Document): documento de origem.
+
+    Returns:
+        str: chave que muda sempre que o conteúdo muda.
+    """
+    if document.blob_id:
+        return document.blob_id
+    return f'doc{document.pk}-{int(document.updated_at.timestamp())}'
+
+
+def attach_derivatives(documents):
+    """
+    Adiciona a cada documento a versão dos seus derivados.
+
+    O atributo `derivative_version` é usado pelos templates no parâmetro
+    `?v=` das URLs dos derivados (o que permite o cache imutável) e vale
+    None quando o tipo do arquivo não tem miniatura. Nenhuma consulta ou
+    acesso ao disco é feito aqui.
+
+    Args:
+        documents (Iterable[Document]): documentos exibidos na página.
+    """
+    for document in documents:
+        document.derivative_version = (
+            derivative_key(document) if supports_derivatives(document) else None
+        )
+
+
+def derivative_path(key, size):
+    """Retorna o caminho de armazenamento de um derivado."""
+    extension = 'webp' if settings.DOCUMENTS_DERIVATIVE_FORMAT == 'webp' else 'jpg'
+    return f'derivatives/{key[:2]}/{key}-{size}.{extension}'
+
+
+def derivative_content_type():
+    """Retorna o tipo MIME dos derivados gerados."""
+    return 'image/webp' if settings.DOCUMENTS_DERIVATIVE_FORMAT == 'webp' else 'image/jpeg'
+
+
+def _open_source_image(document):
+    """Abre a imagem de origem (o próprio arquivo ou a 1ª página do PDF)."""
+    extension = document.file_extension.lower()
+    if extension in IMAGE_EXTENSIONS:
+        with open_document_file(document) as fileobj:
+            image = Image.open(fileobj)
+            # reduz JPEGs já na decodificação, sem carregar a resolução total
+            image.draft('RGB', (SIZES['preview'], SIZES['preview']))
+            image.load()
+        return image
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source.pdf')
+        with open_document_file(document) as fileobj, open(source, 'wb') as out:
+            shutil.copyfileobj(fileobj, out)
+        subprocess.run(
+            ['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+             '-r', str(PDF_RENDER_DPI), source, os.path.join(tmp, 'page')],
+            check=True,
+            timeout=60,
+            capture_output=True,
+        )
+        image = Image.open(os.path.join(tmp, 'page.png'))
+        image.load()
+    return image
+
+
+def _encode(image, max_dimension):
+    """Reduz a imagem para caber em `max_dimension` e a codifica."""
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    if settings.DOCUMENTS_DERIVATIVE_FORMAT == 'webp' and has_alpha:
+        image = image.convert('RGBA')
+    else:
+        image = image.convert('RGB')
+    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    if settings.DOCUMENTS_DERIVATIVE_FORMAT == 'webp':
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    else:
+        image.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_derivatives(document):
+    """
+    Gera (se ainda não existirem) todos os derivados de um documento.
+
+    Args:
+        document (Document): documento de origem.
+
+    Returns:
+        bool: True se os derivados estão disponíveis ao final.
+    """
+    if not supports_derivatives(document):
+        return False
+
+    key = derivative_key(document)
+    missing = {
+        size: dimension for size, dimension in SIZES.items()
+        if not default_storage.exists(derivative_path(key, size))
+    }
+    if not missing:
+        return True
+
+    try:
+        source = _open_source_image(document)
+    except (OSError, subprocess.SubprocessError, Image.DecompressionBombError) as e:
+        logger.warning('Falha ao gerar derivados do documento %s: %s', document.pk, e)
+        return False
+
+    for size, dimension in missing.items():
+        data = _encode(source, dimension)
+        path = derivative_path(key, size)
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(data))
+    return True
+
+
+def generate_document_derivatives(document_id):
+    """Tarefa que gera os derivados de um documento a partir do seu ID."""
+    document = Document.objects.defer('content', 'search_vector').filter(pk=document_id).first()
+    if document is not None:
+        generate_derivatives(document)
+
+
+def schedule_derivatives(document):
+    """
+    Enfileira a geração dos derivados fora da requisição atual.
+
+    Acessos repetidos a um derivado ausente não geram tarefas duplicadas
+    enquanto a primeira ainda estiver na fila.
+
+    Args:
+        document (Document): documento sem derivados.
+    """
+    if supports_derivatives(document):
+        enqueue(generate_document_derivatives, unique_key=str(document.pk), document_id=document.pk)
+
+
+def delete_derivatives(key):
+    """Remove todos os derivados associados a uma chave de conteúdo."""
+    for size in SIZES:
+        path = derivative_path(key, size)
+        try:
+            default_storage.delete(path)
+        except OSError as e:
+            logger.warning('Falha ao remover o derivado %s: %s', path, e)
@@ -0,0 +1,331 @@
+"""
+downloads.py
+
+Entrega dos arquivos dos documentos.
+
+Todo acesso a arquivos passa pela view `documents_download`, que confere as
+permissões e então delega a este módulo:
+- Requisições condicionais (If-None-Match / If-Modified-Since) recebem 304.
+- Requisições com Range recebem apenas o trecho pedido (206), o que permite
+  retomar downloads e navegar em PDFs sem baixar o arquivo inteiro.
+- Com `DOCUMENTS_SENDFILE` configurado, os bytes são enviados pelo proxy
+  (X-Accel-Redirect no nginx ou X-Sendfile no Apache/lighttpd), liberando
+  o worker assim que as permissões são verificadas.
+- Em modo ASGI, `aserve_document` envia os bytes com um iterador assíncrono
+  cujas leituras de disco rodam fora do event loop, então cada download
+  lento ocupa apenas uma corrotina, e não uma thread ou um processo.
+- Arquivos gravados comprimidos (ver `compression.py`) são enviados como
+  estão, com `Content-Encoding`, quando o cliente aceita o algoritmo; caso
+  contrário, são descomprimidos durante o envio. Nesses arquivos o
+  sendfile não é usado, e Range só é atendido na versão descomprimida.
+"""
+
+import asyncio
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date
+
+from .compression import accepts_encoding, decoded, path_encoding
+
+# Tamanho dos blocos lidos do arquivo ao enviar um intervalo
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """O intervalo pedido está fora do arquivo."""
+
+
+def document_etag(document, content_encoding=''):
+    """
+    Retorna o ETag forte de um documento.
+
+    Usa o SHA-256 do conteúdo quando o documento está no armazenamento
+    deduplicado; caso contrário, combina ID, data de atualização e tamanho.
+    A versão comprimida tem um ETag próprio, já que os bytes são outros.
+
+    Args:
+        document (Document): documento a ser entregue.
+        content_encoding (str): algoritmo da resposta ('' se descomprimida).
+
+    Returns:
+        str: ETag entre aspas, pronto para o cabeçalho.
+    """
+    suffix = f'-{content_encoding}' if content_encoding else ''
+    if document.blob_id:
+        return f'"{document.blob_id}{suffix}"'
+    return f'"{document.pk}-{int(document.updated_at.timestamp())}-{document.file_size}{suffix}"'
+
+
+def document_last_modified(document):
+    """Retorna a data de atualização do documento como timestamp (segundos)."""
+    return int(document.updated_at.timestamp())
+
+
+def parse_range(header, size):
+    """
+    Interpreta o cabeçalho Range para um arquivo de `size` bytes.
+
+    Apenas um intervalo é suportado; pedidos com vários intervalos são
+    atendidos com o arquivo inteiro, como permite a RFC 9110.
+
+    Args:
+        header (str): valor do cabeçalho Range.
+        size (int): tamanho total do arquivo.
+
+    Returns:
+        tuple | None: (início, fim) inclusivos, ou None para enviar tudo.
+
+    Raises:
+        RangeNotSatisfiable: se o intervalo não tiver bytes dentro do arquivo.
+    """
+    match = _RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # sufixo: os últimos N bytes (nenhum, se o arquivo estiver vazio)
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, min(end, size - 1)
+
+
+def _if_range_passes(request, etag, last_modified):
+    """Verifica se o If-Range (quando enviado) ainda vale para o arquivo atual."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return if_range == http_date(last_modified)
+
+
+def _read_range(fileobj, start, length):
+    """Lê `length` bytes a partir de `start`, em blocos, e fecha o arquivo."""
+    try:
+        fileobj.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = fileobj.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        fileobj.close()
+
+
+async def _aread_range(fileobj, start, length):
+    """Versão assíncrona de `_read_range`: as leituras rodam em uma thread."""
+    try:
+        await asyncio.to_thread(fileobj.seek, start)
+        remaining = length
+        while remaining > 0:
+            data = await asyncio.to_thread(fileobj.read, min(STREAM_CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        await asyncio.to_thread(fileobj.close)
+
+
+def _set_common_headers(response, document, etag, last_modified, as_attachment, encoding=None):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'none' if encoding and encoding.content else 'bytes'
+    # o arquivo depende de login: apenas o navegador pode guardá-lo, sempre revalidando
+    response['Cache-Control'] = 'private, no-cache'
+    if encoding and encoding.stored:
+        # a resposta muda conforme o Accept-Encoding do cliente
+        patch_vary_headers(response, ('Accept-Encoding',))
+    if document is not None:
+        response['Content-Type'] = document.file_type or 'application/octet-stream'
+        response['Content-Disposition'] = content_disposition_header(
+            as_attachment, document.file_name
+        )
+        if encoding and encoding.content:
+            response['Content-Encoding'] = encoding.content
+    return response
+
+
+class _Encoding:
+    """
+    Compressão do arquivo armazenado e da resposta.
+
+    Atributos:
+        stored (str): algoritmo do arquivo no armazenamento ('' se nenhum).
+        content (str): algoritmo da resposta; vazio quando o arquivo é
+            enviado descomprimido.
+    """
+
+    def __init__(self, request, document):
+        self.stored = path_encoding(document.file.name)
+        self.content = self.stored if self.stored and accepts_encoding(request, self.stored) else ''
+
+
+def _sendfile_response(document):
+    """Monta a resposta que delega o envio do arquivo ao proxy."""
+    mode = settings.DOCUMENTS_SENDFILE
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = (
+            settings.DOCUMENTS_SENDFILE_PREFIX.rstrip('/') + '/' + quote(document.file.name)
+        )
+    else:
+        response['X-Sendfile'] = document.file.path
+    return response
+
+
+def _early_response(request, document, etag, last_modified, as_attachment, encoding):
+    """Retorna a resposta que dispensa a leitura do arquivo (304/412 ou sendfile), se houver."""
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return _set_common_headers(conditional, None, etag, last_modified, as_attachment, encoding)
+
+    # o proxy não repassaria o Content-Encoding nem descomprimiria o arquivo
+    if settings.DOCUMENTS_SENDFILE and not encoding.stored:
+        response = _sendfile_response(document)
+        return _set_common_headers(response, document, etag, last_modified, as_attachment, encoding)
+    return None
+
+
+def _requested_range(request, etag, last_modified, size, encoding):
+    """Retorna o intervalo pedido (ou None) para um arquivo de `size` bytes."""
+    # a versão comprimida é sempre enviada inteira
+    if request.method == 'GET' and not encoding.content and _if_range_passes(request, etag, last_modified):
+        return parse_range(request.headers.get('Range'), size)
+    return None
+
+
+def _range_not_satisfiable(size, etag, last_modified, as_attachment, encoding):
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{size}'
+    return _set_common_headers(response, None, etag, last_modified, as_attachment, encoding)
+
+
+def _partial_response(streaming_content, start, end, size):
+    response = StreamingHttpResponse(streaming_content, status=206)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def _content_size(document, encoding):
+    """Tamanho do corpo da resposta completa: o do arquivo armazenado ou o original."""
+    if encoding.stored and not encoding.content:
+        return document.file_size
+    return document.file.size
+
+
+def _open_content(document, encoding):
+    """Abre o arquivo para envio, descomprimindo-o se o cliente não aceitar a compressão."""
+    fileobj = document.file.open('rb')
+    if encoding.stored and not encoding.content:
+        return decoded(fileobj, encoding.stored)
+    return fileobj
+
+
+def serve_document(request, document, as_attachment=True):
+    """
+    Gera a resposta de download de um documento.
+
+    Deve ser chamada apenas depois de verificadas as permissões do usuário.
+
+    Args:
+        request (HttpRequest): requisição de download.
+        document (Document): documento a ser entregue.
+        as_attachment (bool): se False, o navegador exibe o arquivo
+            (ex: PDFs e imagens) em vez de baixá-lo.
+
+    Returns:
+        HttpResponse: 304/412, 206, 416 ou o arquivo completo (200).
+    """
+    encoding = _Encoding(request, document)
+    etag = document_etag(document, encoding.content)
+    last_modified = document_last_modified(document)
+
+    response = _early_response(request, document, etag, last_modified, as_attachment, encoding)
+    if response is not None:
+        return response
+
+    size = _content_size(document, encoding)
+    try:
+        byte_range = _requested_range(request, etag, last_modified, size, encoding)
+    except RangeNotSatisfiable:
+        return _range_not_satisfiable(size, etag, last_modified, as_attachment, encoding)
+
+    fileobj = _open_content(document, encoding)
+    if byte_range is not None:
+        start, end = byte_range
+        response = _partial_response(_read_range(fileobj, start, end - start + 1), start, end, size)
+    elif encoding.stored and not encoding.content:
+        response = StreamingHttpResponse(_read_range(fileobj, 0, size))
+        response['Content-Length'] = str(size)
+    else:
+        response = FileResponse(fileobj, as_attachment=as_attachment)
+
+    return _set_common_headers(response, document, etag, last_modified, as_attachment, encoding)
+
+
+async def aserve_document(request, document, as_attachment=True):
+    """
+    Versão assíncrona de `serve_document`, usada pelas views assíncronas.
+
+    Abertura, tamanho e leitura do arquivo rodam em threads, sem bloquear o
+    event loop. Sob WSGI (onde a resposta é consumida de forma síncrona) o
+    conteúdo é enviado com o iterador síncrono, como em `serve_document`.
+
+    Args:
+        request (HttpRequest): requisição de download.
+        document (Document): documento a ser entregue.
+        as_attachment (bool): se False, o navegador exibe o arquivo.
+
+    Returns:
+        HttpResponse: 304/412, 206, 416 ou o arquivo completo (200).
+    """
+    encoding = _Encoding(request, document)
+    etag = document_etag(document, encoding.content)
+    last_modified = document_last_modified(document)
+
+    response = _early_response(request, document, etag, last_modified, as_attachment, encoding)
+    if response is not None:
+        return response
+
+    size = await asyncio.to_thread(_content_size, document, encoding)
+    try:
+        byte_range = _requested_range(request, etag, last_modified, size, encoding)
+    except RangeNotSatisfiable:
+        return _range_not_satisfiable(size, etag, last_modified, as_attachment, encoding)
+
+    fileobj = await asyncio.to_thread(_open_content, document, encoding)
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+    length = end - start + 1
+    if isinstance(request, ASGIRequest):
+        content = _aread_range(fileobj, start, length)
+    else:
+        content = _read_range(fileobj, start, length)
+
+    if byte_range is None:
+        response = StreamingHttpResponse(content)
+        response['Content-Length'] = str(size)
+    else:
+        response = _partial_response(content, start, end, size)
+
+    return _set_common_headers(response, document, etag, last_modified, as_attachment, encoding)
@@ -0,0 +1,271 @@
+"""
+export.py
+
+Exportação de documentos em um arquivo .zip (view `documents_export` e
+comando `export_documents`).
+
+O .zip é montado durante o envio, sem arquivo temporário: o `ZipFile`
+escreve em um destino não pesquisável (os tamanhos e o CRC de cada arquivo
+vão no descritor depois dos dados) e os bytes são repassados ao cliente à
+medida que são produzidos. A memória usada não depende do tamanho dos
+arquivos; apenas o diretório central (algumas centenas de bytes por
+arquivo) fica em memória até o fim.
+
+Conteúdo do .zip:
+- 'manifest.csv' ou 'manifest.json': metadados dos documentos exportados;
+- 'documentos/<id>-<nome original>': os arquivos, já descomprimidos do
+  armazenamento;
+- 'erros.txt': arquivos que não puderam ser lidos, se houver.
+
+Notas:
+    - Formatos que já são comprimidos (pdf, docx, imagens...) são guardados
+      sem compressão (ZIP_STORED); os demais usam deflate.
+    - Arquivos e arquivos .zip acima de 4GB usam as extensões ZIP64.
+    - Os documentos são lidos em lotes pela chave primária, então nenhuma
+      consulta fica aberta durante o envio.
+"""
+
+import csv
+import io
+import json
+import os
+import zipfile
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from .compression import SAMPLE_SIZE, is_compressed_format, open_document_file
+from .models import Document
+from .search import search_query
+from .streaming import aiterate
+
+# Documentos lidos do banco por consulta
+EXPORT_BATCH_SIZE = 500
+
+# Tamanho dos blocos lidos dos arquivos
+READ_CHUNK_SIZE = 256 * 1024
+
+# Nível do deflate: exportações grandes são limitadas pela CPU
+DEFLATE_LEVEL = 6
+
+MANIFEST_FORMATS = ('csv', 'json')
+
+MANIFEST_FIELDS = [
+    'id', 'path', 'title', 'description', 'author', 'file_name', 'file_size',
+    'file_type', 'sha256', 'uploaded_at', 'updated_at',
+]
+
+# Menor data representável em um .zip
+_MIN_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
+class _ZipSink:
+    """Destino do `ZipFile`: acumula os bytes escritos até serem enviados."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Retorna (e descarta) os bytes escritos desde a última chamada."""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_queryset(ids=None, search='', author='', date_from=None, date_to=None):
+    """
+    Seleciona os documentos a exportar (fora da lixeira).
+
+    Sem nenhum filtro, todos os documentos são selecionados.
+
+    Args:
+        ids (list[int] | None): IDs dos documentos.
+        search (str): termos da busca textual.
+        author (str): username do autor.
+        date_from (date | None): enviados a partir desta data.
+        date_to (date | None): enviados até esta data (inclusive).
+
+    Returns:
+        QuerySet: documentos selecionados.
+    """
+    documents = Document.objects.defer('content', 'search_vector').select_related('author')
+    if ids:
+        documents = documents.filter(pk__in=ids)
+    if search:
+        documents = documents.filter(search_vector=search_query(search))
+    if author:
+        documents = documents.filter(author__username=author)
+    if date_from:
+        documents = documents.filter(uploaded_at__date__gte=date_from)
+    if date_to:
+        documents = documents.filter(uploaded_at__date__lte=date_to)
+    return documents
+
+
+def _iter_documents(queryset, batch_size):
+    """Percorre os documentos em lotes pela chave primária."""
+    last = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last).order_by('pk')[:batch_size])
+        if not batch:
+            return
+        yield from batch
+        last = batch[-1].pk
+
+
+def archive_path(document):
+    """
+    Retorna o caminho de um documento dentro do .zip.
+
+    O ID no início evita colisões entre documentos com o mesmo nome.
+
+    Args:
+        document (Document): documento exportado.
+
+    Returns:
+        str: caminho como 'documentos/42-relatorio.pdf'.
+    """
+    name = os.path.basename(document.file_name.replace('\\', '/')) or 'arquivo'
+    return f'documentos/{document.pk}-{name}'
+
+
+def manifest_row(document):
+    """Metadados de um documento no manifesto."""
+    return {
+        'id': document.pk,
+        'path': archive_path(document),
+        'title': document.title,
+        'description': document.description,
+        'author': document.author.username if document.author else '',
+        'file_name': document.file_name,
+        'file_size': document.file_size,
+        'file_type': document.file_type,
+        'sha256': document.blob_id or '',
+        'uploaded_at': document.uploaded_at.isoformat(),
+        'updated_at': document.updated_at.isoformat(),
+    }
+
+
+def _zip_info(name, moment, compress_type, file_size=0):
+    date_time = timezone.localtime(moment).timetuple()[:6]
+    info = zipfile.ZipInfo(name, date_time=max(date_time, _MIN_DATE_TIME))
+    info.compress_type = compress_type
+    # o tamanho declarado decide se a entrada precisa do ZIP64
+    info.file_size = file_size
+    return info
+
+
+def _write_manifest(archive, sink, queryset, manifest, batch_size):
+    """Grava o manifesto, repassando os bytes a cada lote."""
+    info = _zip_info(f'manifest.{manifest}', timezone.now(), zipfile.ZIP_DEFLATED)
+    with archive.open(info, 'w') as entry, io.TextIOWrapper(entry, encoding='utf-8', newline='') as text:
+        if manifest == 'csv':
+            writer = csv.DictWriter(text, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+        else:
+            text.write('[')
+        for index, document in enumerate(_iter_documents(queryset, batch_size)):
+            row = manifest_row(document)
+            if manifest == 'csv':
+                writer.writerow(row)
+            else:
+                text.write(',\n' if index else '\n')
+                text.write(json.dumps(row, ensure_ascii=False))
+            if index % batch_size == batch_size - 1:
+                text.flush()
+                yield sink.drain()
+        if manifest == 'json':
+            text.write('\n]\n')
+    yield sink.drain()
+
+
+def _write_document(archive, sink, document):
+    """Grava o arquivo de um documento no .zip, repassando os bytes a cada bloco."""
+    with open_document_file(document) as source:
+        data = source.read(READ_CHUNK_SIZE)
+        compress_type = (
+            zipfile.ZIP_STORED if is_compressed_format(document.file_name, data[:SAMPLE_SIZE])
+            else zipfile.ZIP_DEFLATED
+        )
+        info = _zip_info(archive_path(document), document.uploaded_at, compress_type, document.file_size)
+        with archive.open(info, 'w') as entry:
+            while data:
+                entry.write(data)
+                yield sink.drain()
+                data = source.read(READ_CHUNK_SIZE)
+    yield sink.drain()
+
+
+def _generate_export(queryset, manifest, batch_size):
+    # o manifesto e os arquivos percorrem a mesma seleção: novos documentos ficam de fora
+    last_pk = queryset.order_by('-pk').values_list('pk', flat=True).first() or 0
+    queryset = queryset.filter(pk__lte=last_pk)
+    sink = _ZipSink()
+    errors = []
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=DEFLATE_LEVEL, allowZip64=True) as archive:
+        yield from _write_manifest(archive, sink, queryset, manifest, batch_size)
+        for document in _iter_documents(queryset, batch_size):
+            try:
+                yield from _write_document(archive, sink, document)
+            except OSError as e:
+                # arquivo ausente no armazenamento: o restante é exportado
+                errors.append(f'{archive_path(document)}: {e}')
+        if errors:
+            archive.writestr(
+                _zip_info('erros.txt', timezone.now(), zipfile.ZIP_DEFLATED),
+                '\n'.join(errors) + '\n',
+            )
+    yield sink.drain()
+
+
+def stream_export(queryset, manifest='csv', batch_size=EXPORT_BATCH_SIZE):
+    """
+    Gera o .zip de uma seleção de documentos, em blocos.
+
+    Args:
+        queryset (QuerySet): documentos a exportar (ver `export_queryset`).
+        manifest (str): formato do manifesto ('csv' ou 'json').
+        batch_size (int): documentos lidos do banco por consulta.
+
+    Yields:
+        bytes: partes consecutivas (não vazias) do arquivo .zip.
+    """
+    for chunk in _generate_export(queryset, manifest, batch_size):
+        if chunk:
+            yield chunk
+
+
+def export_response(request, queryset, manifest='csv'):
+    """
+    Monta a resposta de download do .zip de uma seleção de documentos.
+
+    Em modo ASGI, o conteúdo é enviado com um iterador assíncrono (o
+    Django acumularia em memória um iterador síncrono inteiro antes de
+    enviá-lo); em WSGI, com o gerador síncrono.
+
+    Args:
+        request (HttpRequest): requisição de exportação.
+        queryset (QuerySet): documentos a exportar.
+        manifest (str): formato do manifesto ('csv' ou 'json').
+
+    Returns:
+        StreamingHttpResponse: arquivo .zip, sem Content-Length.
+    """
+    content = stream_export(queryset, manifest)
+    if isinstance(request, ASGIRequest):
+        content = aiterate(content)
+    response = StreamingHttpResponse(content, content_type='application/zip')
+    file_name = f'documentos-{timezone.localtime():%Y%m%d-%H%M%S}.zip'
+    response['Content-Disposition'] = content_disposition_header(True, file_name)
+    response['Cache-Control'] = 'private, no-store'
+    return response
@@ -0,0 +1,123 @@
+"""
+extraction.py
+
+Extrai o texto dos arquivos enviados para alimentar a busca textual.
+
+Formatos suportados:
+- .txt e .csv: decodificados diretamente (UTF-8, com fallback para latin-1).
+- .docx e .xlsx: lidos como pacotes ZIP/XML, sem dependências externas.
+- .pdf: lido com `pypdf`, página a página.
+
+Notas:
+    - O texto extraído é limitado a `MAX_TEXT_LENGTH` caracteres, já que o
+      `tsvector` do Postgres não aceita documentos muito grandes.
+    - Falhas de leitura nunca interrompem o upload: o documento apenas
+      fica pesquisável pelo título e pela descrição.
+"""
+
+import logging
+import re
+import zipfile
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+# Limite de caracteres extraídos por documento
+MAX_TEXT_LENGTH = 200_000
+
+# Limite de bytes lidos de arquivos de texto puro
+MAX_PLAIN_BYTES = 4 * 1024 * 1024
+
+_WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+def _decode(data):
+    """Decodifica bytes como UTF-8, recorrendo a latin-1 se necessário."""
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+
+def _extract_plain(fileobj):
+    return _decode(fileobj.read(MAX_PLAIN_BYTES))
+
+
+def _extract_docx(fileobj):
+    with zipfile.ZipFile(fileobj) as package:
+        root = ElementTree.fromstring(package.read('word/document.xml'))
+    paragraphs = []
+    for paragraph in root.iter(f'{_WORD_NS}p'):
+        text = ''.join(node.text or '' for node in paragraph.iter(f'{_WORD_NS}t'))
+        if text:
+            paragraphs.append(text)
+    return '\n'.join(paragraphs)
+
+
+def _extract_xlsx(fileobj):
+    parts = []
+    with zipfile.ZipFile(fileobj) as package:
+        names = package.namelist()
+        if 'xl/sharedStrings.xml' in names:
+            root = ElementTree.fromstring(package.read('xl/sharedStrings.xml'))
+            for item in root.iter(f'{_SHEET_NS}si'):
+                parts.append(''.join(node.text or '' for node in item.iter(f'{_SHEET_NS}t')))
+        # textos gravados diretamente nas células (inlineStr)
+        for name in names:
+            if name.startswith('xl/worksheets/') and name.endswith('.xml'):
+                root = ElementTree.fromstring(package.read(name))
+                for cell in root.iter(f'{_SHEET_NS}is'):
+                    parts.append(''.join(node.text or '' for node in cell.iter(f'{_SHEET_NS}t')))
+    return '\n'.join(part for part in parts if part)
+
+
+def _extract_pdf(fileobj):
+    from pypdf import PdfReader
+
+    reader = PdfReader(fileobj)
+    pages = []
+    length = 0
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        pages.append(text)
+        length += len(text)
+        if length >= MAX_TEXT_LENGTH:
+            break
+    return '\n'.join(pages)
+
+
+EXTRACTORS = {
+    '.txt': _extract_plain,
+    '.csv': _extract_plain,
+    '.docx': _extract_docx,
+    '.xlsx': _extract_xlsx,
+    '.pdf': _extract_pdf,
+}
+
+
+def extract_text(fileobj, extension):
+    """
+    Extrai o texto de um arquivo de acordo com sua extensão.
+
+    Args:
+        fileobj (File): arquivo aberto em modo binário (precisa permitir seek).
+        extension (str): extensão do arquivo (ex: '.pdf').
+
+    Returns:
+        str: texto extraído, normalizado e truncado; vazio se o formato
+        não for suportado ou se a leitura falhar.
+    """
+    extractor = EXTRACTORS.get((extension or '').lower())
+    if extractor is None:
+        return ''
+
+    try:
+        text = extractor(fileobj)
+    except Exception as e:
+        logger.warning('Falha ao extrair texto (%s): %s', extension, e)
+        return ''
+
+    # remove caracteres nulos (não aceitos pelo Postgres) e espaços repetidos
+    text = re.sub(r'[ \t\r\f\v]+', ' ', text.replace('\x00', ''))
+    return text[:MAX_TEXT_LENGTH].strip()
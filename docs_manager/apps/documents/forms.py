@@ -5,17 +5,62 @@ Define os formulários da aplicação para criação de documentos e comentário
 
 Formulários disponíveis:
 - DocumentForm: usado para upload e validação de documentos.
+- UploadSessionForm: usado para abrir um upload em partes (retomável).
+- UploadFinalizeForm: usado para informar os dados do documento ao
+  finalizar um upload em partes.
+- BulkUploadForm: usado para importar vários arquivos (ou arquivos .zip)
+  de uma vez.
+- ExportForm: usado para selecionar os documentos exportados em .zip.
+- RevisionForm: usado para enviar uma nova versão de um documento.
+- ShareForm: usado para compartilhar um documento com um usuário ou grupo.
 - CommentForm: usado para criar comentários associados a documentos.
 
 Notas:
     - O DocumentForm inclui validação de tamanho máximo de arquivo (50MB)
       e checagem de extensões permitidas.
+    - O DocumentForm aceita apenas o hash SHA-256 no lugar do arquivo quando
+      o conteúdo já está armazenado no servidor.
     - O CommentForm usa widgets personalizados para melhor UX.
 """
 
 import os
+import re
 from django import forms
-from .models import Document, Comment
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from .models import Document, Comment, DocumentShare
+from .permissions import can_reuse_blob
+
+
+# tamanho máximo: 50MB
+MAX_FILE_SIZE = 50 * 1024 * 1024
+
+# extensões permitidas
+ALLOWED_EXTENSIONS = {
+    'pdf', 'doc', 'docx', 'txt', 'xlsx', 'csv',
+    'jpg', 'jpeg', 'png', 'gif'
+}
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def validate_file_name(name):
+    """
+    Verifica se a extensão do arquivo está entre as permitidas.
+
+    Args:
+        name (str): nome original do arquivo.
+
+    Raises:
+        forms.ValidationError: se a extensão não for permitida.
+    """
+    ext = os.path.splitext(name)[1].lower().lstrip('.')
+
+    if ext not in ALLOWED_EXTENSIONS:
+        raise forms.ValidationError(
+            'Tipo de arquivo não permitido! '
+            f'Extensões aceitas: {", ".join(sorted(ALLOWED_EXTENSIONS))}'
+        )
 
 
 class DocumentForm(forms.ModelForm):
@@ -26,11 +71,21 @@ class DocumentForm(forms.ModelForm):
         title: título do documento.
         description: descrição opcional.
         file: arquivo a ser enviado.
+        sha256: hash do conteúdo, enviado no lugar do arquivo quando o
+            servidor já o possui.
+        source_name: nome original do arquivo quando apenas o hash é enviado.
+        source_type: tipo MIME do arquivo quando apenas o hash é enviado.
 
     Validações:
         - Tamanho máximo do arquivo: 50MB.
         - Extensões permitidas: pdf, doc, docx, txt, xlsx, csv, jpg, jpeg, png, gif.
+        - Sem arquivo, o hash precisa corresponder a um conteúdo existente
+          que o usuário possa reutilizar (ver `can_reuse_blob`).
     """
+    sha256 = forms.CharField(required=False, max_length=64, widget=forms.HiddenInput)
+    source_name = forms.CharField(required=False, max_length=255, widget=forms.HiddenInput)
+    source_type = forms.CharField(required=False, max_length=100, widget=forms.HiddenInput)
+
     class Meta:
         model = Document
         fields = ['title', 'description', 'file']
@@ -53,6 +108,15 @@ class DocumentForm(forms.ModelForm):
             })
         }
 
+    def __init__(self, *args, upload_error=None, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # o arquivo pode ser omitido quando o hash de um conteúdo existente é enviado
+        self.fields['file'].required = False
+        # erro do recebimento do arquivo (ex: envio interrompido por tamanho)
+        self.upload_error = upload_error
+        # usuário que faz o upload, para validar o atalho por hash
+        self.user = user
+
     def clean_file(self):
         """
         Valida o arquivo enviado pelo usuário.
@@ -66,35 +130,274 @@ class DocumentForm(forms.ModelForm):
         Returns:
             UploadedFile: arquivo validado.
         """
+        if self.upload_error:
+            raise forms.ValidationError(self.upload_error)
+
         file = self.cleaned_data.get('file')
         if not file:
             return file
 
-        # tamanho máximo: 50MB
-        max_size = 50 * 1024 * 1024
-        if file.size > max_size:
+        if file.size > MAX_FILE_SIZE:
             raise forms.ValidationError(
                 f'Arquivo muito grande! Máx 50MB '
                 f'({file.size / 1024 / 1024:.2f}MB)'
             )
 
-        # extensões permitidas
-        allowed_extensions = {
-            'pdf', 'doc', 'docx', 'txt', 'xlsx', 'csv',
-            'jpg', 'jpeg', 'png', 'gif'
-        }
+        validate_file_name(file.name)
+
+        return file
+
+    def clean_sha256(self):
+        """Normaliza o hash informado e verifica seu formato."""
+        sha256 = self.cleaned_data.get('sha256', '').strip().lower()
+        if sha256 and not SHA256_RE.match(sha256):
+            raise forms.ValidationError('Hash SHA-256 inválido.')
+        return sha256
+
+    def clean(self):
+        """
+        Exige o arquivo ou o hash de um conteúdo já armazenado.
+
+        Raises:
+            forms.ValidationError: se nenhum dos dois for enviado, se o hash
+                não corresponder a um conteúdo existente ou se o nome
+                informado tiver extensão inválida.
+        """
+        cleaned_data = super().clean()
+        if cleaned_data.get('file') or self.has_error('file'):
+            return cleaned_data
+
+        sha256 = cleaned_data.get('sha256')
+        if not sha256:
+            self.add_error('file', 'Selecione um arquivo.')
+            return cleaned_data
 
-        ext = os.path.splitext(file.name)[1].lower().lstrip('.')
+        if self.user is None or not can_reuse_blob(self.user, sha256):
+            self.add_error('file', 'Conteúdo não encontrado no servidor. Envie o arquivo.')
+            return cleaned_data
 
-        if ext not in allowed_extensions:
+        try:
+            validate_file_name(cleaned_data.get('source_name', ''))
+        except forms.ValidationError as e:
+            self.add_error('file', e)
+        return cleaned_data
+
+
+class UploadSessionForm(forms.Form):
+    """
+    Formulário para abrir uma sessão de upload em partes.
+
+    Campos:
+        file_name: nome original do arquivo.
+        file_size: tamanho total do arquivo em bytes.
+        file_type: tipo MIME do arquivo (opcional).
+        sha256: hash do arquivo completo (opcional); se o conteúdo já
+            existir no servidor, nenhuma parte precisa ser enviada.
+
+    Validações:
+        - Tamanho máximo definido por `DOCUMENTS_MAX_UPLOAD_SIZE`.
+        - Mesmas extensões permitidas pelo DocumentForm.
+    """
+    file_name = forms.CharField(max_length=255)
+    file_size = forms.IntegerField(min_value=1)
+    file_type = forms.CharField(max_length=100, required=False)
+    sha256 = forms.CharField(max_length=64, required=False)
+
+    def clean_file_name(self):
+        """Valida a extensão do arquivo."""
+        file_name = os.path.basename(self.cleaned_data['file_name'])
+        validate_file_name(file_name)
+        return file_name
+
+    def clean_file_size(self):
+        """Verifica se o arquivo não excede o limite do upload em partes."""
+        file_size = self.cleaned_data['file_size']
+        max_size = settings.DOCUMENTS_MAX_UPLOAD_SIZE
+        if file_size > max_size:
             raise forms.ValidationError(
-                'Tipo de arquivo não permitido! '
-                f'Extensões aceitas: {", ".join(sorted(allowed_extensions))}'
+                f'Arquivo muito grande! Máx {max_size / 1024 / 1024:.0f}MB '
+                f'({file_size / 1024 / 1024:.2f}MB)'
             )
+        return file_size
+
+    def clean_sha256(self):
+        """Normaliza o hash informado e verifica seu formato."""
+        sha256 = self.cleaned_data.get('sha256', '').strip().lower()
+        if sha256 and not SHA256_RE.match(sha256):
+            raise forms.ValidationError('Hash SHA-256 inválido.')
+        return sha256
+
+
+class UploadFinalizeForm(forms.ModelForm):
+    """
+    Formulário com os dados do documento criado ao finalizar um upload em partes.
+
+    Campos:
+        title: título do documento.
+        description: descrição opcional.
+    """
+    class Meta:
+        model = Document
+        fields = ['title', 'description']
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    """Campo de arquivo que permite selecionar vários arquivos."""
+    allow_multiple_selected = True
+
 
+class MultipleFileField(forms.FileField):
+    """Campo que recebe uma lista de arquivos."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)]
+
+
+class BulkUploadForm(forms.Form):
+    """
+    Formulário para importação de documentos em lote.
+
+    Campos:
+        files: arquivos a importar; arquivos .zip são expandidos.
+        description: descrição opcional aplicada a todos os documentos.
+
+    Validações:
+        - Cada arquivo é validado individualmente na importação (mesmas
+          regras do DocumentForm), e as falhas aparecem no relatório sem
+          impedir a importação dos demais.
+    """
+    files = MultipleFileField(widget=MultipleFileInput(attrs={
+        'class': 'form-control',
+        'accept': (
+            '.pdf,.doc,.docx,.txt,.xlsx,.csv,'
+            '.jpg,.jpeg,.png,.gif,.zip'
+        )
+    }))
+    description = forms.CharField(required=False, widget=forms.Textarea(attrs={
+        'class': 'form-control',
+        'rows': 3,
+        'placeholder': 'Descrição aplicada a todos os documentos (opcional)'
+    }))
+
+
+class ExportForm(forms.Form):
+    """
+    Formulário (GET) com a seleção de documentos a exportar.
+
+    Campos:
+        ids: IDs separados por vírgula (opcional).
+        search: termos da busca textual (opcional).
+        author: username do autor (opcional).
+        date_from / date_to: intervalo das datas de envio (opcional).
+        manifest: formato do manifesto ('csv' ou 'json').
+
+    Sem nenhum filtro, todos os documentos são exportados.
+    """
+    ids = forms.CharField(required=False)
+    search = forms.CharField(required=False, max_length=255)
+    author = forms.CharField(required=False, max_length=150)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    manifest = forms.ChoiceField(choices=[('csv', 'CSV'), ('json', 'JSON')], required=False)
+
+    def clean_ids(self):
+        """Converte a lista de IDs separados por vírgula."""
+        value = self.cleaned_data.get('ids', '')
+        try:
+            return [int(item) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise forms.ValidationError('Lista de IDs inválida.')
+
+    def clean_manifest(self):
+        """Usa o manifesto em CSV quando nenhum formato é informado."""
+        return self.cleaned_data.get('manifest') or 'csv'
+
+    def clean(self):
+        """Verifica se o intervalo de datas é válido."""
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('A data inicial deve ser anterior à data final.')
+        return cleaned_data
+
+
+class RevisionForm(forms.Form):
+    """
+    Formulário para envio de uma nova versão de um documento.
+
+    Campos:
+        file: arquivo da nova versão.
+
+    Validações:
+        - Mesmas regras do DocumentForm (50MB e extensões permitidas).
+    """
+    file = forms.FileField(widget=forms.FileInput(attrs={
+        'class': 'form-control',
+        'accept': (
+            '.pdf,.doc,.docx,.txt,.xlsx,.csv,'
+            '.jpg,.jpeg,.png,.gif'
+        )
+    }))
+
+    def clean_file(self):
+        """Valida o tamanho e a extensão do arquivo."""
+        file = self.cleaned_data['file']
+        if file.size > MAX_FILE_SIZE:
+            raise forms.ValidationError(
+                f'Arquivo muito grande! Máx 50MB '
+                f'({file.size / 1024 / 1024:.2f}MB)'
+            )
+        validate_file_name(file.name)
         return file
 
 
+class ShareForm(forms.Form):
+    """
+    Formulário para compartilhar um documento.
+
+    Campos:
+        target: username do usuário ou nome do grupo que recebe o acesso.
+        level: nível de acesso (visualizar, comentar ou excluir).
+
+    Validações:
+        - O destinatário precisa existir; usuários têm prioridade sobre
+          grupos com o mesmo nome.
+    """
+    target = forms.CharField(max_length=150, widget=forms.TextInput(attrs={
+        'class': 'form-control',
+        'placeholder': 'Usuário ou grupo'
+    }))
+    level = forms.TypedChoiceField(
+        choices=DocumentShare.LEVEL_CHOICES,
+        coerce=int,
+        initial=DocumentShare.LEVEL_VIEW,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
+    def clean_target(self):
+        """
+        Converte o nome informado no usuário ou grupo correspondente.
+
+        Returns:
+            dict: {'user': User} ou {'group': Group}.
+        """
+        name = self.cleaned_data['target'].strip()
+        user = User.objects.filter(username=name).first()
+        if user is not None:
+            return {'user': user}
+        group = Group.objects.filter(name=name).first()
+        if group is not None:
+            return {'group': group}
+        raise forms.ValidationError(f'Usuário ou grupo "{name}" não encontrado.')
+
+
 class CommentForm(forms.ModelForm):
     """
     Formulário para criação de comentários em documentos.
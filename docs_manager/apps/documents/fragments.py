@@ -0,0 +1,106 @@
+"""
+fragments.py
+
+Cache dos cards renderizados da listagem de documentos.
+
+O HTML de cada card (ícones, miniatura, autor, tamanho, contagem de
+comentários) é guardado no cache com a chave 'documents:card:<id>' e só é
+renderizado de novo quando o documento ou seus comentários mudam. As
+partes que dependem de quem vê a página ou da busca (botão de exclusão e
+trecho destacado) ficam fora do cache: o HTML guardado é dividido nos
+marcadores `CARD_SLOT` e a listagem as insere entre os pedaços.
+
+Notas:
+    - O backend do cache é definido por `CACHE_BACKEND` nas configurações
+      (memória local, arquivos ou banco de dados).
+    - Cada entrada guarda também a versão do documento (data de
+      atualização, contagem de comentários, versão da miniatura e nome
+      exibido do autor); uma entrada com versão diferente é descartada
+      mesmo que o sinal de invalidação não tenha chegado a tempo. Assim,
+      renomear um usuário atualiza os cards dos seus documentos sem
+      percorrê-los.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = 'documents/_document_card.html'
+
+# Marcador das partes do card que ficam fora do cache
+CARD_SLOT = '<!-- card-slot -->'
+
+# Versão do template do card: alterá-la descarta os cards já em cache
+CARD_TEMPLATE_VERSION = 2
+
+
+def card_cache_key(document_id):
+    """Retorna a chave de cache do card de um documento."""
+    return f'documents:card:{document_id}'
+
+
+def _author_marker(author):
+    """Partes do autor exibidas no card (ver `CARD_TEMPLATE`)."""
+    if author is None:
+        return ''
+    return f'{author.username}|{author.first_name}|{author.last_name}'
+
+
+def _card_version(document):
+    return (
+        f'{CARD_TEMPLATE_VERSION}:{document.updated_at.timestamp()}:'
+        f'{document.comments_count}:{document.derivative_version}:'
+        f'{_author_marker(document.author)}'
+    )
+
+
+def _render_card(document):
+    parts = render_to_string(CARD_TEMPLATE, {'document': document}).split(CARD_SLOT)
+    return tuple(parts)
+
+
+def attach_cards(documents):
+    """
+    Adiciona a cada documento o HTML do seu card, em `document.card`.
+
+    Os cards são lidos do cache com uma única consulta ao backend; os que
+    faltam são renderizados e gravados de uma vez. `card` é uma tupla com
+    os pedaços do HTML: antes do trecho da busca, entre o trecho e o botão
+    de exclusão e depois do botão.
+
+    Deve ser chamada depois de `attach_derivatives`.
+
+    Args:
+        documents (Iterable[Document]): documentos exibidos na página, com
+            o autor já carregado.
+    """
+    documents = list(documents)
+    cached = cache.get_many([card_cache_key(document.pk) for document in documents])
+    missing = {}
+    for document in documents:
+        key = card_cache_key(document.pk)
+        version = _card_version(document)
+        entry = cached.get(key)
+        if entry is not None and entry[0] == version:
+            parts = entry[1]
+        else:
+            parts = _render_card(document)
+            missing[key] = (version, parts)
+        document.card = tuple(mark_safe(part) for part in parts)
+    if missing:
+        cache.set_many(missing, settings.DOCUMENTS_CARD_CACHE_TIMEOUT)
+
+
+def invalidate_card(document_id):
+    """
+    Remove do cache o card de um documento, após o commit da transação atual.
+
+    Esperar o commit evita que uma requisição concorrente grave de novo no
+    cache a versão antiga, ainda visível no banco.
+
+    Args:
+        document_id (int): ID do documento alterado.
+    """
+    transaction.on_commit(lambda: cache.delete(card_cache_key(document_id)))
@@ -0,0 +1,122 @@
+"""
+benchmark.py
+
+Comando que mede o desempenho das views de documentos com uma carga de
+dados reproduzível (ver `apps/documents/benchmark.py`).
+
+O resultado (JSON) pode ser gravado e comparado com o de outra execução.
+O comando termina com erro se algum cenário passar do orçamento de
+consultas por requisição, o que permite usá-lo na integração contínua.
+
+Uso:
+    python manage.py benchmark --documents 2000 --comments 10000 --output atual.json
+    python manage.py benchmark --concurrency 16 --compare base.json
+    python manage.py benchmark --scenarios list details --requests 500
+    python manage.py benchmark --reset
+"""
+
+import json
+import platform
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.documents import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Gera uma carga de dados e mede latência, vazão e consultas das views de documentos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Usuários da carga de dados.')
+        parser.add_argument('--documents', type=int, default=500, help='Documentos da carga de dados.')
+        parser.add_argument('--comments', type=int, default=2000, help='Comentários da carga de dados.')
+        parser.add_argument('--seed', type=int, default=42, help='Semente da carga e dos alvos das requisições.')
+        parser.add_argument('--requests', type=int, default=200, help='Requisições por cenário.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requisições simultâneas.')
+        parser.add_argument(
+            '--scenarios', nargs='+', choices=[scenario.name for scenario in benchmark.SCENARIOS],
+            help='Cenários a executar (padrão: todos).',
+        )
+        parser.add_argument('--output', help='Arquivo onde gravar o resultado em JSON.')
+        parser.add_argument('--compare', help='Resultado (JSON) de uma execução anterior para comparação.')
+        parser.add_argument('--reset', action='store_true', help='Remove a carga de dados e encerra.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted = benchmark.reset()
+            self.stdout.write(self.style.SUCCESS(f'{deleted} documento(s) de benchmark removido(s).'))
+            return
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as fileobj:
+                    baseline = json.load(fileobj)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Não foi possível ler "{options["compare"]}": {e}')
+
+        started = time.monotonic()
+        volumes = benchmark.seed(
+            users=max(1, options['users']),
+            documents=max(1, options['documents']),
+            comments=max(0, options['comments']),
+            seed=options['seed'],
+        )
+        self.stderr.write(
+            f'Carga pronta em {time.monotonic() - started:.1f}s: {volumes["users"]} usuário(s), '
+            f'{volumes["documents"]} documento(s), {volumes["comments"]} comentário(s).'
+        )
+
+        users = list(benchmark.bench_users().order_by('pk'))
+        context = {
+            'users': users,
+            'documents': list(
+                benchmark.Document.objects.filter(author__in=users).values_list('pk', flat=True)
+            ),
+        }
+        selected = options['scenarios'] or [scenario.name for scenario in benchmark.SCENARIOS]
+        requests = max(1, options['requests'])
+        concurrency = max(1, options['concurrency'])
+
+        result = {
+            'meta': {
+                'seed': options['seed'],
+                'requests': requests,
+                'concurrency': concurrency,
+                'volumes': volumes,
+                'python': platform.python_version(),
+                'database': connection.vendor,
+                'timestamp': int(time.time()),
+            },
+            'scenarios': {},
+        }
+        for scenario in benchmark.SCENARIOS:
+            if scenario.name not in selected:
+                continue
+            self.stderr.write(f'Executando "{scenario.name}"...')
+            result['scenarios'][scenario.name] = benchmark.run_scenario(
+                scenario, requests, concurrency, context, seed=options['seed']
+            )
+
+        if baseline is not None:
+            result['comparison'] = benchmark.compare(result, baseline)
+
+        output = json.dumps(result, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fileobj:
+                fileobj.write(output + '\n')
+        self.stdout.write(output)
+
+        failures = [
+            f'{name}: {data["over_budget"]} requisição(ões) com mais de '
+            f'{data["queries_per_request"]["budget"]} consultas (máx {data["queries_per_request"]["max"]})'
+            for name, data in result['scenarios'].items() if data['over_budget']
+        ]
+        failures += [
+            f'{name}: {data["errors"]} requisição(ões) com status inesperado'
+            for name, data in result['scenarios'].items() if data['errors']
+        ]
+        if failures:
+            raise CommandError('Benchmark falhou:\n' + '\n'.join(failures))
@@ -0,0 +1,37 @@
+"""
+cleanup_upload_sessions.py
+
+Comando para descartar sessões de upload em partes expiradas.
+
+Remove as partes gravadas em disco e os registros das sessões cuja
+validade terminou, estejam elas abertas ou já concluídas, e os arquivos
+de uploads individuais abandonados em 'incoming/'.
+
+Uso:
+    python manage.py cleanup_upload_sessions
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.documents.models import UploadSession
+from apps.documents.upload_handlers import discard_stale_uploads
+from apps.documents.uploads import discard
+
+
+class Command(BaseCommand):
+    help = 'Remove sessões de upload em partes expiradas e suas partes em disco.'
+
+    def handle(self, *args, **options):
+        expired = UploadSession.objects.filter(expires_at__lt=timezone.now())
+
+        total = 0
+        for session in expired.iterator():
+            discard(session)
+            total += 1
+        expired.delete()
+
+        self.stdout.write(self.style.SUCCESS(f'{total} sessão(ões) removida(s).'))
+
+        stale = discard_stale_uploads()
+        self.stdout.write(self.style.SUCCESS(f'{stale} upload(s) abandonado(s) removido(s).'))
@@ -0,0 +1,49 @@
+"""
+compress_blobs.py
+
+Comando para comprimir os arquivos do armazenamento deduplicado gravados
+antes da compressão (ou com ela desativada).
+
+Apenas conteúdos que comprimem bem são regravados (ver `compression.py`);
+os documentos passam a apontar para o arquivo novo e o antigo é apagado.
+
+Uso:
+    python manage.py compress_blobs
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from apps.documents.compression import SUFFIXES, storage_encoding
+from apps.documents.models import Blob
+from apps.documents.storage import compress_blob
+
+
+class Command(BaseCommand):
+    help = 'Comprime os arquivos de texto já armazenados no armazenamento deduplicado.'
+
+    def handle(self, *args, **options):
+        if not storage_encoding():
+            raise CommandError('A compressão está desativada (DOCUMENTS_COMPRESSION).')
+
+        compressed = Q()
+        for suffix in SUFFIXES.values():
+            compressed |= Q(file__endswith=suffix)
+        pending = Blob.objects.exclude(compressed).order_by('pk').values_list('pk', flat=True)
+
+        count = before = after = 0
+        for sha256 in pending.iterator(chunk_size=500):
+            try:
+                sizes = compress_blob(sha256)
+            except OSError as e:
+                self.stderr.write(f'Blob {sha256}: arquivo indisponível ({e})')
+                continue
+            if sizes is None:
+                continue
+            count += 1
+            before += sizes[0]
+            after += sizes[1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{count} arquivo(s) comprimido(s): {before / 1024 / 1024:.2f}MB -> {after / 1024 / 1024:.2f}MB.'
+        ))
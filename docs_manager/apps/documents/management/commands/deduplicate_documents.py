@@ -0,0 +1,47 @@
+"""
+deduplicate_documents.py
+
+Comando para migrar documentos antigos para o armazenamento deduplicado.
+
+Cada arquivo em 'documents/' é movido para o blob correspondente ao seu
+SHA-256; cópias repetidas passam a compartilhar o mesmo arquivo físico.
+
+Uso:
+    python manage.py deduplicate_documents
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.documents.models import Document
+from apps.documents.storage import store_blob
+
+
+class Command(BaseCommand):
+    help = 'Move os arquivos de documentos antigos para o armazenamento endereçado por conteúdo.'
+
+    def handle(self, *args, **options):
+        documents = Document.all_objects.filter(blob__isnull=True).exclude(file='')
+        documents = documents.defer('content', 'search_vector').order_by('pk')
+
+        migrated = freed = 0
+        for document in documents.iterator(chunk_size=200):
+            old_name = document.file.name
+            try:
+                with document.file.open('rb') as fileobj, transaction.atomic():
+                    blob = store_blob(fileobj, file_name=document.file_name)
+                    document.blob = blob
+                    document.file = blob.file.name
+                    document.save(update_fields=['blob', 'file'])
+            except OSError as e:
+                self.stderr.write(f'Documento {document.pk}: arquivo indisponível ({e})')
+                continue
+
+            document.file.storage.delete(old_name)
+            migrated += 1
+            if blob.ref_count > 1:
+                freed += blob.size
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{migrated} documento(s) migrado(s); {freed / 1024 / 1024:.2f}MB liberados.'
+        ))
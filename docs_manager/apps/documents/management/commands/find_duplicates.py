@@ -0,0 +1,154 @@
+"""
+find_duplicates.py
+
+Comando para calcular as assinaturas de quase duplicatas dos documentos
+existentes e agrupar todo o acervo (ver `similarity.py`).
+
+Primeiro calcula, em lotes, as assinaturas que faltam (documentos enviados
+antes da detecção ou com `--rebuild`, todas). Depois carrega todas as
+assinaturas em uma única matriz (512 bytes por documento), agrupa os
+documentos parecidos e marca cada um como cópia do mais antigo do seu grupo.
+Pode ser agendado periodicamente: só as marcações alteradas são gravadas.
+
+Uso:
+    python manage.py find_duplicates
+    python manage.py find_duplicates --threshold 0.9
+    python manage.py find_duplicates --rebuild
+"""
+
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.documents.models import Document, DocumentSignature
+from apps.documents.similarity import (
+    band_hashes,
+    cluster_signatures,
+    decode_signatures,
+    encode_signature,
+    text_signature,
+)
+
+
+class Command(BaseCommand):
+    help = 'Calcula as assinaturas que faltam e marca os documentos quase duplicados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=None,
+            help='Similaridade mínima (0 a 1). Padrão: DOCUMENTS_DUPLICATE_THRESHOLD.',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recalcula todas as assinaturas, e não apenas as que faltam.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Documentos lidos e gravados por vez (padrão: 500).',
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = settings.DOCUMENTS_DUPLICATE_THRESHOLD
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        computed = self.compute_signatures(options['rebuild'], batch_size)
+        groups, copies, changed = self.mark_duplicates(threshold, batch_size)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{computed} assinatura(s) calculada(s); {copies} documento(s) marcado(s) '
+            f'como cópia em {groups} grupo(s); {changed} marcação(ões) alterada(s) '
+            f'em {elapsed:.1f}s.'
+        ))
+
+    def compute_signatures(self, rebuild, batch_size):
+        """Calcula e grava, em lotes, as assinaturas dos documentos ativos."""
+        documents = Document.objects.exclude(content='').only('pk', 'content').order_by('pk')
+        if not rebuild:
+            documents = documents.filter(signature__isnull=True)
+
+        computed = 0
+        batch = []
+        for document in documents.iterator(chunk_size=batch_size):
+            signature = text_signature(document.content)
+            if signature is None:
+                continue
+            batch.append(DocumentSignature(
+                document_id=document.pk,
+                minhash=encode_signature(signature),
+                bands=band_hashes(signature).tolist(),
+            ))
+            if len(batch) >= batch_size:
+                computed += self._save_signatures(batch)
+                batch = []
+        if batch:
+            computed += self._save_signatures(batch)
+        return computed
+
+    def _save_signatures(self, signatures):
+        DocumentSignature.objects.bulk_create(
+            signatures,
+            update_conflicts=True,
+            unique_fields=['document'],
+            update_fields=['minhash', 'bands', 'updated_at'],
+        )
+        return len(signatures)
+
+    def mark_duplicates(self, threshold, batch_size):
+        """
+        Agrupa as assinaturas dos documentos ativos e grava as marcações alteradas.
+
+        Returns:
+            tuple[int, int, int]: grupos, documentos marcados como cópia e
+                marcações alteradas.
+        """
+        rows = (
+            DocumentSignature.objects.filter(document__deleted_at__isnull=True)
+            .order_by('pk')
+            .values_list('pk', 'duplicate_of_id', 'similarity', 'minhash')
+        )
+        ids, current, minhashes = [], [], []
+        for pk, duplicate_of, similarity, minhash in rows.iterator(chunk_size=5000):
+            ids.append(pk)
+            current.append((duplicate_of, similarity))
+            minhashes.append(minhash)
+        if not ids:
+            return 0, 0, 0
+
+        matrix = decode_signatures(minhashes)
+        del minhashes
+        representatives, scores = cluster_signatures(matrix, threshold)
+
+        changed = []
+        for row, (pk, (old_duplicate_of, old_similarity)) in enumerate(zip(ids, current)):
+            duplicate_of = similarity = None
+            if representatives[row] != row:
+                duplicate_of = ids[representatives[row]]
+                similarity = float(scores[row])
+            if duplicate_of != old_duplicate_of or not _same_score(similarity, old_similarity):
+                changed.append(DocumentSignature(
+                    document_id=pk, duplicate_of_id=duplicate_of, similarity=similarity,
+                ))
+        DocumentSignature.objects.bulk_update(
+            changed, ['duplicate_of', 'similarity'], batch_size=batch_size
+        )
+
+        copies = representatives != np.arange(len(ids))
+        groups = len(np.unique(representatives[copies]))
+        return groups, int(copies.sum()), len(changed)
+
+
+def _same_score(a, b):
+    """Compara duas similaridades gravadas (None = sem marcação)."""
+    if a is None or b is None:
+        return a is b
+    return abs(a - b) < 1e-9
@@ -0,0 +1,27 @@
+"""
+generate_derivatives.py
+
+Comando para gerar as miniaturas e pré-visualizações dos documentos existentes.
+
+Uso:
+    python manage.py generate_derivatives
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.documents.derivatives import generate_derivatives
+from apps.documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Gera as miniaturas e pré-visualizações que ainda não existem.'
+
+    def handle(self, *args, **options):
+        documents = Document.objects.defer('content', 'search_vector').order_by('pk')
+
+        total = 0
+        for document in documents.iterator(chunk_size=200):
+            if generate_derivatives(document):
+                total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{total} documento(s) com derivados disponíveis.'))
@@ -0,0 +1,73 @@
+"""
+import_documents.py
+
+Comando para importar em lote os arquivos de uma pasta (ou de um .zip) do servidor.
+
+Cada arquivo é validado com as regras do upload (extensão e tamanho), os
+arquivos são gravados em paralelo e os documentos inseridos em lotes.
+Ao final, as falhas são listadas arquivo por arquivo.
+
+Uso:
+    python manage.py import_documents /caminho/para/pasta --author admin
+    python manage.py import_documents arquivo.zip --batch-size 1000 --workers 16
+"""
+
+import os
+import time
+import zipfile
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.documents.bulk import BATCH_SIZE, WRITE_WORKERS, directory_entries, import_entries, zip_entries
+
+
+class Command(BaseCommand):
+    help = 'Importa em lote os arquivos de uma pasta ou de um .zip como documentos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Pasta (percorrida recursivamente) ou arquivo .zip.')
+        parser.add_argument('--author', help='Usuário (username) definido como autor dos documentos.')
+        parser.add_argument('--description', default='', help='Descrição aplicada a todos os documentos.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Documentos inseridos por transação.')
+        parser.add_argument('--workers', type=int, default=WRITE_WORKERS, help='Threads que gravam os arquivos.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        author = None
+        if options['author']:
+            try:
+                author = get_user_model().objects.get(username=options['author'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'Usuário "{options["author"]}" não encontrado.')
+
+        started = time.monotonic()
+        import_options = {
+            'author': author,
+            'description': options['description'],
+            'batch_size': max(1, options['batch_size']),
+            'workers': max(1, options['workers']),
+        }
+        if os.path.isdir(path):
+            results = import_entries(directory_entries(path), **import_options)
+        elif zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                results = import_entries(zip_entries(archive), **import_options)
+        else:
+            raise CommandError(f'"{path}" não é uma pasta nem um arquivo .zip.')
+        elapsed = time.monotonic() - started
+
+        imported = 0
+        for result in results:
+            if result.ok:
+                imported += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'OK    {result.name} -> documento {result.document.pk}')
+            else:
+                self.stderr.write(f'ERRO  {result.name}: {result.error}')
+
+        rate = len(results) / elapsed * 60 if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{imported} documento(s) importado(s), {len(results) - imported} com falha '
+            f'em {elapsed:.1f}s ({rate:.0f} arquivos/min).'
+        ))
@@ -0,0 +1,43 @@
+"""
+purge_trash.py
+
+Comando para excluir em definitivo os documentos que estão na lixeira há
+mais de `DOCUMENTS_TRASH_RETENTION_DAYS` dias, junto com seus arquivos.
+
+Deve ser agendado para rodar periodicamente (ex: cron diário).
+
+Uso:
+    python manage.py purge_trash
+    python manage.py purge_trash --days 0 --batch-size 5000 --workers 16
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.documents.trash import BATCH_SIZE, DELETE_WORKERS, purge_trash
+
+
+class Command(BaseCommand):
+    help = 'Exclui em definitivo os documentos da lixeira que passaram do prazo de retenção.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help=f'Dias na lixeira antes da exclusão (padrão: {settings.DOCUMENTS_TRASH_RETENTION_DAYS}).',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Documentos excluídos por transação.')
+        parser.add_argument('--workers', type=int, default=DELETE_WORKERS, help='Threads que apagam os arquivos.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        documents, files = purge_trash(
+            days=None if options['days'] is None else max(0, options['days']),
+            batch_size=max(1, options['batch_size']),
+            workers=max(1, options['workers']),
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{documents} documento(s) excluído(s) e {files} arquivo(s) apagado(s) em {elapsed:.1f}s.'
+        ))
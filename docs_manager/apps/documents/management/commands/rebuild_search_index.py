@@ -0,0 +1,40 @@
+"""
+rebuild_search_index.py
+
+Comando para (re)indexar a busca textual dos documentos existentes.
+
+Uso:
+    python manage.py rebuild_search_index
+    python manage.py rebuild_search_index --no-extract
+"""
+
+from django.core.management.base import BaseCommand
+
+from apps.documents.models import Document
+from apps.documents.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = 'Extrai o texto dos arquivos e recalcula o tsvector de todos os documentos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-extract',
+            action='store_true',
+            help='Apenas recalcula o tsvector, sem ler os arquivos novamente.',
+        )
+
+    def handle(self, *args, **options):
+        extract = not options['no_extract']
+        documents = Document.all_objects.defer('content', 'search_vector').order_by('pk')
+
+        total = 0
+        for document in documents.iterator(chunk_size=200):
+            try:
+                update_search_index(document, extract=extract)
+            except OSError as e:
+                self.stderr.write(f'Documento {document.pk}: arquivo indisponível ({e})')
+                continue
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{total} documento(s) indexado(s).'))
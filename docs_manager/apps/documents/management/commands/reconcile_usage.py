@@ -0,0 +1,31 @@
+"""
+reconcile_usage.py
+
+Comando para reconstruir a tabela de uso do armazenamento (`StorageUsage`)
+a partir dos documentos ativos, em uma única agregação.
+
+Os totais são mantidos incrementalmente a cada upload e exclusão; este
+comando corrige divergências causadas por alterações feitas fora da
+aplicação (ex: direto no banco). Pode ser agendado periodicamente.
+
+Uso:
+    python manage.py reconcile_usage
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.documents.usage import reconcile_usage
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o uso de armazenamento por usuário e extensão a partir dos documentos.'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        corrected = reconcile_usage()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{corrected} linha(s) de uso corrigida(s) em {elapsed:.1f}s.'
+        ))
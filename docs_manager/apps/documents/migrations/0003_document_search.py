@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:29
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+
+def populate_search_vector(apps, schema_editor):
+    # documentos existentes passam a ser pesquisáveis pelo título e descrição;
+    # o conteúdo dos arquivos é indexado pelo comando rebuild_search_index
+    Document = apps.get_model('documents', 'Document')
+    config = settings.DOCUMENTS_SEARCH_CONFIG
+    Document.objects.update(
+        search_vector=(
+            SearchVector('title', weight='A', config=config)
+            + SearchVector('description', weight='B', config=config)
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_document_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Texto extraído do arquivo'),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='document_search_idx'),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
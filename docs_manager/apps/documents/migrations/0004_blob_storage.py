@@ -0,0 +1,33 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_document_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Conteúdo de arquivo',
+                'verbose_name_plural': 'Conteúdos de arquivos',
+            },
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documents', to='documents.blob'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:32
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_blob_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_size', models.BigIntegerField()),
+                ('file_type', models.CharField(blank=True, default='', max_length=100)),
+                ('sha256', models.CharField(blank=True, default='', max_length=64)),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('open', 'Aberta'), ('completed', 'Concluída')], default='open', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('document', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='documents.document')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sessão de upload',
+                'verbose_name_plural': 'Sessões de upload',
+            },
+        ),
+    ]
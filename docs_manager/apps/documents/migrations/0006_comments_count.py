@@ -0,0 +1,43 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_comments_count(apps, schema_editor):
+    # calcula o contador dos documentos existentes em um único UPDATE
+    Document = apps.get_model('documents', 'Document')
+    Comment = apps.get_model('documents', 'Comment')
+    counts = (
+        Comment.objects.filter(document=OuterRef('pk'))
+        .order_by()
+        .values('document')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Document.objects.update(
+        comments_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_upload_session'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['document', '-created_at', '-id'], name='comment_document_created_idx'),
+        ),
+        migrations.RunPython(populate_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:49
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_comments_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='document',
+            name='document_uploaded_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='document',
+            name='document_search_idx',
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['-uploaded_at', '-id'], name='document_uploaded_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('deleted_at__isnull', True)), fields=['search_vector'], name='document_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['-deleted_at', '-id'], name='document_trash_idx'),
+        ),
+    ]
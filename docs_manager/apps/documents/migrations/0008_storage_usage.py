@@ -0,0 +1,70 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_storage_usage(apps, schema_editor):
+    # agrega os documentos ativos existentes (as alterações seguintes são incrementais)
+    Document = apps.get_model('documents', 'Document')
+    StorageUsage = apps.get_model('documents', 'StorageUsage')
+    totals = (
+        Document.objects.filter(author__isnull=False, deleted_at__isnull=True)
+        .order_by()
+        .values('author_id', 'file_extension')
+        .annotate(documents=Count('pk'), size=Sum('file_size'))
+    )
+    StorageUsage.objects.bulk_create(
+        (
+            StorageUsage(
+                user_id=row['author_id'],
+                extension=row['file_extension'],
+                documents_count=row['documents'],
+                total_size=row['size'] or 0,
+            )
+            for row in totals.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_trash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_bytes', models.BigIntegerField(default=0, help_text='Espaço máximo em bytes (0 = sem limite)')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='storage_quota', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Cota de armazenamento',
+                'verbose_name_plural': 'Cotas de armazenamento',
+            },
+        ),
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('extension', models.CharField(blank=True, default='', max_length=10)),
+                ('documents_count', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Uso de armazenamento',
+                'verbose_name_plural': 'Uso de armazenamento',
+                'constraints': [models.UniqueConstraint(fields=('user', 'extension'), name='storage_usage_user_extension_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_storage_usage, migrations.RunPython.noop),
+    ]
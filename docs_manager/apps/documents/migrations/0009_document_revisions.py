@@ -0,0 +1,52 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:09
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_storage_usage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chunk',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Trecho de revisão',
+                'verbose_name_plural': 'Trechos de revisões',
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('file_size', models.BigIntegerField(default=0)),
+                ('file_type', models.CharField(blank=True, default='', max_length=100)),
+                ('sha256', models.CharField(max_length=64)),
+                ('chunks', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=64), default=list)),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='documents.document')),
+            ],
+            options={
+                'verbose_name': 'Revisão de documento',
+                'verbose_name_plural': 'Revisões de documentos',
+                'ordering': ['-number'],
+                'constraints': [models.UniqueConstraint(fields=('document', 'number'), name='document_revision_number_uniq')],
+            },
+        ),
+    ]
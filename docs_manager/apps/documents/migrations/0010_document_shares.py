@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('documents', '0009_document_revisions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentShare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField(choices=[(1, 'Visualizar'), (2, 'Comentar'), (3, 'Excluir')], default=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shares', to='documents.document')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_shares', to='auth.group')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_shares', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Compartilhamento',
+                'verbose_name_plural': 'Compartilhamentos',
+                'indexes': [models.Index(condition=models.Q(('user__isnull', False)), fields=['user', 'document', 'level'], name='document_share_user_idx'), models.Index(condition=models.Q(('group__isnull', False)), fields=['group', 'document', 'level'], name='document_share_group_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('group__isnull', True), ('user__isnull', False)), models.Q(('group__isnull', False), ('user__isnull', True)), _connector='OR'), name='document_share_target_chk'), models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('document', 'user'), name='document_share_user_uniq'), models.UniqueConstraint(condition=models.Q(('group__isnull', False)), fields=('document', 'group'), name='document_share_group_uniq')],
+            },
+        ),
+    ]
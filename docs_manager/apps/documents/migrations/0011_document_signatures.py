@@ -0,0 +1,32 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:30
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_document_shares'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSignature',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='documents.document')),
+                ('minhash', models.BinaryField()),
+                ('bands', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField())),
+                ('similarity', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='near_duplicates', to='documents.document')),
+            ],
+            options={
+                'verbose_name': 'Assinatura de documento',
+                'verbose_name_plural': 'Assinaturas de documentos',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['bands'], name='document_signature_bands_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_document_signatures'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('open', 'Aberta'), ('finalizing', 'Em finalização'), ('completed', 'Concluída')], default='open', max_length=10),
+        ),
+    ]
@@ -2,14 +2,74 @@
 models.py
 
 Define os modelos principais da aplicação de gerenciamento de documentos:
-- Document: representa um arquivo enviado por um usuário.
+- Blob: conteúdo de arquivo armazenado uma única vez, endereçado pelo SHA-256.
+- Document: representa um arquivo enviado por um usuário (com lixeira).
 - Comment: representa comentários feitos em documentos por usuários.
+- UploadSession: upload em partes (retomável) ainda não finalizado.
+- StorageUsage: espaço ocupado por usuário e extensão, mantido a cada upload.
+- StorageQuota: cota de armazenamento de um usuário.
+- Chunk: trecho de conteúdo das revisões, armazenado uma única vez.
+- DocumentRevision: versão de um documento, descrita pela lista de trechos.
+- DocumentShare: compartilhamento de um documento com um usuário ou grupo.
+- DocumentSignature: assinatura MinHash do texto, usada para achar quase duplicatas.
 """
 
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from django.contrib.auth.models import User
+from django.db.models import Q
+from django.contrib.auth.models import Group, User
+import math
 import os
+import uuid
+
+
+class Blob(models.Model):
+    """
+    Representa um conteúdo de arquivo armazenado uma única vez.
+
+    Documentos com o mesmo conteúdo apontam para o mesmo blob, e o arquivo
+    físico só é removido quando o último documento que o referencia é
+    excluído.
+
+    Campos:
+        sha256: hash SHA-256 do conteúdo (chave primária).
+        file: arquivo armazenado em 'blobs/<aa>/<bb>/<sha256>', com o sufixo
+            '.gz' ou '.zst' quando gravado comprimido.
+        size: tamanho do conteúdo original em bytes.
+        ref_count: quantidade de documentos que referenciam o blob.
+        created_at: data/hora em que o conteúdo foi armazenado.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Conteúdo de arquivo"
+        verbose_name_plural = "Conteúdos de arquivos"
+
+    def __str__(self):
+        """Retorna o hash do conteúdo."""
+        return self.sha256
+
+
+class DocumentQuerySet(models.QuerySet):
+    """Consultas de documentos com filtros da lixeira."""
+
+    def trashed(self):
+        """Documentos na lixeira."""
+        return self.filter(deleted_at__isnull=False)
+
+
+class DocumentManager(models.Manager.from_queryset(DocumentQuerySet)):
+    """Manager padrão de documentos: ignora os que estão na lixeira."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class Document(models.Model):
@@ -20,13 +80,22 @@ class Document(models.Model):
         title: título do documento.
         description: descrição opcional do documento.
         author: usuário que enviou o documento.
-        file: arquivo armazenado na pasta 'documents/'.
+        file: arquivo armazenado na pasta 'documents/' (ou o caminho do blob).
+        blob: conteúdo deduplicado ao qual o documento pertence, se houver.
         file_name: nome original do arquivo.
         file_size: tamanho do arquivo em bytes.
         file_type: tipo MIME do arquivo (ex: application/pdf).
         file_extension: extensão do arquivo (ex: .pdf, .docx).
+        content: texto extraído do arquivo, usado na busca.
+        search_vector: tsvector ponderado (título > descrição > conteúdo).
+        comments_count: quantidade de comentários, mantida pelos sinais de `Comment`.
+        deleted_at: data/hora em que o documento foi para a lixeira (None se ativo).
         uploaded_at: data/hora de envio.
         updated_at: data/hora da última atualização.
+
+    Managers:
+        objects: apenas documentos ativos (fora da lixeira).
+        all_objects: todos os documentos, inclusive os da lixeira.
     """
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -41,21 +110,61 @@ class Document(models.Model):
         upload_to='documents/',
         help_text="Arquivo armazenado em pasta local"
     )
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='documents',
+        editable=False,
+    )
     file_name = models.CharField(max_length=255, default='arquivo', help_text="Nome original do arquivo")
     file_size = models.BigIntegerField(default=0, help_text="Tamanho do arquivo em bytes")
     file_type = models.CharField(max_length=100, blank=True, default='', help_text="Tipo MIME do arquivo")
     file_extension = models.CharField(max_length=10, blank=True, default='', help_text="Extensão do arquivo")
+    content = models.TextField(blank=True, default='', editable=False, help_text="Texto extraído do arquivo")
+    search_vector = SearchVectorField(null=True, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = DocumentManager()
+    all_objects = DocumentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-uploaded_at']
         verbose_name = "Documento"
         verbose_name_plural = "Documentos"
+        indexes = [
+            # usado pela paginação por cursor da listagem; os índices da
+            # listagem e da busca ignoram os documentos na lixeira
+            models.Index(
+                fields=['-uploaded_at', '-id'],
+                name='document_uploaded_id_idx',
+                condition=Q(deleted_at__isnull=True),
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='document_search_idx',
+                condition=Q(deleted_at__isnull=True),
+            ),
+            # usado pela página da lixeira e pela limpeza (purge_trash)
+            models.Index(
+                fields=['-deleted_at', '-id'],
+                name='document_trash_idx',
+                condition=Q(deleted_at__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         """Retorna o título do documento."""
         return self.title
+
+    @property
+    def is_trashed(self):
+        """Indica se o documento está na lixeira."""
+        return self.deleted_at is not None
     
     def can_be_deleted_by(self, user):
         """
@@ -63,7 +172,8 @@ class Document(models.Model):
 
         Regras:
             - Administradores (staff ou superuser) podem deletar qualquer documento.
-            - Usuários comuns só podem deletar documentos que eles mesmos enviaram.
+            - Usuários comuns podem deletar os documentos que enviaram e os
+              compartilhados com eles no nível "Excluir".
 
         Args:
             user (User): Usuário a ser verificado.
@@ -71,9 +181,8 @@ class Document(models.Model):
         Returns:
             bool: True se o usuário pode deletar, False caso contrário.
         """
-        if user.is_staff or user.is_superuser:
-            return True
-        return self.author == user
+        from .permissions import user_permissions
+        return user_permissions(user).can_delete(self)
     
     def get_file_size_display(self):
         """
@@ -111,7 +220,347 @@ class Comment(models.Model):
         ordering = ['-created_at']
         verbose_name = "Comentário"
         verbose_name_plural = "Comentários"
+        indexes = [
+            # usado pela paginação por cursor dos comentários de um documento
+            models.Index(fields=['document', '-created_at', '-id'], name='comment_document_created_idx'),
+        ]
 
     def __str__(self):
         """Retorna uma string resumida do comentário."""
         return f'Comentário de {self.author} em {self.document.title}'
+
+
+class UploadSession(models.Model):
+    """
+    Representa um upload em partes (chunks), que pode ser retomado.
+
+    As partes são gravadas em disco fora do banco; a sessão guarda apenas
+    os metadados necessários para validá-las e montar o documento final.
+
+    Campos:
+        id: identificador público da sessão (UUID).
+        user: usuário que abriu a sessão.
+        file_name: nome original do arquivo.
+        file_size: tamanho total esperado em bytes.
+        file_type: tipo MIME informado pelo cliente.
+        sha256: hash esperado do arquivo completo (opcional).
+        chunk_size: tamanho de cada parte (a última pode ser menor).
+        status: situação da sessão (aberta, em finalização ou concluída).
+        document: documento criado ao finalizar a sessão.
+        created_at: data/hora de abertura.
+        expires_at: data/hora a partir da qual a sessão pode ser descartada.
+    """
+    STATUS_OPEN = 'open'
+    STATUS_FINALIZING = 'finalizing'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Aberta'),
+        (STATUS_FINALIZING, 'Em finalização'),
+        (STATUS_COMPLETED, 'Concluída'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    file_size = models.BigIntegerField()
+    file_type = models.CharField(max_length=100, blank=True, default='')
+    sha256 = models.CharField(max_length=64, blank=True, default='')
+    chunk_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Sessão de upload"
+        verbose_name_plural = "Sessões de upload"
+
+    def __str__(self):
+        """Retorna o nome do arquivo e a situação da sessão."""
+        return f'{self.file_name} ({self.get_status_display()})'
+
+    @property
+    def total_chunks(self):
+        """Quantidade de partes esperadas para o arquivo completo."""
+        return max(1, math.ceil(self.file_size / self.chunk_size))
+
+    def expected_chunk_size(self, index):
+        """
+        Retorna o tamanho esperado de uma parte.
+
+        Args:
+            index (int): posição da parte, começando em 0.
+
+        Returns:
+            int: tamanho em bytes; a última parte contém o restante do arquivo.
+        """
+        if index < self.total_chunks - 1:
+            return self.chunk_size
+        return self.file_size - self.chunk_size * (self.total_chunks - 1)
+
+
+class StorageUsage(models.Model):
+    """
+    Espaço ocupado pelos documentos ativos de um usuário, por extensão.
+
+    Os totais são somados e subtraídos a cada upload, exclusão, ida para a
+    lixeira e restauração (ver `usage.py`), então consultar o uso de um
+    usuário lê poucas linhas em vez de agregar a tabela de documentos.
+    O comando `reconcile_usage` reconstrói a tabela a partir dos documentos.
+
+    Campos:
+        user: dono dos documentos.
+        extension: extensão dos arquivos (ex: '.pdf'; '' se não houver).
+        documents_count: quantidade de documentos ativos.
+        total_size: soma de `Document.file_size`, em bytes.
+        updated_at: data/hora da última alteração.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='storage_usage')
+    extension = models.CharField(max_length=10, blank=True, default='')
+    documents_count = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Uso de armazenamento"
+        verbose_name_plural = "Uso de armazenamento"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'extension'], name='storage_usage_user_extension_uniq'),
+        ]
+
+    def __str__(self):
+        """Retorna o usuário e a extensão."""
+        return f'{self.user} ({self.extension or "sem extensão"})'
+
+
+class StorageQuota(models.Model):
+    """
+    Cota de armazenamento de um usuário.
+
+    Substitui, para o usuário, o limite padrão `DOCUMENTS_USER_QUOTA`.
+
+    Campos:
+        user: usuário ao qual a cota se aplica.
+        max_bytes: espaço máximo dos documentos ativos, em bytes (0 = sem limite).
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='storage_quota')
+    max_bytes = models.BigIntegerField(default=0, help_text="Espaço máximo em bytes (0 = sem limite)")
+
+    class Meta:
+        verbose_name = "Cota de armazenamento"
+        verbose_name_plural = "Cotas de armazenamento"
+
+    def __str__(self):
+        """Retorna o usuário da cota."""
+        return str(self.user)
+
+
+class Chunk(models.Model):
+    """
+    Trecho do conteúdo de uma revisão, armazenado uma única vez.
+
+    As revisões são divididas em trechos pelo próprio conteúdo (ver
+    `revisions.py`), então versões parecidas de um arquivo compartilham a
+    maior parte dos trechos. O arquivo físico só é removido quando nenhuma
+    revisão o referencia.
+
+    Campos:
+        sha256: hash SHA-256 do trecho (chave primária).
+        file: arquivo armazenado em 'chunks/<aa>/<bb>/<sha256>', com o sufixo
+            '.gz' ou '.zst' quando gravado comprimido.
+        size: tamanho original do trecho em bytes.
+        ref_count: quantidade de ocorrências do trecho nas revisões.
+        created_at: data/hora em que o trecho foi armazenado.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Trecho de revisão"
+        verbose_name_plural = "Trechos de revisões"
+
+    def __str__(self):
+        """Retorna o hash do trecho."""
+        return self.sha256
+
+
+class DocumentRevision(models.Model):
+    """
+    Versão do conteúdo de um documento.
+
+    O documento continua apontando para o arquivo da versão atual; as
+    revisões guardam o histórico, cada uma como a lista ordenada dos seus
+    trechos. O conteúdo de uma revisão é a concatenação dos trechos.
+
+    Campos:
+        document: documento ao qual a revisão pertence.
+        number: número da revisão no documento (1, 2, ...).
+        author: usuário que enviou a versão.
+        file_name: nome original do arquivo.
+        file_size: tamanho do arquivo em bytes.
+        file_type: tipo MIME do arquivo.
+        sha256: hash SHA-256 do conteúdo completo.
+        chunks: hashes dos trechos, na ordem do conteúdo.
+        created_at: data/hora em que a versão foi enviada.
+    """
+    document = models.ForeignKey(Document, related_name='revisions', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    file_name = models.CharField(max_length=255)
+    file_size = models.BigIntegerField(default=0)
+    file_type = models.CharField(max_length=100, blank=True, default='')
+    sha256 = models.CharField(max_length=64)
+    chunks = ArrayField(models.CharField(max_length=64), default=list)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-number']
+        verbose_name = "Revisão de documento"
+        verbose_name_plural = "Revisões de documentos"
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'number'], name='document_revision_number_uniq'),
+        ]
+
+    def __str__(self):
+        """Retorna o documento e o número da revisão."""
+        return f'{self.document_id} (revisão {self.number})'
+
+
+class DocumentShare(models.Model):
+    """
+    Compartilhamento de um documento com um usuário ou com um grupo.
+
+    Os níveis são cumulativos: quem pode comentar também pode visualizar, e
+    quem pode excluir também pode comentar. O autor e os administradores
+    têm sempre o nível máximo. As permissões são resolvidas em
+    `permissions.py`.
+
+    Campos:
+        document: documento compartilhado.
+        user: usuário que recebe o acesso (ou vazio, se for um grupo).
+        group: grupo que recebe o acesso (ou vazio, se for um usuário).
+        level: nível de acesso (visualizar, comentar ou excluir).
+        created_by: usuário que concedeu o acesso.
+        created_at: data/hora da concessão.
+    """
+    LEVEL_VIEW = 1
+    LEVEL_COMMENT = 2
+    LEVEL_DELETE = 3
+    LEVEL_CHOICES = [
+        (LEVEL_VIEW, 'Visualizar'),
+        (LEVEL_COMMENT, 'Comentar'),
+        (LEVEL_DELETE, 'Excluir'),
+    ]
+
+    document = models.ForeignKey(Document, related_name='shares', on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='document_shares',
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='document_shares',
+    )
+    level = models.PositiveSmallIntegerField(choices=LEVEL_CHOICES, default=LEVEL_VIEW)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Compartilhamento"
+        verbose_name_plural = "Compartilhamentos"
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    Q(user__isnull=False, group__isnull=True)
+                    | Q(user__isnull=True, group__isnull=False)
+                ),
+                name='document_share_target_chk',
+            ),
+            # também servem à verificação "o documento X foi compartilhado comigo?"
+            models.UniqueConstraint(
+                fields=['document', 'user'],
+                name='document_share_user_uniq',
+                condition=Q(user__isnull=False),
+            ),
+            models.UniqueConstraint(
+                fields=['document', 'group'],
+                name='document_share_group_uniq',
+                condition=Q(group__isnull=False),
+            ),
+        ]
+        indexes = [
+            # usados para carregar as permissões de um usuário e de seus grupos
+            models.Index(
+                fields=['user', 'document', 'level'],
+                name='document_share_user_idx',
+                condition=Q(user__isnull=False),
+            ),
+            models.Index(
+                fields=['group', 'document', 'level'],
+                name='document_share_group_idx',
+                condition=Q(group__isnull=False),
+            ),
+        ]
+
+    def __str__(self):
+        """Retorna o documento, o destinatário e o nível."""
+        return f'{self.document_id} -> {self.user or self.group} ({self.get_level_display()})'
+
+
+class DocumentSignature(models.Model):
+    """
+    Assinatura MinHash do texto de um documento (ver `similarity.py`).
+
+    Calculada pelo worker depois da extração do texto e a cada nova versão.
+    Guarda também o resultado da comparação: o documento do qual este é uma
+    provável cópia.
+
+    Campos:
+        document: documento assinado (chave primária).
+        minhash: assinatura (`NUM_PERM` valores uint32, little-endian).
+        bands: hashes das faixas LSH, com índice GIN para a busca de candidatos.
+        duplicate_of: documento mais antigo do qual este é uma provável cópia.
+        similarity: similaridade estimada com `duplicate_of` (0 a 1).
+        updated_at: data/hora do último cálculo.
+    """
+    document = models.OneToOneField(
+        Document, on_delete=models.CASCADE, primary_key=True, related_name='signature'
+    )
+    minhash = models.BinaryField()
+    bands = ArrayField(models.BigIntegerField())
+    duplicate_of = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='near_duplicates',
+    )
+    similarity = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Assinatura de documento"
+        verbose_name_plural = "Assinaturas de documentos"
+        indexes = [
+            # usado para achar os candidatos a duplicata (operador &&)
+            GinIndex(fields=['bands'], name='document_signature_bands_idx'),
+        ]
+
+    def __str__(self):
+        """Retorna o documento assinado."""
+        return str(self.document_id)
@@ -0,0 +1,195 @@
+"""
+pagination.py
+
+Define a paginação por cursor (keyset) usada na listagem de documentos e
+nos comentários de cada documento.
+
+Em vez de OFFSET, cada página é buscada a partir do último par
+(`uploaded_at`, `id`) visto, o que mantém o custo constante mesmo nas
+páginas mais profundas e aproveita o índice composto de `Document`.
+
+Notas:
+    - O cursor é opaco para o cliente (base64 de "valor|id").
+    - Nos resultados da busca, a ordenação usa (`rank`, `id`); nos
+      comentários, (`created_at`, `id`); na lixeira, (`deleted_at`, `id`).
+    - O total exibido é exato apenas até `COUNT_LIMIT`; acima disso é usada
+      a estimativa do planner do Postgres (`pg_class.reltuples`).
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+
+
+# Acima deste número de resultados, o total passa a ser aproximado
+COUNT_LIMIT = 1000
+
+
+# Conversores do valor de cada campo de ordenação aceito no cursor
+_CURSOR_PARSERS = {
+    'uploaded_at': datetime.fromisoformat,
+    'created_at': datetime.fromisoformat,
+    'deleted_at': datetime.fromisoformat,
+    'rank': float,
+}
+
+
+def encode_cursor(value, pk):
+    """
+    Codifica a posição de um item em um cursor opaco.
+
+    Args:
+        value (datetime | float): valor do campo de ordenação
+            (`uploaded_at`, `created_at`, `deleted_at` ou `rank` da busca).
+        pk (int): ID do item.
+
+    Returns:
+        str: cursor seguro para ser usado em URLs.
+    """
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    raw = f'{value}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field='uploaded_at'):
+    """
+    Decodifica um cursor gerado por `encode_cursor`.
+
+    Args:
+        cursor (str): cursor recebido na query string.
+        field (str): campo de ordenação ao qual o cursor se refere.
+
+    Returns:
+        tuple | None: par (valor, pk), ou None se o cursor for inválido.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk = raw.rsplit('|', 1)
+        return _CURSOR_PARSERS[field](value), int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """
+    Representa uma página de resultados paginada por cursor.
+
+    Atributos:
+        object_list (list): itens da página, já na ordem de exibição.
+        next_cursor (str | None): cursor para a próxima página.
+        previous_cursor (str | None): cursor para a página anterior.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def paginate_keyset(queryset, page_size, after=None, before=None, field='uploaded_at'):
+    """
+    Pagina um queryset por (`field`, `id`) decrescentes.
+
+    Busca `page_size + 1` linhas para saber se existe uma página seguinte
+    sem precisar de uma consulta extra.
+
+    Args:
+        queryset (QuerySet): documentos (ou comentários) já filtrados.
+        page_size (int): quantidade de itens por página.
+        after (str | None): cursor do último item da página anterior.
+        before (str | None): cursor do primeiro item da página seguinte.
+        field (str): campo de ordenação; `uploaded_at` na listagem,
+            `rank` nos resultados da busca, `created_at` nos comentários ou
+            `deleted_at` na lixeira.
+
+    Returns:
+        KeysetPage: página com os itens e os cursores de navegação.
+    """
+    after_key = decode_cursor(after, field)
+    before_key = decode_cursor(before, field)
+
+    if before_key:
+        value, pk = before_key
+        rows = list(
+            queryset.filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+            ).order_by(field, 'id')[:page_size + 1]
+        )
+        has_more = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_previous, has_next = has_more, True
+    else:
+        if after_key:
+            value, pk = after_key
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+            )
+        rows = list(queryset.order_by(f'-{field}', '-id')[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = after_key is not None
+
+    if not rows:
+        return KeysetPage(rows)
+
+    first, last = rows[0], rows[-1]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(getattr(last, field), last.pk) if has_next else None,
+        previous_cursor=encode_cursor(getattr(first, field), first.pk) if has_previous else None,
+    )
+
+
+def estimate_count(queryset, filtered, relation=None):
+    """
+    Retorna o total de documentos sem varrer a tabela inteira.
+
+    A contagem é limitada a `COUNT_LIMIT + 1` linhas. Se o limite for
+    ultrapassado, usa a estimativa do Postgres para a tabela (quando não há
+    filtro) ou apenas informa que existem mais de `COUNT_LIMIT` resultados.
+
+    Args:
+        queryset (QuerySet): documentos já filtrados.
+        filtered (bool): indica se há filtros aplicados ao queryset.
+        relation (str | None): tabela ou índice parcial cuja estimativa de
+            linhas corresponde ao queryset sem filtros; o padrão é a tabela
+            do modelo.
+
+    Returns:
+        tuple: (total, exato), onde `exato` indica se o valor é preciso.
+    """
+    bounded = queryset.order_by().values('pk')[:COUNT_LIMIT + 1].count()
+    if bounded <= COUNT_LIMIT:
+        return bounded, True
+
+    if not filtered and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [relation or queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] > COUNT_LIMIT:
+            return row[0], False
+
+    return COUNT_LIMIT, False
@@ -0,0 +1,218 @@
+"""
+permissions.py
+
+Permissões dos usuários sobre os documentos.
+
+Cada usuário tem, sobre cada documento, um nível de acesso (ver
+`DocumentShare`): visualizar, comentar ou excluir. O autor e os
+administradores (staff ou superuser) têm sempre o nível máximo; os demais
+recebem o maior nível entre os compartilhamentos feitos com eles e com os
+seus grupos.
+
+Com `DOCUMENTS_SHARING` desativado (padrão), todos os usuários continuam
+vendo e comentando todos os documentos, e os compartilhamentos apenas
+concedem a exclusão. Ativado, cada usuário vê apenas os próprios
+documentos e os compartilhados com ele.
+
+Com o compartilhamento ativado, os atalhos de upload por hash (enviar
+apenas o SHA-256 de um conteúdo já armazenado) só valem para conteúdos de
+documentos que o usuário já pode ver (`can_reuse_blob`); caso contrário,
+quem conhecesse o hash de um arquivo privado obteria uma cópia dele.
+
+Notas:
+    - A visibilidade é resolvida no banco, como um único filtro (EXISTS)
+      aplicado à consulta da listagem, e não documento a documento.
+    - Os níveis de um usuário são lidos uma vez por requisição e, com um
+      cache compartilhado entre os processos (`CACHE_SHARED`), guardados no
+      cache ('documents:permissions:<id>:<versão>'). Os sinais de
+      `DocumentShare` e da associação usuário-grupo descartam as entradas
+      afetadas: as do usuário, quando o compartilhamento é com ele, ou todas
+      (pela versão), quando é com um grupo.
+    - Com o cache de cada processo ('locmem'), o descarte não alcançaria os
+      outros workers, e um acesso revogado continuaria valendo neles; por
+      isso os níveis são lidos do banco a cada requisição.
+    - Usuários com mais de `PERMISSIONS_CACHE_MAX_DOCUMENTS` documentos
+      compartilhados também não vão para o cache, que guarda um único valor
+      por usuário.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q
+
+from .models import Blob, Document, DocumentShare
+
+# Segundos que os níveis de acesso de um usuário ficam em cache
+PERMISSIONS_CACHE_TIMEOUT = 60 * 60
+
+# Documentos compartilhados acima dos quais os níveis não vão para o cache
+PERMISSIONS_CACHE_MAX_DOCUMENTS = 1000
+
+# Chave com a versão dos compartilhamentos com grupos
+_GROUPS_VERSION_KEY = 'documents:permissions:groups-version'
+
+
+def is_admin(user):
+    """Indica se o usuário administra todos os documentos (staff ou superuser)."""
+    return user.is_staff or user.is_superuser
+
+
+def _shares_for(user):
+    """Compartilhamentos feitos com o usuário ou com algum dos seus grupos."""
+    # os grupos entram como subconsulta: o OR não depende de um JOIN
+    return DocumentShare.objects.filter(Q(user=user) | Q(group__in=user.groups.values('pk')))
+
+
+def visible_documents(queryset, user):
+    """
+    Restringe uma consulta de documentos aos que o usuário pode ver.
+
+    O filtro é um único EXISTS sobre os compartilhamentos (usando os
+    índices de `DocumentShare`), então a consulta continua paginada e
+    ordenada pelo banco.
+
+    Args:
+        queryset (QuerySet): documentos.
+        user (User): usuário que faz a consulta.
+
+    Returns:
+        QuerySet: documentos do usuário, compartilhados com ele ou, para
+            administradores e com `DOCUMENTS_SHARING` desativado, todos.
+    """
+    if not settings.DOCUMENTS_SHARING or is_admin(user):
+        return queryset
+    shared = _shares_for(user).filter(document=OuterRef('pk'))
+    return queryset.filter(Q(author=user) | Exists(shared))
+
+
+def restricts_visibility(user):
+    """Indica se `visible_documents` filtra os documentos do usuário."""
+    return settings.DOCUMENTS_SHARING and not is_admin(user)
+
+
+def can_reuse_blob(user, sha256):
+    """
+    Indica se o usuário pode criar um documento a partir apenas do hash.
+
+    Sem restrição de visibilidade, basta o conteúdo existir. Com ela, o
+    conteúdo precisa pertencer a um documento ativo que o usuário já vê;
+    para os demais, o servidor responde como se o conteúdo não existisse
+    (o usuário envia os bytes), sem revelar a existência de arquivos
+    privados.
+
+    Args:
+        user (User): usuário que faz o upload.
+        sha256 (str): hash do conteúdo.
+
+    Returns:
+        bool: True se o hash pode substituir o envio do arquivo.
+    """
+    if not sha256:
+        return False
+    if not restricts_visibility(user):
+        return Blob.objects.filter(pk=sha256).exists()
+    return visible_documents(Document.objects.filter(blob_id=sha256), user).exists()
+
+
+class DocumentPermissions:
+    """
+    Níveis de acesso de um usuário, já carregados.
+
+    Atributos:
+        user (User): usuário.
+        levels (dict): documento -> maior nível compartilhado com o usuário.
+    """
+
+    def __init__(self, user, levels):
+        self.user = user
+        self.levels = levels
+
+    def level(self, document):
+        """
+        Retorna o nível de acesso do usuário a um documento.
+
+        Args:
+            document (Document): documento com `author_id`.
+
+        Returns:
+            int: nível de `DocumentShare` (0 se não houver acesso).
+        """
+        if is_admin(self.user) or document.author_id == self.user.pk:
+            return DocumentShare.LEVEL_DELETE
+        default = 0 if settings.DOCUMENTS_SHARING else DocumentShare.LEVEL_COMMENT
+        return max(default, self.levels.get(document.pk, 0))
+
+    def can_view(self, document):
+        """Indica se o usuário pode ver o documento."""
+        return self.level(document) >= DocumentShare.LEVEL_VIEW
+
+    def can_comment(self, document):
+        """Indica se o usuário pode comentar no documento."""
+        return self.level(document) >= DocumentShare.LEVEL_COMMENT
+
+    def can_delete(self, document):
+        """Indica se o usuário pode excluir o documento, restaurá-lo e enviar versões."""
+        return self.level(document) >= DocumentShare.LEVEL_DELETE
+
+
+def permissions_cache_key(user_id):
+    """Retorna a chave de cache dos níveis de acesso de um usuário."""
+    version = cache.get_or_set(_GROUPS_VERSION_KEY, time.time_ns, None)
+    return f'documents:permissions:{user_id}:{version}'
+
+
+def user_permissions(user):
+    """
+    Retorna os níveis de acesso de um usuário.
+
+    Os níveis são lidos do cache, se compartilhado (ou do banco, em uma
+    consulta), uma única vez por requisição: o resultado fica guardado no
+    próprio objeto do usuário, que o Django reaproveita durante a requisição.
+
+    Args:
+        user (User): usuário autenticado.
+
+    Returns:
+        DocumentPermissions: níveis do usuário.
+    """
+    permissions = getattr(user, '_document_permissions', None)
+    if permissions is not None:
+        return permissions
+
+    levels = {}
+    if not is_admin(user):
+        key = permissions_cache_key(user.pk) if settings.CACHE_SHARED else None
+        levels = cache.get(key) if key else None
+        if levels is None:
+            levels = dict(
+                _shares_for(user).order_by().values('document_id')
+                .annotate(level=Max('level')).values_list('document_id', 'level')
+            )
+            if key and len(levels) <= PERMISSIONS_CACHE_MAX_DOCUMENTS:
+                cache.set(key, levels, PERMISSIONS_CACHE_TIMEOUT)
+
+    permissions = DocumentPermissions(user, levels)
+    user._document_permissions = permissions
+    return permissions
+
+
+def invalidate_user_permissions(user_ids):
+    """
+    Descarta do cache os níveis de acesso de usuários, após o commit.
+
+    Args:
+        user_ids (Iterable[int]): IDs dos usuários afetados.
+    """
+    user_ids = list(user_ids)
+    transaction.on_commit(
+        lambda: cache.delete_many([permissions_cache_key(user_id) for user_id in user_ids])
+    )
+
+
+def invalidate_group_permissions():
+    """Descarta do cache os níveis de todos os usuários (compartilhamento com grupo alterado)."""
+    # um valor novo (e não um incremento): a versão pode ter sido removida do cache
+    transaction.on_commit(lambda: cache.set(_GROUPS_VERSION_KEY, time.time_ns(), None))
@@ -0,0 +1,536 @@
+"""
+revisions.py
+
+Revisões (versões anteriores) dos documentos, armazenadas em trechos
+deduplicados.
+
+Ao enviar uma nova versão de um documento, o conteúdo é dividido em trechos
+pelo próprio conteúdo (content-defined chunking): um hash de janela
+deslizante (gear hash, sobre os últimos 32 bytes) marca um corte sempre que
+os seus bits mais altos são zero. Como os cortes dependem apenas dos bytes
+próximos, uma edição no meio do arquivo muda só os trechos ao redor dela e
+os demais continuam idênticos aos da versão anterior. Cada trecho distinto
+é gravado uma única vez em 'chunks/<aa>/<bb>/<sha256>' e representado por
+um `Chunk` com contagem de referências, como os blobs em `storage.py`.
+
+Assim, o espaço ocupado pelo histórico de um documento editado com
+frequência cresce com o tamanho de cada edição, e não com o tamanho do
+arquivo vezes o número de versões.
+
+O documento continua apontando para o arquivo da versão atual (download,
+busca e miniaturas não mudam); as revisões são remontadas sob demanda,
+concatenando os trechos durante o envio.
+
+Notas:
+    - A primeira revisão (o conteúdo original) é criada quando a segunda
+      versão é enviada.
+    - O hash é calculado com numpy sobre blocos de 4MB; os limites de
+      tamanho dos trechos (16KB a 256KB, média de ~80KB) são aplicados em
+      Python, apenas sobre os candidatos a corte.
+    - Os trechos de texto são gravados comprimidos, com as mesmas regras
+      dos blobs (ver `compression.py`).
+    - A tabela de hash e os parâmetros de corte não podem mudar sem perder
+      a deduplicação com os trechos já armazenados.
+"""
+
+import asyncio
+import copy
+import hashlib
+import io
+import os
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Case, F, Max, Value, When
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date
+
+from apps.jobs.queue import enqueue
+
+from .compression import SUFFIXES, choose_encoding, compress, decoded, open_document_file, path_encoding
+from .derivatives import delete_derivatives, derivative_key
+from .models import Chunk, Document, DocumentRevision
+from .storage import hash_file, release_blob, store_blob
+from .tables import delete_table, supports_table
+from .tasks import delete_stored_file, process_document
+from .usage import check_quota, record_usage
+
+# Tamanho mínimo e máximo de um trecho
+CHUNK_MIN_SIZE = 16 * 1024
+CHUNK_MAX_SIZE = 256 * 1024
+
+# Bits do hash que precisam ser zero para um corte (um corte a cada 64KB, em média)
+CHUNK_MASK_BITS = 16
+
+# Bytes que influenciam o hash em cada posição
+GEAR_WINDOW = 32
+
+# Tamanho dos blocos lidos do arquivo ao dividi-lo
+READ_SIZE = 4 * 1024 * 1024
+
+# Trechos registrados no banco por consulta
+CHUNK_BATCH_SIZE = 256
+
+# Revisões listadas nos detalhes do documento (as mais recentes)
+REVISIONS_SHOWN = 20
+
+# Tabela do gear hash: um valor pseudoaleatório fixo por byte
+_GEAR = np.random.default_rng(0x646F6373).integers(0, 2 ** 32, size=256, dtype=np.uint32)
+
+_MASK = np.uint32(((1 << CHUNK_MASK_BITS) - 1) << (32 - CHUNK_MASK_BITS))
+
+# Liberações acumuladas por `batch_chunk_releases` (None fora do bloco)
+_pending_releases = ContextVar('pending_chunk_releases', default=None)
+
+
+def _cut_candidates(data, skip):
+    """
+    Retorna as posições de `data` em que um trecho pode terminar.
+
+    Args:
+        data (bytes): últimos bytes já processados seguidos do bloco novo.
+        skip (int): quantidade de bytes já processados no início de `data`,
+            usados apenas como contexto do hash.
+
+    Returns:
+        ndarray: fins (exclusivos) dos possíveis trechos, relativos ao bloco novo.
+    """
+    values = _GEAR[np.frombuffer(data, dtype=np.uint8)]
+    hashes = values.copy()
+    # h[i] = soma de G[b[i - k]] << k para k < 32, com estouro em 32 bits
+    for shift in range(1, GEAR_WINDOW):
+        hashes[shift:] += values[:-shift] << np.uint32(shift)
+    ends = np.flatnonzero((hashes & _MASK) == 0) + 1
+    return ends[ends > skip] - skip
+
+
+def split_chunks(fileobj):
+    """
+    Divide um conteúdo em trechos definidos pelo próprio conteúdo.
+
+    Os cortes não dependem do tamanho dos blocos lidos, então o mesmo
+    conteúdo gera sempre os mesmos trechos.
+
+    Args:
+        fileobj (File): conteúdo aberto em modo binário, a partir da posição atual.
+
+    Yields:
+        bytes: trechos consecutivos (entre `CHUNK_MIN_SIZE` e
+            `CHUNK_MAX_SIZE` bytes, exceto o último).
+    """
+    buffer = bytearray()
+    context = b''
+    while block := fileobj.read(READ_SIZE):
+        ends = _cut_candidates(context + block, len(context)) + len(buffer)
+        context = (context + block)[-(GEAR_WINDOW - 1):]
+        buffer += block
+
+        start = 0
+        for end in ends.tolist():
+            while end - start > CHUNK_MAX_SIZE:
+                yield bytes(buffer[start:start + CHUNK_MAX_SIZE])
+                start += CHUNK_MAX_SIZE
+            if end - start >= CHUNK_MIN_SIZE:
+                yield bytes(buffer[start:end])
+                start = end
+        # os próximos candidatos estão além do tamanho máximo
+        while len(buffer) - start > CHUNK_MAX_SIZE:
+            yield bytes(buffer[start:start + CHUNK_MAX_SIZE])
+            start += CHUNK_MAX_SIZE
+        del buffer[:start]
+    if buffer:
+        yield bytes(buffer)
+
+
+def chunk_path(sha256, encoding=''):
+    """
+    Retorna o caminho de armazenamento de um trecho a partir do hash.
+
+    Args:
+        sha256 (str): hash hexadecimal do trecho.
+        encoding (str): algoritmo de compressão do arquivo ('' se nenhum).
+
+    Returns:
+        str: caminho relativo ao MEDIA_ROOT.
+    """
+    return f'chunks/{sha256[:2]}/{sha256[2:4]}/{sha256}{SUFFIXES.get(encoding, "")}'
+
+
+def _write_chunk_file(path, data):
+    """Grava um trecho no caminho exato (comprimido, se for o caso), se ainda não existir."""
+    if default_storage.exists(path):
+        return
+    encoding = path_encoding(path)
+    if encoding:
+        with compress(io.BytesIO(data), encoding) as compressed:
+            saved = default_storage.save(path, compressed)
+    else:
+        saved = default_storage.save(path, io.BytesIO(data))
+    if saved != path:
+        # outro processo gravou o mesmo trecho ao mesmo tempo
+        default_storage.delete(saved)
+
+
+def add_chunk_references(references):
+    """
+    Registra referências a vários trechos com um número fixo de consultas.
+
+    Segue `add_blob_references`: os trechos inexistentes são criados e os
+    existentes são travados em ordem e têm a contagem somada em um único
+    UPDATE. Deve ser chamada dentro da transação que cria a revisão.
+
+    Args:
+        references (dict): hash -> (caminho, tamanho, quantidade de novas
+            referências).
+
+    Returns:
+        dict: hash -> caminho do arquivo do trecho. Difere do caminho
+            informado quando o trecho já existia com outra compressão.
+    """
+    if not references:
+        return {}
+
+    def missing_chunks(shas):
+        return [
+            Chunk(sha256=sha, file=references[sha][0], size=references[sha][1], ref_count=0)
+            for sha in shas
+        ]
+
+    with transaction.atomic():
+        Chunk.objects.bulk_create(missing_chunks(references), ignore_conflicts=True)
+        paths = dict(
+            Chunk.objects.select_for_update().filter(pk__in=references)
+            .order_by('pk').values_list('pk', 'file')
+        )
+        # um trecho pode ter sido liberado entre a inserção e o bloqueio
+        missing = set(references) - set(paths)
+        if missing:
+            Chunk.objects.bulk_create(missing_chunks(missing), ignore_conflicts=True)
+            paths.update((sha, references[sha][0]) for sha in missing)
+
+        Chunk.objects.filter(pk__in=references).update(
+            ref_count=F('ref_count') + Case(
+                *[When(pk=sha, then=Value(count)) for sha, (_, _, count) in references.items()],
+                default=Value(0),
+            )
+        )
+    return paths
+
+
+def _store_batch(batch, encoding):
+    """Registra e grava um lote de trechos (hash -> bytes), na ordem do conteúdo."""
+    counts = Counter(sha for sha, _ in batch)
+    data = dict(batch)
+    paths = add_chunk_references({
+        sha: (chunk_path(sha, encoding), len(data[sha]), count) for sha, count in counts.items()
+    })
+    # com as linhas travadas, também regrava os arquivos perdidos no disco
+    for sha, path in paths.items():
+        _write_chunk_file(path, data[sha])
+
+
+def store_chunks(fileobj, file_name=''):
+    """
+    Divide um conteúdo em trechos e grava apenas os que ainda não existem.
+
+    Deve ser chamada dentro da transação que cria a revisão: as
+    referências são registradas aos poucos, em lotes de
+    `CHUNK_BATCH_SIZE` trechos.
+
+    Args:
+        fileobj (File): conteúdo original, aberto em modo binário.
+        file_name (str): nome original, usado para decidir a compressão.
+
+    Returns:
+        tuple: (hashes dos trechos na ordem do conteúdo, SHA-256 do
+            conteúdo completo, tamanho em bytes).
+    """
+    fileobj.seek(0)
+    encoding = choose_encoding(fileobj, file_name)
+    digest = hashlib.sha256()
+    size = 0
+    chunks = []
+    batch = []
+    for data in split_chunks(fileobj):
+        digest.update(data)
+        size += len(data)
+        sha = hashlib.sha256(data).hexdigest()
+        chunks.append(sha)
+        batch.append((sha, data))
+        if len(batch) >= CHUNK_BATCH_SIZE:
+            _store_batch(batch, encoding)
+            batch = []
+    _store_batch(batch, encoding)
+    return chunks, digest.hexdigest(), size
+
+
+def release_chunks(counts):
+    """
+    Remove referências de vários trechos, apagando os que não forem mais usados.
+
+    Os trechos são travados em ordem (como em `add_chunk_references`) e
+    têm a contagem decrementada em um único UPDATE; os arquivos dos que
+    chegaram a zero são apagados pela fila de tarefas depois do commit.
+
+    Dentro de `batch_chunk_releases`, a liberação é apenas acumulada e feita
+    em lote ao final do bloco.
+
+    Args:
+        counts (Counter): hash -> quantidade de referências removidas.
+    """
+    pending = _pending_releases.get()
+    if pending is not None:
+        pending.update(counts)
+        return
+    if not counts:
+        return
+
+    with transaction.atomic():
+        rows = list(
+            Chunk.objects.select_for_update().filter(pk__in=counts)
+            .order_by('pk').values_list('pk', 'file', 'ref_count')
+        )
+        unused = [(sha, path) for sha, path, ref_count in rows if ref_count <= counts[sha]]
+        if unused:
+            Chunk.objects.filter(pk__in=[sha for sha, _ in unused]).delete()
+        remaining = {sha: counts[sha] for sha, _, ref_count in rows if ref_count > counts[sha]}
+        if remaining:
+            Chunk.objects.filter(pk__in=remaining).update(
+                ref_count=F('ref_count') - Case(
+                    *[When(pk=sha, then=Value(count)) for sha, count in remaining.items()],
+                    default=Value(0),
+                )
+            )
+        if unused:
+            enqueue(delete_chunk_files, chunks=unused)
+
+
+@contextmanager
+def batch_chunk_releases():
+    """
+    Acumula as chamadas a `release_chunks` e as aplica uma única vez ao final do bloco.
+
+    Usado pela limpeza da lixeira, que exclui as revisões de muitos
+    documentos de uma vez. Deve ser usado dentro da transação que exclui
+    as revisões.
+    """
+    pending = Counter()
+    token = _pending_releases.set(pending)
+    try:
+        yield
+    finally:
+        _pending_releases.reset(token)
+    release_chunks(pending)
+
+
+def delete_chunk_files(chunks):
+    """
+    Tarefa que apaga os arquivos de trechos que não existem mais no banco.
+
+    Args:
+        chunks (list): pares (hash, caminho) dos trechos excluídos.
+    """
+    recreated = set(
+        Chunk.objects.filter(pk__in=[sha for sha, _ in chunks]).values_list('pk', flat=True)
+    )
+    for sha, path in chunks:
+        if sha not in recreated:
+            default_storage.delete(path)
+
+
+def _create_revision(document, fileobj, number, **fields):
+    chunks, sha256, size = store_chunks(fileobj, fields['file_name'])
+    return DocumentRevision.objects.create(
+        document=document,
+        number=number,
+        sha256=sha256,
+        file_size=size,
+        chunks=chunks,
+        **fields,
+    )
+
+
+def _store_content(document, uploaded_file, sha256):
+    """Grava o arquivo enviado como o conteúdo atual do documento (sem salvar o documento)."""
+    if settings.DOCUMENTS_DEDUPLICATE:
+        document.blob = store_blob(uploaded_file, sha256=sha256, file_name=uploaded_file.name)
+        document.file = document.blob.file.name
+    else:
+        document.blob = None
+        document.file.save(uploaded_file.name, uploaded_file, save=False)
+
+
+def _release_content(previous):
+    """Libera o arquivo que o documento tinha antes da nova versão."""
+    if previous.blob_id:
+        release_blob(previous.blob_id)
+        return
+    # os derivados e o cache da planilha ficam sob a chave antiga
+    key = derivative_key(previous)
+    enqueue(delete_stored_file, path=previous.file.name)
+    enqueue(delete_derivatives, key=key)
+    if supports_table(previous):
+        enqueue(delete_table, key=key)
+
+
+def add_revision(document, uploaded_file, user):
+    """
+    Envia uma nova versão de um documento.
+
+    A versão anterior é preservada como revisão (na primeira vez, o
+    conteúdo original vira a revisão 1) e o documento passa a apontar para
+    o arquivo enviado. O texto extraído, as miniaturas e o cache da
+    planilha são refeitos pela fila de tarefas.
+
+    Args:
+        document (Document): documento ativo.
+        uploaded_file (UploadedFile): arquivo da nova versão, já validado.
+        user (User): usuário que enviou a versão.
+
+    Returns:
+        DocumentRevision: revisão criada para a nova versão.
+
+    Raises:
+        QuotaExceeded: se o aumento de tamanho ultrapassar a cota do autor.
+        ValueError: se o conteúdo for igual ao da versão atual.
+        OSError: se o arquivo da versão atual não puder ser lido.
+    """
+    sha256 = hash_file(uploaded_file)
+    with transaction.atomic():
+        # trava o documento: versões simultâneas recebem números distintos
+        document = Document.objects.defer('content', 'search_vector').select_for_update().get(pk=document.pk)
+        previous = copy.copy(document)
+
+        last = document.revisions.aggregate(number=Max('number'))['number'] or 0
+        if not last:
+            with open_document_file(document) as fileobj:
+                current = _create_revision(
+                    document, fileobj, 1,
+                    author=document.author,
+                    file_name=document.file_name,
+                    file_type=document.file_type,
+                    created_at=document.uploaded_at,
+                )
+            last = 1
+        else:
+            current = document.revisions.only('sha256').get(number=last)
+        if current.sha256 == sha256:
+            raise ValueError('O arquivo enviado é igual à versão atual.')
+
+        if document.author is not None and uploaded_file.size > document.file_size:
+            check_quota(document.author, uploaded_file.size - document.file_size)
+
+        revision = _create_revision(
+            document, uploaded_file, last + 1,
+            author=user,
+            file_name=uploaded_file.name,
+            file_type=uploaded_file.content_type or '',
+            created_at=timezone.now(),
+        )
+        _store_content(document, uploaded_file, sha256)
+        document.file_name = revision.file_name
+        document.file_size = revision.file_size
+        document.file_type = revision.file_type
+        document.file_extension = os.path.splitext(revision.file_name)[1].lower()
+        document.save(update_fields=[
+            'file', 'blob', 'file_name', 'file_size', 'file_type', 'file_extension', 'updated_at',
+        ])
+
+        _release_content(previous)
+        record_usage([previous], sign=-1)
+        record_usage([document])
+        enqueue(process_document, document_id=document.pk)
+    return revision
+
+
+def revision_chunk_paths(revision):
+    """
+    Retorna os caminhos dos trechos de uma revisão, na ordem do conteúdo.
+
+    Args:
+        revision (DocumentRevision): revisão a ser remontada.
+
+    Returns:
+        list[str]: um caminho por trecho (trechos repetidos aparecem repetidos).
+
+    Raises:
+        FileNotFoundError: se algum trecho não existir mais no banco.
+    """
+    paths = {}
+    unique = list(dict.fromkeys(revision.chunks))
+    for index in range(0, len(unique), CHUNK_BATCH_SIZE * 4):
+        paths.update(
+            Chunk.objects.filter(pk__in=unique[index:index + CHUNK_BATCH_SIZE * 4])
+            .values_list('pk', 'file')
+        )
+    missing = set(unique) - set(paths)
+    if missing:
+        raise FileNotFoundError(f'Trechos ausentes na revisão {revision.number}: {len(missing)}')
+    return [paths[sha] for sha in revision.chunks]
+
+
+def _read_chunk(path):
+    with decoded(default_storage.open(path, 'rb'), path_encoding(path)) as fileobj:
+        return fileobj.read()
+
+
+def read_revision(paths):
+    """
+    Remonta o conteúdo de uma revisão, um trecho por vez.
+
+    Args:
+        paths (list[str]): caminhos dos trechos (ver `revision_chunk_paths`).
+
+    Yields:
+        bytes: conteúdo de cada trecho, na ordem.
+    """
+    for path in paths:
+        yield _read_chunk(path)
+
+
+async def _aread_revision(paths):
+    """Versão assíncrona de `read_revision`: as leituras rodam em uma thread."""
+    for path in paths:
+        yield await asyncio.to_thread(_read_chunk, path)
+
+
+async def aserve_revision(request, revision):
+    """
+    Gera a resposta de download de uma revisão, remontada durante o envio.
+
+    Deve ser chamada apenas depois de verificadas as permissões do usuário.
+    O conteúdo de uma revisão não muda, então o ETag é o SHA-256 dele e
+    requisições condicionais recebem 304 sem ler os trechos.
+
+    Args:
+        request (HttpRequest): requisição de download.
+        revision (DocumentRevision): revisão a ser entregue.
+
+    Returns:
+        HttpResponse: 304/412 ou o arquivo completo (200), sem Range.
+    """
+    etag = f'"{revision.sha256}"'
+    last_modified = int(revision.created_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        paths = await asyncio.to_thread(revision_chunk_paths, revision)
+        if isinstance(request, ASGIRequest):
+            content = _aread_revision(paths)
+        else:
+            content = read_revision(paths)
+        response = StreamingHttpResponse(content, content_type=revision.file_type or 'application/octet-stream')
+        response['Content-Length'] = str(revision.file_size)
+        response['Content-Disposition'] = content_disposition_header(True, revision.file_name)
+        response['Accept-Ranges'] = 'none'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,154 @@
+"""
+search.py
+
+Define a busca textual de documentos no Postgres.
+
+Cada documento guarda um `tsvector` ponderado (título > descrição > conteúdo)
+indexado por GIN, de modo que a busca não depende do tamanho do acervo.
+Os resultados são ordenados por relevância e os documentos exibidos
+recebem trechos destacados do conteúdo.
+"""
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchHeadline,
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db.models import F, FloatField, TextField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .compression import open_document_file
+from .extraction import extract_text
+from .models import Document
+
+# Marcadores usados pelo ts_headline; são trocados por <mark> após o escape
+_START_SEL = '\x02'
+_STOP_SEL = '\x03'
+
+
+def document_search_vector():
+    """
+    Monta a expressão do `tsvector` ponderado de um documento.
+
+    Returns:
+        SearchVector: título (peso A), descrição (peso B) e conteúdo (peso C).
+    """
+    config = settings.DOCUMENTS_SEARCH_CONFIG
+    return (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector('description', weight='B', config=config)
+        + SearchVector('content', weight='C', config=config)
+    )
+
+
+def update_search_index(document, extract=True):
+    """
+    Atualiza o texto extraído e o `tsvector` de um documento.
+
+    Args:
+        document (Document): documento a ser indexado.
+        extract (bool): se True, extrai novamente o texto do arquivo.
+    """
+    if extract and document.file:
+        with open_document_file(document) as fileobj:
+            document.content = extract_text(fileobj, document.file_extension)
+        Document.objects.filter(pk=document.pk).update(content=document.content)
+
+    Document.objects.filter(pk=document.pk).update(search_vector=document_search_vector())
+
+
+def search_query(text):
+    """
+    Monta a consulta textual a partir do texto digitado pelo usuário.
+
+    A consulta aceita a sintaxe de buscadores web (aspas, `-termo`, `or`).
+
+    Args:
+        text (str): termos digitados pelo usuário.
+
+    Returns:
+        SearchQuery: consulta pronta para ser aplicada ao `search_vector`.
+    """
+    return SearchQuery(text, search_type='websearch', config=settings.DOCUMENTS_SEARCH_CONFIG)
+
+
+def search_documents(queryset, text):
+    """
+    Filtra documentos pelo texto buscado e os anota com a relevância.
+
+    O filtro usa o índice GIN de `search_vector`; o `rank` é calculado
+    apenas para os documentos encontrados. O `ts_rank` do Postgres é um
+    `real` (float4); ele é convertido para `double precision`, o mesmo tipo
+    do valor gravado no cursor da paginação, para que a comparação de
+    empate (`rank = valor`) seja exata.
+
+    Args:
+        queryset (QuerySet): documentos sobre os quais buscar.
+        text (str): termos digitados pelo usuário.
+
+    Returns:
+        QuerySet: documentos encontrados, anotados com `rank`.
+    """
+    query = search_query(text)
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField()),
+    )
+
+
+def attach_snippets(documents, text):
+    """
+    Adiciona a cada documento um trecho destacado com os termos buscados.
+
+    Os trechos são gerados em uma única consulta restrita aos documentos
+    informados (normalmente os da página atual), já que o `ts_headline`
+    precisa reprocessar o texto completo de cada documento.
+
+    Args:
+        documents (Iterable[Document]): documentos exibidos na página.
+        text (str): termos digitados pelo usuário.
+    """
+    documents = list(documents)
+    if not documents:
+        return
+
+    snippets = dict(
+        Document.objects.filter(pk__in=[document.pk for document in documents])
+        .annotate(
+            snippet=SearchHeadline(
+                Concat('description', Value(' '), 'content', output_field=TextField()),
+                search_query(text),
+                config=settings.DOCUMENTS_SEARCH_CONFIG,
+                start_sel=_START_SEL,
+                stop_sel=_STOP_SEL,
+                max_fragments=2,
+                max_words=20,
+                min_words=8,
+            )
+        )
+        .values_list('pk', 'snippet')
+    )
+    for document in documents:
+        document.snippet = format_snippet(snippets.get(document.pk))
+
+
+def format_snippet(snippet):
+    """
+    Converte o trecho retornado pelo ts_headline em HTML seguro.
+
+    O conteúdo do documento é escapado antes de os marcadores serem
+    trocados por `<mark>`, evitando injeção de HTML vinda dos arquivos.
+
+    Args:
+        snippet (str): trecho com os marcadores de destaque.
+
+    Returns:
+        SafeString: trecho pronto para ser exibido no template.
+    """
+    if not snippet or _START_SEL not in snippet:
+        return ''
+    html = escape(snippet.strip())
+    return mark_safe(html.replace(_START_SEL, '<mark>').replace(_STOP_SEL, '</mark>'))
@@ -0,0 +1,144 @@
+"""
+signals.py
+
+Receptores de sinais dos modelos de documentos.
+
+- release_document_blob: libera a referência ao blob quando um documento é
+  excluído, inclusive por exclusão em cascata (ex: remoção do autor).
+- delete_blob_derivatives: remove as miniaturas e o cache da pré-visualização
+  de planilhas de um conteúdo que deixou de existir.
+- increment_comments_count / decrement_comments_count: mantêm o contador
+  `Document.comments_count` com UPDATEs atômicos (F()), sem recontar.
+- invalidate_document_card / invalidate_comment_card: removem do cache o
+  card do documento na listagem quando ele ou seus comentários mudam.
+- add_document_usage / remove_document_usage: mantêm a tabela de uso do
+  armazenamento (`StorageUsage`) quando um documento ativo é criado ou
+  excluído em definitivo.
+- invalidate_share_permissions / invalidate_membership_permissions:
+  descartam do cache os níveis de acesso afetados quando um
+  compartilhamento ou a associação de um usuário a um grupo muda.
+- release_revision_chunks: libera as referências aos trechos de uma revisão
+  excluída (inclusive pela exclusão definitiva do documento).
+"""
+
+from collections import Counter
+
+from django.db.models import F, QuerySet
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.jobs.queue import enqueue
+
+from .derivatives import delete_derivatives, derivative_key
+from .fragments import invalidate_card
+from .models import Blob, Comment, Document, DocumentRevision, DocumentShare
+from .permissions import invalidate_group_permissions, invalidate_user_permissions
+from .revisions import release_chunks
+from .storage import release_blob
+from .tables import delete_table, supports_table
+from .usage import record_usage
+
+
+@receiver(post_delete, sender=Document)
+def release_document_blob(sender, instance, **kwargs):
+    """Decrementa a contagem de referências do blob do documento excluído."""
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    else:
+        # documentos fora do armazenamento deduplicado têm derivados próprios
+        enqueue(delete_derivatives, key=derivative_key(instance))
+        if supports_table(instance):
+            enqueue(delete_table, key=derivative_key(instance))
+
+
+@receiver(post_delete, sender=Blob)
+def delete_blob_derivatives(sender, instance, **kwargs):
+    """Enfileira a remoção dos derivados de um blob excluído."""
+    enqueue(delete_derivatives, key=instance.pk)
+    enqueue(delete_table, key=instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comments_count(sender, instance, created, raw=False, **kwargs):
+    """Soma um ao contador de comentários do documento."""
+    if created and not raw:
+        Document.all_objects.filter(pk=instance.document_id).update(
+            comments_count=F('comments_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def decrement_comments_count(sender, instance, origin=None, **kwargs):
+    """Subtrai um do contador de comentários do documento."""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is Document:
+        # o próprio documento está sendo excluído (ex: limpeza da lixeira)
+        return
+    Document.all_objects.filter(pk=instance.document_id, comments_count__gt=0).update(
+        comments_count=F('comments_count') - 1
+    )
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_document_card(sender, instance, raw=False, **kwargs):
+    """Descarta o card em cache de um documento alterado ou excluído."""
+    if not raw:
+        invalidate_card(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_card(sender, instance, raw=False, origin=None, **kwargs):
+    """Descarta o card em cache do documento de um comentário criado ou excluído."""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if not raw and origin_model is not Document:
+        invalidate_card(instance.document_id)
+
+
+@receiver(post_save, sender=Document)
+def add_document_usage(sender, instance, created, raw=False, **kwargs):
+    """Soma o novo documento ao uso de armazenamento do autor."""
+    if created and not raw and instance.deleted_at is None:
+        record_usage([instance])
+
+
+@receiver(post_delete, sender=Document)
+def remove_document_usage(sender, instance, **kwargs):
+    """Subtrai do uso do autor um documento ativo excluído em definitivo."""
+    # documentos na lixeira já foram subtraídos ao serem excluídos
+    if instance.deleted_at is None:
+        record_usage([instance], sign=-1)
+
+
+@receiver(post_delete, sender=DocumentRevision)
+def release_revision_chunks(sender, instance, **kwargs):
+    """Decrementa a contagem de referências dos trechos da revisão excluída."""
+    release_chunks(Counter(instance.chunks))
+
+
+@receiver(post_save, sender=DocumentShare)
+@receiver(post_delete, sender=DocumentShare)
+def invalidate_share_permissions(sender, instance, raw=False, **kwargs):
+    """Descarta os níveis de acesso em cache de quem recebeu o compartilhamento."""
+    if raw:
+        return
+    if instance.user_id:
+        invalidate_user_permissions([instance.user_id])
+    else:
+        invalidate_group_permissions()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_membership_permissions(sender, instance, action, pk_set=None, **kwargs):
+    """Descarta os níveis em cache quando um usuário entra ou sai de um grupo."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, User):
+        invalidate_user_permissions([instance.pk])
+    elif pk_set:
+        invalidate_user_permissions(pk_set)
+    else:
+        # grupo esvaziado: os membros anteriores não são conhecidos
+        invalidate_group_permissions()
@@ -0,0 +1,328 @@
+"""
+similarity.py
+
+Detecção de documentos quase duplicados (mesmo texto com pequenas
+alterações), a partir do texto extraído para a busca.
+
+Cada documento recebe uma assinatura MinHash: o texto é dividido em
+sequências de `SHINGLE_SIZE` palavras e, para cada uma de `NUM_PERM`
+funções de hash, guarda-se o menor hash entre as sequências. A fração de
+posições iguais entre duas assinaturas estima a similaridade de Jaccard
+entre os textos.
+
+Para não comparar um documento com todos os outros, a assinatura é dividida
+em `BANDS` faixas de `ROWS` valores (LSH): documentos parecidos têm, com alta
+probabilidade, ao menos uma faixa idêntica. Os hashes das faixas ficam em
+um array indexado (GIN), e os candidatos de um documento são lidos com uma
+única consulta de sobreposição; só eles são comparados, de uma vez, com
+NumPy.
+
+- No upload (e a cada nova versão), o worker calcula a assinatura e marca
+  o documento como provável cópia do mais parecido já existente
+  (`update_signature`).
+- O comando `find_duplicates` calcula as assinaturas que faltam e agrupa
+  todo o acervo (`cluster_signatures`).
+
+Notas:
+    - Com 16 faixas de 8 valores, pares com similaridade de 0.8 viram
+      candidatos em ~95% dos casos, e pares abaixo de 0.5 raramente; por isso
+      `DOCUMENTS_DUPLICATE_THRESHOLD` não deve ficar abaixo de ~0.7.
+    - As funções de hash vêm de uma semente fixa: assinaturas calculadas em
+      processos e momentos diferentes são comparáveis. Alterar as constantes
+      exige recalcular todas (`find_duplicates --rebuild`).
+    - Documentos sem texto (imagens) ou com menos de `MIN_WORDS` palavras não
+      recebem assinatura.
+"""
+
+import re
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Q
+
+from .models import Document, DocumentSignature
+from .permissions import visible_documents
+
+# Palavras por sequência comparada (shingle)
+SHINGLE_SIZE = 5
+
+# Documentos com menos palavras não recebem assinatura
+MIN_WORDS = 20
+
+# Valores da assinatura MinHash e sua divisão em faixas (BANDS * ROWS)
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Semente das funções de hash (fixa: as assinaturas precisam ser comparáveis)
+SEED = 20261018
+
+# Sequências processadas por vez no cálculo da assinatura (limita a memória)
+SHINGLE_BATCH = 4096
+
+# Candidatos lidos por documento no upload (limita faixas muito comuns)
+MAX_CANDIDATES = 500
+
+# Cópias prováveis listadas nos detalhes do documento
+DUPLICATES_SHOWN = 10
+
+# Linhas comparadas por vez no agrupamento (limita a memória)
+COMPARE_BATCH = 65536
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_WORD_RE = re.compile(r'\w+')
+
+_rng = np.random.default_rng(SEED)
+# h(x) = (a * x + b) mod p; com a, b e x de 32 bits, a conta não transborda
+_PERM_A = _rng.integers(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingle_hashes(text):
+    """
+    Calcula os hashes (32 bits) das sequências de palavras de um texto.
+
+    Args:
+        text (str): texto extraído do documento.
+
+    Returns:
+        numpy.ndarray | None: hashes únicos (uint64 com valores de 32 bits);
+            None se o texto tiver menos de `MIN_WORDS` palavras.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < max(MIN_WORDS, SHINGLE_SIZE):
+        return None
+    word_hashes = np.fromiter(
+        (zlib.crc32(word.encode()) for word in words), dtype=np.uint64, count=len(words)
+    )
+    count = len(words) - SHINGLE_SIZE + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        # polinômio sobre as palavras da sequência (módulo 2**64)
+        hashes = hashes * _MIX + word_hashes[offset:offset + count]
+    hashes = np.unique(hashes)
+    return (hashes ^ (hashes >> np.uint64(32))) & _MAX_HASH
+
+
+def text_signature(text):
+    """
+    Calcula a assinatura MinHash de um texto.
+
+    Args:
+        text (str): texto extraído do documento.
+
+    Returns:
+        numpy.ndarray | None: `NUM_PERM` valores uint32; None se o texto for
+            curto demais para ser comparado.
+    """
+    hashes = shingle_hashes(text)
+    if hashes is None:
+        return None
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), SHINGLE_BATCH):
+        batch = hashes[start:start + SHINGLE_BATCH]
+        permuted = (np.outer(_PERM_A, batch) + _PERM_B[:, None]) % _MERSENNE_PRIME
+        np.minimum(signature, (permuted & _MAX_HASH).min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def band_hashes(signatures):
+    """
+    Calcula os hashes das faixas LSH de uma ou mais assinaturas.
+
+    Args:
+        signatures (numpy.ndarray): assinatura (NUM_PERM,) ou matriz
+            (N, NUM_PERM) de assinaturas.
+
+    Returns:
+        numpy.ndarray: int64 com formato (BANDS,) ou (N, BANDS); faixas
+            iguais em posições diferentes têm hashes diferentes.
+    """
+    rows = signatures.astype(np.uint64).reshape(signatures.shape[:-1] + (BANDS, ROWS))
+    hashes = np.arange(1, BANDS + 1, dtype=np.uint64) * _MIX
+    for row in range(ROWS):
+        hashes = hashes * _MIX + rows[..., row]
+    hashes ^= hashes >> np.uint64(31)
+    return hashes.view(np.int64)
+
+
+def encode_signature(signature):
+    """Converte a assinatura nos bytes gravados em `DocumentSignature.minhash`."""
+    return signature.astype('<u4').tobytes()
+
+
+def decode_signatures(values):
+    """
+    Converte os bytes gravados em uma matriz de assinaturas.
+
+    Args:
+        values (Iterable[bytes | memoryview]): valores de `minhash`.
+
+    Returns:
+        numpy.ndarray: matriz uint32 (N, NUM_PERM).
+    """
+    data = b''.join(bytes(value) for value in values)
+    return np.frombuffer(data, dtype='<u4').reshape(-1, NUM_PERM)
+
+
+def estimate_similarity(signature, others):
+    """
+    Estima a similaridade de Jaccard entre uma assinatura e várias outras.
+
+    Args:
+        signature (numpy.ndarray): assinatura (NUM_PERM,).
+        others (numpy.ndarray): matriz (N, NUM_PERM).
+
+    Returns:
+        numpy.ndarray: similaridades entre 0 e 1, uma por linha.
+    """
+    return (others == signature).mean(axis=1)
+
+
+def update_signature(document):
+    """
+    Calcula a assinatura de um documento e o marca como provável cópia.
+
+    Os candidatos são os documentos ativos com alguma faixa em comum (uma
+    consulta no índice GIN); entre os que passam de
+    `DOCUMENTS_DUPLICATE_THRESHOLD`, o documento é marcado como cópia do
+    mais parecido (ou do original dele, se ele próprio for uma cópia).
+
+    Args:
+        document (Document): documento com o `content` já extraído.
+
+    Returns:
+        DocumentSignature | None: assinatura gravada; None (e a assinatura
+            anterior removida) se o texto for curto demais.
+    """
+    signature = text_signature(document.content)
+    if signature is None:
+        DocumentSignature.objects.filter(pk=document.pk).delete()
+        return None
+    bands = band_hashes(signature)
+
+    candidates = list(
+        DocumentSignature.objects
+        .filter(bands__overlap=bands.tolist(), document__deleted_at__isnull=True)
+        # as cópias deste documento não podem virar o original dele
+        .exclude(Q(pk=document.pk) | Q(duplicate_of=document.pk))
+        .values_list('document_id', 'duplicate_of_id', 'minhash')[:MAX_CANDIDATES]
+    )
+    duplicate_of = similarity = None
+    if candidates:
+        scores = estimate_similarity(signature, decode_signatures(row[2] for row in candidates))
+        best = int(scores.argmax())
+        if scores[best] >= settings.DOCUMENTS_DUPLICATE_THRESHOLD:
+            by_document = {row[0]: float(score) for row, score in zip(candidates, scores)}
+            duplicate_of = candidates[best][1] or candidates[best][0]
+            similarity = by_document.get(duplicate_of, float(scores[best]))
+
+    record, _ = DocumentSignature.objects.update_or_create(
+        document_id=document.pk,
+        defaults={
+            'minhash': encode_signature(signature),
+            'bands': bands.tolist(),
+            'duplicate_of_id': duplicate_of,
+            'similarity': similarity,
+        },
+    )
+    return record
+
+
+def near_duplicates(document, user):
+    """
+    Lista os documentos quase duplicados de um documento, visíveis ao usuário.
+
+    Args:
+        document (Document): documento exibido.
+        user (User): usuário que faz a consulta.
+
+    Returns:
+        tuple[Document | None, list[Document]]: o provável original do
+            documento e as suas prováveis cópias (até `DUPLICATES_SHOWN`, as
+            mais parecidas primeiro), anotados com `similarity`.
+    """
+    documents = visible_documents(Document.objects.only('pk', 'title', 'author_id'), user)
+    original = (
+        documents.filter(near_duplicates__document=document)
+        .annotate(similarity=F('near_duplicates__similarity'))
+        .first()
+    )
+    copies = list(
+        documents.filter(signature__duplicate_of=document)
+        .annotate(similarity=F('signature__similarity'))
+        .order_by('-similarity', 'pk')[:DUPLICATES_SHOWN]
+    )
+    return original, copies
+
+
+def _similar_rows(matrix, left, right, threshold):
+    """Filtra os pares de linhas (left[i], right[i]) com similaridade >= threshold."""
+    keep = np.zeros(len(left), dtype=bool)
+    for start in range(0, len(left), COMPARE_BATCH):
+        stop = start + COMPARE_BATCH
+        scores = (matrix[left[start:stop]] == matrix[right[start:stop]]).mean(axis=1)
+        keep[start:stop] = scores >= threshold
+    return left[keep], right[keep]
+
+
+def cluster_signatures(matrix, threshold):
+    """
+    Agrupa as assinaturas parecidas de todo o acervo.
+
+    Em cada faixa, as linhas são ordenadas pelo hash da faixa; cada linha de
+    um grupo com o mesmo hash é comparada (em lote) com a primeira do grupo.
+    Os pares acima do limite são unidos (union-find), e cada grupo fica
+    representado pela sua primeira linha.
+
+    Args:
+        matrix (numpy.ndarray): assinaturas (N, NUM_PERM), na ordem em que os
+            documentos foram criados.
+        threshold (float): similaridade mínima entre dois documentos.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: para cada linha, a linha que
+            representa o seu grupo (ela própria, se for original) e a
+            similaridade estimada com ela (NaN nos originais).
+    """
+    count = len(matrix)
+    bands = band_hashes(matrix)
+    positions = np.arange(count)
+    edges = []
+    for band in range(BANDS):
+        # estável: dentro de cada grupo, a linha mais antiga vem primeiro
+        order = np.argsort(bands[:, band], kind='stable')
+        column = bands[order, band]
+        starts = np.ones(count, dtype=bool)
+        starts[1:] = column[1:] != column[:-1]
+        anchors = order[np.maximum.accumulate(np.where(starts, positions, 0))]
+        grouped = anchors != order
+        edges.append(_similar_rows(matrix, anchors[grouped], order[grouped], threshold))
+
+    parent = list(range(count))
+
+    def find(row):
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    left = np.concatenate([pair[0] for pair in edges])
+    right = np.concatenate([pair[1] for pair in edges])
+    if len(left):
+        for a, b in np.unique(np.stack([left, right], axis=1), axis=0).tolist():
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                # o representante é sempre a linha mais antiga do grupo
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    representatives = np.fromiter((find(row) for row in range(count)), dtype=np.int64, count=count)
+    scores = np.full(count, np.nan)
+    copies = np.flatnonzero(representatives != positions)
+    for start in range(0, len(copies), COMPARE_BATCH):
+        rows = copies[start:start + COMPARE_BATCH]
+        scores[rows] = (matrix[rows] == matrix[representatives[rows]]).mean(axis=1)
+    return representatives, scores
@@ -1,19 +1,20 @@
 (function() {
+    const form = document.getElementById('search-form');
     const search = document.getElementById('search');
-    if (search) {
+    if (form && search) {
+        // a busca é feita no servidor; aguarda o usuário parar de digitar
+        let timer = null;
         search.addEventListener('input', function() {
-            const query = this.value.toLowerCase();
-
-            const cards = document.querySelectorAll('.card-document');
-            cards.forEach(card => {
-                const title = card.querySelector('#title-document').textContent.toLowerCase();
-                console.log(title);
-                if (title.includes(query)) {
-                    card.style.display = 'flex';
-                } else {
-                    card.style.display = 'none';
-                }
-            });
+            clearTimeout(timer);
+            timer = setTimeout(function() {
+                form.requestSubmit();
+            }, 400);
         });
+
+        // mantém o cursor no fim do texto após o recarregamento da página
+        if (search.value) {
+            search.focus();
+            search.setSelectionRange(search.value.length, search.value.length);
+        }
     }
-})();
\ No newline at end of file
+})();
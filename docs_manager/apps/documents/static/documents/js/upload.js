@@ -0,0 +1,159 @@
+(function() {
+    const form = document.getElementById('upload-form');
+    const fileInput = document.getElementById('id_file');
+    if (!form || !fileInput) {
+        return;
+    }
+
+    // acima deste tamanho o arquivo é enviado em partes (upload retomável)
+    const maxSingleSize = parseInt(form.dataset.maxSingleSize, 10);
+    const parallelChunks = 4;
+    const maxRetries = 3;
+    const csrfToken = form.querySelector('[name="csrfmiddlewaretoken"]').value;
+    const submitButton = form.querySelector('button[type="submit"]');
+
+    async function sha256(file) {
+        const buffer = await file.arrayBuffer();
+        const digest = await window.crypto.subtle.digest('SHA-256', buffer);
+        return Array.from(new Uint8Array(digest))
+            .map(byte => byte.toString(16).padStart(2, '0'))
+            .join('');
+    }
+
+    async function request(method, url, body) {
+        const response = await fetch(url, {
+            method: method,
+            body: body,
+            headers: {'X-CSRFToken': csrfToken},
+        });
+        const data = response.status === 204 ? {} : await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || ('Erro HTTP ' + response.status));
+        }
+        return data;
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    // a sessão fica salva no navegador para que o envio possa ser retomado
+    // depois de uma queda de conexão ou de recarregar a página
+    function sessionKey(file) {
+        return 'upload-session:' + [file.name, file.size, file.lastModified].join(':');
+    }
+
+    async function openSession(file) {
+        const base = form.dataset.sessionUrl;
+        const saved = localStorage.getItem(sessionKey(file));
+        if (saved) {
+            try {
+                const session = await request('GET', base + saved + '/');
+                if (session.status === 'open') {
+                    return session;
+                }
+            } catch (error) {
+                localStorage.removeItem(sessionKey(file));
+            }
+        }
+        const body = new FormData();
+        body.append('file_name', file.name);
+        body.append('file_size', file.size);
+        body.append('file_type', file.type);
+        const session = await request('POST', base, body);
+        localStorage.setItem(sessionKey(file), session.id);
+        return session;
+    }
+
+    async function sendChunk(file, session, index) {
+        const start = index * session.chunk_size;
+        const chunk = file.slice(start, Math.min(start + session.chunk_size, file.size));
+        const url = form.dataset.sessionUrl + session.id + '/chunks/' + index + '/';
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await request('PUT', url, chunk);
+            } catch (error) {
+                if (attempt >= maxRetries) {
+                    throw error;
+                }
+                await sleep(1000 * Math.pow(2, attempt));
+            }
+        }
+    }
+
+    async function chunkedUpload(file) {
+        const session = await openSession(file);
+        const received = new Set(session.received);
+        const pending = [];
+        for (let index = 0; index < session.total_chunks; index++) {
+            if (!received.has(index)) {
+                pending.push(index);
+            }
+        }
+
+        let done = received.size;
+        async function worker() {
+            while (pending.length) {
+                await sendChunk(file, session, pending.shift());
+                done++;
+                submitButton.textContent =
+                    'Enviando... ' + Math.floor(100 * done / session.total_chunks) + '%';
+            }
+        }
+        const workers = [];
+        for (let i = 0; i < parallelChunks; i++) {
+            workers.push(worker());
+        }
+        await Promise.all(workers);
+
+        const body = new FormData();
+        body.append('title', form.querySelector('[name="title"]').value);
+        body.append('description', form.querySelector('[name="description"]').value);
+        await request('POST', form.dataset.sessionUrl + session.id + '/finalize/', body);
+        localStorage.removeItem(sessionKey(file));
+        window.location.href = form.dataset.successUrl;
+    }
+
+    // calcula o hash antes do envio; se o servidor já tiver o conteúdo,
+    // envia apenas o hash e os metadados, sem os bytes do arquivo
+    async function hashedUpload(file) {
+        try {
+            const hash = await sha256(file);
+            const data = await request('GET', form.dataset.checkUrl + '?sha256=' + hash);
+            if (data.exists) {
+                form.querySelector('[name="sha256"]').value = hash;
+                form.querySelector('[name="source_name"]').value = file.name;
+                form.querySelector('[name="source_type"]').value = file.type;
+                fileInput.disabled = true;
+            }
+        } catch (error) {
+            console.error('Falha ao verificar o arquivo:', error);
+        }
+        form.submit();
+    }
+
+    form.addEventListener('submit', async function(event) {
+        const file = fileInput.files[0];
+        if (!file || form.dataset.submitting) {
+            return;
+        }
+        event.preventDefault();
+        form.dataset.submitting = '1';
+        submitButton.disabled = true;
+
+        if (file.size > maxSingleSize) {
+            try {
+                await chunkedUpload(file);
+            } catch (error) {
+                alert('Falha no upload: ' + error.message + '. Envie novamente para retomar.');
+                delete form.dataset.submitting;
+                submitButton.disabled = false;
+                submitButton.textContent = 'Upload';
+            }
+        } else if (window.crypto && window.crypto.subtle) {
+            await hashedUpload(file);
+        } else {
+            form.submit();
+        }
+    });
+})();
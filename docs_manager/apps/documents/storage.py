@@ -0,0 +1,396 @@
+"""
+storage.py
+
+Armazenamento endereçado por conteúdo (deduplicado) dos arquivos enviados.
+
+Cada conteúdo distinto é gravado uma única vez em 'blobs/<aa>/<bb>/<sha256>'
+e representado por um `Blob`, que conta quantos documentos o referenciam.
+O arquivo físico só é apagado quando a contagem chega a zero.
+
+Notas:
+    - O modo é controlado por `DOCUMENTS_DEDUPLICATE` nas configurações.
+    - Conteúdos de texto são gravados comprimidos (ver `compression.py`);
+      o caminho do blob recebe então o sufixo do algoritmo.
+    - Documentos antigos (sem blob) continuam em 'documents/' até serem
+      migrados pelo comando `deduplicate_documents`.
+"""
+
+import hashlib
+import os
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from apps.jobs.queue import enqueue
+
+from .compression import SUFFIXES, choose_encoding, compress, path_encoding
+from .models import Blob, Document
+
+# Tamanho dos blocos lidos ao calcular o hash
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Liberações acumuladas por `batch_blob_releases` (None fora do bloco)
+_pending_releases = ContextVar('pending_blob_releases', default=None)
+
+
+def hash_file(fileobj):
+    """
+    Calcula o SHA-256 de um arquivo, lendo-o em blocos.
+
+    Args:
+        fileobj (File): arquivo aberto em modo binário.
+
+    Returns:
+        str: hash hexadecimal do conteúdo.
+    """
+    digest = hashlib.sha256()
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    if hasattr(fileobj, 'chunks'):
+        chunks = fileobj.chunks(HASH_CHUNK_SIZE)
+    else:
+        chunks = iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b'')
+    for chunk in chunks:
+        digest.update(chunk)
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def blob_path(sha256, encoding=''):
+    """
+    Retorna o caminho de armazenamento de um conteúdo a partir do hash.
+
+    Os dois primeiros níveis de diretório evitam pastas com milhares de
+    arquivos.
+
+    Args:
+        sha256 (str): hash hexadecimal do conteúdo.
+        encoding (str): algoritmo de compressão do arquivo ('' se nenhum).
+
+    Returns:
+        str: caminho relativo ao MEDIA_ROOT.
+    """
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{SUFFIXES.get(encoding, "")}'
+
+
+def _write_blob_file(path, fileobj):
+    """
+    Grava o conteúdo no caminho exato do blob (comprimido, se for o caso), se ainda não existir.
+
+    Returns:
+        bool: True se o arquivo foi criado por esta chamada.
+    """
+    if default_storage.exists(path):
+        return False
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    encoding = path_encoding(path)
+    if encoding:
+        with compress(fileobj, encoding) as compressed:
+            saved = default_storage.save(path, compressed)
+    else:
+        saved = default_storage.save(path, fileobj)
+    if saved != path:
+        # outro processo gravou o mesmo conteúdo ao mesmo tempo
+        default_storage.delete(saved)
+        return False
+    return True
+
+
+def save_blob_file(fileobj, sha256, file_name=''):
+    """
+    Grava o conteúdo de um blob no disco, sem registrar referências.
+
+    Usado pela importação em lote, que grava os arquivos em paralelo e
+    registra as referências depois, com `add_blob_references`.
+
+    Args:
+        fileobj (File): arquivo aberto em modo binário.
+        sha256 (str): hash hexadecimal do conteúdo.
+        file_name (str): nome original, usado para decidir a compressão.
+
+    Returns:
+        tuple[str, bool]: caminho do blob, relativo ao MEDIA_ROOT, e se o
+            arquivo foi gravado por esta chamada (False se já existia).
+    """
+    path = blob_path(sha256, choose_encoding(fileobj, file_name))
+    return path, _write_blob_file(path, fileobj)
+
+
+def add_blob_references(references):
+    """
+    Registra referências a vários blobs com um número fixo de consultas.
+
+    Blobs inexistentes são criados; os existentes são travados (em ordem,
+    evitando deadlocks com `release_blob`) e têm a contagem somada em um
+    único UPDATE. Deve ser chamada dentro da transação que cria os
+    documentos.
+
+    Args:
+        references (dict): hash -> (caminho gravado, tamanho, quantidade de
+            novas referências).
+
+    Returns:
+        dict: hash -> caminho do arquivo do blob. Difere do caminho gravado
+            quando o blob já existia com outra compressão.
+    """
+    if not references:
+        return {}
+
+    def missing_blobs(shas):
+        return [
+            Blob(sha256=sha, file=references[sha][0], size=references[sha][1], ref_count=0)
+            for sha in shas
+        ]
+
+    with transaction.atomic():
+        Blob.objects.bulk_create(missing_blobs(references), ignore_conflicts=True)
+        paths = dict(
+            Blob.objects.select_for_update().filter(pk__in=references)
+            .order_by('pk').values_list('pk', 'file')
+        )
+        # um blob pode ter sido liberado entre a inserção e o bloqueio
+        missing = set(references) - set(paths)
+        if missing:
+            Blob.objects.bulk_create(missing_blobs(missing), ignore_conflicts=True)
+            paths.update((sha, references[sha][0]) for sha in missing)
+
+        Blob.objects.filter(pk__in=references).update(
+            ref_count=F('ref_count') + Case(
+                *[When(pk=sha, then=Value(count)) for sha, (_, _, count) in references.items()],
+                default=Value(0),
+            )
+        )
+    return paths
+
+
+def store_blob(fileobj, sha256=None, file_name=''):
+    """
+    Armazena um conteúdo e adiciona uma referência ao blob correspondente.
+
+    Se o conteúdo já existir, nenhum byte é gravado: apenas a contagem de
+    referências é incrementada.
+
+    Args:
+        fileobj (File): arquivo aberto em modo binário.
+        sha256 (str | None): hash já calculado do conteúdo, se disponível.
+        file_name (str): nome original, usado para decidir a compressão.
+
+    Returns:
+        Blob: blob que passa a ser referenciado pelo chamador.
+    """
+    sha256 = sha256 or hash_file(fileobj)
+    path = blob_path(sha256, choose_encoding(fileobj, file_name))
+
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=sha256,
+            defaults={'file': path, 'size': fileobj.size, 'ref_count': 1},
+        )
+        if not created:
+            Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+            blob.ref_count += 1
+        # também regrava o arquivo caso ele tenha sido perdido no disco
+        _write_blob_file(blob.file.name, fileobj)
+
+    return blob
+
+
+def adopt_blob(upload):
+    """
+    Registra como blob um arquivo já gravado durante o upload.
+
+    O arquivo recebido (ver `upload_handlers.py`) é movido, sem cópia, para
+    o caminho do blob. Se o conteúdo já existir, apenas a contagem de
+    referências é incrementada e o arquivo recebido fica para ser descartado.
+
+    A mudança de lugar só é feita após o commit: se a transação do chamador
+    for desfeita, o arquivo continua em 'incoming/' e é descartado com o
+    upload, em vez de ficar no caminho de um blob que não existe no banco.
+
+    Args:
+        upload (StagedUploadedFile): arquivo recebido, com hash e compressão.
+
+    Returns:
+        Blob: blob que passa a ser referenciado pelo chamador.
+    """
+    path = blob_path(upload.sha256, upload.compression)
+
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=upload.sha256,
+            defaults={'file': path, 'size': upload.size, 'ref_count': 1},
+        )
+        if not created:
+            Blob.objects.filter(pk=upload.sha256).update(ref_count=F('ref_count') + 1)
+            blob.ref_count += 1
+        # também repõe o arquivo caso ele tenha sido perdido no disco
+        if blob.file.name == path and not default_storage.exists(path):
+            transaction.on_commit(lambda: upload.move_to(path))
+
+    return blob
+
+
+def acquire_blob(sha256):
+    """
+    Adiciona uma referência a um blob já armazenado, sem receber os bytes.
+
+    Usado quando o cliente envia apenas o hash de um conteúdo que o
+    servidor já possui.
+
+    Args:
+        sha256 (str): hash hexadecimal do conteúdo.
+
+    Returns:
+        Blob | None: blob referenciado, ou None se o conteúdo não existir.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is None or not default_storage.exists(blob.file.name):
+            return None
+        Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') + 1)
+        blob.ref_count += 1
+    return blob
+
+
+def release_blob(sha256):
+    """
+    Remove uma referência de um blob, apagando-o quando não houver outras.
+
+    O arquivo físico é removido pela fila de tarefas depois que a transação
+    é confirmada, e apenas se nenhum novo blob com o mesmo hash tiver sido
+    criado nesse meio tempo.
+
+    Dentro de `batch_blob_releases`, a liberação é apenas acumulada e feita
+    em lote ao final do bloco.
+
+    Args:
+        sha256 (str): hash do blob a ser liberado.
+    """
+    pending = _pending_releases.get()
+    if pending is not None:
+        pending[sha256] += 1
+        return
+
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=sha256).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            Blob.objects.filter(pk=sha256).update(ref_count=F('ref_count') - 1)
+            return
+        path = blob.file.name
+        blob.delete()
+
+    enqueue(delete_blob_file, sha256=sha256, path=path)
+
+
+@contextmanager
+def batch_blob_releases():
+    """
+    Acumula as chamadas a `release_blob` e as aplica em lote ao final do bloco.
+
+    Usado pela limpeza da lixeira, em que milhares de documentos são
+    excluídos de uma vez: em vez de um SELECT FOR UPDATE por documento, os
+    blobs são travados (em ordem, como em `add_blob_references`) e têm a
+    contagem decrementada em um único UPDATE. Deve ser usado dentro da
+    transação que exclui os documentos.
+
+    Os arquivos físicos dos blobs que chegaram a zero não são enfileirados:
+    o chamador os recebe na lista e decide como apagá-los, depois do commit
+    (ver `delete_blob_file`).
+
+    Yields:
+        list[tuple]: preenchida ao final do bloco com (hash, caminho) de cada
+            blob excluído.
+    """
+    pending = Counter()
+    released = []
+    token = _pending_releases.set(pending)
+    try:
+        yield released
+    finally:
+        _pending_releases.reset(token)
+
+    if not pending:
+        return
+    with transaction.atomic():
+        blobs = list(
+            Blob.objects.select_for_update().filter(pk__in=pending)
+            .order_by('pk').values_list('pk', 'file', 'ref_count')
+        )
+        unused = [(sha, path) for sha, path, ref_count in blobs if ref_count <= pending[sha]]
+        if unused:
+            Blob.objects.filter(pk__in=[sha for sha, _ in unused]).delete()
+        remaining = {sha: pending[sha] for sha, _, ref_count in blobs if ref_count > pending[sha]}
+        if remaining:
+            Blob.objects.filter(pk__in=remaining).update(
+                ref_count=F('ref_count') - Case(
+                    *[When(pk=sha, then=Value(count)) for sha, count in remaining.items()],
+                    default=Value(0),
+                )
+            )
+    released.extend(unused)
+
+
+def compress_blob(sha256):
+    """
+    Regrava comprimido o arquivo de um blob gravado antes da compressão.
+
+    O arquivo novo é gravado antes da troca; o caminho do blob e dos
+    documentos que o referenciam é atualizado em uma transação e o arquivo
+    antigo é apagado após o commit.
+
+    Args:
+        sha256 (str): hash do blob.
+
+    Returns:
+        tuple | None: (tamanho antigo, tamanho novo) em bytes, ou None se o
+            blob não existir, já estiver comprimido ou não valer a pena
+            comprimi-lo.
+    """
+    blob = Blob.objects.filter(pk=sha256).first()
+    if blob is None or path_encoding(blob.file.name):
+        return None
+    old_path = blob.file.name
+    file_name = blob.documents.values_list('file_name', flat=True).first() or ''
+
+    with default_storage.open(old_path, 'rb') as fileobj:
+        encoding = choose_encoding(fileobj, file_name)
+        if not encoding:
+            return None
+        new_path = blob_path(sha256, encoding)
+        created = _write_blob_file(new_path, fileobj)
+    sizes = (default_storage.size(old_path), default_storage.size(new_path))
+
+    with transaction.atomic():
+        updated = Blob.objects.select_for_update().filter(pk=sha256, file=old_path).update(file=new_path)
+        if not updated:
+            # o blob foi liberado ou regravado durante a compressão; o arquivo
+            # novo só é apagado se foi gravado aqui (senão pertence a outro processo)
+            if created:
+                transaction.on_commit(lambda: default_storage.delete(new_path))
+            return None
+        Document.all_objects.filter(blob_id=sha256).update(file=new_path)
+        transaction.on_commit(lambda: default_storage.delete(old_path))
+    return sizes
+
+
+def delete_blob_file(sha256, path):
+    """
+    Tarefa que apaga o arquivo de um blob que não existe mais no banco.
+
+    A remoção é tentada direto, sem verificar antes se o arquivo existe: se
+    outra execução (ou a limpeza da lixeira) já o apagou, não há o que fazer.
+    """
+    if Blob.objects.filter(pk=sha256).exists():
+        return
+    try:
+        os.remove(default_storage.path(path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,77 @@
+"""
+streaming.py
+
+Respostas enviadas em partes (streaming), sem montar o conteúdo inteiro
+em memória antes do primeiro byte.
+
+Usado pela listagem de documentos, cujo cabeçalho sai antes das consultas
+(o navegador já baixa o CSS e as fontes enquanto o servidor lê a página de
+documentos), e pela exportação em .zip.
+
+Notas:
+    - O gerador é consumido depois que a view retorna, fora dos
+      middlewares. `streaming_response` o executa em uma cópia do contexto
+      da requisição (ContextVars), então as consultas continuam indo para a
+      réplica escolhida (ver `db_routing.py`) e entrando nas métricas (ver
+      `instrumentation.py`).
+    - Em ASGI, o Django acumularia em memória um iterador síncrono inteiro
+      antes de enviá-lo; por isso ele é consumido com `aiterate`, um bloco
+      por vez em uma thread.
+"""
+
+import contextvars
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+
+async def aiterate(iterator):
+    """
+    Consome um iterador síncrono fora do event loop, um bloco por vez.
+
+    Args:
+        iterator (Iterator[bytes | str]): gerador do conteúdo.
+
+    Yields:
+        bytes | str: os mesmos blocos do iterador.
+    """
+    next_chunk = sync_to_async(partial(next, iterator, None), thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk()) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close, thread_sensitive=True)()
+
+
+def _in_context(iterator, context):
+    """Avança o gerador sempre dentro do contexto da requisição."""
+    try:
+        while True:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        context.run(iterator.close)
+
+
+def streaming_response(request, chunks, content_type='text/html; charset=utf-8'):
+    """
+    Monta uma resposta que envia os blocos de um gerador à medida que são produzidos.
+
+    Args:
+        request (HttpRequest): requisição atual.
+        chunks (Generator[str | bytes]): gerador do conteúdo; deve ser
+            criado (e não iniciado) pela view.
+        content_type (str): tipo do conteúdo.
+
+    Returns:
+        StreamingHttpResponse: resposta sem Content-Length.
+    """
+    content = _in_context(chunks, contextvars.copy_context())
+    if isinstance(request, ASGIRequest):
+        content = aiterate(content)
+    return StreamingHttpResponse(content, content_type=content_type)
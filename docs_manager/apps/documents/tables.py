@@ -0,0 +1,599 @@
+"""
+tables.py
+
+Pré-visualização paginada de planilhas (.csv e .xlsx).
+
+Cada planilha é lida uma única vez, em blocos (o CSV pelo leitor do
+pandas, o XLSX pelo XML da primeira aba, com `iterparse`), e convertida em
+um cache colunar em disco, endereçado pelo conteúdo (a mesma chave dos
+derivados). Cada coluna é gravada em um arquivo binário próprio:
+- números: float64 (NaN para células vazias);
+- datas: int64 com nanossegundos desde 1970 em UTC (NaT para vazias);
+- texto: deslocamentos int64 + bytes UTF-8 concatenados.
+
+Os arquivos são abertos com `numpy.memmap`, então exibir um intervalo de
+linhas lê do disco apenas as linhas pedidas, qualquer que seja o tamanho
+da planilha. Os tipos e as estatísticas de cada coluna (vazios, mínimo,
+máximo, média) são calculados durante a leitura e ficam em 'meta.json'.
+
+Notas:
+    - A conversão roda na fila de tarefas (após o upload ou no primeiro
+      acesso); enquanto isso, a página informa que a visualização está
+      sendo preparada.
+    - O cache fica em `DOCUMENTS_TABLE_CACHE_ROOT`, que precisa ser um disco
+      local (o memmap não funciona sobre armazenamento remoto). Pode ser
+      apagado a qualquer momento: é recriado sob demanda.
+    - Datas do XLSX gravadas como número de série aparecem como números.
+"""
+
+import csv
+import json
+import logging
+import os
+import re
+import shutil
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from apps.jobs.queue import enqueue
+
+from .compression import open_document_file
+from .derivatives import derivative_key
+from .models import Document
+
+logger = logging.getLogger(__name__)
+
+TABLE_EXTENSIONS = {'.csv', '.xlsx'}
+
+# Linhas lidas e convertidas por bloco
+PARSE_CHUNK_ROWS = 50_000
+
+# Colunas mantidas na pré-visualização (as demais são descartadas)
+MAX_COLUMNS = 200
+
+# Linhas entregues por requisição
+MAX_WINDOW_ROWS = 500
+
+# Bytes usados para detectar o separador e a codificação do CSV
+CSV_SAMPLE_SIZE = 64 * 1024
+
+# Versão do formato do cache; mudar o valor descarta os caches antigos
+FORMAT_VERSION = 1
+
+TYPE_INTEGER = 'integer'
+TYPE_FLOAT = 'float'
+TYPE_DATE = 'date'
+TYPE_TEXT = 'text'
+
+TYPE_LABELS = {
+    TYPE_INTEGER: 'inteiro',
+    TYPE_FLOAT: 'decimal',
+    TYPE_DATE: 'data',
+    TYPE_TEXT: 'texto',
+}
+
+_NAT = np.iinfo(np.int64).min
+_SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_DATE_RE = r'^\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?)?$'
+_CELL_COLUMN_RE = re.compile(r'^([A-Z]+)')
+
+
+def supports_table(document):
+    """Indica se o tipo do documento tem pré-visualização em tabela."""
+    return (document.file_extension or '').lower() in TABLE_EXTENSIONS
+
+
+def table_dir(key):
+    """Retorna a pasta do cache colunar de um conteúdo."""
+    return os.path.join(settings.DOCUMENTS_TABLE_CACHE_ROOT, key[:2], f'{key}-v{FORMAT_VERSION}')
+
+
+# ---------------------------------------------------------------------------
+# Leitura das planilhas em blocos
+# ---------------------------------------------------------------------------
+
+def _sniff_csv(sample):
+    """Detecta a codificação e o separador a partir do início do arquivo."""
+    try:
+        # o último caractere da amostra pode ter sido cortado ao meio
+        text = sample[:-4].decode('utf-8') if len(sample) > 4 else sample.decode('utf-8')
+        encoding = 'utf-8'
+    except UnicodeDecodeError:
+        text = sample.decode('latin-1')
+        encoding = 'latin-1'
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    return encoding, delimiter
+
+
+def _csv_chunks(document):
+    with open_document_file(document) as fileobj:
+        encoding, delimiter = _sniff_csv(fileobj.read(CSV_SAMPLE_SIZE))
+    with open_document_file(document) as fileobj:
+        reader = pd.read_csv(
+            fileobj,
+            sep=delimiter,
+            encoding=encoding,
+            encoding_errors='replace',
+            dtype=str,
+            na_filter=False,
+            on_bad_lines='skip',
+            chunksize=PARSE_CHUNK_ROWS,
+        )
+        for chunk in reader:
+            yield chunk
+
+
+def _column_index(reference):
+    """Converte a coluna de uma referência de célula ('C12') em índice (2)."""
+    match = _CELL_COLUMN_RE.match(reference or '')
+    if not match:
+        return None
+    index = 0
+    for letter in match.group(1):
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _shared_strings(package):
+    if 'xl/sharedStrings.xml' not in package.namelist():
+        return []
+    strings = []
+    with package.open('xl/sharedStrings.xml') as stream:
+        for _, element in ElementTree.iterparse(stream):
+            if element.tag == f'{_SHEET_NS}si':
+                strings.append(''.join(node.text or '' for node in element.iter(f'{_SHEET_NS}t')))
+                element.clear()
+    return strings
+
+
+def _first_sheet(package):
+    """Caminho da primeira aba da pasta de trabalho."""
+    try:
+        workbook = ElementTree.fromstring(package.read('xl/workbook.xml'))
+        sheet = workbook.find(f'{_SHEET_NS}sheets/{_SHEET_NS}sheet')
+        relation_id = sheet.get(f'{_REL_NS}id')
+        relations = ElementTree.fromstring(package.read('xl/_rels/workbook.xml.rels'))
+        for relation in relations.iter(f'{_PACKAGE_REL_NS}Relationship'):
+            if relation.get('Id') == relation_id:
+                target = relation.get('Target').lstrip('/')
+                return target if target.startswith('xl/') else f'xl/{target}'
+    except (KeyError, AttributeError, ElementTree.ParseError):
+        pass
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _cell_value(cell, shared):
+    kind = cell.get('t')
+    if kind == 'inlineStr':
+        return ''.join(node.text or '' for node in cell.iter(f'{_SHEET_NS}t'))
+    value = cell.find(f'{_SHEET_NS}v')
+    text = value.text if value is not None and value.text else ''
+    if kind == 's' and text:
+        return shared[int(text)]
+    return text
+
+
+def _xlsx_rows(fileobj):
+    """Percorre as linhas da primeira aba, sem carregar a planilha inteira."""
+    with zipfile.ZipFile(fileobj) as package:
+        shared = _shared_strings(package)
+        with package.open(_first_sheet(package)) as stream:
+            sheet_data = None
+            for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == f'{_SHEET_NS}sheetData':
+                        sheet_data = element
+                    continue
+                if element.tag != f'{_SHEET_NS}row':
+                    continue
+                values = {}
+                position = 0
+                for cell in element.iter(f'{_SHEET_NS}c'):
+                    index = _column_index(cell.get('r'))
+                    position = position if index is None else index
+                    if position < MAX_COLUMNS:
+                        values[position] = _cell_value(cell, shared)
+                    position += 1
+                row = [''] * (max(values) + 1 if values else 0)
+                for index, value in values.items():
+                    row[index] = value
+                yield row
+                # descarta as linhas já lidas
+                if sheet_data is not None:
+                    sheet_data.clear()
+
+
+def _xlsx_chunks(document):
+    with open_document_file(document) as fileobj:
+        rows = _xlsx_rows(fileobj)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [name.strip() or f'Coluna {index + 1}' for index, name in enumerate(header)]
+        width = len(columns)
+        batch = []
+        for row in rows:
+            batch.append((row + [''] * (width - len(row)))[:width])
+            if len(batch) >= PARSE_CHUNK_ROWS:
+                yield pd.DataFrame(batch, columns=columns, dtype=object)
+                batch = []
+        yield pd.DataFrame(batch, columns=columns, dtype=object)
+
+
+READERS = {
+    '.csv': _csv_chunks,
+    '.xlsx': _xlsx_chunks,
+}
+
+
+# ---------------------------------------------------------------------------
+# Gravação do cache colunar
+# ---------------------------------------------------------------------------
+
+class _ColumnWriter:
+    """
+    Grava uma coluna bloco a bloco, descobrindo o tipo no caminho.
+
+    Enquanto todos os valores preenchidos forem números (ou datas ISO),
+    a versão numérica é gravada ao lado do texto; ao final, fica apenas a
+    representação do tipo detectado.
+    """
+
+    def __init__(self, directory, index, name):
+        self.directory = directory
+        self.index = index
+        self.name = str(name)
+        self.rows = 0
+        self.nulls = 0
+        self.max_length = 0
+        self.numeric = True
+        self.integral = True
+        self.date = True
+        self.has_time = False
+        self.number_stats = {'min': None, 'max': None, 'sum': 0.0}
+        self.date_stats = {'min': None, 'max': None}
+        self._offset = 0
+        self._files = {
+            'offsets': open(self._path('offsets'), 'wb'),
+            'text': open(self._path('text'), 'wb'),
+            'float': open(self._path('float'), 'wb'),
+            'date': open(self._path('date'), 'wb'),
+        }
+        np.zeros(1, dtype=np.int64).tofile(self._files['offsets'])
+
+    def _path(self, kind):
+        return os.path.join(self.directory, f'{self.index}.{kind}')
+
+    def _discard(self, kind):
+        self._files.pop(kind).close()
+        os.remove(self._path(kind))
+
+    def write(self, values):
+        values = values.astype(str)
+        filled = values != ''
+        count = int(filled.sum())
+        self.rows += len(values)
+        self.nulls += len(values) - count
+
+        encoded = [value.encode('utf-8') for value in values]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        if len(lengths):
+            self.max_length = max(self.max_length, int(lengths.max()))
+        (self._offset + np.cumsum(lengths)).astype(np.int64).tofile(self._files['offsets'])
+        self._offset += int(lengths.sum())
+        self._files['text'].write(b''.join(encoded))
+
+        if self.numeric:
+            self._write_numbers(values, filled, count)
+        if self.date:
+            self._write_dates(values, filled, count)
+
+    def _write_numbers(self, values, filled, count):
+        numbers = pd.to_numeric(values.where(filled, None), errors='coerce').to_numpy(dtype=np.float64)
+        valid = ~np.isnan(numbers)
+        if int(valid.sum()) != count:
+            self.numeric = False
+            self._discard('float')
+            return
+        numbers.tofile(self._files['float'])
+        if count:
+            present = numbers[valid]
+            self.integral = self.integral and bool(np.all(present == np.floor(present)))
+            stats = self.number_stats
+            low, high = float(present.min()), float(present.max())
+            stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+            stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+            stats['sum'] += float(present.sum())
+
+    def _write_dates(self, values, filled, count):
+        if count and not values[filled].str.match(_DATE_RE).all():
+            self.date = False
+            self._discard('date')
+            return
+        dates = pd.to_datetime(values.where(filled, None), format='ISO8601', utc=True, errors='coerce')
+        valid = ~dates.isna().to_numpy()
+        if int(valid.sum()) != count:
+            self.date = False
+            self._discard('date')
+            return
+        nanoseconds = dates.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        nanoseconds.tofile(self._files['date'])
+        if count:
+            present = nanoseconds[valid]
+            self.has_time = self.has_time or bool(np.any(present % (24 * 3600 * 10**9)))
+            stats = self.date_stats
+            low, high = int(present.min()), int(present.max())
+            stats['min'] = low if stats['min'] is None else min(stats['min'], low)
+            stats['max'] = high if stats['max'] is None else max(stats['max'], high)
+
+    def finish(self):
+        """Fecha os arquivos, mantém apenas o tipo detectado e retorna os metadados."""
+        for fileobj in self._files.values():
+            fileobj.close()
+        filled = self.rows - self.nulls
+        # colunas totalmente vazias ficam como texto
+        column_type = TYPE_TEXT
+        if filled and self.numeric:
+            column_type = TYPE_INTEGER if self.integral else TYPE_FLOAT
+        elif filled and self.date:
+            column_type = TYPE_DATE
+
+        keep = {'float'} if column_type in (TYPE_INTEGER, TYPE_FLOAT) else (
+            {'date'} if column_type == TYPE_DATE else {'offsets', 'text'}
+        )
+        for kind in ('offsets', 'text', 'float', 'date'):
+            if kind not in keep and os.path.exists(self._path(kind)):
+                os.remove(self._path(kind))
+
+        stats = {'filled': filled, 'nulls': self.nulls}
+        if column_type in (TYPE_INTEGER, TYPE_FLOAT):
+            stats.update(
+                min=self.number_stats['min'],
+                max=self.number_stats['max'],
+                mean=self.number_stats['sum'] / filled,
+            )
+        elif column_type == TYPE_DATE:
+            stats.update(min=self.date_stats['min'], max=self.date_stats['max'])
+        else:
+            stats['max_length'] = self.max_length
+        return {
+            'name': self.name,
+            'type': column_type,
+            'has_time': self.has_time,
+            'stats': stats,
+        }
+
+    def abort(self):
+        for fileobj in self._files.values():
+            fileobj.close()
+
+
+def _write_table(document, directory):
+    """Lê a planilha em blocos e grava as colunas em `directory`."""
+    writers = None
+    truncated = 0
+    try:
+        for chunk in READERS[document.file_extension.lower()](document):
+            if writers is None:
+                truncated = max(0, chunk.shape[1] - MAX_COLUMNS)
+                writers = [
+                    _ColumnWriter(directory, index, name)
+                    for index, name in enumerate(chunk.columns[:MAX_COLUMNS])
+                ]
+            for index, writer in enumerate(writers):
+                writer.write(chunk.iloc[:, index])
+    except BaseException:
+        for writer in writers or []:
+            writer.abort()
+        raise
+
+    columns = [writer.finish() for writer in writers or []]
+    return {
+        'version': FORMAT_VERSION,
+        'rows': writers[0].rows if writers else 0,
+        'columns': columns,
+        'truncated_columns': truncated,
+    }
+
+
+def build_table(document):
+    """
+    Gera (se ainda não existir) o cache colunar de uma planilha.
+
+    A conversão é gravada em uma pasta temporária e movida para o lugar
+    final apenas no fim, então leitores nunca veem um cache incompleto.
+    Falhas de leitura também são gravadas, para não repetir a tentativa.
+
+    Args:
+        document (Document): documento .csv ou .xlsx.
+
+    Returns:
+        bool: True se o cache está disponível ao final.
+    """
+    if not supports_table(document):
+        return False
+    directory = table_dir(derivative_key(document))
+    if os.path.exists(directory):
+        return True
+
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    building = f'{directory}.tmp-{os.getpid()}'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    try:
+        try:
+            meta = _write_table(document, building)
+        except (ValueError, KeyError, IndexError, zipfile.BadZipFile,
+                ElementTree.ParseError, pd.errors.ParserError) as e:
+            logger.warning('Falha ao ler a planilha do documento %s: %s', document.pk, e)
+            for name in os.listdir(building):
+                os.remove(os.path.join(building, name))
+            meta = {'version': FORMAT_VERSION, 'error': 'Não foi possível ler a planilha.'}
+        with open(os.path.join(building, 'meta.json'), 'w', encoding='utf-8') as out:
+            json.dump(meta, out, ensure_ascii=False)
+        try:
+            os.rename(building, directory)
+        except OSError:
+            # outro processo terminou a mesma conversão antes
+            if not os.path.exists(directory):
+                raise
+    finally:
+        shutil.rmtree(building, ignore_errors=True)
+    return True
+
+
+def build_document_table(document_id):
+    """Tarefa que gera o cache colunar de um documento a partir do seu ID."""
+    document = Document.all_objects.defer('content', 'search_vector').filter(pk=document_id).first()
+    if document is not None:
+        build_table(document)
+
+
+def schedule_table(document):
+    """Enfileira a conversão de uma planilha, sem duplicar tarefas pendentes."""
+    if supports_table(document):
+        enqueue(build_document_table, unique_key=str(document.pk), document_id=document.pk)
+
+
+def delete_table(key):
+    """Remove o cache colunar associado a uma chave de conteúdo."""
+    shutil.rmtree(table_dir(key), ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Leitura de intervalos de linhas
+# ---------------------------------------------------------------------------
+
+def _memmap(path, dtype):
+    """Abre um arquivo de coluna sem lê-lo (arquivos vazios não podem ser mapeados)."""
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def _format_number(value, column_type):
+    if np.isnan(value):
+        return None
+    if column_type == TYPE_INTEGER:
+        return str(int(value))
+    return np.format_float_positional(value, trim='-')
+
+
+def _format_date(value, has_time):
+    if value == _NAT:
+        return None
+    moment = np.datetime64(int(value), 'ns')
+    if has_time:
+        return str(np.datetime_as_string(moment, unit='s')).replace('T', ' ')
+    return str(np.datetime_as_string(moment, unit='D'))
+
+
+class Table:
+    """
+    Planilha convertida, aberta para leitura de intervalos de linhas.
+
+    Atributos:
+        rows (int): quantidade de linhas (sem o cabeçalho).
+        columns (list[dict]): nome, tipo, rótulo do tipo e estatísticas
+            de cada coluna.
+        truncated_columns (int): colunas descartadas além de `MAX_COLUMNS`.
+        error (str): motivo da falha na conversão, se houver.
+    """
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.rows = meta.get('rows', 0)
+        self.columns = meta.get('columns', [])
+        self.truncated_columns = meta.get('truncated_columns', 0)
+        self.error = meta.get('error', '')
+        for column in self.columns:
+            column['label'] = TYPE_LABELS[column['type']]
+            column['summary'] = self._summary(column)
+
+    def _summary(self, column):
+        """Estatísticas da coluna já formatadas para exibição."""
+        stats = column['stats']
+        summary = [('Preenchidas', stats['filled']), ('Vazias', stats['nulls'])]
+        if column['type'] in (TYPE_INTEGER, TYPE_FLOAT) and stats['filled']:
+            summary += [
+                ('Mínimo', _format_number(stats['min'], column['type'])),
+                ('Máximo', _format_number(stats['max'], column['type'])),
+                ('Média', np.format_float_positional(stats['mean'], precision=4, trim='-')),
+            ]
+        elif column['type'] == TYPE_DATE and stats['filled']:
+            summary += [
+                ('Mínimo', _format_date(stats['min'], column['has_time'])),
+                ('Máximo', _format_date(stats['max'], column['has_time'])),
+            ]
+        elif column['type'] == TYPE_TEXT:
+            summary.append(('Maior tamanho', stats['max_length']))
+        return summary
+
+    def _column_values(self, index, column, start, stop):
+        path = os.path.join(self.directory, str(index))
+        if column['type'] in (TYPE_INTEGER, TYPE_FLOAT):
+            values = _memmap(f'{path}.float', np.float64)[start:stop]
+            return [_format_number(value, column['type']) for value in values]
+        if column['type'] == TYPE_DATE:
+            values = _memmap(f'{path}.date', np.int64)[start:stop]
+            return [_format_date(value, column['has_time']) for value in values]
+
+        offsets = np.array(_memmap(f'{path}.offsets', np.int64)[start:stop + 1])
+        if len(offsets) < 2:
+            return []
+        data = bytes(_memmap(f'{path}.text', np.uint8)[offsets[0]:offsets[-1]])
+        relative = offsets - offsets[0]
+        return [
+            data[relative[i]:relative[i + 1]].decode('utf-8', errors='replace') or None
+            for i in range(len(relative) - 1)
+        ]
+
+    def window(self, start, count):
+        """
+        Lê um intervalo de linhas, acessando apenas os bytes dessas linhas.
+
+        Args:
+            start (int): primeira linha (a partir de 0).
+            count (int): quantidade de linhas (até `MAX_WINDOW_ROWS`).
+
+        Returns:
+            list[list[str | None]]: valores formatados; None nas células vazias.
+        """
+        start = min(max(0, start), self.rows)
+        stop = min(start + max(0, min(count, MAX_WINDOW_ROWS)), self.rows)
+        if stop <= start or not self.columns:
+            return []
+        values = [
+            self._column_values(index, column, start, stop)
+            for index, column in enumerate(self.columns)
+        ]
+        return [list(row) for row in zip(*values)]
+
+
+def load_table(document):
+    """
+    Abre o cache colunar de uma planilha, se já tiver sido gerado.
+
+    Args:
+        document (Document): documento .csv ou .xlsx.
+
+    Returns:
+        Table | None: planilha pronta para leitura, ou None se o cache
+            ainda não existir.
+    """
+    directory = table_dir(derivative_key(document))
+    try:
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as fileobj:
+            meta = json.load(fileobj)
+    except FileNotFoundError:
+        return None
+    return Table(directory, meta)
@@ -0,0 +1,46 @@
+"""
+tasks.py
+
+Tarefas em segundo plano dos documentos, executadas pelo worker da fila
+(`python manage.py run_jobs`).
+
+- process_document: extrai o texto do arquivo, atualiza a busca e a
+  assinatura de quase duplicatas e gera as miniaturas (ou, nas planilhas,
+  o cache da pré-visualização) de um documento recém-enviado.
+- delete_stored_file: apaga um arquivo do armazenamento.
+"""
+
+from django.core.files.storage import default_storage
+
+from .derivatives import generate_derivatives
+from .models import Document
+from .search import update_search_index
+from .similarity import update_signature
+from .tables import build_table
+
+
+def process_document(document_id):
+    """
+    Processa um documento recém-enviado.
+
+    Args:
+        document_id (int): ID do documento.
+    """
+    # inclui documentos já na lixeira, que podem ser restaurados
+    document = Document.all_objects.defer('content', 'search_vector').filter(pk=document_id).first()
+    if document is None:
+        return
+    update_search_index(document)
+    update_signature(document)
+    generate_derivatives(document)
+    build_table(document)
+
+
+def delete_stored_file(path):
+    """
+    Apaga um arquivo do armazenamento, se ainda existir.
+
+    Args:
+        path (str): caminho relativo ao MEDIA_ROOT.
+    """
+    default_storage.delete(path)
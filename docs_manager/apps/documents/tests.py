@@ -1,3 +1,1439 @@
-from django.test import TestCase
+"""
+tests.py
 
-# Create your tests here.
+Testes da aplicação de documentos.
+
+Uso:
+    python manage.py test apps.documents
+"""
+
+import asyncio
+import contextvars
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest.mock import Mock, patch
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.db import DatabaseError, connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from apps.jobs.models import Job
+from docs_manager.body_limits import BodyLimitMiddleware
+from docs_manager.body_streaming import ASGIBodyStream, StreamingBodyASGIHandler
+from docs_manager.db_routing import PIN_COOKIE, PrimaryReplicaRouter, replica_routing_middleware
+from docs_manager.instrumentation import instrumentation_middleware
+
+from . import bulk, compression, derivatives, revisions, storage, usage, views
+from .bulk import BulkEntry
+from .downloads import RangeNotSatisfiable, parse_range
+from .export import archive_path, export_queryset, stream_export
+from .models import Blob, Comment, Document, DocumentShare, StorageQuota, StorageUsage, UploadSession
+from .pagination import decode_cursor, encode_cursor, paginate_keyset
+from .permissions import can_reuse_blob, permissions_cache_key, user_permissions
+from .revisions import CHUNK_MAX_SIZE, CHUNK_MIN_SIZE, split_chunks
+from .search import search_documents, update_search_index
+from .similarity import cluster_signatures, text_signature
+from .storage import adopt_blob
+from .streaming import aiterate, streaming_response
+from .tables import build_table, load_table
+from .trash import purge_trash
+from .upload_handlers import StagedUploadedFile
+from .usage import QuotaExceeded, check_quota, reconcile_usage, remaining_quota, user_usage
+from .views import LIST_FLUSH_CARDS
+
+
+class MediaTestMixin:
+    """Armazenamento e pastas temporárias isolados em cada teste."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            UPLOAD_SESSIONS_ROOT=os.path.join(self.media_root, 'sessions'),
+            DOCUMENTS_TABLE_CACHE_ROOT=os.path.join(self.media_root, 'tables'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self, folder):
+        """Arquivos gravados em uma pasta do armazenamento."""
+        root = os.path.join(self.media_root, folder)
+        return [os.path.join(path, name) for path, _, names in os.walk(root) for name in names]
+
+    def create_document(self, author, file_name, content, **fields):
+        """Cria um documento com o conteúdo gravado no armazenamento temporário."""
+        path = default_storage.save(f'documents/{file_name}', io.BytesIO(content))
+        base, extension = os.path.splitext(file_name)
+        values = {
+            'title': base, 'author': author, 'file': path, 'file_name': file_name,
+            'file_size': len(content), 'file_extension': extension.lower(),
+        }
+        values.update(fields)
+        return Document.objects.create(**values)
+
+
+class MediaTestCase(MediaTestMixin, TestCase):
+    """`TestCase` com o armazenamento isolado."""
+
+
+class UploadErrorLoggingTests(MediaTestCase):
+    """Erros do upload individual vão para o log, com o traceback."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('autora'))
+
+    def test_invalid_form_is_logged(self):
+        with self.assertLogs('apps.documents.views', 'WARNING') as logs:
+            self.client.post(reverse('documents_upload'), {'title': 'Sem arquivo'})
+        self.assertIn('Formulário de upload inválido', logs.output[0])
+
+    def test_save_error_is_logged_with_the_traceback(self):
+        upload = SimpleUploadedFile('nota.txt', b'nota')
+        with patch('apps.documents.views._save_uploaded_document', side_effect=OSError('disco cheio')):
+            with self.assertLogs('apps.documents.views', 'ERROR') as logs:
+                self.client.post(reverse('documents_upload'), {'title': 'Nota', 'file': upload})
+        self.assertIsNotNone(logs.records[0].exc_info)
+        self.assertFalse(Document.objects.exists())
+
+
+class HashUploadPermissionTests(MediaTestCase):
+    """Atalho de upload por hash com o compartilhamento ativado."""
+
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner', password='senha-segura-1')
+        self.other = User.objects.create_user('other', password='senha-segura-1')
+        self.sha256 = 'a' * 64
+        blob = Blob.objects.create(sha256=self.sha256, file='blobs/aa/aa/' + self.sha256, size=3, ref_count=1)
+        self.document = Document.objects.create(
+            title='Privado', author=self.owner, file=blob.file.name, blob=blob
+        )
+
+    @override_settings(DOCUMENTS_SHARING=True)
+    def test_private_blob_is_not_reusable(self):
+        self.assertTrue(can_reuse_blob(self.owner, self.sha256))
+        self.assertFalse(can_reuse_blob(self.other, self.sha256))
+
+        self.client.force_login(self.other)
+        response = self.client.get(reverse('documents_upload_check'), {'sha256': self.sha256})
+        self.assertEqual(response.json(), {'exists': False})
+
+    @override_settings(DOCUMENTS_SHARING=True)
+    def test_private_blob_requires_the_file(self):
+        self.client.force_login(self.other)
+        with self.assertLogs('apps.documents.views', 'WARNING'):
+            self.client.post(reverse('documents_upload'), {
+                'title': 'Cópia', 'sha256': self.sha256, 'source_name': 'copia.pdf',
+            })
+        self.assertFalse(Document.objects.filter(author=self.other).exists())
+        self.assertEqual(Blob.objects.get(pk=self.sha256).ref_count, 1)
+
+    @override_settings(DOCUMENTS_SHARING=True)
+    def test_shared_blob_is_reusable(self):
+        DocumentShare.objects.create(document=self.document, user=self.other)
+        self.assertTrue(can_reuse_blob(self.other, self.sha256))
+
+    def test_without_sharing_any_existing_blob_is_reusable(self):
+        self.assertTrue(can_reuse_blob(self.other, self.sha256))
+        self.assertFalse(can_reuse_blob(self.other, 'b' * 64))
+
+
+class PermissionRevocationTests(TestCase):
+    """Revogação de compartilhamentos e o cache dos níveis de acesso."""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner')
+        self.other = User.objects.create_user('other')
+        self.document = Document.objects.create(title='Doc', author=self.owner, file='documents/doc.txt')
+        self.share = DocumentShare.objects.create(
+            document=self.document, user=self.other, level=DocumentShare.LEVEL_DELETE
+        )
+
+    def _fresh_permissions(self):
+        # um novo objeto de usuário, como em uma nova requisição
+        return user_permissions(User.objects.get(pk=self.other.pk))
+
+    def _revoke(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.share.delete()
+
+    @override_settings(DOCUMENTS_SHARING=True, CACHE_SHARED=False)
+    def test_revocation_without_shared_cache(self):
+        self.assertTrue(self._fresh_permissions().can_delete(self.document))
+        # sem executar os descartes: outro processo não receberia o sinal
+        self.share.delete()
+        self.assertFalse(self._fresh_permissions().can_view(self.document))
+
+    @override_settings(DOCUMENTS_SHARING=True, CACHE_SHARED=True)
+    def test_revocation_with_shared_cache(self):
+        self.assertTrue(self._fresh_permissions().can_delete(self.document))
+        self._revoke()
+        self.assertFalse(self._fresh_permissions().can_view(self.document))
+
+    @override_settings(DOCUMENTS_SHARING=True, CACHE_SHARED=True)
+    def test_group_revocation_with_shared_cache(self):
+        group = Group.objects.create(name='equipe')
+        self.other.groups.add(group)
+        self.share.delete()
+        DocumentShare.objects.create(document=self.document, group=group)
+        self.assertTrue(self._fresh_permissions().can_view(self.document))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.groups.remove(group)
+        self.assertFalse(self._fresh_permissions().can_view(self.document))
+
+    @override_settings(DOCUMENTS_SHARING=True, CACHE_SHARED=True)
+    def test_large_levels_are_not_cached(self):
+        with patch('apps.documents.permissions.PERMISSIONS_CACHE_MAX_DOCUMENTS', 0):
+            self._fresh_permissions()
+        self.assertIsNone(cache.get(permissions_cache_key(self.other.pk)))
+
+
+class KeysetPaginationTests(TestCase):
+    """Paginação por cursor da listagem e da busca."""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+
+    def _walk(self, queryset, field, page_size=2):
+        """Percorre todas as páginas para frente e depois para trás."""
+        forward, pages = [], []
+        page = paginate_keyset(queryset, page_size, field=field)
+        while True:
+            # um cursor que não avança repetiria a mesma página para sempre
+            self.assertLess(len(pages), 20)
+            pages.append(page)
+            forward.extend(document.pk for document in page)
+            if not page.has_next:
+                break
+            page = paginate_keyset(queryset, page_size, after=page.next_cursor, field=field)
+
+        backward = [document.pk for document in page]
+        while page.has_previous:
+            self.assertLess(len(backward), 20)
+            page = paginate_keyset(queryset, page_size, before=page.previous_cursor, field=field)
+            backward = [document.pk for document in page] + backward
+        return forward, backward, pages
+
+    def test_cursor_round_trip(self):
+        document = Document.objects.create(title='Doc', author=self.author, file='documents/doc.txt')
+        cursor = encode_cursor(document.uploaded_at, document.pk)
+        self.assertEqual(decode_cursor(cursor), (document.uploaded_at, document.pk))
+        self.assertEqual(decode_cursor(encode_cursor(0.1 + 0.2, 7), 'rank'), (0.1 + 0.2, 7))
+        self.assertIsNone(decode_cursor('não é um cursor'))
+        self.assertIsNone(decode_cursor(''))
+
+    def test_list_pages_with_tied_dates(self):
+        documents = [
+            Document.objects.create(title=f'Doc {i}', author=self.author, file='documents/doc.txt')
+            for i in range(7)
+        ]
+        # datas repetidas: o desempate é feito pelo id
+        Document.objects.filter(pk__in=[d.pk for d in documents[:4]]).update(uploaded_at=documents[0].uploaded_at)
+        expected = list(Document.objects.order_by('-uploaded_at', '-id').values_list('pk', flat=True))
+
+        forward, backward, pages = self._walk(Document.objects.all(), 'uploaded_at')
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+        self.assertFalse(pages[0].has_previous)
+
+    def test_search_pages_through_tied_ranks(self):
+        # relevâncias repetidas e com valores que não são exatos em float4
+        for i in range(9):
+            document = Document.objects.create(
+                title='relatório anual' if i % 3 else 'relatório anual relatório',
+                description='orçamento ' * (i % 2),
+                author=self.author,
+                file='documents/doc.txt',
+            )
+            update_search_index(document, extract=False)
+
+        results = search_documents(Document.objects.all(), 'relatório')
+        expected = list(results.order_by('-rank', '-id').values_list('pk', flat=True))
+        self.assertEqual(len(expected), 9)
+        self.assertLess(len(set(results.values_list('rank', flat=True))), 9)
+
+        forward, backward, _ = self._walk(results, 'rank')
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+
+class CompressionTests(SimpleTestCase):
+    """Compressão dos arquivos no armazenamento."""
+
+    content = b'linha de texto repetida\n' * 5000
+
+    def _encodings(self):
+        return ['gzip'] + (['zstd'] if compression.zstandard is not None else [])
+
+    def test_round_trip(self):
+        for encoding in self._encodings():
+            with self.subTest(encoding=encoding):
+                with compression.compress(io.BytesIO(self.content), encoding) as packed:
+                    data = packed.read()
+                self.assertLess(len(data), len(self.content))
+                with compression.decoded(io.BytesIO(data), encoding) as reader:
+                    self.assertEqual(reader.read(), self.content)
+
+    def test_writer_matches_compress(self):
+        for encoding in self._encodings():
+            with self.subTest(encoding=encoding):
+                target = io.BytesIO()
+                writer = compression.compressing_writer(target, encoding)
+                for start in range(0, len(self.content), 4096):
+                    writer.write(self.content[start:start + 4096])
+                writer.close()
+                self.assertFalse(target.closed)
+                with compression.decoded(io.BytesIO(target.getvalue()), encoding) as reader:
+                    self.assertEqual(reader.read(), self.content)
+
+    def test_forward_seek(self):
+        with compression.compress(io.BytesIO(self.content), 'gzip') as packed:
+            reader = compression.decoded(io.BytesIO(packed.read()), 'gzip')
+        reader.seek(100)
+        self.assertEqual(reader.read(10), self.content[100:110])
+        reader.close()
+
+    def test_closing_the_reader_closes_the_file(self):
+        for encoding in self._encodings():
+            with self.subTest(encoding=encoding):
+                with compression.compress(io.BytesIO(self.content), encoding) as packed:
+                    source = io.BytesIO(packed.read())
+                reader = compression.decoded(source, encoding)
+                reader.read(10)
+                reader.close()
+                self.assertTrue(source.closed)
+                reader.close()
+
+    def test_choose_encoding(self):
+        with override_settings(DOCUMENTS_COMPRESSION='gzip'):
+            self.assertEqual(compression.choose_encoding(io.BytesIO(self.content), 'a.txt'), 'gzip')
+            self.assertEqual(compression.choose_encoding(io.BytesIO(self.content), 'a.pdf'), '')
+            self.assertEqual(compression.choose_encoding(io.BytesIO(os.urandom(4096)), 'a.txt'), '')
+
+    def test_setting_is_read_on_every_call(self):
+        with override_settings(DOCUMENTS_COMPRESSION='gzip'):
+            self.assertEqual(compression.storage_encoding(), 'gzip')
+        with override_settings(DOCUMENTS_COMPRESSION=''):
+            self.assertEqual(compression.storage_encoding(), '')
+        with override_settings(DOCUMENTS_COMPRESSION='GZIP'):
+            self.assertEqual(compression.storage_encoding(), 'gzip')
+
+
+class ParseRangeTests(SimpleTestCase):
+    """Interpretação do cabeçalho Range."""
+
+    def test_closed_range(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+
+    def test_open_range_goes_to_the_end(self):
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 999))
+
+    def test_end_past_the_file_is_clamped(self):
+        self.assertEqual(parse_range('bytes=500-5000', 1000), (500, 999))
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=1000-', 'bytes=1000-1200', 'bytes=50-10', 'bytes=-0'):
+            with self.subTest(header=header):
+                with self.assertRaises(RangeNotSatisfiable):
+                    parse_range(header, 1000)
+
+    def test_empty_file_has_no_satisfiable_range(self):
+        for header in ('bytes=-100', 'bytes=0-', 'bytes=0-0'):
+            with self.subTest(header=header):
+                with self.assertRaises(RangeNotSatisfiable):
+                    parse_range(header, 0)
+
+    def test_unsupported_ranges_send_the_whole_file(self):
+        for header in ('', None, 'bytes=-', 'bytes=0-1,5-9', 'items=0-10'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+
+class ChunkerTests(SimpleTestCase):
+    """Divisão do conteúdo das revisões em trechos."""
+
+    def setUp(self):
+        self.data = np.random.default_rng(7).bytes(3 * 1024 * 1024)
+
+    def _chunks(self, data):
+        return list(split_chunks(io.BytesIO(data)))
+
+    def test_chunks_cover_the_content_within_the_size_limits(self):
+        chunks = self._chunks(self.data)
+        self.assertEqual(b''.join(chunks), self.data)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), CHUNK_MIN_SIZE)
+            self.assertLessEqual(len(chunk), CHUNK_MAX_SIZE)
+
+    def test_cuts_do_not_depend_on_the_read_size(self):
+        expected = self._chunks(self.data)
+        for read_size in (1000, 64 * 1024 + 7):
+            with self.subTest(read_size=read_size), patch.object(revisions, 'READ_SIZE', read_size):
+                self.assertEqual(self._chunks(self.data), expected)
+
+    def test_content_without_cuts_is_split_at_the_maximum_size(self):
+        data = b'\0' * (CHUNK_MAX_SIZE * 2 + 10)
+        self.assertEqual(
+            [len(chunk) for chunk in self._chunks(data)],
+            [CHUNK_MAX_SIZE, CHUNK_MAX_SIZE, 10],
+        )
+
+    def test_local_edit_keeps_the_other_chunks(self):
+        middle = len(self.data) // 2
+        edited = self.data[:middle] + b'trecho inserido' + self.data[middle:]
+        before = self._chunks(self.data)
+        after = self._chunks(edited)
+        self.assertEqual(b''.join(after), edited)
+        changed = set(after) - set(before)
+        self.assertLessEqual(len(changed), 2)
+
+
+class ClusterSignaturesTests(SimpleTestCase):
+    """Agrupamento das assinaturas de quase duplicatas."""
+
+    def _text(self, seed, words=400):
+        rng = np.random.default_rng(seed)
+        return ' '.join(f'palavra{n}' for n in rng.integers(0, 5000, size=words))
+
+    def _matrix(self, texts):
+        return np.stack([text_signature(text) for text in texts])
+
+    def test_copies_point_to_the_oldest_document(self):
+        original = self._text(1)
+        edited = original.replace(original.split()[200], 'alterada', 1)
+        matrix = self._matrix([self._text(2), original, edited, original, self._text(3)])
+
+        representatives, scores = cluster_signatures(matrix, 0.8)
+
+        self.assertEqual(representatives.tolist(), [0, 1, 1, 1, 4])
+        self.assertTrue(np.isnan(scores[[0, 1, 4]]).all())
+        self.assertEqual(scores[3], 1.0)
+        self.assertGreaterEqual(scores[2], 0.8)
+
+    def test_unrelated_documents_are_not_grouped(self):
+        matrix = self._matrix([self._text(seed) for seed in range(10, 20)])
+        representatives, scores = cluster_signatures(matrix, 0.8)
+        self.assertEqual(representatives.tolist(), list(range(10)))
+        self.assertTrue(np.isnan(scores).all())
+
+    def test_threshold_separates_distant_versions(self):
+        original = self._text(4)
+        words = original.split()
+        # metade das palavras trocada: similaridade bem abaixo do limite
+        rewritten = ' '.join(words[:200] + self._text(5, words=200).split())
+        representatives, _ = cluster_signatures(self._matrix([original, rewritten]), 0.8)
+        self.assertEqual(representatives.tolist(), [0, 1])
+
+
+@override_settings(DOCUMENTS_UPLOAD_CHUNK_SIZE=100_000, DOCUMENTS_COMPRESSION='gzip')
+class ResumableUploadTests(MediaTestMixin, TransactionTestCase):
+    """
+    Upload em partes: montagem e finalização.
+
+    Com transações reais: o arquivo montado só é movido para o blob no
+    commit, antes de a view descartar o que sobrou do upload.
+    """
+
+    content = b''.join(b'linha %06d do arquivo\n' % i for i in range(12_000))
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('uploader')
+        self.client.force_login(self.user)
+
+    def _open_session(self, **extra):
+        response = self.client.post(reverse('documents_upload_session_create'), {
+            'file_name': 'dados.txt', 'file_size': len(self.content), **extra,
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def _send_parts(self, session):
+        for index in range(session['total_chunks']):
+            start = index * session['chunk_size']
+            response = self.client.put(
+                reverse('documents_upload_chunk', args=[session['id'], index]),
+                self.content[start:start + session['chunk_size']],
+                content_type='application/octet-stream',
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def _finalize(self, session):
+        return self.client.post(
+            reverse('documents_upload_finalize', args=[session['id']]), {'title': 'Dados'}
+        )
+
+    def test_finalize_assembles_into_a_compressed_blob(self):
+        session = self._open_session(sha256=hashlib.sha256(self.content).hexdigest())
+        self._send_parts(session)
+        response = self._finalize(session)
+        self.assertEqual(response.status_code, 201)
+
+        document = Document.objects.get(pk=response.json()['document'])
+        self.assertTrue(document.file.name.endswith('.gz'))
+        self.assertEqual(document.file_size, len(self.content))
+        with compression.open_document_file(document) as fileobj:
+            self.assertEqual(fileobj.read(), self.content)
+        self.assertEqual(self.stored_files('incoming'), [])
+        self.assertEqual(self.stored_files('sessions'), [])
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, UploadSession.STATUS_COMPLETED)
+
+        # finalizar de novo apenas retorna o documento
+        again = self._finalize(session)
+        self.assertEqual(again.json()['document'], document.pk)
+
+    def test_hash_mismatch_reopens_the_session(self):
+        session = self._open_session(sha256='0' * 64)
+        self._send_parts(session)
+        response = self._finalize(session)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(pk=session['id']).status, UploadSession.STATUS_OPEN)
+        self.assertEqual(self.stored_files('incoming'), [])
+        self.assertFalse(Document.objects.exists())
+
+    def test_session_being_finalized_is_locked(self):
+        session = self._open_session()
+        UploadSession.objects.filter(pk=session['id']).update(status=UploadSession.STATUS_FINALIZING)
+        response = self._finalize(session)
+        self.assertEqual(response.status_code, 409)
+        response = self.client.put(
+            reverse('documents_upload_chunk', args=[session['id'], 0]), b'x',
+            content_type='application/octet-stream',
+        )
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(DOCUMENTS_UPLOAD_CHUNK_SIZE=1000)
+class BodyLimitMiddlewareTests(SimpleTestCase):
+    """Recusa dos uploads grandes demais antes da leitura do corpo (ASGI)."""
+
+    async def _call(self, path, body_events, headers=()):
+        received = []
+        sent = []
+        events = list(body_events)
+
+        async def app(scope, receive, send):
+            while True:
+                event = await receive()
+                received.append(event)
+                if event['type'] == 'http.disconnect' or not event.get('more_body'):
+                    break
+            if received[-1]['type'] != 'http.disconnect':
+                await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+                await send({'type': 'http.response.body', 'body': b''})
+
+        async def receive():
+            return events.pop(0)
+
+        async def send(event):
+            sent.append(event)
+
+        scope = {'type': 'http', 'method': 'PUT', 'path': path, 'headers': list(headers)}
+        await BodyLimitMiddleware(app)(scope, receive, send)
+        return received, sent[0]['status']
+
+    def _chunk_path(self):
+        return reverse('documents_upload_chunk', args=['6c1b5b5e-9a31-4c3e-8f8e-3a0f0f0f0f0f', 0])
+
+    async def test_content_length_over_limit_is_rejected_unread(self):
+        received, status = await self._call(
+            self._chunk_path(), [{'type': 'http.request', 'body': b'x' * 2000}],
+            headers=[(b'content-length', b'2000')],
+        )
+        self.assertEqual(status, 413)
+        self.assertEqual(received, [])
+
+    async def test_streamed_body_is_cut_at_the_limit(self):
+        events = [{'type': 'http.request', 'body': b'x' * 600, 'more_body': True}] * 3
+        received, status = await self._call(self._chunk_path(), events)
+        self.assertEqual(status, 413)
+        self.assertEqual(received[-1], {'type': 'http.disconnect'})
+        self.assertEqual(len(received), 2)
+
+    async def test_body_within_limit_passes(self):
+        received, status = await self._call(
+            self._chunk_path(), [{'type': 'http.request', 'body': b'x' * 1000}],
+            headers=[(b'content-length', b'1000')],
+        )
+        self.assertEqual(status, 200)
+
+    async def test_other_views_are_not_limited(self):
+        received, status = await self._call(
+            reverse('documents_list'), [{'type': 'http.request', 'body': b'x' * 5000}],
+            headers=[(b'content-length', b'5000')],
+        )
+        self.assertEqual(status, 200)
+
+
+@override_settings(DOCUMENTS_DEDUPLICATE=True, DOCUMENTS_COMPRESSION='gzip')
+class StreamingBodyTests(MediaTestMixin, TransactionTestCase):
+    """Corpo dos uploads lido sob demanda em modo ASGI, sem cópia prévia."""
+
+    CSRF_TOKEN = 'a' * 32
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('enviadora')
+        self.client.force_login(self.user)
+        self.cookie = (
+            f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}; '
+            f'{settings.CSRF_COOKIE_NAME}={self.CSRF_TOKEN}'
+        ).encode()
+
+    def _upload_body(self, content):
+        body = encode_multipart(BOUNDARY, {
+            'title': 'Relatório',
+            'csrfmiddlewaretoken': self.CSRF_TOKEN,
+            'file': SimpleUploadedFile('relatorio.txt', content),
+        })
+        return body, [
+            (b'content-type', MULTIPART_CONTENT.encode()),
+            (b'content-length', str(len(body)).encode()),
+            (b'cookie', self.cookie),
+        ]
+
+    async def _call(self, path, messages, headers):
+        """Chama o handler com o corpo dividido em mensagens; retorna o status enviado."""
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # o cliente continua conectado até o fim da resposta
+            await asyncio.Future()
+
+        async def send(event):
+            sent.append(event)
+
+        scope = {
+            'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+            'headers': headers, 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+        }
+        await StreamingBodyASGIHandler()(scope, receive, send)
+        return sent[0]['status'] if sent else None
+
+    @staticmethod
+    def _messages(body, size=1000):
+        return [
+            {'type': 'http.request', 'body': body[start:start + size], 'more_body': start + size < len(body)}
+            for start in range(0, len(body), size)
+        ]
+
+    async def test_upload_body_is_not_copied_before_the_view(self):
+        content = os.urandom(5000)
+        body, headers = self._upload_body(content)
+        with patch.object(ASGIHandler, 'read_body', side_effect=AssertionError('corpo copiado')):
+            status = await self._call(reverse('documents_upload'), self._messages(body), headers)
+        self.assertEqual(status, 302)
+        document = await Document.objects.aget(author=self.user)
+        self.assertEqual(document.file_size, len(content))
+        with default_storage.open(document.file.name) as stored:
+            self.assertEqual(stored.read(), content)
+
+    async def test_disconnect_during_the_upload_discards_the_partial_file(self):
+        # mais que um bloco do handler, para o arquivo parcial chegar ao disco
+        body, headers = self._upload_body(os.urandom(600 * 1024))
+        messages = self._messages(body, size=64 * 1024)[:6] + [{'type': 'http.disconnect'}]
+        status = await self._call(reverse('documents_upload'), messages, headers)
+        self.assertIsNone(status)
+        # a thread de leitura termina depois do cancelamento da view
+        for _ in range(50):
+            if not self.stored_files('incoming'):
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.stored_files('incoming'), [])
+        self.assertFalse(await Document.objects.filter(author=self.user).aexists())
+
+    async def test_stream_reads_messages_on_demand(self):
+        messages = self._messages(b'linha 1\nlinha 2\nresto', size=4)
+        received = []
+
+        async def receive():
+            received.append(messages[0])
+            return messages.pop(0)
+
+        stream = ASGIBodyStream(receive, asyncio.get_running_loop())
+        with self.assertRaises(RuntimeError):
+            stream.read()
+
+        first = await asyncio.to_thread(stream.readline)
+        self.assertEqual(first, b'linha 1\n')
+        self.assertEqual(len(received), 2)
+        rest = await asyncio.to_thread(lambda: (stream.read(3), stream.read()))
+        self.assertEqual(rest, (b'lin', b'ha 2\nresto'))
+        self.assertTrue(stream.consumed.is_set())
+
+    async def test_stream_reports_a_disconnect(self):
+        messages = [{'type': 'http.request', 'body': b'abc', 'more_body': True}, {'type': 'http.disconnect'}]
+
+        async def receive():
+            return messages.pop(0)
+
+        stream = ASGIBodyStream(receive, asyncio.get_running_loop())
+        with self.assertRaises(OSError):
+            await asyncio.to_thread(stream.read)
+        self.assertTrue(stream.disconnected)
+
+
+class BlobStorageTests(MediaTestCase):
+    """Arquivos dos blobs diante de transações desfeitas e processos concorrentes."""
+
+    content = b'conteudo do blob\n' * 2000
+
+    def _staged_upload(self):
+        path = os.path.join('incoming', 'recebido')
+        default_storage.save(path, io.BytesIO(self.content))
+        return StagedUploadedFile(
+            path, 'arquivo.bin', 'application/octet-stream', len(self.content),
+            hashlib.sha256(self.content).hexdigest(), '',
+        )
+
+    def test_adopted_file_is_moved_only_after_commit(self):
+        upload = self._staged_upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            blob = adopt_blob(upload)
+            self.assertFalse(default_storage.exists(blob.file.name))
+        self.assertTrue(default_storage.exists(blob.file.name))
+        self.assertIsNone(upload.path)
+
+    def test_rolled_back_adoption_leaves_no_blob_file(self):
+        upload = self._staged_upload()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                adopt_blob(upload)
+                raise RuntimeError
+        self.assertEqual(self.stored_files('blobs'), [])
+        self.assertTrue(default_storage.exists(upload.path))
+
+    def _compress_while_blob_changes(self, sha256):
+        """Comprime o blob, simulando outro processo que o regrava ao mesmo tempo."""
+        write = storage._write_blob_file
+
+        def write_then_change(path, fileobj):
+            created = write(path, fileobj)
+            Blob.objects.filter(pk=sha256).update(file='blobs/outro')
+            return created
+
+        with patch.object(storage, '_write_blob_file', write_then_change):
+            with self.captureOnCommitCallbacks(execute=True):
+                return storage.compress_blob(sha256)
+
+    def _plain_blob(self):
+        sha256 = hashlib.sha256(self.content).hexdigest()
+        path = storage.blob_path(sha256)
+        default_storage.save(path, io.BytesIO(self.content))
+        Blob.objects.create(sha256=sha256, file=path, size=len(self.content), ref_count=1)
+        return sha256
+
+    def test_compression_conflict_deletes_only_its_own_file(self):
+        sha256 = self._plain_blob()
+        self.assertIsNone(self._compress_while_blob_changes(sha256))
+        self.assertFalse(default_storage.exists(storage.blob_path(sha256, 'gzip')))
+
+    def test_compression_conflict_keeps_a_file_written_by_another_process(self):
+        sha256 = self._plain_blob()
+        new_path = storage.blob_path(sha256, 'gzip')
+        default_storage.save(new_path, io.BytesIO(b'gravado por outro processo'))
+        self.assertIsNone(self._compress_while_blob_changes(sha256))
+        self.assertTrue(default_storage.exists(new_path))
+
+    def test_deleting_a_missing_blob_file_is_harmless(self):
+        path = storage.blob_path('0' * 64)
+        default_storage.save(path, io.BytesIO(self.content))
+        storage.delete_blob_file('0' * 64, path)
+        self.assertFalse(default_storage.exists(path))
+        storage.delete_blob_file('0' * 64, path)
+
+
+class BulkImportRollbackTests(MediaTestCase):
+    """Arquivos de um lote cuja transação foi desfeita."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('importer')
+
+    def _entry(self, name, content):
+        return BulkEntry(name, len(content), lambda: io.BytesIO(content))
+
+    def _import_failing(self, entries):
+        with patch.object(bulk, 'record_usage', side_effect=DatabaseError('falha simulada')):
+            return bulk.import_entries(entries, author=self.user, workers=2)
+
+    @override_settings(DOCUMENTS_DEDUPLICATE=True, DOCUMENTS_COMPRESSION='')
+    def test_new_blob_files_are_removed(self):
+        existing = b'conteudo ja armazenado\n' * 10
+        sha256 = hashlib.sha256(existing).hexdigest()
+        path = storage.blob_path(sha256)
+        default_storage.save(path, io.BytesIO(existing))
+        Blob.objects.create(sha256=sha256, file=path, size=len(existing), ref_count=1)
+
+        results = self._import_failing([
+            self._entry('novo.txt', b'conteudo novo\n' * 10),
+            self._entry('repetido.txt', existing),
+        ])
+
+        self.assertTrue(all(result.error.startswith('Erro ao salvar no banco') for result in results))
+        self.assertEqual(self.stored_files('blobs'), [os.path.join(self.media_root, path)])
+
+    @override_settings(DOCUMENTS_DEDUPLICATE=False)
+    def test_document_files_are_removed(self):
+        results = self._import_failing([self._entry('a.txt', b'primeiro\n' * 10)])
+        self.assertFalse(results[0].ok)
+        self.assertEqual(self.stored_files('documents'), [])
+
+
+
+class UploadRollbackTests(MediaTestCase):
+    """Arquivo movido para 'documents/' em um upload cuja transação é desfeita."""
+
+    content = b'conteudo enviado\n' * 100
+
+    @override_settings(DOCUMENTS_DEDUPLICATE=False)
+    def test_moved_file_is_removed_on_rollback(self):
+        user = User.objects.create_user('owner')
+        default_storage.save('incoming/recebido', io.BytesIO(self.content))
+        upload = StagedUploadedFile(
+            'incoming/recebido', 'arquivo.txt', 'text/plain', len(self.content),
+            hashlib.sha256(self.content).hexdigest(), '',
+        )
+        form = Mock(save=lambda commit: Document(title='Desfeito'))
+
+        with patch.object(views, 'enqueue', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            views._save_uploaded_document(form, user, upload)
+
+        self.assertEqual(self.stored_files('documents'), [])
+        self.assertFalse(Document.objects.exists())
+
+class EmptyFileDownloadTests(MediaTestCase):
+    """Download de um documento com arquivo vazio."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('owner')
+        self.client.force_login(self.user)
+        path = default_storage.save('documents/vazio.txt', io.BytesIO(b''))
+        self.document = Document.objects.create(
+            title='Vazio', author=self.user, file=path, file_name='vazio.txt',
+            file_size=0, file_type='text/plain', file_extension='.txt',
+        )
+
+    def test_suffix_range_is_not_satisfiable(self):
+        response = self.client.get(
+            reverse('documents_download', args=[self.document.pk]), HTTP_RANGE='bytes=-10',
+        )
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+
+class CardCacheTests(TestCase):
+    """Cards da listagem guardados em cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('autora', first_name='Ana', last_name='Lima')
+        self.client.force_login(self.user)
+        Document.objects.create(
+            title='Relatório', author=self.user, file='documents/relatorio.pdf',
+            file_name='relatorio.pdf', file_size=10, file_type='application/pdf',
+            file_extension='.pdf',
+        )
+
+    def test_renamed_author_refreshes_the_card(self):
+        self.assertContains(self.client.get(reverse('documents_list')), 'Ana Lima')
+        self.user.last_name = 'Souza'
+        self.user.save()
+        response = self.client.get(reverse('documents_list'))
+        self.assertContains(response, 'Ana Souza')
+        self.assertNotContains(response, 'Ana Lima')
+
+
+@override_settings(DOCUMENTS_DERIVATIVE_FORMAT='webp', JOBS_IMMEDIATE=False)
+class DerivativeTests(MediaTestCase):
+    """Miniaturas e pré-visualizações geradas fora da requisição."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('fotografa')
+        self.client.force_login(self.user)
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'navy').save(buffer, 'PNG')
+        self.document = self.create_document(self.user, 'foto.png', buffer.getvalue())
+
+    def test_generates_every_size_within_its_limit(self):
+        self.assertTrue(derivatives.generate_derivatives(self.document))
+        key = derivatives.derivative_key(self.document)
+        for size, dimension in derivatives.SIZES.items():
+            with default_storage.open(derivatives.derivative_path(key, size)) as fileobj:
+                image = Image.open(fileobj)
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(max(image.size), dimension)
+
+    def test_existing_derivatives_are_not_rendered_again(self):
+        derivatives.generate_derivatives(self.document)
+        with patch.object(derivatives, '_open_source_image') as open_source:
+            self.assertTrue(derivatives.generate_derivatives(self.document))
+        open_source.assert_not_called()
+
+    def test_missing_derivative_is_scheduled_once(self):
+        url = reverse('documents_derivative', args=[self.document.pk, 'thumb'])
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(
+            Job.objects.filter(name__endswith='generate_document_derivatives').count(), 1
+        )
+
+    def test_ready_derivative_is_cached_by_version(self):
+        derivatives.generate_derivatives(self.document)
+        key = derivatives.derivative_key(self.document)
+        url = reverse('documents_derivative', args=[self.document.pk, 'preview'])
+
+        response = self.client.get(url, {'v': key})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('no-cache', self.client.get(url)['Cache-Control'])
+
+    def test_unsupported_type_has_no_derivatives(self):
+        document = self.create_document(self.user, 'notas.txt', b'texto')
+        self.assertFalse(derivatives.generate_derivatives(document))
+        response = self.client.get(reverse('documents_derivative', args=[document.pk, 'thumb']))
+        self.assertEqual(response.status_code, 404)
+
+
+class CommentTests(TestCase):
+    """Contador de comentários e paginação dos comentários nos detalhes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('leitor')
+        self.client.force_login(self.user)
+        self.document = Document.objects.create(
+            title='Ata', author=self.user, file='documents/ata.pdf', file_name='ata.pdf',
+        )
+
+    def _comment(self, text):
+        return Comment.objects.create(document=self.document, author=self.user, text=text)
+
+    def _count(self):
+        return Document.objects.get(pk=self.document.pk).comments_count
+
+    def test_counter_follows_creation_and_deletion(self):
+        first = self._comment('primeiro')
+        self._comment('segundo')
+        self.assertEqual(self._count(), 2)
+        first.delete()
+        self.assertEqual(self._count(), 1)
+
+    def test_counter_never_goes_negative(self):
+        comment = self._comment('único')
+        Document.objects.filter(pk=self.document.pk).update(comments_count=0)
+        comment.delete()
+        self.assertEqual(self._count(), 0)
+
+    @override_settings(DOCUMENTS_COMMENTS_PAGE_SIZE=2)
+    def test_comments_are_paginated_newest_first(self):
+        for text in ('um', 'dois', 'três'):
+            self._comment(text)
+        url = reverse('documents_details', args=[self.document.pk])
+
+        first = self.client.get(url).context['comments']
+        self.assertEqual([comment.text for comment in first], ['três', 'dois'])
+        self.assertTrue(first.has_next)
+
+        second = self.client.get(url, {'comments_after': first.next_cursor}).context['comments']
+        self.assertEqual([comment.text for comment in second], ['um'])
+        self.assertFalse(second.has_next)
+
+    def test_posted_comment_is_counted(self):
+        self.client.post(reverse('documents_details', args=[self.document.pk]), {'text': 'ótimo'})
+        self.assertEqual(self._count(), 1)
+
+
+class TrashTests(MediaTestCase):
+    """Lixeira: exclusão reversível e limpeza definitiva em lotes."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dona')
+        self.client.force_login(self.user)
+
+    def _trash(self, document, days_ago):
+        Document.objects.filter(pk=document.pk).update(
+            deleted_at=timezone.now() - timedelta(days=days_ago)
+        )
+
+    def test_delete_moves_to_the_trash_and_restore_brings_back(self):
+        document = self.create_document(self.user, 'nota.txt', b'nota')
+        self.client.post(reverse('documents_delete', args=[document.pk]))
+        self.assertFalse(Document.objects.filter(pk=document.pk).exists())
+        self.assertTrue(Document.all_objects.trashed().filter(pk=document.pk).exists())
+        self.assertTrue(default_storage.exists(document.file.name))
+
+        self.client.post(reverse('documents_restore', args=[document.pk]))
+        self.assertTrue(Document.objects.filter(pk=document.pk).exists())
+
+    def test_only_allowed_users_can_delete(self):
+        document = self.create_document(User.objects.create_user('outra'), 'nota.txt', b'nota')
+        self.client.post(reverse('documents_delete', args=[document.pk]))
+        self.assertTrue(Document.objects.filter(pk=document.pk).exists())
+
+    @override_settings(DOCUMENTS_TRASH_RETENTION_DAYS=30)
+    def test_purge_removes_only_expired_documents_and_their_files(self):
+        expired = self.create_document(self.user, 'antigo.txt', b'antigo')
+        recent = self.create_document(self.user, 'recente.txt', b'recente')
+        self._trash(expired, 40)
+        self._trash(recent, 5)
+
+        self.assertEqual(purge_trash(batch_size=1, workers=2), (1, 1))
+        self.assertFalse(Document.all_objects.filter(pk=expired.pk).exists())
+        self.assertFalse(default_storage.exists(expired.file.name))
+        self.assertTrue(Document.all_objects.filter(pk=recent.pk).exists())
+        self.assertTrue(default_storage.exists(recent.file.name))
+
+    def test_purge_keeps_blobs_still_referenced(self):
+        content = b'conteudo compartilhado'
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = default_storage.save(storage.blob_path(sha256), io.BytesIO(content))
+        blob = Blob.objects.create(sha256=sha256, file=path, size=len(content), ref_count=2)
+        first, second = (
+            Document.objects.create(title=title, author=self.user, file=path, blob=blob)
+            for title in ('primeiro', 'segundo')
+        )
+
+        self._trash(first, 60)
+        purge_trash(days=30)
+        self.assertEqual(Blob.objects.get(pk=sha256).ref_count, 1)
+        self.assertTrue(default_storage.exists(path))
+
+        self._trash(second, 60)
+        self.assertEqual(purge_trash(days=30), (1, 1))
+        self.assertFalse(Blob.objects.filter(pk=sha256).exists())
+        self.assertFalse(default_storage.exists(path))
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0, INSTRUMENTATION_SERVER_TIMING=True)
+class InstrumentationTests(TestCase):
+    """Medição por requisição: Server-Timing, consultas repetidas e streaming."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _run(self, view):
+        return instrumentation_middleware(view)(self.factory.get('/medido/'))
+
+    def test_sampled_request_reports_queries_and_templates(self):
+        user = User.objects.create_user('leitor')
+        self.client.force_login(user)
+        response = self.client.get(reverse('documents_list'))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ consultas, \d+ repetidas", tpl;dur=[\d.]+$')
+        self.assertNotIn('"0 consultas', timing)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_unsampled_request_reports_only_the_total(self):
+        response = self._run(lambda request: HttpResponse('ok'))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+$')
+
+    @override_settings(INSTRUMENTATION_DUPLICATE_QUERIES=3, INSTRUMENTATION_SLOW_REQUEST_MS=60_000)
+    def test_repeated_queries_are_logged(self):
+        def view(request):
+            for pk in range(3):
+                User.objects.filter(pk=pk).exists()
+            return HttpResponse('ok')
+
+        with self.assertLogs('docs_manager.instrumentation', 'WARNING') as logs:
+            self._run(view)
+        record = logs.records[0].metrics
+        self.assertEqual(record['repeated_count'], 3)
+        self.assertEqual(record['duplicate_queries'], 2)
+        self.assertIn('auth_user', record['repeated_sql'])
+
+    @override_settings(INSTRUMENTATION_DUPLICATE_QUERIES=3, INSTRUMENTATION_SLOW_REQUEST_MS=60_000)
+    def test_fast_request_without_repetition_is_not_logged(self):
+        with self.assertNoLogs('docs_manager.instrumentation'):
+            self._run(lambda request: HttpResponse('ok'))
+
+    @override_settings(INSTRUMENTATION_SLOW_REQUEST_MS=0)
+    def test_streamed_bytes_are_logged_after_the_body_is_sent(self):
+        with self.assertNoLogs('docs_manager.instrumentation'):
+            response = self._run(lambda request: StreamingHttpResponse([b'abc', b'defg']))
+        with self.assertLogs('docs_manager.instrumentation', 'WARNING') as logs:
+            self.assertEqual(b''.join(response.streaming_content), b'abcdefg')
+        self.assertEqual(logs.records[0].metrics['bytes_sent'], 7)
+        self.assertIn('stream_ms', logs.records[0].metrics)
+
+
+class StorageUsageTests(TestCase):
+    """Tabela de uso por usuário e extensão, cotas e reconstrução."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('autora')
+        self.client.force_login(self.user)
+
+    def _document(self, file_name, size):
+        extension = os.path.splitext(file_name)[1]
+        return Document.objects.create(
+            title=file_name, author=self.user, file=f'documents/{file_name}',
+            file_name=file_name, file_size=size, file_extension=extension,
+        )
+
+    def _rows(self):
+        return {
+            row.extension: (row.documents_count, row.total_size)
+            for row in StorageUsage.objects.filter(user=self.user)
+        }
+
+    def test_usage_follows_upload_trash_restore_and_delete(self):
+        pdf = self._document('a.pdf', 100)
+        self._document('b.pdf', 50)
+        self._document('c.txt', 7)
+        self.assertEqual(self._rows(), {'.pdf': (2, 150), '.txt': (1, 7)})
+
+        self.client.post(reverse('documents_delete', args=[pdf.pk]))
+        self.assertEqual(user_usage(self.user), {'documents': 2, 'size': 57})
+        self.client.post(reverse('documents_restore', args=[pdf.pk]))
+        self.assertEqual(user_usage(self.user), {'documents': 3, 'size': 157})
+
+        pdf.delete()
+        self.assertEqual(self._rows(), {'.pdf': (1, 50), '.txt': (1, 7)})
+
+    @override_settings(DOCUMENTS_USER_QUOTA=100)
+    def test_quota_counts_only_active_documents(self):
+        self._document('a.pdf', 80)
+        with self.assertRaises(QuotaExceeded):
+            check_quota(self.user, 30)
+
+        StorageQuota.objects.create(user=self.user, max_bytes=200)
+        check_quota(self.user, 30)
+        self.assertEqual(remaining_quota(self.user), 120)
+
+    def test_reconcile_fixes_missing_divergent_and_stale_rows(self):
+        self._document('a.pdf', 100)
+        self._document('c.txt', 7)
+        StorageUsage.objects.filter(user=self.user, extension='.pdf').update(documents_count=5)
+        StorageUsage.objects.filter(user=self.user, extension='.txt').delete()
+        StorageUsage.objects.create(user=self.user, extension='.doc', documents_count=1, total_size=9)
+
+        self.assertEqual(reconcile_usage(), 3)
+        self.assertEqual(self._rows(), {'.pdf': (1, 100), '.txt': (1, 7)})
+        self.assertEqual(reconcile_usage(), 0)
+
+    def test_reconcile_keeps_an_increment_made_during_the_rebuild(self):
+        self._document('a.pdf', 100)
+        StorageUsage.objects.filter(user=self.user).delete()
+        real_apply = usage.apply_usage
+
+        def concurrent_upload(deltas):
+            # upload de outro documento, confirmado depois da agregação
+            real_apply({(self.user.pk, '.pdf'): (1, 20)})
+            real_apply(deltas)
+
+        with patch.object(usage, 'apply_usage', side_effect=concurrent_upload):
+            reconcile_usage()
+        self.assertEqual(self._rows(), {'.pdf': (2, 120)})
+
+
+class ExportTests(MediaTestCase):
+    """Exportação em .zip montado durante o envio, com manifesto."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('exportadora')
+        self.client.force_login(self.user)
+
+    def _export(self, **params):
+        response = self.client.get(reverse('documents_export'), params)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_zip_has_the_files_and_a_csv_manifest(self):
+        text = self.create_document(self.user, 'nota.txt', b'texto ' * 1000)
+        image = self.create_document(self.user, 'foto.png', b'\x89PNG\r\n\x1a\n' + os.urandom(64))
+
+        archive = self._export()
+        self.assertEqual(archive.read(archive_path(text)), b'texto ' * 1000)
+        self.assertEqual(archive.getinfo(archive_path(text)).compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo(archive_path(image)).compress_type, zipfile.ZIP_STORED)
+
+        rows = list(csv.DictReader(io.StringIO(archive.read('manifest.csv').decode())))
+        self.assertEqual([row['path'] for row in rows], [archive_path(text), archive_path(image)])
+        self.assertEqual(rows[0]['author'], 'exportadora')
+
+    def test_selection_and_json_manifest(self):
+        chosen = self.create_document(self.user, 'a.txt', b'a')
+        self.create_document(self.user, 'b.txt', b'b')
+
+        archive = self._export(ids=str(chosen.pk), manifest='json')
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual([row['id'] for row in manifest], [chosen.pk])
+        self.assertEqual(archive.namelist(), ['manifest.json', archive_path(chosen)])
+
+    @override_settings(DOCUMENTS_SHARING=True)
+    def test_only_visible_documents_are_exported(self):
+        mine = self.create_document(self.user, 'meu.txt', b'meu')
+        self.create_document(User.objects.create_user('outra'), 'dela.txt', b'dela')
+        self.assertEqual(self._export().namelist(), ['manifest.csv', archive_path(mine)])
+
+    def test_missing_file_is_listed_in_the_errors(self):
+        present = self.create_document(self.user, 'ok.txt', b'ok')
+        missing = self.create_document(self.user, 'sumiu.txt', b'sumiu')
+        default_storage.delete(missing.file.name)
+
+        archive = self._export()
+        self.assertEqual(archive.read(archive_path(present)), b'ok')
+        self.assertIn(archive_path(missing), archive.read('erros.txt').decode())
+
+    def test_batches_cover_every_document(self):
+        documents = [self.create_document(self.user, f'{index}.txt', b'x') for index in range(5)]
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(stream_export(export_queryset(), batch_size=2))))
+        self.assertEqual(
+            archive.namelist(), ['manifest.csv'] + [archive_path(document) for document in documents]
+        )
+
+
+class TablePreviewTests(MediaTestCase):
+    """Pré-visualização de planilhas pelo cache colunar."""
+
+    CSV = (
+        'nome;quantidade;preço;data\n'
+        'café;3;4.5;2024-01-31\n'
+        'chá;;2.25;\n'
+        'água;10;1;2024-03-01\n'
+    ).encode()
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('analista')
+        self.client.force_login(self.user)
+
+    def _xlsx(self):
+        namespace = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+        sheet = (
+            f'<worksheet xmlns="{namespace}"><sheetData>'
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="inlineStr"><is><t>total</t></is></c></row>'
+            '<row r="2"><c r="A2" t="s"><v>1</v></c><c r="B2"><v>7</v></c></row>'
+            '<row r="3"><c r="B3"><v>1.5</v></c></row>'
+            '</sheetData></worksheet>'
+        )
+        strings = f'<sst xmlns="{namespace}"><si><t>item</t></si><si><t>caneta</t></si></sst>'
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as package:
+            package.writestr('xl/worksheets/sheet1.xml', sheet)
+            package.writestr('xl/sharedStrings.xml', strings)
+        return buffer.getvalue()
+
+    def test_csv_columns_are_typed_and_read_by_window(self):
+        document = self.create_document(self.user, 'vendas.csv', self.CSV)
+        self.assertTrue(build_table(document))
+        table = load_table(document)
+
+        self.assertEqual(table.rows, 3)
+        columns = {column['name']: column for column in table.columns}
+        self.assertEqual(columns['quantidade']['type'], 'integer')
+        self.assertEqual(columns['data']['type'], 'date')
+        self.assertEqual(columns['preço']['type'], 'float')
+        self.assertEqual(columns['nome']['type'], 'text')
+        self.assertEqual(columns['quantidade']['stats']['nulls'], 1)
+        self.assertEqual(columns['quantidade']['stats']['max'], 10)
+
+        self.assertEqual(table.window(1, 2), [
+            ['chá', None, '2.25', None],
+            ['água', '10', '1', '2024-03-01'],
+        ])
+        self.assertEqual(table.window(10, 5), [])
+
+    def test_xlsx_uses_the_first_sheet(self):
+        document = self.create_document(self.user, 'itens.xlsx', self._xlsx())
+        build_table(document)
+        table = load_table(document)
+        self.assertEqual([column['name'] for column in table.columns], ['item', 'total'])
+        self.assertEqual(table.window(0, 10), [['caneta', '7'], [None, '1.5']])
+
+    def test_unreadable_file_records_the_error(self):
+        document = self.create_document(self.user, 'quebrada.xlsx', b'isto nao e um zip')
+        with self.assertLogs('apps.documents.tables', 'WARNING'):
+            build_table(document)
+        self.assertTrue(load_table(document).error)
+        response = self.client.get(reverse('documents_table', args=[document.pk]))
+        self.assertEqual(response.status_code, 422)
+
+    def test_view_schedules_the_conversion_then_serves_rows(self):
+        document = self.create_document(self.user, 'vendas.csv', self.CSV)
+        url = reverse('documents_table', args=[document.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(Job.objects.filter(unique_key=str(document.pk)).exists())
+
+        build_table(document)
+        data = self.client.get(url, {'start': 2, 'count': 5}).json()
+        self.assertEqual(data['status'], 'ready')
+        self.assertEqual(data['total_rows'], 3)
+        self.assertEqual(data['rows'], [['água', '10', '1', '2024-03-01']])
+
+    def test_other_types_have_no_table(self):
+        document = self.create_document(self.user, 'nota.txt', b'texto')
+        response = self.client.get(reverse('documents_table', args=[document.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Leituras nas réplicas e leitura das próprias escritas no principal."""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def _run(self, request, write=False):
+        """Executa uma view que registra o banco das leituras antes e depois de escrever."""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Document))
+            if write:
+                self.router.db_for_write(Document)
+                reads.append(self.router.db_for_read(Document))
+            return HttpResponse('ok')
+
+        response = replica_routing_middleware(view)(request)
+        return reads, response
+
+    def test_safe_request_reads_from_the_replica(self):
+        reads, response = self._run(self.factory.get('/'))
+        self.assertEqual(reads, ['replica1'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_write_moves_reads_to_the_primary_and_pins_the_browser(self):
+        reads, response = self._run(self.factory.get('/'), write=True)
+        self.assertEqual(reads, ['replica1', 'default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_unsafe_method_reads_from_the_primary(self):
+        reads, response = self._run(self.factory.post('/'))
+        self.assertEqual(reads, ['default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_pinned_browser_reads_from_the_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self._run(request)[0], ['default'])
+
+    def test_reads_inside_a_transaction_stay_on_the_primary(self):
+        with patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self._run(self.factory.get('/'))[0], ['default'])
+
+    def test_outside_requests_everything_uses_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Document), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'documents'))
+        self.assertTrue(self.router.allow_migrate('default', 'documents'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_nothing_changes(self):
+        reads, response = self._run(self.factory.post('/'), write=True)
+        self.assertEqual(reads, ['default', 'default'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class StreamedListTests(TestCase):
+    """Listagem enviada em partes, com os ícones de um único sprite SVG."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('leitora')
+        self.client.force_login(self.user)
+
+    def _document(self, title):
+        return Document.objects.create(
+            title=title, author=self.user, file=f'documents/{title}.txt', file_name=f'{title}.txt',
+        )
+
+    def test_header_is_sent_before_any_query(self):
+        self._document('relatorio')
+        response = self.client.get(reverse('documents_list'))
+        self.assertTrue(response.streaming)
+
+        chunks = iter(response.streaming_content)
+        with self.assertNumQueries(0):
+            head = next(chunks).decode()
+        self.assertIn('icon-search', head)
+        self.assertNotIn('relatorio', head)
+        self.assertIn('relatorio', b''.join(chunks).decode())
+
+    @override_settings(DOCUMENTS_PAGE_SIZE=25)
+    def test_every_card_is_sent_in_batches(self):
+        titles = [f'documento-{index:02}' for index in range(LIST_FLUSH_CARDS + 3)]
+        for title in titles:
+            self._document(title)
+        chunks = list(self.client.get(reverse('documents_list')).streaming_content)
+        page = b''.join(chunks).decode()
+        for title in titles:
+            self.assertIn(title, page)
+        # cabeçalho, resultados, dois lotes de cards, fim dos resultados e rodapé
+        self.assertEqual(len(chunks), 6)
+
+    def test_icons_reference_symbols_of_the_sprite(self):
+        self._document('planilha')
+        page = b''.join(self.client.get(reverse('documents_list')).streaming_content).decode()
+        used = set(re.findall(r'icons\.svg#([\w-]+)', page))
+        self.assertTrue(used)
+        with open(finders.find('img/icons.svg'), encoding='utf-8') as sprite:
+            symbols = set(re.findall(r'<symbol id="([\w-]+)"', sprite.read()))
+        self.assertLessEqual(used, symbols)
+
+    def test_generator_runs_in_the_request_context(self):
+        variable = contextvars.ContextVar('variavel', default='fora')
+        token = variable.set('requisição')
+        try:
+            response = streaming_response(RequestFactory().get('/'), (variable.get() for _ in range(2)))
+        finally:
+            variable.reset(token)
+        self.assertEqual(list(response.streaming_content), [b'requisi\xc3\xa7\xc3\xa3o'] * 2)
+
+    def test_aiterate_yields_every_chunk_and_closes_the_generator(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield b'a'
+                yield b'b'
+            finally:
+                closed.append(True)
+
+        async def collect():
+            return [chunk async for chunk in aiterate(chunks())]
+
+        self.assertEqual(async_to_sync(collect)(), [b'a', b'b'])
+        self.assertEqual(closed, [True])
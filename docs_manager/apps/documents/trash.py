@@ -0,0 +1,117 @@
+"""
+trash.py
+
+Limpeza definitiva da lixeira de documentos (comando `purge_trash`).
+
+Excluir um documento apenas preenche `Document.deleted_at`. Depois de
+`DOCUMENTS_TRASH_RETENTION_DAYS` dias, os documentos da lixeira são
+removidos em lotes: cada lote exclui as linhas (e os comentários) em uma
+única transação, liberando as referências aos blobs em bloco, e só depois
+do commit os arquivos são apagados do armazenamento, em paralelo.
+As referências aos trechos das revisões também são liberadas em bloco; os
+arquivos dos trechos que deixam de ser usados são apagados pela fila.
+
+Notas:
+    - As linhas são reservadas com `SKIP LOCKED`, então duas limpezas
+      simultâneas não disputam o mesmo lote.
+    - Se a remoção de um arquivo falhar, o documento já foi excluído e o
+      arquivo fica órfão; a falha é registrada no log e não interrompe o lote.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Blob, Document
+from .revisions import batch_chunk_releases
+from .storage import batch_blob_releases
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de documentos excluídos por transação
+BATCH_SIZE = 1000
+
+# Threads que apagam os arquivos de um lote do armazenamento
+DELETE_WORKERS = 8
+
+
+def _delete_file(path):
+    """Apaga um arquivo do armazenamento, retornando True em caso de sucesso."""
+    try:
+        default_storage.delete(path)
+    except OSError as e:
+        logger.warning('Falha ao remover o arquivo %s: %s', path, e)
+        return False
+    return True
+
+
+def purge_batch(cutoff, batch_size, pool):
+    """
+    Exclui em definitivo um lote de documentos que estão na lixeira desde antes de `cutoff`.
+
+    Args:
+        cutoff (datetime): documentos excluídos antes desta data são removidos.
+        batch_size (int): quantidade máxima de documentos do lote.
+        pool (ThreadPoolExecutor): threads que apagam os arquivos.
+
+    Returns:
+        tuple: (documentos excluídos, arquivos apagados).
+    """
+    with transaction.atomic():
+        rows = list(
+            Document.all_objects.filter(deleted_at__lt=cutoff)
+            .select_for_update(skip_locked=True)
+            .order_by('-deleted_at', '-id')
+            .values_list('pk', 'file', 'blob_id')[:batch_size]
+        )
+        if not rows:
+            return 0, 0
+        with batch_blob_releases() as released, batch_chunk_releases():
+            # o texto extraído e o vetor de busca não são usados pelos sinais
+            Document.all_objects.filter(pk__in=[pk for pk, _, _ in rows]).defer(
+                'content', 'search_vector'
+            ).delete()
+
+    paths = [path for _, path, blob_id in rows if path and not blob_id]
+    if released:
+        # um blob com o mesmo conteúdo pode ter sido criado após o commit
+        recreated = set(
+            Blob.objects.filter(pk__in=[sha for sha, _ in released]).values_list('pk', flat=True)
+        )
+        paths.extend(path for sha, path in released if sha not in recreated)
+
+    deleted_files = sum(pool.map(_delete_file, paths))
+    return len(rows), deleted_files
+
+
+def purge_trash(days=None, batch_size=BATCH_SIZE, workers=DELETE_WORKERS):
+    """
+    Exclui em definitivo os documentos que passaram do prazo da lixeira.
+
+    Args:
+        days (int | None): dias de permanência na lixeira; o padrão vem de
+            `DOCUMENTS_TRASH_RETENTION_DAYS`.
+        batch_size (int): documentos excluídos por transação.
+        workers (int): threads que apagam os arquivos em paralelo.
+
+    Returns:
+        tuple: (documentos excluídos, arquivos apagados).
+    """
+    if days is None:
+        days = settings.DOCUMENTS_TRASH_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+
+    documents = files = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='purge-trash') as pool:
+        while True:
+            purged, deleted_files = purge_batch(cutoff, batch_size, pool)
+            if not purged:
+                break
+            documents += purged
+            files += deleted_files
+    return documents, files
@@ -0,0 +1,287 @@
+"""
+upload_handlers.py
+
+Recebimento do upload individual de documentos em uma única passagem.
+
+O `DocumentUploadHandler` substitui os handlers padrão do Django na view
+`documents_upload`. Cada bloco do corpo da requisição é, na mesma passagem:
+- somado ao tamanho, com o envio interrompido assim que passa do limite;
+- somado ao SHA-256 do conteúdo;
+- gravado (comprimido, se for o caso) em 'incoming/' no próprio
+  armazenamento, de onde o arquivo é apenas movido para o caminho final.
+
+O tipo MIME é detectado pelos primeiros bytes do conteúdo, e não pelo
+informado pelo navegador.
+
+Notas:
+    - Em modo WSGI, o corpo é lido sob demanda: o arquivo é lido uma vez e
+      gravado uma vez (sem arquivo temporário do Django, sem nova leitura
+      para o hash e sem cópia no `document.save()`), e o envio é
+      interrompido assim que passa do limite.
+    - Em modo ASGI (o usado em produção), o `ASGIHandler` padrão do Django
+      receberia o corpo inteiro antes da view, em um arquivo temporário. Nas
+      views de `STREAMED_BODY_VIEWS`, o `StreamingBodyASGIHandler`
+      (`docs_manager/body_streaming.py`) entrega o corpo sob demanda, então
+      também aqui o arquivo é lido e gravado uma única vez. Os envios com
+      Content-Length acima do limite são recusados antes, pelo
+      `BodyLimitMiddleware` (`docs_manager/body_limits.py`), com os valores
+      de `request_body_limits`.
+    - O arquivo recebido que não for movido para o destino final
+      (formulário inválido, cota excedida, conteúdo já armazenado) é
+      apagado quando o Django fecha os arquivos, ao fim da requisição. Os
+      que sobram de um processo interrompido são removidos pelo comando
+      `cleanup_upload_sessions`.
+"""
+
+import hashlib
+import io
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .compression import SAMPLE_SIZE, choose_encoding, compressing_writer
+from .forms import MAX_FILE_SIZE
+
+# Pasta do armazenamento onde os arquivos ficam durante o recebimento
+INCOMING_DIR = 'incoming'
+
+# Horas até um arquivo em 'incoming/' ser considerado abandonado
+STALE_UPLOAD_HOURS = 24
+
+# Folga para os demais campos do formulário no tamanho total do corpo
+FORM_FIELDS_ALLOWANCE = 64 * 1024
+
+# Assinaturas (primeiros bytes) dos formatos aceitos e seus tipos MIME
+SIGNATURES = (
+    (b'%PDF', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword'),
+)
+
+# Pasta característica de cada formato Office dentro do .zip
+OFFICE_ZIP_TYPES = (
+    (b'word/', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    (b'xl/', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+)
+
+TEXT_TYPES = {'.csv': 'text/csv'}
+
+# Views (nomes das URLs) que leem o corpo sob demanda também em modo ASGI
+STREAMED_BODY_VIEWS = {'documents_upload', 'documents_upload_chunk'}
+
+
+def sniff_content_type(sample, file_name=''):
+    """
+    Detecta o tipo MIME de um conteúdo pelos primeiros bytes.
+
+    Args:
+        sample (bytes): início do conteúdo (até `SAMPLE_SIZE` bytes).
+        file_name (str): nome original, usado apenas para distinguir
+            formatos com a mesma assinatura (csv e txt).
+
+    Returns:
+        str: tipo MIME; 'application/octet-stream' se não for reconhecido.
+    """
+    for signature, content_type in SIGNATURES:
+        if sample.startswith(signature):
+            return content_type
+    if sample.startswith(b'PK\x03\x04'):
+        for folder, content_type in OFFICE_ZIP_TYPES:
+            if folder in sample:
+                return content_type
+        return 'application/zip'
+    if b'\x00' not in sample:
+        extension = os.path.splitext(file_name)[1].lower()
+        return TEXT_TYPES.get(extension, 'text/plain')
+    return 'application/octet-stream'
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    Arquivo recebido pelo `DocumentUploadHandler`, já gravado no armazenamento.
+
+    Atributos:
+        path (str | None): caminho atual no armazenamento (None depois de
+            movido para o destino final ou descartado).
+        sha256 (str): hash do conteúdo original.
+        compression (str): compressão do arquivo gravado ('' se nenhuma).
+    """
+
+    def __init__(self, path, name, content_type, size, sha256, compression):
+        super().__init__(None, name, content_type, size)
+        self.path = path
+        self.sha256 = sha256
+        self.compression = compression
+
+    def open(self, mode='rb'):
+        raise ValueError('O arquivo recebido já foi gravado no armazenamento.')
+
+    def close(self):
+        # chamado pelo Django ao fim da requisição: apaga o que não foi usado
+        self.discard()
+
+    def move_to(self, name):
+        """
+        Move o arquivo para o caminho final, sem copiar os bytes.
+
+        Args:
+            name (str): caminho de destino, relativo ao MEDIA_ROOT.
+
+        Returns:
+            str: o próprio caminho de destino.
+        """
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(default_storage.path(self.path), target)
+        self.path = None
+        return name
+
+    def discard(self):
+        """Apaga o arquivo recebido, se ele não foi movido para o destino final."""
+        if self.path is not None:
+            default_storage.delete(self.path)
+            self.path = None
+
+
+class DocumentUploadHandler(FileUploadHandler):
+    """
+    Handler de upload que grava, mede e calcula o hash em uma única passagem.
+
+    Ver o início do módulo. Se o limite de tamanho for ultrapassado, o
+    recebimento é interrompido e `error` recebe a mensagem para o usuário.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, request=None, max_size=MAX_FILE_SIZE):
+        super().__init__(request)
+        self.max_size = max_size
+        self.error = None
+        self.path = None
+        self.body_too_large = False
+
+    def _too_large(self):
+        self.error = (
+            f'Arquivo muito grande! Máx {self.max_size // 1024 // 1024}MB'
+        )
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # corpo inteiro acima do limite: o envio é interrompido no início do
+        # arquivo, depois de lidos apenas os campos anteriores (CSRF, título)
+        self.body_too_large = content_length > self.max_size + FORM_FIELDS_ALLOWANCE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.body_too_large or (self.content_length or 0) > self.max_size:
+            self._too_large()
+            raise StopUpload(connection_reset=True)
+        self.path = os.path.join(INCOMING_DIR, uuid.uuid4().hex)
+        full_path = default_storage.path(self.path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        self.file = open(full_path, 'xb')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.sample = bytearray()
+        self.writer = None
+        self.encoding = ''
+
+    def _start(self):
+        """Decide a compressão e o tipo MIME pela amostra inicial e grava-a."""
+        sample = bytes(self.sample)
+        self.sample = None
+        if settings.DOCUMENTS_DEDUPLICATE:
+            # apenas os blobs são gravados comprimidos
+            self.encoding = choose_encoding(io.BytesIO(sample), self.file_name)
+        self.content_type = sniff_content_type(sample, self.file_name)
+        self.writer = compressing_writer(self.file, self.encoding)
+        self.writer.write(sample)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self._too_large()
+            self._discard()
+            raise StopUpload(connection_reset=True)
+        self.digest.update(raw_data)
+        if self.writer is not None:
+            self.writer.write(raw_data)
+        else:
+            self.sample += raw_data
+            if len(self.sample) >= SAMPLE_SIZE:
+                self._start()
+
+    def file_complete(self, file_size):
+        if self.writer is None:
+            self._start()
+        if self.writer is not self.file:
+            self.writer.close()
+        self.file.close()
+        uploaded = StagedUploadedFile(
+            self.path, self.file_name, self.content_type, self.size,
+            self.digest.hexdigest(), self.encoding,
+        )
+        # a partir daqui, o arquivo pertence ao `StagedUploadedFile`
+        self.path = None
+        return uploaded
+
+    def upload_interrupted(self):
+        self._discard()
+
+    def _discard(self):
+        if self.path is not None:
+            self.file.close()
+            default_storage.delete(self.path)
+            self.path = None
+
+
+def request_body_limits():
+    """
+    Tamanho máximo do corpo das requisições de upload, por nome da URL.
+
+    Usado pelo `BodyLimitMiddleware` para recusar os envios grandes demais
+    antes de o corpo ser recebido (ver o início do módulo).
+
+    Returns:
+        dict: nome da URL -> (bytes, mensagem de erro, resposta em JSON?).
+    """
+    too_large = f'Arquivo muito grande! Máx {MAX_FILE_SIZE // 1024 // 1024}MB'
+    chunk_size = settings.DOCUMENTS_UPLOAD_CHUNK_SIZE
+    return {
+        'documents_upload': (MAX_FILE_SIZE + FORM_FIELDS_ALLOWANCE, too_large, False),
+        'documents_revise': (MAX_FILE_SIZE + FORM_FIELDS_ALLOWANCE, too_large, False),
+        'documents_upload_chunk': (
+            chunk_size, f'Parte maior que o tamanho da parte ({chunk_size} bytes).', True,
+        ),
+    }
+
+
+def discard_stale_uploads():
+    """
+    Apaga os arquivos abandonados em 'incoming/' (ex: processo interrompido).
+
+    Returns:
+        int: quantidade de arquivos removidos.
+    """
+    limit = time.time() - STALE_UPLOAD_HOURS * 60 * 60
+    removed = 0
+    try:
+        entries = os.scandir(default_storage.path(INCOMING_DIR))
+    except FileNotFoundError:
+        return 0
+    with entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < limit:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+    return removed
@@ -0,0 +1,165 @@
+"""
+uploads.py
+
+Armazenamento temporário das partes de uploads retomáveis.
+
+Cada sessão tem uma pasta própria em `UPLOAD_SESSIONS_ROOT`, com uma parte
+por arquivo ('<índice>.part'). As partes são gravadas em um arquivo
+temporário e renomeadas ao final, de modo que uma parte só aparece como
+recebida quando está completa. Assim, várias partes podem ser enviadas em
+paralelo sem nenhum bloqueio no banco.
+
+Na finalização, as partes são unidas direto no armazenamento (`assemble`),
+fora de qualquer transação.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .compression import choose_encoding, compressing_writer
+from .upload_handlers import INCOMING_DIR, StagedUploadedFile
+
+# Tamanho dos blocos lidos da requisição e das partes
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ChunkError(Exception):
+    """Erro de validação de uma parte enviada."""
+
+
+def session_dir(session):
+    """Retorna a pasta onde ficam as partes de uma sessão."""
+    return os.path.join(settings.UPLOAD_SESSIONS_ROOT, str(session.pk))
+
+
+def chunk_path(session, index):
+    """Retorna o caminho do arquivo de uma parte."""
+    return os.path.join(session_dir(session), f'{index}.part')
+
+
+def write_chunk(session, index, stream):
+    """
+    Grava uma parte a partir do corpo da requisição.
+
+    O corpo é lido em blocos direto do stream (sem carregar a parte inteira
+    em memória) e só é renomeado para o nome final se tiver exatamente o
+    tamanho esperado. Reenviar uma parte substitui a anterior.
+
+    Args:
+        session (UploadSession): sessão à qual a parte pertence.
+        index (int): posição da parte, começando em 0.
+        stream (file-like): corpo da requisição.
+
+    Raises:
+        ChunkError: se o índice for inválido ou o tamanho não conferir.
+    """
+    if not 0 <= index < session.total_chunks:
+        raise ChunkError(f'Parte {index} fora do intervalo (0-{session.total_chunks - 1}).')
+
+    expected = session.expected_chunk_size(index)
+    directory = session_dir(session)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    written = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while written <= expected:
+                data = stream.read(min(COPY_BUFFER_SIZE, expected + 1 - written))
+                if not data:
+                    break
+                out.write(data)
+                written += len(data)
+        if written != expected:
+            raise ChunkError(f'Parte {index} com {written} bytes; esperado {expected}.')
+        os.replace(tmp_path, chunk_path(session, index))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def received_chunks(session):
+    """
+    Lista as partes já recebidas de uma sessão.
+
+    Args:
+        session (UploadSession): sessão consultada.
+
+    Returns:
+        list[int]: índices das partes completas, em ordem crescente.
+    """
+    try:
+        names = os.listdir(session_dir(session))
+    except FileNotFoundError:
+        return []
+    indexes = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if ext == '.part' and stem.isdigit():
+            indexes.append(int(stem))
+    return sorted(indexes)
+
+
+def assemble(session):
+    """
+    Junta as partes de uma sessão direto no armazenamento, em uma única passagem.
+
+    Cada parte é lida uma vez: os blocos são somados ao SHA-256 e gravados
+    (comprimidos, se for o caso) em 'incoming/', de onde o arquivo é apenas
+    movido para o caminho final, sem nova leitura nem cópia (ver
+    `StagedUploadedFile`). Não deve rodar dentro de uma transação: para
+    arquivos grandes, a montagem leva minutos.
+
+    Args:
+        session (UploadSession): sessão com todas as partes recebidas.
+
+    Returns:
+        StagedUploadedFile: arquivo montado, com hash, tamanho e compressão.
+
+    Raises:
+        ChunkError: se faltar alguma parte.
+    """
+    missing = set(range(session.total_chunks)) - set(received_chunks(session))
+    if missing:
+        raise ChunkError(f'Faltam {len(missing)} parte(s) para concluir o upload.')
+
+    encoding = ''
+    if settings.DOCUMENTS_DEDUPLICATE:
+        # apenas os blobs são gravados comprimidos
+        with open(chunk_path(session, 0), 'rb') as first:
+            encoding = choose_encoding(first, session.file_name)
+
+    path = os.path.join(INCOMING_DIR, uuid.uuid4().hex)
+    full_path = default_storage.path(path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(full_path, 'xb') as out:
+            writer = compressing_writer(out, encoding)
+            for index in range(session.total_chunks):
+                with open(chunk_path(session, index), 'rb') as part:
+                    while data := part.read(COPY_BUFFER_SIZE):
+                        digest.update(data)
+                        size += len(data)
+                        writer.write(data)
+            if writer is not out:
+                writer.close()
+    except BaseException:
+        default_storage.delete(path)
+        raise
+    return StagedUploadedFile(
+        path, session.file_name, session.file_type, size, digest.hexdigest(), encoding
+    )
+
+
+def discard(session):
+    """Remove a pasta de uma sessão e todas as suas partes."""
+    shutil.rmtree(session_dir(session), ignore_errors=True)
@@ -8,12 +8,36 @@ urlpatterns = [
     path('', views.documents_list, name='documents_list'), 
     # Rota para upload de documentos
     path('upload/', views.documents_upload, name='documents_upload'),
+    # Rota para importação em lote (vários arquivos ou .zip)
+    path('upload/bulk/', views.documents_bulk_upload, name='documents_bulk_upload'),
+    # Rota para verificar se um conteúdo já existe antes do upload
+    path('upload/check/', views.documents_upload_check, name='documents_upload_check'),
+    # Rotas do upload em partes (retomável)
+    path('uploads/', views.documents_upload_session_create, name='documents_upload_session_create'),
+    path('uploads/<uuid:session_id>/', views.documents_upload_session, name='documents_upload_session'),
+    path('uploads/<uuid:session_id>/chunks/<int:index>/', views.documents_upload_chunk, name='documents_upload_chunk'),
+    path('uploads/<uuid:session_id>/finalize/', views.documents_upload_finalize, name='documents_upload_finalize'),
     # Rota para exibir detalhes do documento, incluindo comentários e para adicionar comentários
     path('<int:pk>/', views.documents_details, name='documents_details'),
     # Rota para deletar documento
     path('<int:pk>/delete/', views.documents_delete, name='documents_delete'),
+    # Rotas da lixeira
+    path('trash/', views.documents_trash, name='documents_trash'),
+    path('<int:pk>/restore/', views.documents_restore, name='documents_restore'),
+    # Rota para exportar documentos em .zip
+    path('export/', views.documents_export, name='documents_export'),
     # Rota para download do documento
     path('<int:pk>/download/', views.documents_download, name='documents_download'),
+    # Rotas do compartilhamento do documento
+    path('<int:pk>/shares/', views.documents_share, name='documents_share'),
+    path('<int:pk>/shares/<int:share_id>/delete/', views.documents_unshare, name='documents_unshare'),
+    # Rotas das versões do documento (envio e download de revisões)
+    path('<int:pk>/revisions/', views.documents_revise, name='documents_revise'),
+    path('<int:pk>/revisions/<int:number>/download/', views.documents_revision_download, name='documents_revision_download'),
+    # Rota das linhas da pré-visualização de planilhas (JSON)
+    path('<int:pk>/table/', views.documents_table, name='documents_table'),
+    # Rota das miniaturas e pré-visualizações
+    path('<int:pk>/derivative/<str:size>/', views.documents_derivative, name='documents_derivative'),
 ] 
 
 if settings.DEBUG:
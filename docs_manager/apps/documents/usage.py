@@ -0,0 +1,238 @@
+"""
+usage.py
+
+Estatísticas de uso do armazenamento e cotas por usuário.
+
+A tabela `StorageUsage` guarda, por usuário e extensão, a quantidade e o
+tamanho total dos documentos ativos. Ela é mantida de forma incremental:
+- upload individual e em partes: sinal `post_save` de `Document`;
+- importação em lote: `record_usage` no mesmo `bulk_create` do lote;
+- lixeira e restauração: `record_usage` nas views, junto do UPDATE;
+- exclusão definitiva de um documento ativo: sinal `post_delete`.
+
+Os documentos na lixeira não contam: o espaço volta para a cota assim que
+o documento é excluído. O comando `reconcile_usage` reconstrói a tabela a
+partir dos documentos, corrigindo qualquer divergência (ex: alterações
+feitas direto no banco).
+
+Notas:
+    - A verificação da cota lê as linhas do usuário (uma por extensão), sem
+      agregar a tabela de documentos.
+    - Uploads simultâneos do mesmo usuário podem, juntos, ultrapassar a cota
+      em até um arquivo cada: a verificação não trava as linhas de uso.
+"""
+
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from .models import Document, StorageQuota, StorageUsage
+
+
+class QuotaExceeded(ValueError):
+    """O upload ultrapassaria a cota de armazenamento do usuário."""
+
+
+def usage_deltas(documents, sign=1):
+    """
+    Agrupa documentos pelas chaves da tabela de uso.
+
+    Args:
+        documents (Iterable[Document]): documentos com `author_id`,
+            `file_extension` e `file_size`; os sem autor são ignorados.
+        sign (int): 1 para somar os documentos, -1 para subtrair.
+
+    Returns:
+        dict: (user_id, extensão) -> (documentos, bytes).
+    """
+    deltas = defaultdict(lambda: (0, 0))
+    for document in documents:
+        if document.author_id is None:
+            continue
+        key = (document.author_id, document.file_extension)
+        count, size = deltas[key]
+        deltas[key] = (count + sign, size + sign * document.file_size)
+    return dict(deltas)
+
+
+def apply_usage(deltas):
+    """
+    Aplica variações à tabela de uso com um número fixo de consultas.
+
+    As linhas inexistentes são criadas (apenas quando há documentos a
+    somar); as existentes são travadas em ordem, evitando deadlocks entre
+    lotes simultâneos, e atualizadas em um único UPDATE.
+
+    Args:
+        deltas (dict): (user_id, extensão) -> (documentos, bytes).
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+    if not deltas:
+        return
+
+    conditions = {key: Q(user_id=key[0], extension=key[1]) for key in deltas}
+    with transaction.atomic():
+        StorageUsage.objects.bulk_create(
+            [
+                StorageUsage(user_id=user_id, extension=extension)
+                for (user_id, extension), (count, _) in deltas.items() if count > 0
+            ],
+            ignore_conflicts=True,
+        )
+        rows = StorageUsage.objects.filter(reduce(or_, conditions.values()))
+        list(rows.select_for_update().order_by('pk').values_list('pk', flat=True))
+        rows.update(
+            updated_at=timezone.now(),
+            documents_count=F('documents_count') + Case(
+                *[When(conditions[key], then=Value(count)) for key, (count, _) in deltas.items()],
+                default=Value(0),
+            ),
+            total_size=F('total_size') + Case(
+                *[When(conditions[key], then=Value(size)) for key, (_, size) in deltas.items()],
+                default=Value(0),
+            ),
+        )
+
+
+def record_usage(documents, sign=1):
+    """
+    Soma (ou subtrai) documentos à tabela de uso.
+
+    Args:
+        documents (Iterable[Document]): documentos criados, excluídos,
+            enviados para a lixeira ou restaurados.
+        sign (int): 1 para somar, -1 para subtrair.
+    """
+    apply_usage(usage_deltas(documents, sign))
+
+
+def user_usage(user):
+    """
+    Retorna o uso total de armazenamento de um usuário.
+
+    Args:
+        user (User): usuário.
+
+    Returns:
+        dict: {'documents': int, 'size': int}.
+    """
+    totals = StorageUsage.objects.filter(user=user).aggregate(
+        documents=Sum('documents_count'), size=Sum('total_size')
+    )
+    return {'documents': totals['documents'] or 0, 'size': totals['size'] or 0}
+
+
+def user_quota(user):
+    """
+    Retorna a cota de armazenamento de um usuário.
+
+    Args:
+        user (User): usuário.
+
+    Returns:
+        int | None: bytes permitidos, ou None se não houver limite.
+    """
+    max_bytes = (
+        StorageQuota.objects.filter(user=user).values_list('max_bytes', flat=True).first()
+    )
+    if max_bytes is None:
+        max_bytes = settings.DOCUMENTS_USER_QUOTA
+    return max_bytes or None
+
+
+def remaining_quota(user):
+    """
+    Retorna quantos bytes o usuário ainda pode enviar.
+
+    Args:
+        user (User | None): usuário; None (ou anônimo) não tem limite.
+
+    Returns:
+        int | None: bytes disponíveis (nunca negativo), ou None sem limite.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    quota = user_quota(user)
+    if quota is None:
+        return None
+    return max(0, quota - user_usage(user)['size'])
+
+
+def quota_error(size, remaining):
+    """Mensagem exibida quando um arquivo não cabe na cota."""
+    return (
+        f'Cota de armazenamento excedida: o arquivo tem {filesizeformat(size)} '
+        f'e restam {filesizeformat(remaining)}.'
+    )
+
+
+def check_quota(user, size):
+    """
+    Verifica se um arquivo cabe na cota do usuário.
+
+    Args:
+        user (User): autor do upload.
+        size (int): tamanho do arquivo, em bytes.
+
+    Raises:
+        QuotaExceeded: se o arquivo ultrapassar o espaço disponível.
+    """
+    remaining = remaining_quota(user)
+    if remaining is not None and size > remaining:
+        raise QuotaExceeded(quota_error(size, remaining))
+
+
+def reconcile_usage():
+    """
+    Reconstrói a tabela de uso a partir dos documentos ativos.
+
+    As linhas de uso são travadas antes da agregação e a correção é aplicada
+    como variação (`apply_usage`), não como valor absoluto: um upload que
+    termine durante a reconstrução espera pelas linhas travadas ou, se criar
+    uma linha nova, tem a sua soma preservada pela variação aplicada depois.
+    As linhas que ficarem zeradas são removidas.
+
+    Notas:
+        - Resta uma janela estreita: se esse upload confirmar a linha nova
+          entre a leitura das linhas e a agregação, o documento conta duas
+          vezes até a próxima reconstrução.
+
+    Returns:
+        int: quantidade de linhas criadas, corrigidas ou zeradas.
+    """
+    with transaction.atomic():
+        current = {
+            (row.user_id, row.extension): (row.documents_count, row.total_size)
+            for row in StorageUsage.objects.select_for_update().order_by('pk')
+        }
+        totals = (
+            Document.objects.filter(author__isnull=False)
+            .order_by()
+            .values('author_id', 'file_extension')
+            .annotate(documents=Count('pk'), size=Sum('file_size'))
+        )
+
+        deltas = {}
+        for row in totals.iterator():
+            key = (row['author_id'], row['file_extension'])
+            count, size = current.pop(key, (0, 0))
+            deltas[key] = (row['documents'] - count, (row['size'] or 0) - size)
+        # linhas sem documentos ativos: a variação as leva a zero
+        for key, (count, size) in current.items():
+            deltas[key] = (-count, -size)
+
+        deltas = {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+        apply_usage(deltas)
+        if current:
+            StorageUsage.objects.filter(
+                reduce(or_, (Q(user_id=user_id, extension=extension) for user_id, extension in current)),
+                documents_count=0,
+                total_size=0,
+            ).delete()
+    return len(deltas)
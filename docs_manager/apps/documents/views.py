@@ -1,18 +1,79 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
+from django.urls import reverse
+from django.conf import settings
 from django.contrib import messages
-from django.http import FileResponse, Http404
-from .models import Document, Comment
-from .forms import DocumentForm, CommentForm
+from django.db import transaction
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from .models import Document, Comment, DocumentRevision, DocumentShare, UploadSession
+from .derivatives import (
+    SIZES,
+    attach_derivatives,
+    derivative_content_type,
+    derivative_key,
+    derivative_path,
+    schedule_derivatives,
+    supports_derivatives,
+)
+from .downloads import aserve_document
+from .export import export_queryset, export_response
+from .fragments import attach_cards
+from .bulk import import_entries, upload_entries
+from .forms import (
+    MAX_FILE_SIZE,
+    BulkUploadForm,
+    CommentForm,
+    DocumentForm,
+    ExportForm,
+    RevisionForm,
+    ShareForm,
+    UploadFinalizeForm,
+    UploadSessionForm,
+)
+from .pagination import estimate_count, paginate_keyset
+from .permissions import can_reuse_blob, restricts_visibility, user_permissions, visible_documents
+from .revisions import REVISIONS_SHOWN, add_revision, aserve_revision
+from .search import attach_snippets, search_documents, update_search_index
+from .similarity import near_duplicates
+from .streaming import streaming_response
+from .upload_handlers import DocumentUploadHandler
+from .storage import acquire_blob, adopt_blob
+from .tables import MAX_WINDOW_ROWS, load_table, schedule_table, supports_table
+from .tasks import process_document
+from .usage import QuotaExceeded, check_quota, record_usage, remaining_quota, user_usage
+from .uploads import ChunkError, assemble, discard, received_chunks, write_chunk
 from django.contrib.auth.decorators import login_required
+from apps.jobs.queue import enqueue
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+import asyncio
+import logging
+import mimetypes
 import os
 
+logger = logging.getLogger(__name__)
+
+# Marcadores onde a listagem insere os resultados e os cards (ver documents_list)
+LIST_RESULTS_SLOT = '<!-- list-results -->'
+LIST_CARDS_SLOT = '<!-- list-cards -->'
+
+# Cards renderizados e enviados por vez na listagem
+LIST_FLUSH_CARDS = 10
+
 def can_delete_document(user, document):
     """
     Verifica se um usuário tem permissão para deletar um documento.
 
     Regras:
     - Usuários staff ou superuser podem deletar qualquer documento.
-    - Usuários comuns só podem deletar documentos que eles mesmos criaram.
+    - Usuários comuns podem deletar os documentos que criaram e os
+      compartilhados com eles no nível "Excluir" (ver `permissions.py`).
 
     Args:
         user (User): Usuário que está tentando deletar o documento.
@@ -21,35 +82,95 @@ def can_delete_document(user, document):
     Returns:
         bool: True se o usuário puder deletar, False caso contrário.
     """
-    if user.is_staff or user.is_superuser:
-        return True
-    return document.author == user
+    return user_permissions(user).can_delete(document)
 
 @login_required
 def documents_list(request):
     """
-    Exibe a lista de documentos, com opção de busca por título.
+    Exibe a lista de documentos, com busca textual no servidor.
+
+    Permite filtrar os documentos usando o parâmetro GET 'search', que é
+    comparado com o título, a descrição e o conteúdo extraído dos arquivos
+    (ordenando por relevância). A lista é paginada por cursor (parâmetros
+    GET 'after' e 'before') e cada página é carregada com um número
+    constante de consultas: o autor vem no mesmo SELECT e a contagem de
+    comentários é lida da coluna `comments_count`.
+
+    Com `DOCUMENTS_SHARING` ativo, a visibilidade entra na própria consulta
+    (ver `visible_documents`), e a permissão de exclusão de cada card vem
+    dos níveis de acesso do usuário, carregados uma vez por requisição.
 
-    Permite filtrar os documentos usando o parâmetro GET 'search'.
+    A página é enviada em partes: o cabeçalho sai antes das consultas e os
+    cards seguem em lotes de `LIST_FLUSH_CARDS`, então o navegador começa a
+    exibi-la sem esperar a renderização da lista inteira.
 
     Args:
         request (HttpRequest): Objeto de requisição do Django.
 
     Returns:
-        HttpResponse: Página renderizada com os documentos filtrados.
+        StreamingHttpResponse: Página com os documentos filtrados.
     """
-    documents = Document.objects.all()
-    
-    # Busca por título
-    search = request.GET.get('search')
-    
+    search = request.GET.get('search', '').strip()
+    context = {'search': search, 'current_user': request.user}
+    # o cabeçalho não depende dos documentos: sai antes das consultas
+    head, tail = render_to_string(
+        'documents/documents_list.html', context, request
+    ).split(LIST_RESULTS_SLOT)
+    return streaming_response(request, _documents_list_chunks(request, search, head, tail))
+
+
+def _documents_list_chunks(request, search, head, tail):
+    """Gera a página da listagem: cabeçalho, contagem, cards em lotes e paginação."""
+    yield head
+
+    documents = visible_documents(Document.objects.defer('content', 'search_vector'), request.user)
+
+    # Busca textual (título, descrição e conteúdo)
     if search:
-        documents = documents.filter(title__icontains=search)
-    
-    return render(request, 'documents/documents_list.html', {
-        'documents': documents,
-        'current_user': request.user
-    })
+        documents = search_documents(documents, search)
+
+    # o índice parcial da listagem contém apenas os documentos fora da lixeira
+    total, total_is_exact = estimate_count(
+        documents,
+        filtered=bool(search) or restricts_visibility(request.user),
+        relation='document_uploaded_id_idx',
+    )
+
+    documents = documents.select_related('author')
+
+    page = paginate_keyset(
+        documents,
+        settings.DOCUMENTS_PAGE_SIZE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        field='rank' if search else 'uploaded_at',
+    )
+
+    results_start, results_end = render_to_string('documents/_document_list_results.html', {
+        'page': page,
+        'search': search,
+        'total': total,
+        'total_is_exact': total_is_exact,
+    }, request).split(LIST_CARDS_SLOT)
+    yield results_start
+
+    if search:
+        attach_snippets(page, search)
+    attach_derivatives(page)
+    permissions = user_permissions(request.user)
+    documents = list(page)
+    for start in range(0, len(documents), LIST_FLUSH_CARDS):
+        batch = documents[start:start + LIST_FLUSH_CARDS]
+        # o HTML de cada card vem do cache; apenas o botão de exclusão e o
+        # trecho da busca são renderizados a cada requisição
+        attach_cards(batch)
+        for document in batch:
+            document.can_delete = permissions.can_delete(document)
+        yield render_to_string('documents/_document_list_items.html', {'documents': batch}, request)
+
+    yield results_end
+    yield tail
+
 
 @login_required
 def documents_details(request, pk):
@@ -57,6 +178,24 @@ def documents_details(request, pk):
     Exibe os detalhes de um documento específico, incluindo comentários.
     Permite adicionar novos comentários e verifica permissão para deletar.
 
+    Os comentários são paginados por cursor (parâmetro GET 'comments_after')
+    e carregados junto com os autores em uma única consulta, então o custo
+    da página não depende da quantidade de comentários do documento.
+
+    Planilhas (.csv e .xlsx) são exibidas como tabela, a partir do cache
+    colunar (ver `tables.py`), com as linhas paginadas pelo parâmetro GET
+    'rows' (primeira linha exibida).
+
+    As versões anteriores do documento (ver `revisions.py`) são listadas
+    sem a lista de trechos, que só é lida no download de uma revisão.
+
+    O provável original e as prováveis cópias do documento (ver
+    `similarity.py`) são lidos das marcações já gravadas pelo worker.
+
+    Documentos que o usuário não pode ver retornam 404; comentar exige o
+    nível "Comentar" (ver `permissions.py`). Quem pode excluir o documento
+    também gerencia os compartilhamentos.
+
     Args:
         request (HttpRequest): Objeto de requisição do Django.
         pk (int): ID do documento a ser visualizado.
@@ -64,14 +203,29 @@ def documents_details(request, pk):
     Returns:
         HttpResponse: Página renderizada com detalhes do documento e comentários.
     """
-    document = get_object_or_404(Document, pk=pk)
-    comments = Comment.objects.filter(document=document)
+    document = get_object_or_404(
+        visible_documents(Document.objects.defer('content', 'search_vector'), request.user), pk=pk
+    )
+    comments = paginate_keyset(
+        Comment.objects.filter(document=document).select_related('author'),
+        settings.DOCUMENTS_COMMENTS_PAGE_SIZE,
+        after=request.GET.get('comments_after'),
+        field='created_at',
+    )
     comment_form = CommentForm()
     
-    # Verificar permissão para deletar
-    can_delete = can_delete_document(request.user, document)
+    # Verificar permissão para comentar e deletar
+    permissions = user_permissions(request.user)
+    can_comment = permissions.can_comment(document)
+    can_delete = permissions.can_delete(document)
+    attach_derivatives([document])
+    table = _table_preview(document, request.GET.get('rows'), settings.DOCUMENTS_TABLE_PAGE_SIZE)
+    revisions = document.revisions.defer('chunks').select_related('author')[:REVISIONS_SHOWN]
+    duplicate_of, duplicates = near_duplicates(document, request.user)
     
-    if request.method == 'POST':
+    if request.method == 'POST' and not can_comment:
+        messages.error(request, 'Você não tem permissão para comentar neste documento.')
+    elif request.method == 'POST':
         comment_form = CommentForm(request.POST)
         if comment_form.is_valid():
             comment = comment_form.save(commit=False)
@@ -87,16 +241,175 @@ def documents_details(request, pk):
         'document': document,
         'comments': comments,
         'form': comment_form,
-        'can_delete': can_delete
+        'can_comment': can_comment,
+        'can_delete': can_delete,
+        'table': table,
+        'revisions': revisions,
+        'duplicate_of': duplicate_of,
+        'duplicates': duplicates,
+        'revision_form': RevisionForm() if can_delete else None,
+        'shares': document.shares.select_related('user', 'group') if can_delete else None,
+        'share_form': ShareForm() if can_delete else None,
     })
 
+def _parse_int(value, default=0):
+    """Converte um parâmetro GET em inteiro não negativo."""
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return default
+
+def _table_preview(document, start, count):
+    """
+    Monta a pré-visualização em tabela de uma planilha.
+
+    Args:
+        document (Document): documento exibido.
+        start (str | None): primeira linha pedida (parâmetro GET).
+        count (int): quantidade de linhas.
+
+    Returns:
+        dict | None: None se o tipo não tiver tabela; {'pending': True}
+            enquanto o cache é gerado; caso contrário, a tabela, as linhas
+            e os limites da página.
+    """
+    if not supports_table(document):
+        return None
+    table = load_table(document)
+    if table is None:
+        schedule_table(document)
+        return {'pending': True}
+    if table.error:
+        return {'error': table.error}
+
+    count = max(1, min(count, MAX_WINDOW_ROWS))
+    start = min(_parse_int(start), max(0, table.rows - 1))
+    rows = table.window(start, count)
+    return {
+        'table': table,
+        'rows': rows,
+        'first': start + 1,
+        'last': start + len(rows),
+        'previous': max(0, start - count) if start > 0 else None,
+        'next': start + count if start + count < table.rows else None,
+    }
+
+@contextmanager
+def _upload_transaction():
+    """
+    Transação da criação de um documento a partir de um arquivo recebido.
+
+    Fornece uma lista onde o chamador registra os arquivos movidos para o
+    destino final durante a transação; se ela for desfeita, esses arquivos
+    são apagados, pois nenhum documento os referencia.
+
+    Notas:
+        - A mudança de lugar não é adiada para o commit (como em
+          `adopt_blob`): o nome livre em 'documents/' só fica reservado
+          depois que o arquivo é movido.
+        - Deve ser a transação mais externa; o rollback de uma transação
+          que a envolva não é detectado.
+    """
+    moved = []
+    try:
+        with transaction.atomic():
+            yield moved
+    except BaseException:
+        for name in moved:
+            default_storage.delete(name)
+        raise
+
+def _save_uploaded_document(form, user, file_obj):
+    """
+    Cria o documento de um upload já validado, em uma única transação.
+
+    Args:
+        form (DocumentForm): formulário válido.
+        user (User): autor do documento.
+        file_obj (StagedUploadedFile | None): arquivo recebido pelo
+            `DocumentUploadHandler`; None quando o cliente enviou apenas o
+            hash de um conteúdo existente.
+
+    Returns:
+        Document: documento criado.
+    """
+    with _upload_transaction() as moved:
+        document = form.save(commit=False)
+        document.author = user
+
+        # Salvar metadados do arquivo (o tipo MIME vem dos primeiros bytes)
+        if file_obj:
+            document.file_name = file_obj.name
+            document.file_size = file_obj.size
+            document.file_type = file_obj.content_type
+            document.file_extension = os.path.splitext(file_obj.name)[1].lower()
+            check_quota(user, file_obj.size)
+
+            # o arquivo já está no armazenamento: apenas muda de lugar
+            if settings.DOCUMENTS_DEDUPLICATE:
+                document.blob = adopt_blob(file_obj)
+                document.file = document.blob.file.name
+            else:
+                name = document.file.field.generate_filename(document, file_obj.name)
+                document.file = file_obj.move_to(default_storage.get_available_name(name))
+                moved.append(document.file.name)
+        else:
+            # o cliente enviou apenas o hash de um conteúdo existente
+            blob = acquire_blob(form.cleaned_data['sha256'])
+            if blob is None:
+                raise ValueError('Conteúdo não encontrado no servidor.')
+            file_name = form.cleaned_data['source_name']
+            document.blob = blob
+            document.file = blob.file.name
+            document.file_name = file_name
+            document.file_size = blob.size
+            document.file_type = (
+                form.cleaned_data['source_type']
+                or mimetypes.guess_type(file_name)[0]
+                or ''
+            )
+            document.file_extension = os.path.splitext(file_name)[1].lower()
+            check_quota(user, blob.size)
+
+        document.save()
+        # título e descrição já entram na busca; o conteúdo do
+        # arquivo e as miniaturas são processados pelo worker
+        update_search_index(document, extract=False)
+        enqueue(process_document, document_id=document.pk)
+    return document
+
+def _usage_context(user):
+    """Uso de armazenamento e espaço restante do usuário, exibidos nas páginas de upload."""
+    return {
+        'usage': user_usage(user),
+        'remaining_quota': remaining_quota(user),
+    }
+
+@csrf_exempt
 @login_required
-def documents_upload(request):
+async def documents_upload(request):
     """
     Permite o upload de novos documentos.
 
     Processa o formulário de upload, salva metadados do arquivo (nome, tamanho, tipo, extensão)
     e armazena o documento no banco de dados. Mensagens de sucesso ou erro são exibidas.
+    A extração do texto e as miniaturas ficam para a fila de tarefas.
+
+    Com `DOCUMENTS_DEDUPLICATE` ativo, o conteúdo é gravado uma única vez por
+    hash. Se o cliente enviar apenas o hash de um conteúdo já armazenado, o
+    documento é criado sem receber os bytes novamente.
+
+    O arquivo é recebido pelo `DocumentUploadHandler` (ver
+    `upload_handlers.py`), que o grava no armazenamento, calcula o hash e
+    detecta o tipo MIME na mesma leitura. Como os handlers precisam ser
+    trocados antes da leitura do corpo, o CSRF é verificado em
+    `_documents_upload`, e não pelo middleware.
+
+    A view é assíncrona: a leitura do formulário roda em uma thread, fora do
+    event loop. Em modo ASGI, o corpo chega a essa thread sob demanda, sem
+    cópia prévia em arquivo temporário (ver `body_streaming.py`), e os
+    envios com Content-Length acima do limite são recusados antes da view,
+    no `BodyLimitMiddleware` (`body_limits.py`).
 
     Args:
         request (HttpRequest): Objeto de requisição do Django.
@@ -104,23 +417,32 @@ def documents_upload(request):
     Returns:
         HttpResponse: Página de upload com formulário.
     """
+    handler = DocumentUploadHandler(request)
+    request.upload_handlers = [handler]
     if request.method == 'POST':
-        form = DocumentForm(request.POST, request.FILES)
-        if form.is_valid():
+        # o corpo é lido (e o arquivo gravado) em uma thread, fora do event loop
+        await asyncio.to_thread(_receive_upload, request, handler)
+    return await _documents_upload(request, handler)
+
+def _receive_upload(request, handler):
+    """Lê o formulário, apagando o arquivo parcial se o cliente desconectar."""
+    try:
+        return request.POST, request.FILES
+    except OSError:
+        handler.upload_interrupted()
+        raise
+
+@csrf_protect
+async def _documents_upload(request, handler):
+    """Processa o upload já recebido, com o CSRF verificado (ver `documents_upload`)."""
+    if request.method == 'POST':
+        user = await request.auser()
+        form = DocumentForm(request.POST, request.FILES, upload_error=handler.error, user=user)
+        if await sync_to_async(form.is_valid)():
             try:
-                document = form.save(commit=False)
-                document.author = request.user
-                
-                # Salvar metadados do arquivo
-                if request.FILES.get('file'):
-                    file_obj = request.FILES['file']
-                    document.file_name = file_obj.name
-                    document.file_size = file_obj.size
-                    document.file_type = file_obj.content_type
-                    document.file_extension = os.path.splitext(file_obj.name)[1].lower()
-                
-                document.save()
-                
+                file_obj = request.FILES.get('file')
+                document = await sync_to_async(_save_uploaded_document)(form, user, file_obj)
+
                 messages.success(
                     request, 
                     f'Documento "{document.title}" salvo com sucesso! ({document.get_file_size_display()})'
@@ -129,21 +451,365 @@ def documents_upload(request):
             
             except Exception as e:
                 messages.error(request, f'Erro ao salvar o documento: {str(e)}')
-                print(f"Erro no upload: {e}")
+                logger.exception('Erro ao salvar o upload do usuário %s', user.pk)
         else:
-            print("Formulário inválido:", form.errors)
+            logger.warning('Formulário de upload inválido: %s', form.errors.as_json())
             for field, errors in form.errors.items():
                 for error in errors:
                     messages.error(request, f'{field}: {error}')
     else:
         form = DocumentForm()
     
-    return render(request, 'documents/documents_upload.html', {'form': form})
+    user = await request.auser()
+    return await sync_to_async(render)(request, 'documents/documents_upload.html', {
+        'form': form,
+        'max_single_size': MAX_FILE_SIZE,
+        'max_upload_size': settings.DOCUMENTS_MAX_UPLOAD_SIZE,
+        **await sync_to_async(_usage_context)(user),
+    })
+
+@login_required
+def documents_bulk_upload(request):
+    """
+    Importa vários documentos de uma vez (vários arquivos ou arquivos .zip).
+
+    Cada arquivo é validado com as regras do upload individual; os válidos
+    são gravados em paralelo e inseridos em lote. A página exibe um
+    relatório com o resultado de cada arquivo.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+
+    Returns:
+        HttpResponse: Página de importação com o formulário e o relatório.
+    """
+    results = None
+    if request.method == 'POST':
+        form = BulkUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            with ExitStack() as stack:
+                entries = upload_entries(form.cleaned_data['files'], stack)
+                results = import_entries(
+                    entries,
+                    author=request.user,
+                    description=form.cleaned_data['description'],
+                )
+            imported = sum(result.ok for result in results)
+            if imported:
+                messages.success(request, f'{imported} documento(s) importado(s) com sucesso!')
+            if imported < len(results):
+                messages.error(request, f'{len(results) - imported} arquivo(s) não puderam ser importados.')
+        else:
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, f'{field}: {error}')
+    else:
+        form = BulkUploadForm()
+
+    return render(request, 'documents/documents_bulk_upload.html', {
+        'form': form,
+        'results': results,
+        **_usage_context(request.user),
+    })
+
+@login_required
+@require_GET
+async def documents_upload_check(request):
+    """
+    Informa se um conteúdo já está armazenado no servidor.
+
+    Permite que o cliente calcule o SHA-256 do arquivo antes do upload e
+    envie apenas o hash quando o conteúdo já existir. Com o compartilhamento
+    ativado, apenas conteúdos de documentos visíveis ao usuário são
+    informados (ver `can_reuse_blob`).
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django, com o
+            parâmetro GET 'sha256'.
+
+    Returns:
+        JsonResponse: `{"exists": bool}`.
+    """
+    sha256 = request.GET.get('sha256', '').strip().lower()
+    user = await request.auser()
+    exists = len(sha256) == 64 and await sync_to_async(can_reuse_blob)(user, sha256)
+    return JsonResponse({'exists': exists})
+
+def _form_errors(form):
+    """Converte os erros de um formulário em uma única mensagem."""
+    return '; '.join(
+        f'{field}: {error}' for field, errors in form.errors.items() for error in errors
+    )
+
+def _upload_session_payload(session, user):
+    """Monta a representação JSON de uma sessão de upload do usuário."""
+    received = received_chunks(session)
+    return {
+        'id': str(session.pk),
+        'status': session.status,
+        'file_size': session.file_size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': session.total_chunks,
+        'received': received,
+        'complete': len(received) == session.total_chunks,
+        'exists': can_reuse_blob(user, session.sha256),
+        'document': session.document_id,
+    }
+
+@login_required
+@require_POST
+def documents_upload_session_create(request):
+    """
+    Abre uma sessão de upload em partes (retomável).
+
+    O cliente informa nome, tamanho e, opcionalmente, tipo e SHA-256 do
+    arquivo. A resposta traz o tamanho das partes e quantas são esperadas;
+    as partes podem então ser enviadas em qualquer ordem e em paralelo.
+    Se o hash informado já existir no servidor, o campo `exists` vem
+    verdadeiro e a sessão pode ser finalizada sem enviar nenhuma parte.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+
+    Returns:
+        JsonResponse: dados da sessão criada (status 201) ou erros (status 400).
+    """
+    form = UploadSessionForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'error': _form_errors(form)}, status=400)
+    try:
+        check_quota(request.user, form.cleaned_data['file_size'])
+    except QuotaExceeded as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    session = UploadSession.objects.create(
+        user=request.user,
+        file_name=form.cleaned_data['file_name'],
+        file_size=form.cleaned_data['file_size'],
+        file_type=form.cleaned_data['file_type']
+            or mimetypes.guess_type(form.cleaned_data['file_name'])[0] or '',
+        sha256=form.cleaned_data['sha256'],
+        chunk_size=settings.DOCUMENTS_UPLOAD_CHUNK_SIZE,
+        expires_at=timezone.now() + timedelta(hours=settings.DOCUMENTS_UPLOAD_SESSION_HOURS),
+    )
+    return JsonResponse(_upload_session_payload(session, request.user), status=201)
+
+@login_required
+@require_http_methods(['GET', 'DELETE'])
+def documents_upload_session(request, session_id):
+    """
+    Consulta (GET) ou cancela (DELETE) uma sessão de upload em partes.
+
+    A consulta informa quais partes já foram recebidas, permitindo que o
+    cliente retome o envio apenas das que faltam.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        session_id (UUID): identificador da sessão.
+
+    Returns:
+        JsonResponse: dados da sessão, ou status 204 após o cancelamento.
+    """
+    session = get_object_or_404(UploadSession, pk=session_id, user=request.user)
+
+    if request.method == 'DELETE':
+        if session.status == UploadSession.STATUS_FINALIZING:
+            return JsonResponse({'error': 'A sessão está sendo finalizada.'}, status=409)
+        discard(session)
+        session.delete()
+        return HttpResponse(status=204)
+
+    return JsonResponse(_upload_session_payload(session, request.user))
+
+@login_required
+@require_http_methods(['PUT'])
+async def documents_upload_chunk(request, session_id, index):
+    """
+    Recebe uma parte de um upload em partes.
+
+    O corpo da requisição é o conteúdo bruto da parte, lido em blocos
+    direto do stream. Cada requisição é curta, então um cliente lento não
+    ocupa um worker durante todo o upload; em modo ASGI, a gravação em
+    disco roda em uma thread, fora do event loop.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        session_id (UUID): identificador da sessão.
+        index (int): posição da parte, começando em 0.
+
+    Returns:
+        JsonResponse: índice gravado, ou erro (status 400/409).
+    """
+    session = await aget_object_or_404(UploadSession, pk=session_id, user=await request.auser())
+    if session.status != UploadSession.STATUS_OPEN:
+        return JsonResponse({'error': 'Sessão já finalizada.'}, status=409)
+
+    try:
+        await asyncio.to_thread(write_chunk, session, index, request)
+    except ChunkError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({'index': index})
+
+def _claim_upload_session(session_id, user):
+    """
+    Marca uma sessão como "em finalização", em uma transação curta.
+
+    Returns:
+        tuple: (sessão, True se a sessão estava aberta e passa a ser
+            finalizada por esta requisição).
+
+    Raises:
+        QuotaExceeded: se o arquivo não couber mais na cota do usuário.
+    """
+    with transaction.atomic():
+        session = get_object_or_404(UploadSession.objects.select_for_update(), pk=session_id, user=user)
+        if session.status != UploadSession.STATUS_OPEN:
+            return session, False
+        # a cota pode ter mudado desde a abertura da sessão
+        check_quota(user, session.file_size)
+        session.status = UploadSession.STATUS_FINALIZING
+        session.save(update_fields=['status'])
+    return session, True
+
+def _reopen_upload_session(session):
+    """Devolve ao estado "aberta" uma sessão cuja finalização falhou."""
+    UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.STATUS_FINALIZING
+    ).update(status=UploadSession.STATUS_OPEN)
+
+def _create_finalized_document(form, user, session, upload):
+    """
+    Cria o documento de uma sessão já montada, em uma transação curta.
+
+    Args:
+        form (UploadFinalizeForm): formulário válido.
+        user (User): autor do documento.
+        session (UploadSession): sessão em finalização.
+        upload (StagedUploadedFile | None): arquivo montado por `assemble`;
+            None quando o conteúdo já existia e nenhuma parte foi enviada.
+
+    Returns:
+        Document: documento criado.
+
+    Raises:
+        QuotaExceeded: se o arquivo não couber mais na cota do usuário.
+        ValueError: se o conteúdo informado pelo hash não existir mais.
+    """
+    with _upload_transaction() as moved:
+        check_quota(user, session.file_size)
+        document = form.save(commit=False)
+        document.author = user
+        document.file_name = session.file_name
+        document.file_size = session.file_size
+        document.file_type = session.file_type
+        document.file_extension = os.path.splitext(session.file_name)[1].lower()
+
+        blob = None
+        if upload is None:
+            # conteúdo já existente: nenhum byte foi enviado
+            blob = acquire_blob(session.sha256)
+            if blob is None:
+                raise ValueError('Conteúdo não encontrado no servidor. Envie as partes do arquivo.')
+        elif settings.DOCUMENTS_DEDUPLICATE:
+            blob = adopt_blob(upload)
+        else:
+            name = document.file.field.generate_filename(document, session.file_name)
+            document.file = upload.move_to(default_storage.get_available_name(name))
+            moved.append(document.file.name)
+
+        if blob is not None:
+            document.blob = blob
+            document.file = blob.file.name
+            document.file_size = blob.size
+        document.save()
+
+        session.status = UploadSession.STATUS_COMPLETED
+        session.document = document
+        session.save(update_fields=['status', 'document'])
+        transaction.on_commit(lambda: discard(session))
+        update_search_index(document, extract=False)
+        enqueue(process_document, document_id=document.pk)
+    return document
+
+@login_required
+@require_POST
+async def documents_upload_finalize(request, session_id):
+    """
+    Finaliza um upload em partes, criando o documento.
+
+    A finalização tem três etapas, e nenhuma transação fica aberta durante
+    a leitura do arquivo:
+    - a sessão é marcada como "em finalização" (transação curta), o que
+      impede o envio de partes e finalizações simultâneas;
+    - as partes são unidas em uma thread, direto no armazenamento e em uma
+      única passagem, calculando o SHA-256 no caminho (ver `assemble`), e o
+      hash é conferido com o informado na abertura da sessão;
+    - o documento e a referência ao blob são criados (transação curta).
+
+    Se algo falhar, a sessão volta a ficar aberta e pode ser finalizada de
+    novo. Finalizar novamente uma sessão concluída apenas retorna o
+    documento já criado.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django, com os
+            campos 'title' e 'description'.
+        session_id (UUID): identificador da sessão.
+
+    Returns:
+        JsonResponse: ID e endereço do documento criado, ou erros (status
+            400, ou 409 se a sessão já estiver sendo finalizada).
+    """
+    form = UploadFinalizeForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'error': _form_errors(form)}, status=400)
+
+    user = await request.auser()
+    try:
+        session, claimed = await sync_to_async(_claim_upload_session)(session_id, user)
+    except QuotaExceeded as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if session.status == UploadSession.STATUS_COMPLETED:
+        return JsonResponse({
+            'document': session.document_id,
+            'url': reverse('documents_details', args=[session.document_id]),
+        })
+    if not claimed:
+        return JsonResponse({'error': 'A sessão já está sendo finalizada.'}, status=409)
+
+    upload = None
+    try:
+        parts = await asyncio.to_thread(received_chunks, session)
+        if parts or not await sync_to_async(can_reuse_blob)(user, session.sha256):
+            upload = await asyncio.to_thread(assemble, session)
+            if session.sha256 and upload.sha256 != session.sha256:
+                raise ChunkError('O hash do arquivo recebido não confere com o informado.')
+        document = await sync_to_async(_create_finalized_document)(form, user, session, upload)
+    except (ChunkError, QuotaExceeded, ValueError) as e:
+        await sync_to_async(_reopen_upload_session)(session)
+        return JsonResponse({'error': str(e)}, status=400)
+    except BaseException:
+        await sync_to_async(_reopen_upload_session)(session)
+        raise
+    finally:
+        # o arquivo montado que não foi movido (conteúdo já existente, erro)
+        if upload is not None:
+            await asyncio.to_thread(upload.discard)
+
+    return JsonResponse({
+        'document': document.pk,
+        'url': reverse('documents_details', args=[document.pk]),
+    }, status=201)
 
 @login_required
 def documents_delete(request, pk):
     """
-    Deleta um documento específico, caso o usuário tenha permissão.
+    Move um documento para a lixeira, caso o usuário tenha permissão.
+
+    A exclusão é apenas a marcação de `deleted_at`: nenhum arquivo é
+    apagado durante a requisição. Documentos na lixeira podem ser
+    restaurados até serem removidos em definitivo pelo comando
+    `purge_trash`, após `DOCUMENTS_TRASH_RETENTION_DAYS` dias.
 
     Args:
         request (HttpRequest): Objeto de requisição do Django.
@@ -152,7 +818,9 @@ def documents_delete(request, pk):
     Returns:
         HttpResponse: Redireciona para a lista de documentos após a deleção.
     """
-    document = get_object_or_404(Document, pk=pk)
+    document = get_object_or_404(
+        Document.objects.only('pk', 'title', 'author_id', 'file_size', 'file_extension'), pk=pk
+    )
     
     # Verificar permissão
     if not can_delete_document(request.user, document):
@@ -160,39 +828,366 @@ def documents_delete(request, pk):
         return redirect('documents_details', pk=pk)
     
     if request.method == 'POST':
-        try:
-            title = document.title
-            # Deletar arquivo da pasta local
-            if document.file:
-                document.file.delete()
-            document.delete()
-            messages.success(request, f'Documento "{title}" deletado com sucesso!')
-        except Exception as e:
-            messages.error(request, f'Erro ao deletar documento: {str(e)}')
-            print(f"Erro na deleção: {e}")
+        with transaction.atomic():
+            # o espaço do documento deixa de contar na cota do autor
+            if Document.objects.filter(pk=pk).update(deleted_at=timezone.now()):
+                record_usage([document], sign=-1)
+        messages.success(request, f'Documento "{document.title}" movido para a lixeira.')
     
     return redirect('documents_list')
 
 @login_required
-def documents_download(request, pk):
+def documents_trash(request):
+    """
+    Exibe a lixeira: documentos excluídos que ainda podem ser restaurados.
+
+    Usuários comuns veem apenas os próprios documentos; staff e
+    superusuários veem todos. A lista é paginada por cursor (parâmetro GET
+    'after'), do mais recente para o mais antigo.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+
+    Returns:
+        HttpResponse: Página renderizada com os documentos da lixeira.
+    """
+    documents = Document.all_objects.trashed().defer('content', 'search_vector').select_related('author')
+    if not (request.user.is_staff or request.user.is_superuser):
+        documents = documents.filter(author=request.user)
+
+    page = paginate_keyset(
+        documents,
+        settings.DOCUMENTS_PAGE_SIZE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        field='deleted_at',
+    )
+    retention = timedelta(days=settings.DOCUMENTS_TRASH_RETENTION_DAYS)
+    for document in page:
+        document.purge_at = document.deleted_at + retention
+
+    return render(request, 'documents/documents_trash.html', {
+        'documents': page,
+        'page': page,
+        'retention_days': settings.DOCUMENTS_TRASH_RETENTION_DAYS,
+    })
+
+@login_required
+@require_POST
+def documents_restore(request, pk):
+    """
+    Restaura um documento da lixeira, caso o usuário tenha permissão.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        pk (int): ID do documento a ser restaurado.
+
+    Returns:
+        HttpResponse: Redireciona para a lixeira.
+    """
+    document = get_object_or_404(
+        Document.all_objects.trashed().only('pk', 'title', 'author_id', 'file_size', 'file_extension'),
+        pk=pk,
+    )
+    if not can_delete_document(request.user, document):
+        messages.error(request, 'Você não tem permissão para restaurar este documento.')
+        return redirect('documents_trash')
+
+    try:
+        if document.author is not None:
+            check_quota(document.author, document.file_size)
+    except QuotaExceeded as e:
+        messages.error(request, f'Não foi possível restaurar o documento. {e}')
+        return redirect('documents_trash')
+
+    with transaction.atomic():
+        if Document.all_objects.trashed().filter(pk=pk).update(deleted_at=None):
+            record_usage([document])
+    messages.success(request, f'Documento "{document.title}" restaurado.')
+    return redirect('documents_trash')
+
+@login_required
+@require_POST
+def documents_share(request, pk):
+    """
+    Compartilha um documento com um usuário ou grupo (ou altera o nível).
+
+    Apenas quem pode excluir o documento gerencia os compartilhamentos.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        pk (int): ID do documento.
+
+    Returns:
+        HttpResponse: Redireciona para os detalhes do documento.
+    """
+    document = get_object_or_404(Document.objects.only('pk', 'title', 'author_id'), pk=pk)
+    if not can_delete_document(request.user, document):
+        messages.error(request, 'Você não tem permissão para compartilhar este documento.')
+        return redirect('documents_details', pk=pk)
+
+    form = ShareForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect('documents_details', pk=pk)
+
+    target = form.cleaned_data['target']
+    share, _ = DocumentShare.objects.update_or_create(
+        document=document,
+        **target,
+        defaults={'level': form.cleaned_data['level']},
+        create_defaults={'level': form.cleaned_data['level'], 'created_by': request.user},
+    )
+    messages.success(
+        request, f'Documento compartilhado com {share.user or share.group} ({share.get_level_display()}).'
+    )
+    return redirect('documents_details', pk=pk)
+
+@login_required
+@require_POST
+def documents_unshare(request, pk, share_id):
+    """
+    Remove um compartilhamento de um documento.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        pk (int): ID do documento.
+        share_id (int): ID do compartilhamento.
+
+    Returns:
+        HttpResponse: Redireciona para os detalhes do documento.
+    """
+    share = get_object_or_404(
+        DocumentShare.objects.select_related('document', 'user', 'group'), pk=share_id, document_id=pk
+    )
+    if not can_delete_document(request.user, share.document):
+        messages.error(request, 'Você não tem permissão para alterar o compartilhamento deste documento.')
+        return redirect('documents_details', pk=pk)
+
+    share.delete()
+    messages.success(request, f'Compartilhamento com {share.user or share.group} removido.')
+    return redirect('documents_details', pk=pk)
+
+@login_required
+async def documents_download(request, pk):
     """
     Permite o download de um documento armazenado na pasta local.
 
+    É o único caminho de acesso aos arquivos: suporta requisições
+    condicionais (304), intervalos de bytes (206) e, se configurado, delega
+    o envio ao proxy via X-Accel-Redirect/X-Sendfile. Com o parâmetro GET
+    'inline', o arquivo é exibido no navegador em vez de baixado.
+
+    A view é assíncrona: em modo ASGI, cada download lento ocupa apenas
+    uma corrotina enquanto os bytes são enviados.
+
     Args:
         request (HttpRequest): Objeto de requisição do Django.
         pk (int): ID do documento a ser baixado.
 
     Returns:
-        FileResponse: Arquivo do documento para download.
+        HttpResponse: Arquivo do documento (completo ou parcial) ou 304.
         Redireciona para os detalhes do documento em caso de erro.
     """
-    document = get_object_or_404(Document, pk=pk)
+    user = await request.auser()
+    document = await aget_object_or_404(
+        visible_documents(Document.objects.defer('content', 'search_vector'), user), pk=pk
+    )
     
     try:
-        response = FileResponse(document.file.open('rb'), as_attachment=True)
-        response['Content-Disposition'] = f'attachment; filename="{document.file_name}"'
-        response['Content-Type'] = document.file_type or 'application/octet-stream'
-        return response
+        return await aserve_document(request, document, as_attachment='inline' not in request.GET)
     except Exception as e:
         messages.error(request, f'Erro ao fazer download: {str(e)}')
         return redirect('documents_details', pk=pk)
+
+@login_required
+@require_POST
+def documents_revise(request, pk):
+    """
+    Recebe uma nova versão de um documento, preservando a anterior como revisão.
+
+    Apenas o autor ou administradores podem enviar versões. O histórico é
+    armazenado em trechos deduplicados (ver `revisions.py`), então cada
+    versão ocupa apenas o espaço do que mudou.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        pk (int): ID do documento.
+
+    Returns:
+        HttpResponse: Redireciona para os detalhes do documento.
+    """
+    document = get_object_or_404(Document.objects.defer('content', 'search_vector'), pk=pk)
+    if not can_delete_document(request.user, document):
+        messages.error(request, 'Apenas o autor ou administradores podem enviar novas versões.')
+        return redirect('documents_details', pk=pk)
+
+    form = RevisionForm(request.POST, request.FILES)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect('documents_details', pk=pk)
+
+    try:
+        revision = add_revision(document, form.cleaned_data['file'], request.user)
+    except (ValueError, OSError) as e:
+        messages.error(request, f'Erro ao enviar a nova versão: {e}')
+    else:
+        messages.success(request, f'Nova versão enviada (revisão {revision.number}).')
+    return redirect('documents_details', pk=pk)
+
+@login_required
+async def documents_revision_download(request, pk, number):
+    """
+    Permite o download de uma revisão de um documento.
+
+    O arquivo é remontado a partir dos trechos durante o envio; a view é
+    assíncrona como `documents_download`.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        pk (int): ID do documento.
+        number (int): número da revisão.
+
+    Returns:
+        HttpResponse: Arquivo da revisão ou 304.
+        Redireciona para os detalhes do documento em caso de erro.
+    """
+    user = await request.auser()
+    revision = await aget_object_or_404(
+        DocumentRevision.objects.filter(document__in=visible_documents(Document.objects.all(), user)),
+        document_id=pk, number=number,
+    )
+
+    try:
+        return await aserve_revision(request, revision)
+    except Exception as e:
+        messages.error(request, f'Erro ao fazer download: {str(e)}')
+        return redirect('documents_details', pk=pk)
+
+@login_required
+@require_GET
+def documents_table(request, pk):
+    """
+    Entrega um intervalo de linhas da pré-visualização de uma planilha (JSON).
+
+    Usada por clientes que rolam a tabela sob demanda: cada requisição lê
+    do cache colunar apenas as linhas pedidas (parâmetros GET 'start' e
+    'count', até 500 linhas).
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        pk (int): ID do documento.
+
+    Returns:
+        JsonResponse: colunas (nome, tipo e estatísticas), total de linhas
+        e as linhas pedidas; status 202 enquanto o cache é gerado.
+    """
+    document = get_object_or_404(
+        visible_documents(Document.objects.defer('content', 'search_vector'), request.user), pk=pk
+    )
+    if not supports_table(document):
+        raise Http404
+    table = load_table(document)
+    if table is None:
+        schedule_table(document)
+        return JsonResponse({'status': 'pending'}, status=202)
+    if table.error:
+        return JsonResponse({'status': 'error', 'error': table.error}, status=422)
+
+    start = _parse_int(request.GET.get('start'))
+    count = _parse_int(request.GET.get('count'), settings.DOCUMENTS_TABLE_PAGE_SIZE)
+    return JsonResponse({
+        'status': 'ready',
+        'total_rows': table.rows,
+        'truncated_columns': table.truncated_columns,
+        'columns': [
+            {'name': column['name'], 'type': column['type'], 'stats': column['stats']}
+            for column in table.columns
+        ],
+        'start': start,
+        'rows': table.window(start, count),
+    })
+
+@login_required
+@require_GET
+def documents_export(request):
+    """
+    Exporta uma seleção de documentos em um único arquivo .zip.
+
+    A seleção vem dos parâmetros GET 'ids' (separados por vírgula),
+    'search', 'author', 'date_from' e 'date_to'; sem nenhum deles, todos os
+    documentos são exportados. O .zip traz um manifesto com os metadados
+    ('manifest=csv' ou 'json') e é gerado durante o envio, sem arquivo
+    temporário (ver `export.py`). Apenas os documentos que o usuário pode
+    ver entram no .zip.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+
+    Returns:
+        StreamingHttpResponse: arquivo .zip.
+        Redireciona para a lista de documentos se a seleção for inválida.
+    """
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        for field, errors in form.errors.items():
+            for error in errors:
+                messages.error(request, f'{field}: {error}')
+        return redirect('documents_list')
+
+    documents = export_queryset(
+        ids=form.cleaned_data['ids'],
+        search=form.cleaned_data['search'].strip(),
+        author=form.cleaned_data['author'].strip(),
+        date_from=form.cleaned_data['date_from'],
+        date_to=form.cleaned_data['date_to'],
+    )
+    documents = visible_documents(documents, request.user)
+    return export_response(request, documents, form.cleaned_data['manifest'])
+
+@login_required
+@require_GET
+def documents_derivative(request, pk, size):
+    """
+    Entrega a miniatura ('thumb') ou a pré-visualização ('preview') de um documento.
+
+    Os derivados são endereçados pelo conteúdo (parâmetro GET 'v'), então
+    podem ser guardados pelo navegador indefinidamente. Se o derivado ainda
+    não existir, sua geração é agendada e o ícone genérico é exibido,
+    sem cache, até que ele fique pronto.
+
+    Args:
+        request (HttpRequest): Objeto de requisição do Django.
+        pk (int): ID do documento.
+        size (str): tamanho do derivado ('thumb' ou 'preview').
+
+    Returns:
+        HttpResponse: Imagem do derivado ou redirecionamento para o ícone.
+    """
+    if size not in SIZES:
+        raise Http404
+    document = get_object_or_404(
+        visible_documents(Document.objects.defer('content', 'search_vector'), request.user), pk=pk
+    )
+    if not supports_derivatives(document):
+        raise Http404
+
+    key = derivative_key(document)
+    path = derivative_path(key, size)
+    if not default_storage.exists(path):
+        schedule_derivatives(document)
+        response = redirect(static('img/icon-document.svg'))
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    response = FileResponse(default_storage.open(path, 'rb'), content_type=derivative_content_type())
+    if request.GET.get('v') == key:
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    response['ETag'] = f'"{key}-{size}"'
+    return response
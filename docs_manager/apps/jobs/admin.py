@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'duration_ms', 'run_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'unique_key')
+    readonly_fields = ('locked_at', 'locked_by', 'last_error', 'duration_ms', 'created_at', 'finished_at')
+    ordering = ('-id',)
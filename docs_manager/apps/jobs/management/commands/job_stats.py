@@ -0,0 +1,45 @@
+"""
+job_stats.py
+
+Comando que resume as métricas da fila de tarefas.
+
+Para cada tipo de tarefa, mostra quantas estão em cada situação e o tempo
+de execução (média e máximo) das concluídas.
+
+Uso:
+    python manage.py job_stats
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Q
+
+from apps.jobs.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Mostra a situação e o tempo de execução das tarefas por tipo.'
+
+    def handle(self, *args, **options):
+        rows = (
+            Job.objects.values('name')
+            .annotate(
+                queued=Count('pk', filter=Q(status=Job.STATUS_QUEUED)),
+                running=Count('pk', filter=Q(status=Job.STATUS_RUNNING)),
+                succeeded=Count('pk', filter=Q(status=Job.STATUS_SUCCEEDED)),
+                failed=Count('pk', filter=Q(status=Job.STATUS_FAILED)),
+                avg_ms=Avg('duration_ms', filter=Q(status=Job.STATUS_SUCCEEDED)),
+                max_ms=Max('duration_ms', filter=Q(status=Job.STATUS_SUCCEEDED)),
+            )
+            .order_by('name')
+        )
+
+        if not rows:
+            self.stdout.write('Nenhuma tarefa registrada.')
+            return
+
+        for row in rows:
+            self.stdout.write(
+                f"{row['name']}: {row['queued']} na fila, {row['running']} executando, "
+                f"{row['succeeded']} concluída(s), {row['failed']} com falha; "
+                f"média {row['avg_ms'] or 0:.1f} ms, máximo {row['max_ms'] or 0:.1f} ms"
+            )
@@ -0,0 +1,52 @@
+"""
+run_jobs.py
+
+Comando que executa o worker da fila de tarefas em segundo plano.
+
+Uso:
+    python manage.py run_jobs
+    python manage.py run_jobs --processes 4
+    python manage.py run_jobs --once
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.jobs.worker import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Executa as tarefas em segundo plano enfileiradas no banco.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=settings.JOBS_WORKER_PROCESSES,
+            help='Quantidade de processos que executam tarefas em paralelo.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help='Segundos de espera quando não há tarefas prontas.',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Encerra quando a fila estiver vazia, em vez de aguardar novas tarefas.',
+        )
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        self.stdout.write(f'Worker iniciado com {processes} processo(s).')
+        try:
+            totals = run_worker(processes, options['poll_interval'], once=options['once'])
+        except KeyboardInterrupt:
+            self.stdout.write('Worker interrompido.')
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['succeeded']} tarefa(s) concluída(s), {totals['retried']} reagendada(s) "
+            f"para nova tentativa, {totals['failed']} com falha."
+        ))
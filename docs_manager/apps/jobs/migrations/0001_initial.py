@@ -0,0 +1,41 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('unique_key', models.CharField(blank=True, default='', max_length=255)),
+                ('status', models.CharField(choices=[('queued', 'Na fila'), ('running', 'Executando'), ('succeeded', 'Concluída'), ('failed', 'Falhou')], default='queued', max_length=10)),
+                ('priority', models.SmallIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('duration_ms', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tarefa',
+                'verbose_name_plural': 'Tarefas',
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['-priority', 'run_at', 'id'], name='job_queued_idx'), models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'queued'), models.Q(('unique_key', ''), _negated=True)), fields=('name', 'unique_key'), name='job_unique_queued_key')],
+            },
+        ),
+    ]
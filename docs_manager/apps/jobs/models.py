@@ -0,0 +1,85 @@
+"""
+models.py
+
+Define o modelo da fila de tarefas em segundo plano:
+- Job: tarefa a ser executada pelo worker (`python manage.py run_jobs`).
+"""
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    Representa uma tarefa enfileirada para execução fora da requisição.
+
+    A fila fica no próprio Postgres: o worker reserva as tarefas com
+    `SELECT ... FOR UPDATE SKIP LOCKED`, de modo que vários workers podem
+    consumir a mesma tabela sem disputar as mesmas linhas.
+
+    Campos:
+        name: caminho pontuado da função a executar (ex: 'apps.documents.tasks.process_document').
+        payload: argumentos nomeados da função (JSON).
+        unique_key: chave opcional que impede duas tarefas iguais na fila ao mesmo tempo.
+        status: situação da tarefa (na fila, executando, concluída ou falhou).
+        priority: tarefas com prioridade maior são executadas antes.
+        attempts: quantidade de execuções já iniciadas.
+        max_attempts: limite de execuções antes de a tarefa ser dada como falha.
+        run_at: data/hora a partir da qual a tarefa pode ser executada.
+        locked_at: data/hora em que um worker reservou a tarefa.
+        locked_by: identificação do worker que reservou a tarefa.
+        last_error: erro da última execução com falha.
+        duration_ms: duração da última execução, em milissegundos.
+        created_at: data/hora de enfileiramento.
+        finished_at: data/hora de conclusão (ou da falha definitiva).
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Na fila'),
+        (STATUS_RUNNING, 'Executando'),
+        (STATUS_SUCCEEDED, 'Concluída'),
+        (STATUS_FAILED, 'Falhou'),
+    ]
+
+    name = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict, blank=True)
+    unique_key = models.CharField(max_length=255, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    last_error = models.TextField(blank=True, default='')
+    duration_ms = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        indexes = [
+            # apenas as tarefas pendentes entram no índice usado pelo worker
+            models.Index(
+                fields=['-priority', 'run_at', 'id'],
+                name='job_queued_idx',
+                condition=Q(status='queued'),
+            ),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'unique_key'],
+                name='job_unique_queued_key',
+                condition=Q(status='queued') & ~Q(unique_key=''),
+            ),
+        ]
+
+    def __str__(self):
+        """Retorna o nome da tarefa e sua situação."""
+        return f'{self.name} #{self.pk} ({self.get_status_display()})'
@@ -0,0 +1,113 @@
+"""
+queue.py
+
+Enfileiramento e execução das tarefas em segundo plano.
+
+As tarefas são funções comuns, identificadas pelo caminho pontuado
+(ex: 'apps.documents.tasks.process_document') e chamadas com os
+argumentos nomeados gravados em `Job.payload`, que precisam ser
+serializáveis em JSON.
+
+Notas:
+    - `enqueue` grava a tarefa apenas quando a transação atual é
+      confirmada, então o worker nunca vê tarefas de dados que sofreram
+      rollback.
+    - Com `JOBS_IMMEDIATE` ativo (útil em desenvolvimento), as tarefas são
+      executadas na própria requisição, após o commit, sem worker.
+"""
+
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Job
+from .runner import run_task
+
+
+def task_name(task):
+    """Retorna o caminho pontuado de uma tarefa (função ou texto)."""
+    if isinstance(task, str):
+        return task
+    return f'{task.__module__}.{task.__qualname__}'
+
+
+def enqueue(task, *, unique_key='', priority=0, delay=None, max_attempts=None, **kwargs):
+    """
+    Enfileira uma tarefa para ser executada após o commit da transação atual.
+
+    Args:
+        task (Callable | str): função a executar ou seu caminho pontuado.
+        unique_key (str): se informada, não enfileira outra tarefa com o mesmo nome
+            e a mesma chave enquanto a anterior ainda estiver na fila.
+        priority (int): tarefas com prioridade maior são executadas antes.
+        delay (timedelta | None): atraso mínimo antes da execução.
+        max_attempts (int | None): limite de tentativas; o padrão vem de
+            `JOBS_MAX_ATTEMPTS`.
+        **kwargs: argumentos da tarefa (serializáveis em JSON).
+    """
+    name = task_name(task)
+
+    if settings.JOBS_IMMEDIATE:
+        transaction.on_commit(lambda: run_task(name, kwargs))
+        return
+
+    job = Job(
+        name=name,
+        payload=kwargs,
+        unique_key=unique_key,
+        priority=priority,
+        run_at=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+    # com chave, uma tarefa igual ainda na fila torna esta desnecessária
+    transaction.on_commit(lambda: Job.objects.bulk_create([job], ignore_conflicts=bool(unique_key)))
+
+
+def enqueue_many(task, payloads, *, priority=0):
+    """
+    Enfileira várias execuções de uma tarefa com um único INSERT.
+
+    Usado pelas importações em lote, onde milhares de `enqueue` individuais
+    custariam um INSERT cada.
+
+    Args:
+        task (Callable | str): função a executar ou seu caminho pontuado.
+        payloads (Iterable[dict]): argumentos de cada execução.
+        priority (int): prioridade das tarefas.
+    """
+    name = task_name(task)
+    payloads = list(payloads)
+
+    if settings.JOBS_IMMEDIATE:
+        transaction.on_commit(lambda: [run_task(name, payload) for payload in payloads])
+        return
+
+    now = timezone.now()
+    jobs = [
+        Job(
+            name=name,
+            payload=payload,
+            priority=priority,
+            run_at=now,
+            max_attempts=settings.JOBS_MAX_ATTEMPTS,
+        )
+        for payload in payloads
+    ]
+    transaction.on_commit(lambda: Job.objects.bulk_create(jobs, batch_size=1000))
+
+
+def retry_delay(attempts):
+    """
+    Calcula o atraso antes de uma nova tentativa (backoff exponencial).
+
+    Args:
+        attempts (int): quantidade de tentativas já realizadas.
+
+    Returns:
+        timedelta: atraso com variação aleatória de até 20%, limitado a 1 hora.
+    """
+    seconds = min(settings.JOBS_RETRY_BACKOFF * 2 ** (attempts - 1), 3600)
+    return timedelta(seconds=seconds * random.uniform(1.0, 1.2))
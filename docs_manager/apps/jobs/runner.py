@@ -0,0 +1,78 @@
+"""
+runner.py
+
+Execução de uma tarefa, usada tanto pelos processos do worker quanto pelo
+modo `JOBS_IMMEDIATE`.
+
+Este módulo não importa modelos no carregamento: os processos do worker
+são iniciados com 'spawn' e só têm o Django configurado depois que
+`init_process` roda.
+"""
+
+import logging
+import time
+
+import django
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def init_process():
+    """Inicializa o Django em cada processo do worker."""
+    django.setup()
+
+
+def run_task(name, payload):
+    """
+    Executa uma tarefa e mede sua duração.
+
+    Args:
+        name (str): caminho pontuado da função.
+        payload (dict): argumentos nomeados.
+
+    Returns:
+        tuple: (duração em milissegundos, mensagem de erro ou None).
+    """
+    started = time.perf_counter()
+    error = None
+    try:
+        import_string(name)(**payload)
+    except Exception as e:
+        logger.exception('Erro na tarefa %s', name)
+        error = f'{type(e).__name__}: {e}'
+    return (time.perf_counter() - started) * 1000, error
+
+
+def execute(name, payload):
+    """Executa uma tarefa dentro de um processo do worker."""
+    close_old_connections()
+    try:
+        return run_task(name, payload)
+    finally:
+        close_old_connections()
+
+
+def serve(connection):
+    """
+    Laço de um processo do worker: executa as tarefas recebidas pela conexão.
+
+    O processo envia None quando o Django está pronto. Cada mensagem
+    recebida é (nome, payload) e recebe como resposta o retorno de
+    `execute`; None (ou a conexão fechada) encerra o processo.
+
+    Args:
+        connection (multiprocessing.connection.Connection): ponta do processo.
+    """
+    init_process()
+    with connection:
+        connection.send(None)
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+            connection.send(execute(*message))
@@ -0,0 +1,134 @@
+"""
+tests.py
+
+Testes da fila de tarefas.
+
+Uso:
+    python manage.py test apps.jobs
+"""
+
+import multiprocessing
+import os
+import time
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .worker import claim_jobs, record_result, release_job, renew_leases, requeue_stale_jobs, run_worker
+
+
+def slow_task(seconds):
+    """Tarefa de teste que apenas espera (executada pelos processos do worker)."""
+    time.sleep(seconds)
+
+
+def crash_task():
+    """Tarefa de teste que derruba o processo que a executa."""
+    os._exit(3)
+
+
+class WorkerLeaseTests(TestCase):
+    """Reserva das tarefas em execução e registro dos resultados."""
+
+    def _claim(self, worker_id='worker-a', **fields):
+        Job.objects.create(name='apps.jobs.tests.slow_task', payload={'seconds': 0}, **fields)
+        return claim_jobs(1, worker_id)[0]
+
+    def _age_lease(self, job, minutes):
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(minutes=minutes))
+
+    @override_settings(JOBS_STALE_AFTER=30)
+    def test_renewed_lease_is_not_requeued(self):
+        job = self._claim()
+        self._age_lease(job, 45)
+        renew_leases([job])
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+        self._age_lease(job, 45)
+        self.assertEqual(requeue_stale_jobs(), 1)
+
+    @override_settings(JOBS_STALE_AFTER=30)
+    def test_stale_job_without_attempts_left_fails(self):
+        retried = self._claim(max_attempts=2)
+        exhausted = self._claim(max_attempts=1)
+        self._age_lease(retried, 45)
+        self._age_lease(exhausted, 45)
+
+        with self.assertLogs('apps.jobs.worker', 'ERROR'):
+            self.assertEqual(requeue_stale_jobs(), 2)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual(retried.status, Job.STATUS_QUEUED)
+        self.assertEqual(exhausted.status, Job.STATUS_FAILED)
+        self.assertIsNotNone(exhausted.finished_at)
+
+    def test_result_of_a_lost_lease_is_discarded(self):
+        job = self._claim()
+        self._age_lease(job, 120)
+        requeue_stale_jobs()
+        other = claim_jobs(1, 'worker-b')[0]
+
+        self.assertIsNone(record_result(job, 1.0, None))
+        self.assertEqual(record_result(other, 1.0, None), 'succeeded')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.STATUS_SUCCEEDED)
+
+    def test_retries_are_told_apart_from_final_failures(self):
+        job = self._claim(max_attempts=2)
+        self.assertEqual(record_result(job, 1.0, 'erro'), 'retried')
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        job = claim_jobs(1, 'worker-a')[0]
+        self.assertEqual(record_result(job, 1.0, 'erro'), 'failed')
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.STATUS_FAILED)
+
+    def test_released_job_keeps_its_attempt(self):
+        job = self._claim()
+        release_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.STATUS_QUEUED, 0))
+
+
+class WorkerTimeoutTests(TestCase):
+    """Interrupção das tarefas acima do tempo limite."""
+
+    @override_settings(JOBS_TIMEOUT=1)
+    def test_job_over_the_timeout_is_interrupted(self):
+        job = Job.objects.create(
+            name='apps.jobs.tests.slow_task', payload={'seconds': 60}, max_attempts=1,
+        )
+        totals = run_worker(1, 0.2, once=True)
+
+        self.assertEqual(totals, {'succeeded': 0, 'retried': 0, 'failed': 1})
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+        self.assertIn('Tempo limite', job.last_error)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    @override_settings(JOBS_TIMEOUT=2)
+    def test_other_jobs_keep_running_during_a_timeout(self):
+        slow = Job.objects.create(name='apps.jobs.tests.slow_task', payload={'seconds': 60}, max_attempts=1)
+        quick = [
+            Job.objects.create(name='apps.jobs.tests.slow_task', payload={'seconds': 0.5})
+            for _ in range(3)
+        ]
+        totals = run_worker(2, 0.1, once=True)
+
+        self.assertEqual(totals, {'succeeded': 3, 'retried': 0, 'failed': 1})
+        self.assertEqual(Job.objects.get(pk=slow.pk).status, Job.STATUS_FAILED)
+        for job in quick:
+            job.refresh_from_db()
+            # nenhuma foi interrompida junto com a tarefa lenta
+            self.assertEqual((job.status, job.attempts), (Job.STATUS_SUCCEEDED, 1))
+
+    def test_crashed_process_is_replaced(self):
+        crashed = Job.objects.create(name='apps.jobs.tests.crash_task', payload={}, max_attempts=1)
+        after = Job.objects.create(name='apps.jobs.tests.slow_task', payload={'seconds': 0})
+        with self.assertLogs('apps.jobs.worker', 'ERROR'):
+            totals = run_worker(1, 0.1, once=True)
+
+        self.assertEqual(totals, {'succeeded': 1, 'retried': 0, 'failed': 1})
+        crashed.refresh_from_db()
+        self.assertIn('código 3', crashed.last_error)
+        self.assertEqual(Job.objects.get(pk=after.pk).status, Job.STATUS_SUCCEEDED)
+        self.assertEqual(multiprocessing.active_children(), [])
@@ -0,0 +1,370 @@
+"""
+worker.py
+
+Laço principal do worker da fila de tarefas.
+
+O processo principal reserva as tarefas no banco e registra os resultados;
+a execução em si acontece em processos filhos, de modo que tarefas pesadas
+(extração de texto, miniaturas) não disputam o GIL entre si. Cada processo
+filho executa uma tarefa por vez, recebida por um pipe, inicializa o Django
+por conta própria e mantém suas próprias conexões com o banco.
+
+Enquanto uma tarefa executa, o worker renova a reserva (`locked_at`) a cada
+`HEARTBEAT_INTERVAL` segundos. Assim, `requeue_stale_jobs` devolve à fila
+apenas as tarefas de workers que pararam de renovar (processo morto), e não
+as que estão apenas demorando. Uma tarefa que passa de `JOBS_TIMEOUT`
+segundos é interrompida: apenas o processo dela é encerrado (e substituído
+por um novo), e a tarefa conta como tentativa com falha; as demais seguem
+executando. O mesmo vale para um processo que morre durante a tarefa.
+"""
+
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from datetime import timedelta
+from multiprocessing.connection import wait
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+from .queue import retry_delay
+from .runner import serve
+
+logger = logging.getLogger(__name__)
+
+# Intervalo entre as limpezas de tarefas antigas e travadas
+MAINTENANCE_INTERVAL = 300
+
+# Segundos entre as renovações da reserva das tarefas em execução
+HEARTBEAT_INTERVAL = 60
+
+# Segundos de espera pelo fim de um processo ocioso antes de encerrá-lo à força
+STOP_TIMEOUT = 10
+
+
+def claim_jobs(limit, worker_id):
+    """
+    Reserva até `limit` tarefas prontas para execução.
+
+    As linhas já reservadas por outra transação são puladas
+    (`SKIP LOCKED`), então vários workers podem rodar ao mesmo tempo.
+
+    Args:
+        limit (int): quantidade máxima de tarefas.
+        worker_id (str): identificação gravada em `locked_by`.
+
+    Returns:
+        list[Job]: tarefas reservadas, já marcadas como em execução.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+            .order_by('-priority', 'run_at', 'id')
+            .only('id', 'name', 'payload', 'attempts', 'max_attempts')[:limit]
+        )
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=Job.STATUS_RUNNING,
+                locked_at=now,
+                locked_by=worker_id,
+                attempts=F('attempts') + 1,
+            )
+    for job in jobs:
+        job.attempts += 1
+        job.locked_by = worker_id
+    return jobs
+
+
+def renew_leases(jobs):
+    """
+    Renova a reserva das tarefas em execução por este worker.
+
+    Args:
+        jobs (Iterable[Job]): tarefas em execução, com `locked_by` preenchido.
+
+    Returns:
+        int: quantidade de reservas renovadas.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return 0
+    return Job.objects.filter(
+        pk__in=[job.pk for job in jobs],
+        status=Job.STATUS_RUNNING,
+        locked_by=jobs[0].locked_by,
+    ).update(locked_at=timezone.now())
+
+
+def record_result(job, duration_ms, error):
+    """
+    Registra o resultado de uma execução, reagendando em caso de falha.
+
+    O resultado só é gravado se a tarefa ainda estiver reservada por este
+    worker: se a reserva tiver sido perdida (ex: o worker ficou sem acesso
+    ao banco e a tarefa foi devolvida à fila), outra execução é a válida.
+
+    Args:
+        job (Job): tarefa executada.
+        duration_ms (float): duração da execução.
+        error (str | None): mensagem de erro, se a execução falhou.
+
+    Returns:
+        str | None: 'succeeded', 'retried' (reagendada) ou 'failed'
+            (falha definitiva); None se a reserva tinha sido perdida.
+    """
+    now = timezone.now()
+    fields = {'duration_ms': duration_ms, 'locked_at': None, 'locked_by': ''}
+    if error is None:
+        outcome = 'succeeded'
+        fields.update(status=Job.STATUS_SUCCEEDED, finished_at=now, last_error='')
+    elif job.attempts < job.max_attempts:
+        outcome = 'retried'
+        fields.update(
+            status=Job.STATUS_QUEUED,
+            run_at=now + retry_delay(job.attempts),
+            last_error=error,
+        )
+    else:
+        outcome = 'failed'
+        fields.update(status=Job.STATUS_FAILED, finished_at=now, last_error=error)
+
+    updated = Job.objects.filter(
+        pk=job.pk, status=Job.STATUS_RUNNING, locked_by=job.locked_by
+    ).update(**fields)
+    if not updated:
+        logger.warning('Tarefa %s #%s: reserva perdida, resultado descartado', job.name, job.pk)
+        return None
+
+    if outcome == 'succeeded':
+        logger.info('Tarefa %s #%s concluída em %.1f ms', job.name, job.pk, duration_ms)
+    elif outcome == 'retried':
+        logger.warning(
+            'Tarefa %s #%s falhou (tentativa %s de %s): %s',
+            job.name, job.pk, job.attempts, job.max_attempts, error,
+        )
+    else:
+        logger.error('Tarefa %s #%s falhou definitivamente: %s', job.name, job.pk, error)
+    return outcome
+
+
+def release_job(job):
+    """Devolve à fila uma tarefa interrompida sem culpa dela, sem gastar uma tentativa."""
+    Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING, locked_by=job.locked_by).update(
+        status=Job.STATUS_QUEUED, locked_at=None, locked_by='', attempts=F('attempts') - 1,
+    )
+
+
+def requeue_stale_jobs():
+    """
+    Devolve à fila tarefas de workers que morreram durante a execução.
+
+    Um worker vivo renova a reserva das suas tarefas a cada
+    `HEARTBEAT_INTERVAL` segundos; só as reservas sem renovação há
+    `JOBS_STALE_AFTER` minutos são devolvidas. As que já usaram todas as
+    tentativas (ex: uma tarefa que derruba o processo a cada execução)
+    falham definitivamente, em vez de voltar à fila para sempre.
+
+    Returns:
+        int: quantidade de tarefas devolvidas à fila ou marcadas como falha.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.STATUS_RUNNING, locked_at__lt=now - timedelta(minutes=settings.JOBS_STALE_AFTER)
+    )
+    with transaction.atomic():
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(
+            status=Job.STATUS_FAILED, locked_at=None, locked_by='', finished_at=now,
+            last_error='Worker encerrado durante a execução, sem tentativas restantes.',
+        )
+        requeued = stale.update(status=Job.STATUS_QUEUED, locked_at=None, locked_by='', run_at=now)
+    if failed:
+        logger.error('%s tarefa(s) de workers encerrados falharam definitivamente', failed)
+    return failed + requeued
+
+
+def purge_finished_jobs():
+    """Remove tarefas concluídas há mais de `JOBS_RETENTION_DAYS` dias."""
+    limit = timezone.now() - timedelta(days=settings.JOBS_RETENTION_DAYS)
+    deleted, _ = Job.objects.filter(
+        status=Job.STATUS_SUCCEEDED, finished_at__lt=limit
+    ).delete()
+    return deleted
+
+
+class _Slot:
+    """
+    Processo filho do worker, que executa uma tarefa por vez.
+
+    O worker é o dono do processo: uma tarefa acima do tempo limite é
+    interrompida encerrando apenas o processo dela.
+
+    Atributos:
+        ready (bool): o processo terminou de inicializar o Django; o tempo
+            de inicialização não conta no tempo limite das tarefas.
+        job (Job | None): tarefa em execução.
+        started (float): início da tarefa (`time.monotonic`).
+    """
+
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=serve, args=(child,))
+        self.process.start()
+        # apenas o filho fica com a outra ponta: a morte dele fecha o pipe
+        child.close()
+        self.ready = False
+        self.job = None
+        self.started = None
+
+    def confirm_ready(self):
+        """Recebe o aviso de que o processo está pronto."""
+        try:
+            self.connection.recv()
+        except (EOFError, OSError):
+            self.process.join()
+            raise RuntimeError(
+                f'O processo do worker terminou ao iniciar (código {self.process.exitcode}).'
+            )
+        self.ready = True
+
+    def submit(self, job):
+        """Envia uma tarefa ao processo."""
+        self.connection.send((job.name, job.payload))
+        self.job = job
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        """Segundos desde o início da tarefa atual."""
+        return time.monotonic() - self.started
+
+    def collect(self):
+        """
+        Recebe o resultado da tarefa atual (bloqueia até ele chegar).
+
+        Returns:
+            tuple: (tarefa, (duração em ms, erro ou None)); o resultado é
+                None se o processo morreu durante a tarefa.
+        """
+        job, self.job = self.job, None
+        try:
+            return job, self.connection.recv()
+        except (EOFError, OSError):
+            self.process.join()
+            return job, None
+
+    def kill(self):
+        """Encerra o processo à força, com a tarefa que estiver executando."""
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        self.job = None
+
+    def stop(self):
+        """Encerra o processo ocioso."""
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.kill()
+        self.connection.close()
+
+
+def _start_processes(processes):
+    # 'spawn' evita herdar as conexões abertas do processo principal
+    context = multiprocessing.get_context('spawn')
+    return context, [_Slot(context) for _ in range(processes)]
+
+
+def run_worker(processes, poll_interval, once=False):
+    """
+    Executa o laço do worker até ser interrompido.
+
+    Args:
+        processes (int): quantidade de processos filhos (tarefas simultâneas).
+        poll_interval (float): segundos de espera quando a fila está vazia.
+        once (bool): se True, encerra quando não houver mais tarefas prontas.
+
+    Returns:
+        dict: totais de tarefas concluídas, reagendadas para nova tentativa
+            e com falha definitiva.
+    """
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    totals = {'succeeded': 0, 'retried': 0, 'failed': 0}
+    last_maintenance = 0
+    last_heartbeat = time.monotonic()
+    context, slots = _start_processes(processes)
+
+    def count(outcome):
+        if outcome is not None:
+            totals[outcome] += 1
+
+    def busy():
+        return [slot for slot in slots if slot.job is not None]
+
+    try:
+        while True:
+            if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                requeue_stale_jobs()
+                purge_finished_jobs()
+                last_maintenance = time.monotonic()
+
+            if time.monotonic() - last_heartbeat > HEARTBEAT_INTERVAL:
+                renew_leases(slot.job for slot in busy())
+                last_heartbeat = time.monotonic()
+
+            idle = [slot for slot in slots if slot.ready and slot.job is None]
+            if idle:
+                for slot, job in zip(idle, claim_jobs(len(idle), worker_id)):
+                    slot.submit(job)
+
+            waiting = [slot for slot in slots if not slot.ready or slot.job is not None]
+            if not waiting:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            readable = wait([slot.connection for slot in waiting], timeout=poll_interval)
+            for index, slot in enumerate(slots):
+                if slot.connection not in readable:
+                    continue
+                if not slot.ready:
+                    slot.confirm_ready()
+                    continue
+                job, result = slot.collect()
+                if result is None:
+                    # o processo morreu durante a tarefa: um novo ocupa o lugar
+                    result = (None, f'Processo do worker encerrado (código {slot.process.exitcode}).')
+                    slot.connection.close()
+                    slots[index] = _Slot(context)
+                count(record_result(job, *result))
+
+            timeout = settings.JOBS_TIMEOUT
+            for index, slot in enumerate(slots):
+                if timeout and slot.job is not None and slot.elapsed() > timeout:
+                    # apenas o processo da tarefa acima do limite é encerrado
+                    job, elapsed = slot.job, slot.elapsed()
+                    slot.kill()
+                    slots[index] = _Slot(context)
+                    count(record_result(job, elapsed * 1000, f'Tempo limite de {timeout}s excedido.'))
+    finally:
+        # ao ser interrompido, espera as tarefas em andamento e devolve à fila
+        # as que não terminaram (processo encerrado junto com o worker)
+        for slot in busy():
+            job, result = slot.collect()
+            if result is not None:
+                count(record_result(job, *result))
+            else:
+                release_job(job)
+        for slot in slots:
+            slot.stop()
+
+    return totals
@@ -0,0 +1,66 @@
+"""
+backends.py
+
+Backend de autenticação com o usuário logado em cache.
+
+O `ModelBackend` do Django lê o usuário do banco a cada requisição
+autenticada, logo depois da leitura da sessão. O `CachedModelBackend`
+guarda o usuário no cache ('users:user:<id>') e só consulta o banco quando
+ele não está lá; com as sessões também em cache (`SESSION_STORE`), uma
+requisição autenticada comum não faz nenhuma consulta para identificar o
+usuário.
+
+Notas:
+    - Os sinais (`signals.py`) descartam a entrada quando o usuário é salvo
+      ou excluído. Isso cobre a troca de senha (as outras sessões são
+      encerradas, pois o hash da sessão é conferido com o usuário
+      atualizado), a desativação e as flags `is_staff`/`is_superuser`, que
+      definem as permissões sobre os documentos.
+    - Só é ativado com um cache compartilhado ('file' ou 'redis'; ver
+      `AUTHENTICATION_BACKENDS` em settings.py). Com o cache 'locmem', cada
+      processo teria a sua cópia e a invalidação alcançaria apenas o
+      processo que fez a alteração; nele, o `ModelBackend` é usado.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+# Segundos que o usuário logado fica em cache
+USER_CACHE_TIMEOUT = 5 * 60
+
+
+def user_cache_key(user_id):
+    """Retorna a chave de cache de um usuário."""
+    return f'users:user:{user_id}'
+
+
+def invalidate_user(user_id):
+    """Descarta do cache um usuário (após alteração ou exclusão)."""
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """`ModelBackend` que lê o usuário da sessão do cache (ver o início do módulo)."""
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            try:
+                user = get_user_model()._default_manager.get(pk=user_id)
+            except get_user_model().DoesNotExist:
+                return None
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            try:
+                user = await get_user_model()._default_manager.aget(pk=user_id)
+            except get_user_model().DoesNotExist:
+                return None
+            await cache.aset(key, user, USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
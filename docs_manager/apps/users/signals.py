@@ -0,0 +1,25 @@
+"""
+signals.py
+
+Receptores de sinais dos usuários.
+
+- invalidate_cached_user: descarta do cache o usuário logado (ver
+  `backends.py`) quando ele é alterado ou excluído.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .backends import invalidate_user
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Descarta o usuário do cache, agora e após o commit."""
+    # agora: a própria transação já lê o usuário atualizado; após o commit:
+    # descarta a cópia que outra requisição possa ter lido antes dele
+    invalidate_user(instance.pk)
+    transaction.on_commit(lambda: invalidate_user(instance.pk))
@@ -1,3 +1,83 @@
-from django.test import TestCase
+"""
+tests.py
 
-# Create your tests here.
+Testes da aplicação de usuários.
+
+Uso:
+    python manage.py test apps.users
+"""
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .backends import CachedModelBackend, user_cache_key
+
+
+class CachedModelBackendTests(TestCase):
+    """Usuário logado em cache e o seu descarte."""
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+        self.user = User.objects.create_user('cached', is_staff=True)
+
+    def test_user_is_read_from_cache(self):
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def test_deactivation_discards_the_cached_user(self):
+        self.backend.get_user(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_demotion_discards_the_cached_user(self):
+        self.backend.get_user(self.user.pk)
+        self.user.is_staff = False
+        self.user.save()
+        self.assertFalse(self.backend.get_user(self.user.pk).is_staff)
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    AUTHENTICATION_BACKENDS=['apps.users.backends.CachedModelBackend'],
+)
+class CachedSessionTests(TestCase):
+    """Sessões em cache: leitura sem o banco e gravação só quando mudam."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('sessao', password='senha-segura-1')
+        self.client.login(username='sessao', password='senha-segura-1')
+
+    def _auth_queries(self):
+        """Consultas à sessão e ao usuário feitas por uma requisição autenticada."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('documents_list'))
+            b''.join(response.streaming_content)
+        return [
+            query['sql'] for query in queries
+            if 'django_session' in query['sql'] or 'FROM "auth_user"' in query['sql']
+        ]
+
+    def test_login_is_written_to_the_database(self):
+        self.assertTrue(Session.objects.filter(session_key=self.client.session.session_key).exists())
+
+    def test_unmodified_session_is_not_saved_again(self):
+        self._auth_queries()
+        self.assertEqual(self._auth_queries(), [])
+
+    def test_modified_session_is_saved(self):
+        session = self.client.session
+        session['preferencia'] = 'lista'
+        session.save()
+        stored = Session.objects.get(session_key=session.session_key).get_decoded()
+        self.assertEqual(stored['preferencia'], 'lista')
@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'docs_manager.settings')
 
-application = get_asgi_application()
+# o mesmo setup de get_asgi_application(), com o handler do projeto
+django.setup(set_prefix=False)
+
+# importados depois do setup do Django (usam as URLs e os settings)
+from docs_manager.body_limits import BodyLimitMiddleware  # noqa: E402
+from docs_manager.body_streaming import StreamingBodyASGIHandler  # noqa: E402
+
+# as views de upload recebem o corpo sob demanda, sem cópia prévia
+django_application = StreamingBodyASGIHandler()
+
+# recusa os uploads grandes demais antes de o Django receber o corpo
+application = BodyLimitMiddleware(django_application)
@@ -0,0 +1,135 @@
+"""
+body_limits.py
+
+Limite de tamanho do corpo das requisições de upload, aplicado antes da
+leitura do corpo (modo ASGI).
+
+Em ASGI, o Django recebe o corpo inteiro da requisição (em memória ou em um
+arquivo temporário) antes de chamar a view e os handlers de upload; um
+arquivo acima do limite seria recebido por completo só para ser recusado
+depois. Este middleware ASGI envolve a aplicação do Django e:
+- recusa com 413, sem ler nenhum byte do corpo, as requisições cujo
+  Content-Length passa do limite da view;
+- nas requisições sem Content-Length (envio em partes), conta os bytes à
+  medida que chegam e interrompe a leitura assim que o limite é passado.
+
+Os limites de cada view (pelo nome da URL) vêm de
+`apps.documents.upload_handlers.request_body_limits`.
+
+Notas:
+    - Em WSGI, o próprio `DocumentUploadHandler` interrompe o envio, pois o
+      corpo é lido sob demanda; o middleware é usado apenas em `asgi.py`.
+    - Nas views que leem o corpo sob demanda também em ASGI (ver
+      `body_streaming.py`), a view pode já ter começado quando o limite é
+      passado; a resposta dela é descartada e o cliente recebe o 413.
+"""
+
+import json
+
+from django.urls import Resolver404, resolve
+
+from apps.documents.upload_handlers import request_body_limits
+
+# Métodos cujo corpo é verificado
+BODY_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+def _content_length(scope):
+    """Retorna o Content-Length da requisição (None se ausente ou inválido)."""
+    for name, value in scope.get('headers', ()):
+        if name == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def scope_url_name(scope):
+    """Retorna o nome da URL de uma requisição ASGI (None se não houver)."""
+    path = scope['path']
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    try:
+        return resolve(path).url_name
+    except Resolver404:
+        return None
+
+
+def _view_limit(scope):
+    """Retorna o limite (bytes, mensagem, JSON?) da view chamada, ou None."""
+    return request_body_limits().get(scope_url_name(scope))
+
+
+async def _reject(send, message, as_json):
+    """Responde 413 e fecha a conexão."""
+    if as_json:
+        body = json.dumps({'error': message}).encode()
+        content_type = b'application/json'
+    else:
+        body = f'<p>{message}</p>'.encode()
+        content_type = b'text/html; charset=utf-8'
+    await send({
+        'type': 'http.response.start',
+        'status': 413,
+        'headers': [
+            (b'content-type', content_type),
+            (b'content-length', str(len(body)).encode()),
+            (b'connection', b'close'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class BodyLimitMiddleware:
+    """
+    Middleware ASGI que recusa uploads acima do limite antes de recebê-los.
+
+    Ver o início do módulo.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] not in BODY_METHODS:
+            return await self.app(scope, receive, send)
+        limit = _view_limit(scope)
+        if limit is None:
+            return await self.app(scope, receive, send)
+        max_size, message, as_json = limit
+
+        length = _content_length(scope)
+        if length is not None and length > max_size:
+            return await _reject(send, message, as_json)
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {'type': 'http.disconnect'}
+            event = await receive()
+            if event['type'] == 'http.request':
+                received += len(event.get('body', b''))
+                if received > max_size:
+                    # para o Django, o cliente desistiu: a leitura termina aqui
+                    exceeded = True
+                    return {'type': 'http.disconnect'}
+            return event
+
+        async def tracked_send(event):
+            nonlocal started
+            if exceeded and not started:
+                # resposta da view ao corpo interrompido: vale o 413 abaixo
+                return
+            if event['type'] == 'http.response.start':
+                started = True
+            await send(event)
+
+        await self.app(scope, limited_receive, tracked_send)
+        if exceeded and not started:
+            await _reject(send, message, as_json)
@@ -0,0 +1,124 @@
+"""
+body_streaming.py
+
+Leitura do corpo das requisições de upload sob demanda, em modo ASGI.
+
+O `ASGIHandler` do Django recebe o corpo inteiro da requisição (em memória
+ou em um arquivo temporário) antes de chamar a view; o handler de upload lê
+dessa cópia, então o arquivo seria gravado duas vezes. Nas views de
+`STREAMED_BODY_VIEWS`, o `StreamingBodyASGIHandler` entrega à requisição um
+`ASGIBodyStream` no lugar do arquivo temporário: cada leitura busca as
+próximas mensagens do canal ASGI, e o corpo passa uma única vez, direto do
+servidor para o `DocumentUploadHandler` (ou para `write_chunk`), como em WSGI.
+
+Notas:
+    - O stream é lido por uma thread (`asyncio.to_thread` nas views); cada
+      mensagem é recebida no event loop, com `run_coroutine_threadsafe`.
+      Ler o corpo no próprio event loop é um erro (`RuntimeError`).
+    - Enquanto o corpo não termina de chegar, apenas o stream consome o
+      canal ASGI; a detecção de desconexão do Django começa depois dele.
+    - O limite de tamanho continua no `BodyLimitMiddleware`
+      (`body_limits.py`), que envolve este handler em `asgi.py`.
+"""
+
+import asyncio
+
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler
+
+from apps.documents.upload_handlers import STREAMED_BODY_VIEWS
+from docs_manager.body_limits import BODY_METHODS, scope_url_name
+
+
+class ASGIBodyStream:
+    """
+    Corpo de uma requisição ASGI, lido do canal à medida que é pedido.
+
+    Atributos:
+        disconnected (bool): o cliente desconectou antes do fim do corpo.
+        consumed (asyncio.Event): sinalizado quando o corpo termina (ou o
+            cliente desconecta).
+    """
+
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.disconnected = False
+        self.consumed = asyncio.Event()
+        self._loop = loop
+        self._buffer = bytearray()
+        self._more_body = True
+
+    async def _receive_message(self):
+        message = await self.receive()
+        if message['type'] == 'http.disconnect':
+            self.disconnected = True
+            self._more_body = False
+        else:
+            self._buffer += message.get('body', b'')
+            self._more_body = message.get('more_body', False)
+        if not self._more_body:
+            self.consumed.set()
+
+    def _fill(self, size=-1, until=None):
+        """Recebe mensagens até haver `size` bytes (ou `until`) no buffer, ou o corpo acabar."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            raise RuntimeError('O corpo da requisição deve ser lido em uma thread, fora do event loop.')
+        while self._more_body and (size < 0 or len(self._buffer) < size):
+            if until is not None and until in self._buffer:
+                break
+            asyncio.run_coroutine_threadsafe(self._receive_message(), self._loop).result()
+        if self.disconnected:
+            # o Django converte em UnreadablePostError, como em WSGI
+            raise OSError('O cliente desconectou durante o envio.')
+
+    def _take(self, size):
+        if size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read(self, size=-1):
+        self._fill(size)
+        return self._take(size)
+
+    def readline(self, size=-1):
+        self._fill(size, until=b'\n')
+        end = self._buffer.find(b'\n') + 1
+        if end and (size < 0 or end <= size):
+            size = end
+        return self._take(size)
+
+    def close(self):
+        self._buffer.clear()
+
+
+class StreamingBodyASGIHandler(ASGIHandler):
+    """
+    `ASGIHandler` que não recebe antes da view o corpo das views de upload.
+
+    Ver o início do módulo.
+    """
+
+    async def handle(self, scope, receive, send):
+        if scope['method'] in BODY_METHODS and scope_url_name(scope) in STREAMED_BODY_VIEWS:
+            # o stream faz o papel do `receive` em read_body e listen_for_disconnect
+            receive = ASGIBodyStream(receive, asyncio.get_running_loop())
+        await super().handle(scope, receive, send)
+
+    async def read_body(self, receive):
+        if isinstance(receive, ASGIBodyStream):
+            return receive
+        return await super().read_body(receive)
+
+    async def listen_for_disconnect(self, receive):
+        if isinstance(receive, ASGIBodyStream):
+            await receive.consumed.wait()
+            if receive.disconnected:
+                raise RequestAborted()
+            receive = receive.receive
+        return await super().listen_for_disconnect(receive)
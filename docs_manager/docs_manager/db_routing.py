@@ -0,0 +1,132 @@
+"""
+db_routing.py
+
+Distribuição das consultas entre o banco principal e as réplicas de leitura.
+
+Com réplicas configuradas (`DB_REPLICA_HOSTS`), as leituras das requisições
+seguras (GET, HEAD, OPTIONS) vão para uma réplica, sorteada uma vez por
+requisição; as escritas vão sempre para o banco principal ('default').
+
+Como as réplicas recebem as alterações com algum atraso, o usuário precisa
+ler as próprias escritas:
+- depois da primeira escrita, o restante da requisição lê do principal;
+- requisições POST, PUT, PATCH e DELETE leem sempre do principal;
+- a resposta de uma requisição que escreveu recebe um cookie que mantém as
+  leituras daquele navegador no principal por `DB_REPLICA_PIN_SECONDS`
+  segundos (o tempo do redirecionamento e da página seguinte).
+
+Notas:
+    - Fora das requisições (worker da fila, comandos, shell), tudo usa o
+      principal: a réplica só é escolhida pelo middleware.
+    - Leituras dentro de uma transação no principal (`transaction.atomic`)
+      também ficam no principal.
+    - As migrações rodam apenas no principal; nos testes, as réplicas
+      espelham o banco de teste (`TEST['MIRROR']`).
+"""
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+# Cookie que mantém as leituras no principal depois de uma escrita
+PIN_COOKIE = 'db_primary'
+
+# Métodos que não alteram dados: as leituras podem ir para uma réplica
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Réplica das leituras da requisição atual (None: banco principal)
+_read_alias = ContextVar('db_read_alias', default=None)
+
+# Indica se a requisição atual já escreveu no banco principal
+_wrote = ContextVar('db_wrote', default=False)
+
+
+def replica_aliases():
+    """Retorna os aliases das réplicas de leitura configuradas."""
+    return settings.DATABASE_REPLICAS
+
+
+class PrimaryReplicaRouter:
+    """
+    Roteador do Django: escritas no principal, leituras na réplica da requisição.
+
+    Ver o início do módulo.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # a partir daqui, a requisição lê as próprias escritas
+        if not _wrote.get():
+            _wrote.set(True)
+            _read_alias.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # as réplicas têm os mesmos dados do principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def _start_request(request):
+    """Escolhe o banco das leituras da requisição."""
+    replicas = replica_aliases()
+    alias = None
+    if replicas and request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES:
+        alias = random.choice(replicas)
+    return _read_alias.set(alias), _wrote.set(False)
+
+
+def _end_request(tokens):
+    """Restaura o roteamento anterior e indica se a requisição escreveu no principal."""
+    wrote = _wrote.get()
+    _read_alias.reset(tokens[0])
+    _wrote.reset(tokens[1])
+    return wrote
+
+
+def _pin_to_primary(request, response, wrote):
+    """Mantém as próximas leituras do navegador no principal, após uma escrita."""
+    if replica_aliases() and (wrote or request.method not in SAFE_METHODS):
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.DB_REPLICA_PIN_SECONDS,
+            httponly=True, samesite='Lax', secure=request.is_secure(),
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """
+    Middleware que direciona as leituras da requisição (ver o início do módulo).
+
+    Deve vir antes dos middlewares que consultam o banco (sessão, autenticação).
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            tokens = _start_request(request)
+            try:
+                response = await get_response(request)
+            finally:
+                wrote = _end_request(tokens)
+            return _pin_to_primary(request, response, wrote)
+    else:
+        def middleware(request):
+            tokens = _start_request(request)
+            try:
+                response = get_response(request)
+            finally:
+                wrote = _end_request(tokens)
+            return _pin_to_primary(request, response, wrote)
+
+    return middleware
@@ -0,0 +1,278 @@
+"""
+instrumentation.py
+
+Medição de desempenho por requisição.
+
+Para uma amostra das requisições (`INSTRUMENTATION_SAMPLE_RATE`), registra:
+- quantidade e tempo das consultas SQL, por meio de um execute wrapper
+  instalado em cada conexão com o banco;
+- consultas repetidas (mesmo SQL com parâmetros diferentes), o sinal mais
+  comum de um N+1;
+- tempo de renderização dos templates, pelo backend `InstrumentedTemplates`;
+- bytes enviados no corpo da resposta (inclusive em respostas em streaming,
+  como os downloads) e o tempo gasto enviando-os.
+
+Os números vão para o cabeçalho `Server-Timing` (visível nas ferramentas de
+desenvolvedor do navegador) e, quando a requisição é lenta ou tem consultas
+repetidas demais, para um log estruturado (uma linha JSON por requisição).
+
+Notas:
+    - Fora da amostra, o custo é apenas o de medir a duração total: o
+      wrapper de SQL e o backend de templates consultam uma ContextVar e
+      seguem adiante.
+    - A ContextVar acompanha a requisição nas threads de `sync_to_async` e
+      `asyncio.to_thread`, então as views assíncronas também são medidas.
+"""
+
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de caracteres do SQL repetido incluída no log
+SQL_PREVIEW_LENGTH = 300
+
+# Métricas da requisição atual (None fora da amostra)
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Métricas coletadas durante uma requisição amostrada.
+
+    Atributos:
+        queries (int): quantidade de consultas executadas.
+        db_time (float): tempo total no banco, em segundos.
+        statements (Counter): execuções de cada SQL (sem os parâmetros).
+        render_time (float): tempo de renderização dos templates, em segundos.
+        bytes_sent (int): bytes do corpo da resposta.
+        stream_time (float | None): tempo de envio de respostas em streaming.
+    """
+
+    __slots__ = ('queries', 'db_time', 'statements', 'render_time', 'bytes_sent', 'stream_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.render_time = 0.0
+        self.bytes_sent = 0
+        self.stream_time = None
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        self.statements[sql] += 1
+
+    @property
+    def duplicate_queries(self):
+        """Consultas que repetem um SQL já executado na mesma requisição."""
+        return self.queries - len(self.statements)
+
+    def most_repeated(self):
+        """Retorna (SQL, execuções) do SQL mais repetido, ou None."""
+        if not self.statements:
+            return None
+        return self.statements.most_common(1)[0]
+
+
+def _record_query(execute, sql, params, many, context):
+    """Execute wrapper que soma as consultas às métricas da requisição atual."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    """Instala o wrapper de medição em uma conexão (uma única vez)."""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class InstrumentedTemplate(Template):
+    """Template do Django que soma o tempo de renderização às métricas."""
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.render_time += time.perf_counter() - started
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """
+    Backend de templates do Django com medição do tempo de renderização.
+
+    Apenas a renderização de nível mais alto é medida; `include` e
+    `extends` ficam dentro dela, sem contagem em dobro.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
+
+
+def server_timing(duration, metrics):
+    """
+    Monta o valor do cabeçalho Server-Timing.
+
+    Args:
+        duration (float): duração da requisição até a resposta, em segundos.
+        metrics (RequestMetrics | None): métricas, se a requisição foi amostrada.
+
+    Returns:
+        str: métricas `app`, `db` e `tpl`, com durações em milissegundos.
+    """
+    parts = [f'app;dur={duration * 1000:.1f}']
+    if metrics is not None:
+        parts.append(
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.queries} consultas, {metrics.duplicate_queries} repetidas"'
+        )
+        parts.append(f'tpl;dur={metrics.render_time * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def _log_request(request, response, duration, metrics):
+    """Registra a requisição se ela for lenta ou tiver consultas repetidas demais."""
+    slow = duration * 1000 >= settings.INSTRUMENTATION_SLOW_REQUEST_MS
+    repeated = metrics.most_repeated() if metrics is not None else None
+    suspect = repeated is not None and repeated[1] >= settings.INSTRUMENTATION_DUPLICATE_QUERIES
+    if not slow and not suspect:
+        return
+
+    match = request.resolver_match
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'view': match.view_name if match else None,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 1),
+        'sampled': metrics is not None,
+    }
+    if metrics is not None:
+        record.update(
+            queries=metrics.queries,
+            db_ms=round(metrics.db_time * 1000, 1),
+            duplicate_queries=metrics.duplicate_queries,
+            render_ms=round(metrics.render_time * 1000, 1),
+            bytes_sent=metrics.bytes_sent,
+        )
+        if metrics.stream_time is not None:
+            record['stream_ms'] = round(metrics.stream_time * 1000, 1)
+        if suspect:
+            record['repeated_sql'] = repeated[0][:SQL_PREVIEW_LENGTH]
+            record['repeated_count'] = repeated[1]
+    logger.warning(
+        'Requisição %s: %s', 'lenta' if slow else 'com consultas repetidas',
+        json.dumps(record, ensure_ascii=False),
+        extra={'metrics': record},
+    )
+
+
+def _count_stream(content, metrics, finish):
+    """Repassa o conteúdo em streaming, contando os bytes enviados."""
+    started = time.perf_counter()
+    try:
+        for chunk in content:
+            metrics.bytes_sent += len(chunk)
+            yield chunk
+    finally:
+        metrics.stream_time = time.perf_counter() - started
+        finish()
+
+
+async def _acount_stream(content, metrics, finish):
+    """Versão assíncrona de `_count_stream`."""
+    started = time.perf_counter()
+    try:
+        async for chunk in content:
+            metrics.bytes_sent += len(chunk)
+            yield chunk
+    finally:
+        metrics.stream_time = time.perf_counter() - started
+        finish()
+
+
+def _start_request():
+    """Decide se a requisição entra na amostra e ativa as métricas."""
+    metrics = RequestMetrics() if random.random() < settings.INSTRUMENTATION_SAMPLE_RATE else None
+    return metrics, _current.set(metrics), time.perf_counter()
+
+
+def _finish_request(request, response, metrics, started):
+    duration = time.perf_counter() - started
+    if settings.INSTRUMENTATION_SERVER_TIMING:
+        response['Server-Timing'] = server_timing(duration, metrics)
+
+    if metrics is None:
+        _log_request(request, response, duration, None)
+    elif response.streaming:
+        # o corpo ainda não foi enviado: o log sai ao fim do streaming
+        def finish():
+            _log_request(request, response, duration, metrics)
+
+        if response.is_async:
+            response.streaming_content = _acount_stream(response.streaming_content, metrics, finish)
+        else:
+            response.streaming_content = _count_stream(response.streaming_content, metrics, finish)
+    else:
+        metrics.bytes_sent = len(response.content)
+        _log_request(request, response, duration, metrics)
+    return response
+
+
+@sync_and_async_middleware
+def instrumentation_middleware(get_response):
+    """
+    Middleware que mede cada requisição amostrada (ver o início do módulo).
+
+    Deve ser o primeiro de `MIDDLEWARE`, para incluir o tempo dos demais.
+    """
+    # conexões abertas antes do carregamento do middleware
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics, token, started = _start_request()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish_request(request, response, metrics, started)
+    else:
+        def middleware(request):
+            metrics, token, started = _start_request()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish_request(request, response, metrics, started)
+
+    return middleware
@@ -39,11 +39,17 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'apps.documents',
-    'apps.users'
+    'apps.users',
+    'apps.jobs',
 ]
 
 MIDDLEWARE = [
+    # mede consultas, templates e bytes enviados (ver INSTRUMENTATION_*)
+    'docs_manager.instrumentation.instrumentation_middleware',
+    # leituras nas réplicas, escritas no principal (ver DB_REPLICA_HOSTS)
+    'docs_manager.db_routing.replica_routing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,7 +64,8 @@ ROOT_URLCONF = 'docs_manager.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates com medição do tempo de renderização
+        'BACKEND': 'docs_manager.instrumentation.InstrumentedTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -82,17 +89,113 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+_DATABASE = {
+    'ENGINE': 'django.db.backends.postgresql',
+    'NAME': config('DB_NAME'),
+    'USER': config('DB_USER'),
+    'PASSWORD': config('DB_PASSWORD'),
+    # segundos que cada conexão é reaproveitada entre requisições (0 = uma por
+    # requisição); apenas em WSGI: em ASGI, use o pool abaixo ou um pooler externo
+    'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),
+    # testa a conexão reaproveitada antes de usá-la, descartando as que caíram
+    'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+    # obrigatório atrás de um pooler em modo transação (pgbouncer, Supavisor na porta 6543)
+    'DISABLE_SERVER_SIDE_CURSORS': config('DB_DISABLE_SERVER_SIDE_CURSORS', default=False, cast=bool),
+    'OPTIONS': {},
+}
+# Pool de conexões por processo (0 = desativado); requer o pacote psycopg[pool]
+# no lugar do psycopg2. Cada alias (principal e réplicas) tem o seu pool.
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=0, cast=int)
+if DB_POOL_MAX_SIZE:
+    from psycopg_pool import ConnectionPool
+
+    _DATABASE['CONN_MAX_AGE'] = 0
+    _DATABASE['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': DB_POOL_MAX_SIZE,
+            # segundos de espera por uma conexão livre antes do erro
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+            # testa cada conexão ao entregá-la, descartando as que caíram
+            'check': ConnectionPool.check_connection,
+        },
+    }
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': config('DB_NAME'), 
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
+        **_DATABASE,
         'HOST': config('DB_HOST', default='localhost'),
         'PORT': config('DB_PORT', default='5432'),
     }
 }
 
+# Réplicas de leitura: 'host' ou 'host:porta', separadas por vírgula, com o
+# mesmo banco, usuário e senha do principal (ver docs_manager/db_routing.py)
+for _index, _address in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    _host, _, _port = _address.partition(':')
+    DATABASES[f'replica{_index}'] = {
+        **_DATABASE,
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['docs_manager.db_routing.PrimaryReplicaRouter']
+# Segundos que as leituras de um navegador ficam no principal depois de uma escrita
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)
+
+
+# Cache (cards da listagem de documentos, entre outros)
+# 'locmem' guarda os dados na memória de cada processo; com vários workers
+# (gunicorn/uvicorn), 'file', 'db' ou 'redis' compartilham o cache entre eles.
+# O backend 'db' exige a tabela criada com: python manage.py createcachetable
+# O backend 'redis' requer o pacote redis e um servidor Redis
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'docs-manager'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'django_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'),
+    'dummy': ('django.core.cache.backends.dummy.DummyCache', ''),
+}
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem')
+CACHES = {
+    'default': {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': config('CACHE_LOCATION', default=_CACHE_BACKENDS[CACHE_BACKEND][1]),
+    }
+}
+# Cache compartilhado entre os processos: só com ele as invalidações feitas
+# por um processo (permissões, usuário logado) alcançam os demais
+CACHE_SHARED = CACHE_BACKEND in ('file', 'db', 'redis')
+if CACHE_BACKEND != 'redis':
+    # o Redis descarta as entradas pela própria política de memória
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+    }
+
+# Sessões: 'db' (no banco), 'cached_db' (lidas do cache, gravadas também no
+# banco) ou 'cache' (apenas no cache). Com as sessões em cache, o cache precisa
+# ser compartilhado entre os processos ('file' ou 'redis'): com 'locmem', um
+# logout não alcançaria as cópias dos outros processos.
+SESSION_STORE = config(
+    'SESSION_STORE', default='cached_db' if CACHE_BACKEND in ('file', 'redis') else 'db'
+)
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_STORE}'
+# grava a sessão apenas quando ela muda, e não a cada requisição.
+# O 'cached_db' grava no cache e no banco ao mesmo tempo (write-through), e não
+# depois (write-behind): como a sessão só muda no login, no logout e em poucas
+# outras ações, as requisições comuns já não escrevem nada, e adiar essas
+# poucas gravações arriscaria perder um login se o cache descartasse a sessão
+# antes de ela chegar ao banco.
+SESSION_SAVE_EVERY_REQUEST = False
+
+# Autenticação com o usuário logado em cache (ver apps/users/backends.py),
+# apenas com um cache compartilhado ('file' ou 'redis'): com 'locmem', um
+# usuário desativado ou com a senha trocada continuaria logado nos outros
+# processos até a entrada expirar
+if CACHE_BACKEND in ('file', 'redis'):
+    AUTHENTICATION_BACKENDS = ['apps.users.backends.CachedModelBackend']
+else:
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
 
 
 # Password validation
@@ -144,6 +247,93 @@ if os.path.isdir(_static_dir):
 else:
     STATICFILES_DIRS = []
 
+# Quantidade de documentos por página na listagem (paginação por cursor)
+DOCUMENTS_PAGE_SIZE = config('DOCUMENTS_PAGE_SIZE', default=20, cast=int)
+# Quantidade máxima de arquivos em um único envio (importação em lote)
+DATA_UPLOAD_MAX_NUMBER_FILES = config('DATA_UPLOAD_MAX_NUMBER_FILES', default=1000, cast=int)
+# Quantidade de comentários exibidos por vez nos detalhes do documento
+DOCUMENTS_COMMENTS_PAGE_SIZE = config('DOCUMENTS_COMMENTS_PAGE_SIZE', default=20, cast=int)
+
+# Configuração de idioma usada pela busca textual do Postgres
+DOCUMENTS_SEARCH_CONFIG = config('DOCUMENTS_SEARCH_CONFIG', default='portuguese')
+
+# Armazena cada conteúdo de arquivo uma única vez, endereçado pelo SHA-256
+DOCUMENTS_DEDUPLICATE = config('DOCUMENTS_DEDUPLICATE', default=True, cast=bool)
+
+# Compressão dos arquivos de texto no armazenamento deduplicado:
+# 'gzip', 'zstd' (requer o pacote zstandard) ou '' (desativada)
+DOCUMENTS_COMPRESSION = config('DOCUMENTS_COMPRESSION', default='gzip')
+
+# Upload em partes (retomável): tamanho das partes, limite do arquivo completo,
+# validade das sessões e pasta onde as partes ficam até a finalização
+DOCUMENTS_UPLOAD_CHUNK_SIZE = config('DOCUMENTS_UPLOAD_CHUNK_SIZE', default=5 * 1024 * 1024, cast=int)
+DOCUMENTS_MAX_UPLOAD_SIZE = config('DOCUMENTS_MAX_UPLOAD_SIZE', default=2 * 1024 * 1024 * 1024, cast=int)
+DOCUMENTS_UPLOAD_SESSION_HOURS = config('DOCUMENTS_UPLOAD_SESSION_HOURS', default=24, cast=int)
+UPLOAD_SESSIONS_ROOT = config('UPLOAD_SESSIONS_ROOT', default=os.path.join(BASE_DIR, 'upload_sessions'))
+
+# Entrega de arquivos pelo proxy depois da verificação de permissões:
+# '' (o Django envia os bytes), 'x-accel-redirect' (nginx) ou 'x-sendfile'
+# (Apache/lighttpd). No nginx, DOCUMENTS_SENDFILE_PREFIX deve apontar para uma
+# location 'internal' que sirva o MEDIA_ROOT.
+DOCUMENTS_SENDFILE = config('DOCUMENTS_SENDFILE', default='')
+DOCUMENTS_SENDFILE_PREFIX = config('DOCUMENTS_SENDFILE_PREFIX', default='/protected/')
+
+# Formato das miniaturas e pré-visualizações geradas ('webp' ou 'jpeg')
+DOCUMENTS_DERIVATIVE_FORMAT = config('DOCUMENTS_DERIVATIVE_FORMAT', default='webp')
+
+# Pré-visualização de planilhas (.csv/.xlsx): pasta local do cache colunar
+# (lido com memmap) e linhas exibidas por página nos detalhes do documento
+DOCUMENTS_TABLE_CACHE_ROOT = config('DOCUMENTS_TABLE_CACHE_ROOT', default=os.path.join(BASE_DIR, 'table_cache'))
+DOCUMENTS_TABLE_PAGE_SIZE = config('DOCUMENTS_TABLE_PAGE_SIZE', default=50, cast=int)
+
+# Segundos que o HTML de cada card da listagem fica em cache
+DOCUMENTS_CARD_CACHE_TIMEOUT = config('DOCUMENTS_CARD_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+
+# Dias que um documento excluído fica na lixeira antes de ser removido
+# em definitivo pelo comando purge_trash
+DOCUMENTS_TRASH_RETENTION_DAYS = config('DOCUMENTS_TRASH_RETENTION_DAYS', default=30, cast=int)
+
+# Cota padrão de armazenamento por usuário, em bytes (0 = sem limite);
+# cotas individuais são definidas no admin (Cotas de armazenamento)
+DOCUMENTS_USER_QUOTA = config('DOCUMENTS_USER_QUOTA', default=0, cast=int)
+
+# Compartilhamento de documentos: com True, cada usuário vê apenas os próprios
+# documentos e os compartilhados com ele ou com seus grupos; com False, todos
+# veem e comentam todos os documentos (os compartilhamentos concedem apenas a exclusão)
+DOCUMENTS_SHARING = config('DOCUMENTS_SHARING', default=False, cast=bool)
+
+# Similaridade estimada (0 a 1) a partir da qual um documento é marcado como
+# provável cópia de outro (ver apps/documents/similarity.py)
+DOCUMENTS_DUPLICATE_THRESHOLD = config('DOCUMENTS_DUPLICATE_THRESHOLD', default=0.8, cast=float)
+
+# Fila de tarefas em segundo plano (python manage.py run_jobs)
+# Processos do worker que executam tarefas em paralelo
+JOBS_WORKER_PROCESSES = config('JOBS_WORKER_PROCESSES', default=2, cast=int)
+# Segundos de espera do worker quando a fila está vazia
+JOBS_POLL_INTERVAL = config('JOBS_POLL_INTERVAL', default=1.0, cast=float)
+# Tentativas por tarefa e atraso base (segundos) do backoff exponencial
+JOBS_MAX_ATTEMPTS = config('JOBS_MAX_ATTEMPTS', default=5, cast=int)
+JOBS_RETRY_BACKOFF = config('JOBS_RETRY_BACKOFF', default=10, cast=int)
+# Minutos sem renovação da reserva até uma tarefa em execução ser
+# considerada abandonada (o worker renova a cada minuto)
+JOBS_STALE_AFTER = config('JOBS_STALE_AFTER', default=30, cast=int)
+# Segundos de execução até uma tarefa ser interrompida (0 = sem limite)
+JOBS_TIMEOUT = config('JOBS_TIMEOUT', default=3600, cast=int)
+# Dias em que as tarefas concluídas são mantidas para consulta
+JOBS_RETENTION_DAYS = config('JOBS_RETENTION_DAYS', default=7, cast=int)
+# Executa as tarefas na própria requisição, sem worker (desenvolvimento)
+JOBS_IMMEDIATE = config('JOBS_IMMEDIATE', default=False, cast=bool)
+
+# Medição de desempenho por requisição (Server-Timing e log de requisições lentas)
+# Fração das requisições medidas em detalhe (0.0 a 1.0)
+INSTRUMENTATION_SAMPLE_RATE = config('INSTRUMENTATION_SAMPLE_RATE', default=0.1, cast=float)
+# Requisições mais lentas que este limite (ms) são registradas no log
+INSTRUMENTATION_SLOW_REQUEST_MS = config('INSTRUMENTATION_SLOW_REQUEST_MS', default=1000, cast=int)
+# Execuções do mesmo SQL em uma requisição a partir das quais ela é registrada (N+1)
+INSTRUMENTATION_DUPLICATE_QUERIES = config('INSTRUMENTATION_DUPLICATE_QUERIES', default=10, cast=int)
+# Envia o cabeçalho Server-Timing nas respostas
+INSTRUMENTATION_SERVER_TIMING = config('INSTRUMENTATION_SERVER_TIMING', default=True, cast=bool)
+
 LOGOUT_REDIRECT_URL = 'login'
 LOGIN_REDIRECT_URL = 'documents_list'
 